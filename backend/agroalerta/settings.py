@@ -168,6 +168,40 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# Cache
+# Em produção usa o Redis do docker-compose (maxmemory-policy allkeys-lru);
+# sem REDIS_URL cai para memória local, com despejo LRU de uma entrada de cada vez.
+REDIS_URL = config('REDIS_URL', default='')
+AI_RESPONSE_CACHE_MAX_ENTRIES = config('AI_RESPONSE_CACHE_MAX_ENTRIES', default=5000, cast=int)
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'ai_responses': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'ai_responses',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'ai_responses': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'ai-responses',
+            'OPTIONS': {
+                'MAX_ENTRIES': AI_RESPONSE_CACHE_MAX_ENTRIES,
+                # Ao atingir MAX_ENTRIES remove apenas a entrada menos usada
+                'CULL_FREQUENCY': AI_RESPONSE_CACHE_MAX_ENTRIES,
+            },
+        },
+    }
+
 """CORS/CSRF configuration"""
 
 # Allow list via env, comma-separated
@@ -188,12 +222,84 @@ CORS_ALLOW_CREDENTIALS = True
 
 # External APIs Configuration
 OPENWEATHER_API_KEY = config('OPENWEATHER_API_KEY', default='')
+OPENWEATHER_TIMEOUT = config('OPENWEATHER_TIMEOUT', default=10, cast=float)
+# Cache do OpenWeatherService (segundos): frescos até *_TTL, servidos como
+# antigos (e atualizados em background) até *_TTL + *_STALE
+WEATHER_CACHE_CURRENT_TTL = config('WEATHER_CACHE_CURRENT_TTL', default=600, cast=int)
+WEATHER_CACHE_CURRENT_STALE = config('WEATHER_CACHE_CURRENT_STALE', default=3600, cast=int)
+WEATHER_CACHE_FORECAST_TTL = config('WEATHER_CACHE_FORECAST_TTL', default=3600, cast=int)
+WEATHER_CACHE_FORECAST_STALE = config('WEATHER_CACHE_FORECAST_STALE', default=6 * 3600, cast=int)
+WEATHER_CACHE_GEOCODING_TTL = config('WEATHER_CACHE_GEOCODING_TTL', default=7 * 24 * 3600, cast=int)
+# Coordenadas GPS arredondadas a esta grelha (graus; 0.05 ~ 5.5 km) para partilhar entradas
+WEATHER_GRID_DEGREES = config('WEATHER_GRID_DEGREES', default=0.05, cast=float)
+# Pedidos até esta distância (km) de uma localidade conhecida ou célula já usada partilham a sua entrada
+WEATHER_NEAREST_RADIUS_KM = config('WEATHER_NEAREST_RADIUS_KM', default=3.0, cast=float)
+# Raio (km) para identificar a localidade conhecida mais próxima de coordenadas GPS
+WEATHER_LOCATION_RADIUS_KM = config('WEATHER_LOCATION_RADIUS_KM', default=25.0, cast=float)
+# Prefetch das localidades conhecidas (python manage.py prefetch_clima)
+WEATHER_PREFETCH_WORKERS = config('WEATHER_PREFETCH_WORKERS', default=4, cast=int)
+# Limite do plano OpenWeather (o gratuito permite 60 chamadas/minuto)
+OPENWEATHER_CALLS_PER_MINUTE = config('OPENWEATHER_CALLS_PER_MINUTE', default=60, cast=int)
 TWILIO_ACCOUNT_SID = config('TWILIO_ACCOUNT_SID', default='')
 TWILIO_AUTH_TOKEN = config('TWILIO_AUTH_TOKEN', default='')
 TWILIO_PHONE_NUMBER = config('TWILIO_PHONE_NUMBER', default='')
+# Outbox de notificações (python manage.py enviar_notificacoes)
+NOTIFICATION_SEND_WORKERS = config('NOTIFICATION_SEND_WORKERS', default=8, cast=int)
+NOTIFICATION_BATCH_SIZE = config('NOTIFICATION_BATCH_SIZE', default=100, cast=int)
+# Linhas por INSERT ao pôr notificações em fila (campanhas grandes)
+NOTIFICATION_INSERT_BATCH_SIZE = config('NOTIFICATION_INSERT_BATCH_SIZE', default=2000, cast=int)
+NOTIFICATION_MAX_ATTEMPTS = config('NOTIFICATION_MAX_ATTEMPTS', default=5, cast=int)
+# Nova tentativa após RETRY_BASE * 2^(tentativa-1) segundos, no máximo RETRY_MAX
+NOTIFICATION_RETRY_BASE_SECONDS = config('NOTIFICATION_RETRY_BASE_SECONDS', default=30, cast=int)
+NOTIFICATION_RETRY_MAX_SECONDS = config('NOTIFICATION_RETRY_MAX_SECONDS', default=3600, cast=int)
+# Linhas reservadas por um worker que morreu voltam à fila ao fim deste tempo
+NOTIFICATION_LEASE_SECONDS = config('NOTIFICATION_LEASE_SECONDS', default=300, cast=int)
+# Limites de envio Twilio (mensagens/segundo; 0 = sem limite), por canal e por conta
+TWILIO_SMS_PER_SECOND = config('TWILIO_SMS_PER_SECOND', default=10, cast=float)
+TWILIO_WHATSAPP_PER_SECOND = config('TWILIO_WHATSAPP_PER_SECOND', default=10, cast=float)
+TWILIO_ACCOUNT_PER_SECOND = config('TWILIO_ACCOUNT_PER_SECOND', default=20, cast=float)
+# Campanhas (python manage.py executar_campanhas): utilizadores por checkpoint e envios em paralelo
+CAMPAIGN_CHUNK_SIZE = config('CAMPAIGN_CHUNK_SIZE', default=500, cast=int)
+CAMPAIGN_SEND_WORKERS = config('CAMPAIGN_SEND_WORKERS', default=8, cast=int)
+# Lease de uma execução de campanha (renovado a cada bloco; tem de durar mais do que um bloco)
+CAMPAIGN_LEASE_SECONDS = config('CAMPAIGN_LEASE_SECONDS', default=900, cast=int)
+# Cliente Twilio: ligações HTTP reutilizadas e pedidos em simultâneo por canal
+TWILIO_SMS_CONCURRENCY = config('TWILIO_SMS_CONCURRENCY', default=8, cast=int)
+TWILIO_WHATSAPP_CONCURRENCY = config('TWILIO_WHATSAPP_CONCURRENCY', default=8, cast=int)
+TWILIO_TIMEOUT = config('TWILIO_TIMEOUT', default=15, cast=float)
+# Respostas 429: o canal pausa (a pausa duplica a cada 429, até BACKOFF_MAX) e o limite de pedidos
+# em simultâneo desce para metade; ambos recuperam com os envios aceites
+TWILIO_MAX_RETRIES = config('TWILIO_MAX_RETRIES', default=3, cast=int)
+TWILIO_BACKOFF_BASE_SECONDS = config('TWILIO_BACKOFF_BASE_SECONDS', default=1, cast=float)
+TWILIO_BACKOFF_MAX_SECONDS = config('TWILIO_BACKOFF_MAX_SECONDS', default=30, cast=float)
+# Envios em lote: mensagens iguais (canal, número e texto) saem uma só vez
+TWILIO_GROUP_IDENTICAL = config('TWILIO_GROUP_IDENTICAL', default=True, cast=bool)
+# Agendamento pelas preferências: faixa (segundos) de cada prioridade no início da janela do
+# utilizador, mensagens por resumo e dia do resumo semanal (0 = segunda-feira)
+SCHEDULER_SPREAD_SECONDS = config('SCHEDULER_SPREAD_SECONDS', default=900, cast=int)
+SCHEDULER_DIGEST_MAX_ITEMS = config('SCHEDULER_DIGEST_MAX_ITEMS', default=10, cast=int)
+SCHEDULER_WEEKLY_DIGEST_WEEKDAY = config('SCHEDULER_WEEKLY_DIGEST_WEEKDAY', default=0, cast=int)
 
 # AI Models Configuration
 HUGGINGFACE_API_KEY = config('HUGGINGFACE_API_KEY', default='')
+HUGGINGFACE_API_URL = config('HUGGINGFACE_API_URL', default='https://api-inference.huggingface.co/models')
+HUGGINGFACE_TIMEOUT = config('HUGGINGFACE_TIMEOUT', default=30, cast=float)
+# Conexões keep-alive (e threads de inferência) partilhadas por processo
+HUGGINGFACE_POOL_SIZE = config('HUGGINGFACE_POOL_SIZE', default=16, cast=int)
+# Tamanho máximo das fotos enviadas para detecção de pragas (multipart/binário)
+PEST_UPLOAD_MAX_BYTES = config('PEST_UPLOAD_MAX_BYTES', default=25 * 1024 * 1024, cast=int)
+# Levantamentos de campo (/api/pragas/detectar/lote/)
+PEST_BATCH_MAX_IMAGES = config('PEST_BATCH_MAX_IMAGES', default=100, cast=int)
+PEST_BATCH_WORKERS = config('PEST_BATCH_WORKERS', default=8, cast=int)
+# Detecções assíncronas (?async=true): análises em background por processo
+PEST_JOB_WORKERS = config('PEST_JOB_WORKERS', default=4, cast=int)
+# Jobs sem resultado ao fim deste tempo (ex.: worker reiniciado) voltam à fila
+PEST_JOB_STALE_SECONDS = config('PEST_JOB_STALE_SECONDS', default=300, cast=int)
+PEST_JOB_WEBHOOK_TIMEOUT = config('PEST_JOB_WEBHOOK_TIMEOUT', default=10, cast=float)
+# Assinatura HMAC-SHA256 dos webhooks (cabeçalho X-Lura-Signature) e hosts permitidos
+# (vazio = qualquer host que resolva só para IPs públicos; os privados são sempre recusados)
+PEST_JOB_WEBHOOK_SECRET = config('PEST_JOB_WEBHOOK_SECRET', default='')
+PEST_JOB_WEBHOOK_ALLOWED_HOSTS = [h.strip() for h in config('PEST_JOB_WEBHOOK_ALLOWED_HOSTS', default='').split(',') if h.strip()]
 
 # Firebase Configuration
 FIREBASE_PROJECT_ID = config('FIREBASE_PROJECT_ID', default='lura-ai')
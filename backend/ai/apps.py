@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "ai"
+
+    def ready(self):
+        # Configura o Google AI e pré-carrega os modelos uma vez por processo,
+        # tirando esse custo da latência da primeira mensagem de chat
+        from firebase.model_registry import warm_up
+        warm_up()
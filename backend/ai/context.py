@@ -0,0 +1,171 @@
+# Janela de contexto das conversas com a IA
+# O histórico enviado ao modelo fica limitado: resumo acumulado das mensagens
+# antigas (AIConversation.summary) + as mensagens ainda não resumidas, cortadas
+# por um orçamento de tokens. O resumo é atualizado em background, por isso o
+# tamanho do prompt não cresce com a duração da conversa.
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from decouple import config
+from django.db import connection
+
+
+SUMMARY_ACK = 'Entendido, vou considerar esse contexto da conversa.'
+
+# Tamanho máximo de cada mensagem dentro do prompt de resumo
+_SUMMARY_MESSAGE_CHARS = 1500
+
+
+def token_budget() -> int:
+    return int(config('AI_CONTEXT_TOKEN_BUDGET', default='3000'))
+
+
+def recent_turns() -> int:
+    """Turnos (pergunta + resposta) mais recentes mantidos sempre na íntegra"""
+    return int(config('AI_CONTEXT_RECENT_TURNS', default='6'))
+
+
+def summary_batch_turns() -> int:
+    """Turnos antigos acumulados antes de o resumo ser atualizado"""
+    return int(config('AI_CONTEXT_SUMMARY_BATCH_TURNS', default='4'))
+
+
+def max_window_messages() -> int:
+    """Número máximo de mensagens não resumidas que vale a pena carregar"""
+    return (recent_turns() + summary_batch_turns()) * 2 + 1
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 caracteres por token
+    return len(text or '') // 4 + 1
+
+
+def build_context_window(messages: List[Dict[str, str]], summary: str = '') -> List[Dict[str, str]]:
+    """
+    Recebe as mensagens em ordem cronológica (a última é a pergunta atual) e
+    devolve as mais recentes que cabem no orçamento de tokens (descontado o
+    resumo) e no limite de turnos. A pergunta atual entra sempre.
+    """
+    budget = token_budget() - (estimate_tokens(summary) if summary else 0)
+    max_turns = recent_turns() + summary_batch_turns()
+
+    window = []
+    used = 0
+    turns = 0
+    for msg in reversed(messages):
+        cost = estimate_tokens(msg['content'])
+        if window and used + cost > budget:
+            break
+        if msg['role'] == 'user':
+            turns += 1
+            if turns > max_turns:
+                break
+        window.append(msg)
+        used += cost
+    window.reverse()
+
+    # O histórico enviado ao modelo começa sempre numa mensagem do usuário
+    while len(window) > 1 and window[0]['role'] != 'user':
+        window.pop(0)
+    return window
+
+
+def with_summary(window: List[Dict[str, str]], summary: str) -> List[Dict[str, str]]:
+    """Antepõe o resumo à janela como um par usuário/assistente (formato de chat_completion)"""
+    if not summary:
+        return window
+    return [
+        {'role': 'user', 'content': f'Resumo da conversa até agora: {summary}'},
+        {'role': 'assistant', 'content': SUMMARY_ACK},
+    ] + window
+
+
+def _summary_prompt(summary: str, messages) -> str:
+    lines = []
+    for msg in messages:
+        role = "Usuário" if msg['role'] == 'user' else "Assistente"
+        lines.append(f"{role}: {msg['content'][:_SUMMARY_MESSAGE_CHARS]}")
+    return (
+        "Atualize o resumo de uma conversa entre um agricultor e a Lura, assistente agrícola. "
+        "Mantenha os factos importantes: culturas, localização, problemas relatados, "
+        "recomendações dadas e decisões tomadas. Responda apenas com o resumo, em português, "
+        "com no máximo 200 palavras.\n\n"
+        f"Resumo atual:\n{summary or '(vazio)'}\n\n"
+        "Novas mensagens:\n" + "\n".join(lines)
+    )
+
+
+def refresh_summary(conversation_id: int) -> bool:
+    """
+    Incorpora no resumo as mensagens não resumidas que já saíram dos últimos
+    turnos, quando há pelo menos AI_CONTEXT_SUMMARY_BATCH_TURNS delas.
+    Retorna True se o resumo foi atualizado.
+    """
+    from firebase.ai_service import FirebaseAIService
+    from .models import AIConversation, AIMessage
+
+    conversation = AIConversation.objects.only('id', 'summary', 'summary_until').get(id=conversation_id)
+    messages = AIMessage.objects.filter(conversation_id=conversation_id)
+    if conversation.summary_until:
+        messages = messages.filter(timestamp__gt=conversation.summary_until)
+
+    # Início dos turnos recentes: a N-ésima pergunta do usuário a contar do fim
+    cutoff = list(
+        messages.filter(role='user').order_by('-timestamp')
+        .values_list('timestamp', flat=True)[recent_turns() - 1:recent_turns()]
+    )
+    if not cutoff:
+        return False
+
+    old_messages = messages.filter(timestamp__lt=cutoff[0])
+    if old_messages.filter(role='user').count() < summary_batch_turns():
+        return False
+
+    to_summarize = list(old_messages.order_by('timestamp').values('role', 'content', 'timestamp')[:max_window_messages()])
+    result = asyncio.run(FirebaseAIService().generate_text(
+        _summary_prompt(conversation.summary, to_summarize),
+        temperature=0.3,
+        max_output_tokens=512
+    ))
+    new_summary = (result.get('text') or '').strip() if result.get('success') else ''
+    if not new_summary:
+        print(f"⚠️ Resumo da conversa {conversation_id} não gerado: {result.get('error')}")
+        return False
+
+    # Só grava se ninguém atualizou o resumo entretanto
+    updated = AIConversation.objects.filter(
+        id=conversation_id, summary_until=conversation.summary_until
+    ).update(summary=new_summary, summary_until=to_summarize[-1]['timestamp'])
+    if updated:
+        print(f"📝 Resumo da conversa {conversation_id} atualizado ({len(to_summarize)} mensagens)")
+    return bool(updated)
+
+
+_summary_executor = ThreadPoolExecutor(
+    max_workers=int(config('AI_CONTEXT_SUMMARY_WORKERS', default='2')),
+    thread_name_prefix='ai-summary'
+)
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def _refresh_in_background(conversation_id: int):
+    try:
+        refresh_summary(conversation_id)
+    except Exception as e:
+        print(f"⚠️ Erro ao atualizar resumo da conversa {conversation_id}: {e}")
+    finally:
+        connection.close()
+        with _refreshing_lock:
+            _refreshing.discard(conversation_id)
+
+
+def schedule_summary_refresh(conversation_id: int):
+    """Agenda a atualização do resumo em background (no máximo uma por conversa de cada vez)"""
+    with _refreshing_lock:
+        if conversation_id in _refreshing:
+            return
+        _refreshing.add(conversation_id)
+    _summary_executor.submit(_refresh_in_background, conversation_id)
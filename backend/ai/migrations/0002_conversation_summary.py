@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aiconversation",
+            name="summary",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="aiconversation",
+            name="summary_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
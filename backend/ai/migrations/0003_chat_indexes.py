@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:48
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY não bloqueia escritas nas tabelas de chat,
+    # mas não pode correr dentro de uma transação
+    atomic = False
+
+    dependencies = [
+        ("ai", "0002_conversation_summary"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="aiconversation",
+            index=models.Index(
+                fields=["user", "is_active", "-updated_at"],
+                name="ai_conv_user_active_upd_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="aimessage",
+            index=models.Index(
+                fields=["conversation", "timestamp"], name="ai_msg_conv_ts_idx"
+            ),
+        ),
+    ]
@@ -27,10 +27,19 @@ class AIConversation(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     
+    # Resumo acumulado das mensagens antigas (ver ai/context.py); as mensagens
+    # com timestamp <= summary_until já estão incluídas no resumo
+    summary = models.TextField(blank=True, default='')
+    summary_until = models.DateTimeField(null=True, blank=True)
+    
     class Meta:
         ordering = ['-updated_at']
         verbose_name = 'Conversa AI'
         verbose_name_plural = 'Conversas AI'
+        indexes = [
+            # Sidebar/listagem: conversas ativas do usuário, mais recentes primeiro
+            models.Index(fields=['user', 'is_active', '-updated_at'], name='ai_conv_user_active_upd_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.title or 'Conversa'} ({self.created_at.strftime('%d/%m/%Y')})"
@@ -61,6 +70,10 @@ class AIMessage(models.Model):
         ordering = ['timestamp']
         verbose_name = 'Mensagem AI'
         verbose_name_plural = 'Mensagens AI'
+        indexes = [
+            # Histórico de uma conversa por ordem cronológica (e paginação por cursor)
+            models.Index(fields=['conversation', 'timestamp'], name='ai_msg_conv_ts_idx'),
+        ]
     
     def __str__(self):
         preview = self.content[:50] + "..." if len(self.content) > 50 else self.content
@@ -91,6 +104,7 @@ class AIUsageStats(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
+        # O índice único (user, date) também serve as consultas por intervalo de datas
         unique_together = ['user', 'date']
         ordering = ['-date']
         verbose_name = 'Estatística de Uso AI'
@@ -30,9 +30,38 @@ class AIConversationSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
     
     def get_message_count(self, obj):
+        # Com prefetch_related('messages') o count() usa o cache, sem nova query
         return obj.messages.count()
 
 
+class AIConversationListSerializer(serializers.ModelSerializer):
+    """
+    Representação leve para listagens (sidebar): sem mensagens aninhadas.
+    Espera um queryset anotado com message_count e last_message_*
+    (ver _with_list_annotations em ai/views.py).
+    """
+    message_count = serializers.IntegerField(read_only=True)
+    last_message = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = AIConversation
+        fields = [
+            'id', 'title', 'conversation_type', 'model_used',
+            'created_at', 'updated_at', 'is_active',
+            'message_count', 'last_message'
+        ]
+        read_only_fields = fields
+    
+    def get_last_message(self, obj):
+        if not obj.last_message_at:
+            return None
+        return {
+            'role': obj.last_message_role,
+            'preview': obj.last_message_preview,
+            'timestamp': serializers.DateTimeField().to_representation(obj.last_message_at)
+        }
+
+
 class AIFeedbackSerializer(serializers.ModelSerializer):
     """Serializer para feedback AI"""
     message_id = serializers.IntegerField(write_only=True)
@@ -120,6 +149,8 @@ class AIProxyChatSerializer(serializers.Serializer):
         min_length=1
     )
     image_data = serializers.CharField(required=False, allow_null=True, allow_blank=True, max_length=5000000)  # 5MB limit for base64 images
+    # Conversa guardada no backend (opcional): permite usar o resumo das mensagens antigas
+    conversation_id = serializers.IntegerField(required=False, allow_null=True)
     
     def validate_messages(self, value):
         if not value:
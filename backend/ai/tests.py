@@ -1,3 +1,550 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from firebase import response_cache
+from firebase.ai_service import FirebaseAIService, _stream_content_event, _stream_done_event
+from firebase.markdown_renderer import IncrementalMarkdownRenderer, _markdown_to_html
+
+from . import context as conversation_context
+from . import usage
+from .models import AIConversation, AIMessage, AIUsageStats
+
+User = get_user_model()
+
+GOLDEN_MARKDOWN_PATH = os.path.join(os.path.dirname(__file__), 'test_data', 'markdown_golden.json')
+
+
+class MarkdownGoldenCorpusTests(SimpleTestCase):
+    """O renderer deve produzir exatamente o HTML do corpus de referência"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(GOLDEN_MARKDOWN_PATH, encoding='utf-8') as f:
+            cls.cases = json.load(f)['cases']
+
+    def test_full_document(self):
+        for case in self.cases:
+            with self.subTest(case=case['name']):
+                self.assertEqual(_markdown_to_html(case['markdown']), case['html'])
+
+    def test_streamed_in_chunks(self):
+        for case in self.cases:
+            for chunk_size in (1, 7, 64):
+                with self.subTest(case=case['name'], chunk_size=chunk_size):
+                    renderer = IncrementalMarkdownRenderer()
+                    text = case['markdown']
+                    html = ''.join(renderer.feed(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size))
+                    html += renderer.finish()
+                    self.assertEqual(html, case['html'])
+
+
+class ConversationListQueryTests(TestCase):
+    """Listagens de conversas sem N+1 e mensagens paginadas por cursor"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='agricultor', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _create_conversations(self, count, messages_per_conversation=3):
+        for i in range(count):
+            conversation = AIConversation.objects.create(user=self.user, title=f'Conversa {i}')
+            for j in range(messages_per_conversation):
+                AIMessage.objects.create(
+                    conversation=conversation,
+                    role='user' if j % 2 == 0 else 'assistant',
+                    content=f'Mensagem {j} da conversa {i} ' + 'x' * 200
+                )
+
+    def _count_list_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_list_query_count_does_not_grow_with_conversations(self):
+        for url in ('/api/ai/conversations/', '/api/ai/conversations/list/'):
+            with self.subTest(url=url):
+                AIConversation.objects.all().delete()
+                self._create_conversations(2)
+                few, _ = self._count_list_queries(url)
+                self._create_conversations(18)
+                many, response = self._count_list_queries(url)
+                self.assertEqual(few, many)
+                self.assertLessEqual(many, 2)  # COUNT da paginação + página
+
+                conversation = response.json()['results'][0]
+                self.assertNotIn('messages', conversation)
+                self.assertEqual(conversation['message_count'], 3)
+                self.assertEqual(conversation['last_message']['role'], 'user')
+                self.assertTrue(conversation['last_message']['preview'].startswith('Mensagem 2'))
+                self.assertLessEqual(len(conversation['last_message']['preview']), 120)
+
+    def test_messages_cursor_pagination(self):
+        conversation = AIConversation.objects.create(user=self.user, title='Longa')
+        ids = [
+            AIMessage.objects.create(conversation=conversation, role='user', content=f'm{i}').id
+            for i in range(7)
+        ]
+        url = f'/api/ai/conversations/{conversation.id}/messages/'
+
+        page = self.client.get(url, {'limit': 3}).json()
+        self.assertEqual([m['id'] for m in page['results']], ids[4:])
+        self.assertTrue(page['has_more'])
+
+        page = self.client.get(url, {'limit': 3, 'before': page['next_before']}).json()
+        self.assertEqual([m['id'] for m in page['results']], ids[1:4])
+
+        page = self.client.get(url, {'limit': 3, 'before': page['next_before']}).json()
+        self.assertEqual([m['id'] for m in page['results']], ids[:1])
+        self.assertFalse(page['has_more'])
+        self.assertIsNone(page['next_before'])
+
+    def test_messages_of_other_user_conversation(self):
+        other = User.objects.create_user(username='outro', password='x')
+        conversation = AIConversation.objects.create(user=other, title='Privada')
+        response = self.client.get(f'/api/ai/conversations/{conversation.id}/messages/')
+        self.assertEqual(response.status_code, 404)
+
+
+@mock.patch.dict(os.environ, {'FIREBASE_AI_DEV_MOCK': 'true', 'AI_RESPONSE_CACHE_ENABLED': 'false'})
+class UsageStatsConcurrencyTests(TransactionTestCase):
+    """Contadores de AIUsageStats exatos com pedidos e gravações em paralelo"""
+
+    def setUp(self):
+        usage.flush()
+        self.users = [User.objects.create_user(username=f'produtor{i}', password='x') for i in range(2)]
+
+    def test_parallel_requests_are_counted_exactly(self):
+        requests_per_user = 20
+
+        def ask(args):
+            user, i = args
+            client = APIClient()
+            client.force_authenticate(user)
+            response = client.post('/api/ai/agriculture/', {'query': f'Pergunta {i}'}, format='json')
+            return response.status_code
+
+        jobs = [(user, i) for user in self.users for i in range(requests_per_user)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            status_codes = list(pool.map(ask, jobs))
+        self.assertEqual(set(status_codes), {200})
+
+        usage.flush()
+        for user in self.users:
+            stats = AIUsageStats.objects.get(user=user)
+            self.assertEqual(stats.total_requests, requests_per_user)
+            self.assertEqual(stats.agriculture_requests, requests_per_user)
+            self.assertEqual(stats.general_requests, 0)
+
+    def test_concurrent_upserts_from_several_workers(self):
+        # Cada thread faz de conta que é um worker diferente a gravar a mesma linha ao mesmo tempo
+        workers = 6
+        barrier = threading.Barrier(workers)
+        today = timezone.now().date()
+        user = self.users[0]
+
+        def flush_as_worker(_):
+            counters = dict.fromkeys(usage._COUNTER_FIELDS, 0)
+            counters.update(total_requests=5, general_requests=5, total_tokens_used=100)
+            barrier.wait()
+            try:
+                with transaction.atomic():
+                    usage._upsert([((user.pk, today), counters)])
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(flush_as_worker, range(workers)))
+
+        stats = AIUsageStats.objects.get(user=user, date=today)
+        self.assertEqual(stats.total_requests, 5 * workers)
+        self.assertEqual(stats.general_requests, 5 * workers)
+        self.assertEqual(stats.total_tokens_used, 100 * workers)
+
+
+class FakeStreamingAIService:
+    """FirebaseAIService de teste: o segundo evento só sai quando `release` é activado"""
+    is_configured = True
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.prompts = []
+
+    async def generate_text_stream(self, prompt, model_name=None, image_data=None, cache_key=None):
+        self.prompts.append(prompt)
+        yield {'type': 'content', 'text': 'Olá ', 'done': False}
+        await self.release.wait()
+        yield {'type': 'done', 'done': True, 'model': 'fake'}
+
+
+class AIChatStreamViewTests(TestCase):
+    """O chat em SSE envia cada evento assim que é gerado (sem juntar a resposta toda)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='agricultor', password='x', first_name='Ana')
+        self.async_client = AsyncClient()
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    async def test_first_event_arrives_before_generator_finishes(self):
+        service = FakeStreamingAIService()
+        with mock.patch('ai.views.FirebaseAIService', return_value=service):
+            response = await self.async_client.post(
+                '/api/ai/proxy/chat/stream/',
+                {'messages': [{'role': 'user', 'content': 'Como plantar milho?'}]},
+                content_type='application/json', headers=self.auth
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+            events = response.streaming_content.__aiter__()
+            first = await asyncio.wait_for(events.__anext__(), timeout=2)
+            self.assertIn('"text": "Olá "', first.decode())
+            self.assertFalse(service.release.is_set())
+
+            service.release.set()
+            rest = [chunk async for chunk in events]
+        self.assertIn('"done": true', rest[-1].decode())
+
+
+def fake_model_stream(*responses, truncated=False):
+    """_generate_text_stream de teste: cada resposta é um modelo; só o último termina"""
+    calls = []
+
+    async def generate(self, prompt, *args, **kwargs):
+        calls.append(prompt)
+        renderer = None
+        for text in responses:
+            # Um modelo que falha a meio já emitiu o texto dele; o seguinte recomeça
+            renderer = IncrementalMarkdownRenderer()
+            yield _stream_content_event(renderer, text)
+        yield _stream_done_event(renderer, model='gemini-2.5-flash', chunks=1, truncated=truncated)
+
+    return generate, calls
+
+
+@mock.patch.dict(os.environ, {'AI_RESPONSE_CACHE_ENABLED': 'true'})
+class ResponseCacheKeyTests(SimpleTestCase):
+    """Chave do cache de respostas: pergunta normalizada + província + tipo de utilizador + modelo"""
+
+    def test_equivalent_questions_share_key(self):
+        self.assertEqual(
+            response_cache.build_cache_key('Quando plantar Milho em Nampula?', 'Nampula'),
+            response_cache.build_cache_key('quando   plantar milho nampula', ' nampula '),
+        )
+        self.assertEqual(response_cache.normalize_prompt('Olá, como é a rega do feijão?'), 'como e rega feijao')
+
+    def test_meaning_words_change_key(self):
+        for with_word, without in (('Plantar mais cedo?', 'Plantar cedo?'),
+                                   ('Regar muito o milho?', 'Regar o milho?'),
+                                   ('Adubar até a floração?', 'Adubar a floração?'),
+                                   ('Milho ou feijão em Nampula?', 'Milho feijão em Nampula?')):
+            self.assertNotEqual(response_cache.build_cache_key(with_word, 'Nampula'),
+                                response_cache.build_cache_key(without, 'Nampula'), with_word)
+
+    def test_personalised_fields_change_key(self):
+        base = response_cache.build_cache_key('Quando plantar milho?', 'Nampula', tipo_usuario='agricultor')
+        self.assertNotEqual(base, response_cache.build_cache_key('Quando plantar milho?', 'Sofala', tipo_usuario='agricultor'))
+        self.assertNotEqual(base, response_cache.build_cache_key('Quando plantar milho?', 'Nampula', tipo_usuario='tecnico'))
+        self.assertNotEqual(base, response_cache.build_cache_key('Quando plantar milho?', 'Nampula'))
+
+    def test_empty_question_has_no_key(self):
+        self.assertIsNone(response_cache.build_cache_key('Olá, obrigado! ', 'Nampula'))
+
+
+@mock.patch.dict(os.environ, {'AI_RESPONSE_CACHE_ENABLED': 'true', 'FIREBASE_AI_DEV_MOCK': 'true'})
+@mock.patch('firebase.ai_service.is_firebase_configured', return_value=True)
+class AIChatStreamCacheTests(TestCase):
+    """Respostas do chat em cache partilhadas entre utilizadores sem dados pessoais"""
+
+    def setUp(self):
+        caches[response_cache.CACHE_ALIAS].clear()
+        self.async_client = AsyncClient()
+
+    @sync_to_async
+    def _user(self, username, first_name, tipo='agricultor'):
+        user = User.objects.create_user(username=username, password='x', first_name=first_name,
+                                        provincia='Nampula', tipo_usuario=tipo)
+        return {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+
+    async def _ask(self, auth, question='Quando plantar milho?'):
+        response = await self.async_client.post(
+            '/api/ai/proxy/chat/stream/', {'messages': [{'role': 'user', 'content': question}]},
+            content_type='application/json', headers=auth
+        )
+        self.assertEqual(response.status_code, 200)
+        events = [json.loads(chunk.decode()[len('data: '):]) async for chunk in response.streaming_content]
+        return events[-1]
+
+    async def test_answer_replayed_across_users_without_name(self, _configured):
+        ana = await self._user('ana', 'Ana')
+        rui = await self._user('rui', 'Rui')
+        tecnico = await self._user('tecnico', 'Tito', tipo='tecnico')
+        generate, calls = fake_model_stream('Plante no início das chuvas.')
+        with mock.patch.object(FirebaseAIService, '_generate_text_stream', generate):
+            first = await self._ask(ana)
+            second = await self._ask(rui)
+            third = await self._ask(tecnico)
+
+        self.assertNotIn('cached', first)
+        self.assertTrue(second['cached'])
+        self.assertNotIn('cached', third)
+        self.assertEqual(len(calls), 2)
+        for prompt in calls:
+            self.assertNotIn('Ana', prompt)
+            self.assertNotIn('Tito', prompt)
+            self.assertNotIn('primeiro nome', prompt)
+        self.assertIn('Localização: Nampula', calls[0])
+
+    async def test_conversation_prompt_keeps_name_and_skips_cache(self, _configured):
+        ana = await self._user('ana', 'Ana')
+        generate, calls = fake_model_stream('Depende da região.')
+        with mock.patch.object(FirebaseAIService, '_generate_text_stream', generate), \
+                mock.patch.object(response_cache, 'get_response') as get_response:
+            response = await self.async_client.post(
+                '/api/ai/proxy/chat/stream/',
+                {'messages': [{'role': 'user', 'content': 'Olá'}, {'role': 'assistant', 'content': 'Olá!'},
+                              {'role': 'user', 'content': 'Quando plantar milho?'}]},
+                content_type='application/json', headers=ana
+            )
+            [chunk async for chunk in response.streaming_content]
+        self.assertIn('Nome do usuário: Ana', calls[0])
+        get_response.assert_not_called()
+
+
+@mock.patch.dict(os.environ, {'AI_RESPONSE_CACHE_ENABLED': 'true', 'FIREBASE_AI_DEV_MOCK': 'true'})
+class StreamCacheStoreTests(SimpleTestCase):
+    """Só respostas em streaming completas vão para o cache"""
+
+    def setUp(self):
+        caches[response_cache.CACHE_ALIAS].clear()
+        self.key = response_cache.build_cache_key('Quando plantar milho?', 'Nampula')
+
+    def _stream(self, generate):
+        async def consume():
+            with mock.patch.object(FirebaseAIService, '_generate_text_stream', generate):
+                events = [event async for event in FirebaseAIService().generate_text_stream(
+                    'prompt', cache_key=self.key)]
+            return events, await response_cache.get_response(self.key)
+        return asyncio.run(consume())
+
+    def test_complete_stream_is_stored(self):
+        _, cached = self._stream(fake_model_stream('Plante no início das chuvas.')[0])
+        self.assertEqual(cached['text'], 'Plante no início das chuvas.')
+
+    def test_stream_after_model_failover_is_not_stored(self):
+        events, cached = self._stream(fake_model_stream('Plante no iní', 'Plante no início das chuvas.')[0])
+        self.assertEqual(events[-1]['type'], 'done')
+        self.assertIsNone(cached)
+
+    def test_truncated_stream_is_not_stored(self):
+        _, cached = self._stream(fake_model_stream('Plante no início', truncated=True)[0])
+        self.assertIsNone(cached)
+
+    def test_stream_abandoned_before_done_is_not_stored(self):
+        async def consume():
+            with mock.patch.object(FirebaseAIService, '_generate_text_stream',
+                                   fake_model_stream('Plante no início das chuvas.')[0]):
+                stream = FirebaseAIService().generate_text_stream('prompt', cache_key=self.key)
+                await stream.__anext__()
+                await stream.aclose()
+            return await response_cache.get_response(self.key)
+        self.assertIsNone(asyncio.run(consume()))
+
+
+def _msg(role, tokens, label=''):
+    # estimate_tokens: ~4 caracteres por token (+1)
+    return {'role': role, 'content': label + 'x' * ((tokens - 1) * 4 - len(label))}
+
+
+@mock.patch.dict(os.environ, {'AI_CONTEXT_TOKEN_BUDGET': '300', 'AI_CONTEXT_RECENT_TURNS': '2',
+                              'AI_CONTEXT_SUMMARY_BATCH_TURNS': '1'})
+class ContextWindowTests(SimpleTestCase):
+    """Janela de contexto: orçamento de tokens, limite de turnos, começa numa pergunta"""
+
+    def test_trimmed_to_token_budget(self):
+        messages = [_msg('user', 100, 'p1'), _msg('assistant', 100, 'r1'),
+                    _msg('user', 100, 'p2'), _msg('assistant', 100, 'r2'), _msg('user', 50, 'p3')]
+        window = conversation_context.build_context_window(messages)
+        # p3 + r2 + p2 = 250 tokens; com r1 passaria dos 300
+        self.assertEqual([m['content'][:2] for m in window], ['p2', 'r2', 'p3'])
+        self.assertLessEqual(sum(conversation_context.estimate_tokens(m['content']) for m in window), 300)
+
+    def test_window_starts_with_user_message(self):
+        messages = [_msg('user', 100, 'p1'), _msg('assistant', 100, 'r1'), _msg('user', 200, 'p2'),
+                    _msg('assistant', 100, 'r2'), _msg('user', 50, 'p3')]
+        # r2 + p3 cabem, p2 já não: a janela não pode começar na resposta r2
+        window = conversation_context.build_context_window(messages)
+        self.assertEqual([m['content'][:2] for m in window], ['p3'])
+
+    def test_current_question_always_included(self):
+        window = conversation_context.build_context_window([_msg('user', 10, 'p1'), _msg('user', 1000, 'p2')])
+        self.assertEqual([m['content'][:2] for m in window], ['p2'])
+
+    def test_summary_uses_part_of_the_budget(self):
+        messages = [_msg('user', 100, 'p1'), _msg('assistant', 100, 'r1'), _msg('user', 50, 'p2')]
+        self.assertEqual(len(conversation_context.build_context_window(messages)), 3)
+        window = conversation_context.build_context_window(messages, summary='y' * 400)
+        self.assertEqual([m['content'][:2] for m in window], ['p2'])
+
+    def test_turn_limit(self):
+        messages = []
+        for i in range(6):
+            messages += [_msg('user', 5, f'p{i}'), _msg('assistant', 5, f'r{i}')]
+        messages.append(_msg('user', 5, 'p6'))
+        window = conversation_context.build_context_window(messages)
+        # recent_turns + summary_batch_turns = 3 perguntas
+        self.assertEqual([m['content'][:2] for m in window], ['p4', 'r4', 'p5', 'r5', 'p6'])
+
+    def test_with_summary(self):
+        window = [{'role': 'user', 'content': 'Quando colher?'}]
+        self.assertEqual(conversation_context.with_summary(window, ''), window)
+        with_summary = conversation_context.with_summary(window, 'Milho em Nampula')
+        self.assertEqual([m['role'] for m in with_summary], ['user', 'assistant', 'user'])
+        self.assertIn('Milho em Nampula', with_summary[0]['content'])
+        self.assertEqual(with_summary[1]['content'], conversation_context.SUMMARY_ACK)
+
+
+@mock.patch.dict(os.environ, {'AI_CONTEXT_RECENT_TURNS': '2', 'AI_CONTEXT_SUMMARY_BATCH_TURNS': '2'})
+class RefreshSummaryTests(TestCase):
+    """Resumo das mensagens antigas: fronteira summary_until e atualização otimista"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='agricultor', password='x')
+        self.conversation = AIConversation.objects.create(user=user, title='Milho')
+        self.start = timezone.now() - timedelta(hours=1)
+        self.turns = 0
+        self.prompts = []
+
+    def _add_turns(self, count):
+        for _ in range(count):
+            self.turns += 1
+            for offset, role in enumerate(('user', 'assistant')):
+                AIMessage.objects.create(
+                    conversation=self.conversation, role=role, content=f'{role} {self.turns};',
+                    timestamp=self.start + timedelta(minutes=self.turns * 2 + offset)
+                )
+
+    def _model(self, text='Resumo', before=None):
+        """generate_text de teste; `before` corre antes da resposta (fora do event loop)"""
+        def generate_text(service, prompt, **kwargs):
+            self.prompts.append(prompt)
+            if before:
+                before()
+
+            async def result():
+                return {'success': True, 'text': text}
+            return result()
+        return mock.patch.object(FirebaseAIService, 'generate_text', generate_text)
+
+    def _refresh(self, **kwargs):
+        with self._model(**kwargs):
+            return conversation_context.refresh_summary(self.conversation.id)
+
+    def test_summary_until_boundary(self):
+        self._add_turns(3)
+        # 3 turnos: 2 recentes + 1 antigo, menos do que AI_CONTEXT_SUMMARY_BATCH_TURNS
+        self.assertFalse(self._refresh())
+        self.assertEqual(self.prompts, [])
+
+        self._add_turns(1)
+        self.assertTrue(self._refresh(text='Resumo 1'))
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, 'Resumo 1')
+        # Turnos 1-2 resumidos; 3-4 ficam na íntegra
+        self.assertEqual(self.conversation.summary_until,
+                         AIMessage.objects.get(content='assistant 2;').timestamp)
+        self.assertIn('user 2;', self.prompts[0])
+        self.assertNotIn('user 3;', self.prompts[0])
+
+        self._add_turns(1)
+        self.assertFalse(self._refresh())
+
+        self._add_turns(1)
+        self.assertTrue(self._refresh(text='Resumo 2'))
+        # Só as mensagens depois de summary_until, mais o resumo anterior
+        prompt = self.prompts[-1]
+        self.assertIn('Resumo 1', prompt)
+        self.assertNotIn('user 2;', prompt)
+        self.assertIn('user 3;', prompt)
+        self.assertIn('assistant 4;', prompt)
+        self.assertNotIn('user 5;', prompt)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary_until,
+                         AIMessage.objects.get(content='assistant 4;').timestamp)
+
+    def test_racing_refresh_does_not_overwrite(self):
+        self._add_turns(4)
+        concurrent_until = AIMessage.objects.get(content='assistant 2;').timestamp
+
+        def other_refresh_finishes():
+            # Outro worker grava o resumo enquanto este espera pelo modelo
+            AIConversation.objects.filter(id=self.conversation.id).update(
+                summary='Resumo do outro worker', summary_until=concurrent_until
+            )
+
+        self.assertFalse(self._refresh(text='Resumo atrasado', before=other_refresh_finishes))
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, 'Resumo do outro worker')
+        self.assertEqual(self.conversation.summary_until, concurrent_until)
+
+    def test_failed_model_call_keeps_summary(self):
+        self._add_turns(4)
+        with mock.patch.object(FirebaseAIService, 'generate_text',
+                               mock.AsyncMock(return_value={'success': False, 'error': 'quota'})):
+            self.assertFalse(conversation_context.refresh_summary(self.conversation.id))
+        self.conversation.refresh_from_db()
+        self.assertEqual((self.conversation.summary, self.conversation.summary_until), ('', None))
+
+
+class AIChatStreamConversationTests(TestCase):
+    """conversation_id no chat em SSE: resumo da conversa no prompt, só para o dono"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='agricultor', password='x', first_name='Ana')
+        self.other = User.objects.create_user(username='outro', password='x')
+        self.async_client = AsyncClient()
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    async def _ask(self, conversation_id):
+        service = FakeStreamingAIService()
+        service.release.set()
+        with mock.patch('ai.views.FirebaseAIService', return_value=service), \
+                mock.patch.object(conversation_context, 'schedule_summary_refresh') as schedule:
+            response = await self.async_client.post(
+                '/api/ai/proxy/chat/stream/',
+                {'messages': [{'role': 'user', 'content': 'E a rega?'}], 'conversation_id': conversation_id},
+                content_type='application/json', headers=self.auth
+            )
+            [chunk async for chunk in response.streaming_content]
+        return service.prompts[0], schedule
+
+    async def test_own_conversation_summary_in_prompt(self):
+        conversation = await AIConversation.objects.acreate(user=self.user, summary='Milho plantado em Outubro')
+        prompt, schedule = await self._ask(conversation.id)
+        self.assertIn('Resumo da conversa até agora: Milho plantado em Outubro', prompt)
+        self.assertIn('Nome do usuário: Ana', prompt)
+        schedule.assert_called_once_with(conversation.id)
+
+    async def test_other_user_conversation_ignored(self):
+        conversation = await AIConversation.objects.acreate(user=self.other, summary='Segredo do outro')
+        prompt, schedule = await self._ask(conversation.id)
+        self.assertNotIn('Segredo do outro', prompt)
+        self.assertNotIn('Resumo da conversa', prompt)
+        schedule.assert_not_called()
@@ -0,0 +1,126 @@
+# Contabilização de uso da IA (AIUsageStats)
+# Os pedidos só acumulam contadores em memória (sem tocar na base de dados);
+# uma thread do processo grava-os a cada AI_USAGE_FLUSH_INTERVAL segundos com
+# um único INSERT ... ON CONFLICT DO UPDATE que soma os valores na própria
+# linha, exato mesmo com vários workers a gravar o mesmo (user, date).
+
+import atexit
+import threading
+from collections import defaultdict
+from decouple import config
+from django.db import connection, transaction
+from django.utils import timezone
+
+
+# request_type -> contador específico incrementado além de total_requests
+_TYPE_COUNTERS = {
+    'agriculture': 'agriculture_requests',
+    'pest_analysis': 'pest_analysis_requests',
+    'general': 'general_requests',
+}
+
+_COUNTER_FIELDS = [
+    'total_requests',
+    'total_tokens_used',
+    'total_conversations',
+    'agriculture_requests',
+    'pest_analysis_requests',
+    'general_requests',
+    'total_processing_time',
+]
+
+_lock = threading.Lock()
+_pending = defaultdict(lambda: dict.fromkeys(_COUNTER_FIELDS, 0))  # (user_id, date) -> incrementos
+_flusher = None
+_flush_lock = threading.Lock()
+
+
+def _flush_interval() -> float:
+    return float(config('AI_USAGE_FLUSH_INTERVAL', default='5'))
+
+
+def record_usage(user, request_type: str, processing_time: float, usage_info=None):
+    """Regista um pedido de IA; a gravação na base de dados acontece em background"""
+    usage_info = usage_info or {}
+    key = (user.pk, timezone.now().date())
+    with _lock:
+        counters = _pending[key]
+        counters['total_requests'] += 1
+        counters[_TYPE_COUNTERS.get(request_type, 'general_requests')] += 1
+        counters['total_processing_time'] += processing_time
+        counters['total_tokens_used'] += usage_info.get('completion_tokens', 0) or 0
+    _ensure_flusher()
+
+
+# Linhas por INSERT (cada linha usa 11 parâmetros)
+_UPSERT_BATCH_SIZE = 1000
+
+
+def _upsert(rows):
+    from .models import AIUsageStats
+
+    table = AIUsageStats._meta.db_table
+    columns = ['user_id', 'date'] + _COUNTER_FIELDS
+    values_sql = ', '.join(['(' + ', '.join(['%s'] * (len(columns) + 2)) + ')'] * len(rows))
+    updates = ', '.join(f'{field} = {table}.{field} + EXCLUDED.{field}' for field in _COUNTER_FIELDS)
+    sql = (
+        f'INSERT INTO {table} ({", ".join(columns)}, created_at, updated_at) VALUES {values_sql} '
+        f'ON CONFLICT (user_id, date) DO UPDATE SET {updates}, updated_at = EXCLUDED.updated_at'
+    )
+    now = timezone.now()
+    params = []
+    for (user_id, date), counters in rows:
+        params.extend([user_id, date] + [counters[field] for field in _COUNTER_FIELDS] + [now, now])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def flush() -> int:
+    """Grava os contadores acumulados; retorna o número de linhas (user, date) afetadas"""
+    with _flush_lock:
+        with _lock:
+            if not _pending:
+                return 0
+            rows = sorted(_pending.items(), key=lambda item: item[0])  # ordem fixa evita deadlocks entre workers
+            _pending.clear()
+        try:
+            with transaction.atomic():
+                for i in range(0, len(rows), _UPSERT_BATCH_SIZE):
+                    _upsert(rows[i:i + _UPSERT_BATCH_SIZE])
+        except Exception as e:
+            # Devolver os incrementos para a próxima tentativa
+            with _lock:
+                for key, counters in rows:
+                    for field, value in counters.items():
+                        _pending[key][field] += value
+            print(f"⚠️ Erro ao gravar estatísticas de uso da IA: {e}")
+            return 0
+        return len(rows)
+
+
+def _flush_loop(stop_event):
+    while not stop_event.wait(_flush_interval()):
+        try:
+            flush()
+        finally:
+            connection.close()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            stop_event = threading.Event()
+            thread = threading.Thread(target=_flush_loop, args=(stop_event,), name='ai-usage-flush', daemon=True)
+            thread.start()
+            _flusher = (thread, stop_event)
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        flush()
+    except Exception:
+        pass
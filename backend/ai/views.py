@@ -4,8 +4,10 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.utils import timezone
-from django.db.models import F
+from django.db.models import Q, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Left
 from django.http import StreamingHttpResponse
+from asgiref.sync import sync_to_async
 import asyncio
 import time
 import json
@@ -13,6 +15,7 @@ import json
 from .models import AIConversation, AIMessage, AIUsageStats, AIFeedback
 from .serializers import (
     AIConversationSerializer, 
+    AIConversationListSerializer,
     AIMessageSerializer,
     AIFeedbackSerializer,
     ChatRequestSerializer,
@@ -21,6 +24,9 @@ from .serializers import (
     AIProxyChatSerializer
 )
 from firebase.ai_service import FirebaseAIService
+from firebase import response_cache
+from . import context as conversation_context
+from . import usage
 import logging
 
 logger = logging.getLogger(__name__)
@@ -40,55 +46,122 @@ from django.core.cache import cache
 from rest_framework.exceptions import Throttled
 import firebase_admin.app_check
 
+def _check_app_check(request):
+    """Retorna uma Response de erro se o App Check token for inválido, senão None"""
+    if not settings.DEBUG and settings.FIREBASE_APP_CHECK_ENABLED:
+        token = request.headers.get('X-Firebase-AppCheck')
+        if not token:
+            return Response(
+                {'error': 'App Check token não fornecido'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        try:
+            app = firebase_admin.get_app()
+            firebase_admin.app_check.verify_token(token, app)
+        except Exception as e:
+            return Response(
+                {'error': 'App Check token inválido'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+    return None
+
 def validate_app_check(view_func):
-    """Decorator para validar App Check token do Firebase"""
+    """Decorator para validar App Check token do Firebase (views sync e async)"""
+    if asyncio.iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(view, request, *args, **kwargs):
+            error_response = await sync_to_async(_check_app_check)(request)
+            if error_response is not None:
+                return error_response
+            return await view_func(view, request, *args, **kwargs)
+        return async_wrapper
+
     @wraps(view_func)
     def wrapper(view, request, *args, **kwargs):
-        if not settings.DEBUG and settings.FIREBASE_APP_CHECK_ENABLED:
-            token = request.headers.get('X-Firebase-AppCheck')
-            if not token:
-                return Response(
-                    {'error': 'App Check token não fornecido'}, 
-                    status=status.HTTP_403_FORBIDDEN
-                )
-            try:
-                app = firebase_admin.get_app()
-                firebase_admin.app_check.verify_token(token, app)
-            except Exception as e:
-                return Response(
-                    {'error': 'App Check token inválido'}, 
-                    status=status.HTTP_403_FORBIDDEN
-                )
+        error_response = _check_app_check(request)
+        if error_response is not None:
+            return error_response
         return view_func(view, request, *args, **kwargs)
     return wrapper
 
+def _consume_rate_limit(request, key_prefix, limit, period):
+    """Incrementa o contador do cliente e levanta Throttled se o limite foi atingido"""
+    if hasattr(request, 'user') and request.user.is_authenticated:
+        key = f"rate_limit:{key_prefix}:{request.user.id}"
+    else:
+        key = f"rate_limit:{key_prefix}:{request.META.get('REMOTE_ADDR')}"
+    
+    count = cache.get(key, 0)
+    if count >= limit:
+        raise Throttled(wait=period)
+    
+    cache.set(key, count + 1, period)
+
 def rate_limit(key_prefix, limit=60, period=60):
-    """Decorator para rate limiting baseado em cache"""
+    """Decorator para rate limiting baseado em cache (views sync e async)"""
     def decorator(view_func):
+        if asyncio.iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(view, request, *args, **kwargs):
+                await sync_to_async(_consume_rate_limit)(request, key_prefix, limit, period)
+                return await view_func(view, request, *args, **kwargs)
+            return async_wrapper
+
         @wraps(view_func)
         def wrapper(view, request, *args, **kwargs):
-            if hasattr(request, 'user') and request.user.is_authenticated:
-                key = f"rate_limit:{key_prefix}:{request.user.id}"
-            else:
-                key = f"rate_limit:{key_prefix}:{request.META.get('REMOTE_ADDR')}"
-            
-            count = cache.get(key, 0)
-            if count >= limit:
-                raise Throttled(wait=period)
-            
-            cache.set(key, count + 1, period)
+            _consume_rate_limit(request, key_prefix, limit, period)
             return view_func(view, request, *args, **kwargs)
         return wrapper
     return decorator
 
 
-class AIProxyGenerateView(APIView):
+class AsyncAPIView(APIView):
+    """
+    APIView com dispatch assíncrono.
+
+    Autenticação, permissões e throttling do DRF (que podem tocar na base de
+    dados) correm via sync_to_async; os handlers (`async def post`) correm no
+    event loop, por isso as chamadas ao FirebaseAIService não ocupam um worker
+    enquanto esperam pelo Gemini. Sob ASGI (uvicorn) um único worker mantém
+    centenas de requests em curso; sob WSGI o Django continua a servir a view
+    através de async_to_sync.
+    """
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(),
+                                  self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AIProxyGenerateView(AsyncAPIView):
     """View para proxy de geração de texto via Firebase AI Logic"""
     permission_classes = [permissions.IsAuthenticated]
 
     @validate_app_check
     @rate_limit("ai_generate", limit=30, period=60)
-    def post(self, request):
+    async def post(self, request):
         serializer = AIProxyGenerateSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -101,17 +174,10 @@ class AIProxyGenerateView(APIView):
             )
 
         start_time = time.time()
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(
-                ai_service.generate_text(
-                    prompt=serializer.validated_data['prompt'],
-                    model_name=serializer.validated_data.get('model', 'gemini-pro')
-                )
-            )
-        finally:
-            loop.close()
+        result = await ai_service.generate_text(
+            prompt=serializer.validated_data['prompt'],
+            model_name=serializer.validated_data.get('model', 'gemini-pro')
+        )
 
         processing_time = time.time() - start_time
         
@@ -137,13 +203,13 @@ class AIProxyGenerateView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class AIChatProxyView(APIView):
+class AIChatProxyView(AsyncAPIView):
     """View para proxy de chat via Firebase AI Logic"""
     permission_classes = [permissions.IsAuthenticated]
 
     @validate_app_check
     @rate_limit("ai_chat", limit=20, period=60)
-    def post(self, request):
+    async def post(self, request):
         serializer = AIProxyChatSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -181,16 +247,9 @@ class AIChatProxyView(APIView):
             })
 
         start_time = time.time()
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(
-                ai_service.chat_completion(
-                    messages=messages
-                )
-            )
-        finally:
-            loop.close()
+        result = await ai_service.chat_completion(
+            messages=messages
+        )
 
         processing_time = time.time() - start_time
 
@@ -213,15 +272,17 @@ class AIChatProxyView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class AIChatStreamView(APIView):
+class AIChatStreamView(AsyncAPIView):
     """View para chat com streaming em tempo real (Server-Sent Events)"""
     permission_classes = [permissions.IsAuthenticated]
     
     @rate_limit("ai_chat_stream", limit=20, period=60)
-    def post(self, request):
+    async def post(self, request):
         """
         Endpoint de streaming que retorna chunks de texto conforme são gerados
-        Usa Server-Sent Events (SSE) para streaming real
+        Usa Server-Sent Events (SSE) para streaming real: o async generator vai
+        directo para o StreamingHttpResponse, que sob ASGI envia cada evento
+        assim que é gerado
         """
         serializer = AIProxyChatSerializer(data=request.data)
         if not serializer.is_valid():
@@ -248,18 +309,33 @@ class AIChatStreamView(APIView):
         # Construir contexto do chat
         prompt_parts = []
 
-        # Obter informações do usuário
+        # Pergunta isolada (sem histórico, conversa nem imagem): a resposta pode vir
+        # do cache e ser partilhada entre utilizadores, por isso o prompt não leva o
+        # nome; província e tipo de utilizador entram no prompt e na chave
         user = request.user
-        user_name = user.get_full_name() or user.first_name or user.username
-        # Extrair apenas o primeiro nome para uma abordagem mais amigável
-        first_name_only = user.first_name if user.first_name else user_name.split()[0] if user_name else "amigo(a)"
-        user_info = f"Nome do usuário: {first_name_only}"
+        conversation_id = serializer.validated_data.get('conversation_id')
+        cacheable = (
+            len(messages) == 1 and messages[0]['role'] == 'user' and not image_data and not conversation_id
+        )
+
+        # Obter informações do usuário
+        info_parts = []
+        if not cacheable:
+            user_name = user.get_full_name() or user.first_name or user.username
+            # Extrair apenas o primeiro nome para uma abordagem mais amigável
+            first_name_only = user.first_name if user.first_name else user_name.split()[0] if user_name else "amigo(a)"
+            info_parts.append(f"Nome do usuário: {first_name_only}")
         
         # Adicionar informações adicionais se disponíveis
         if hasattr(user, 'provincia') and user.provincia:
-            user_info += f", Localização: {user.provincia}"
+            info_parts.append(f"Localização: {user.provincia}")
         if hasattr(user, 'tipo_usuario') and user.tipo_usuario:
-            user_info += f", Tipo: {user.get_tipo_usuario_display()}"
+            info_parts.append(f"Tipo: {user.get_tipo_usuario_display()}")
+        user_info = ", ".join(info_parts)
+        name_hint = (
+            "" if cacheable else
+            "Quando adequado, use o primeiro nome do usuário (não use 'Sr.' ou 'Sra.') para criar uma conversa mais amigável e próxima. "
+        )
 
         # Injetar contexto do sistema com informações do criador e do usuário
         system_context = (
@@ -270,20 +346,38 @@ class AIChatStreamView(APIView):
             "digital com as práticas agrícolas, trazendo inovação e eficiência ao setor. "
             f"\n\n{user_info}\n\n"
             "Responda de forma clara, prática e útil para agricultores, e quando apropriado considere o contexto de Moçambique. "
-            "Quando adequado, use o primeiro nome do usuário (não use 'Sr.' ou 'Sra.') para criar uma conversa mais amigável e próxima. "
+            f"{name_hint}"
             "Seja completa e detalhada nas respostas, não deixe frases incompletas. "
             "Quando criar tabelas, use formatação Markdown apropriada para melhor visualização."
         )
         prompt_parts.append(f"Sistema: {system_context}")
         
-        # Adicionar TODAS as mensagens ao prompt (incluindo a última)
-        for msg in messages:
+        # Conversa guardada no backend: usar o resumo das mensagens antigas
+        summary = ''
+        if conversation_id:
+            conversation = await AIConversation.objects.filter(id=conversation_id, user=user).only('id', 'summary').afirst()
+            if conversation:
+                summary = conversation.summary
+                conversation_context.schedule_summary_refresh(conversation.id)
+        if summary:
+            prompt_parts.append(f"Resumo da conversa até agora: {summary}")
+        
+        # Adicionar as mensagens mais recentes que cabem na janela de contexto (incluindo a última)
+        for msg in conversation_context.build_context_window(messages, summary):
             role = "Assistente" if msg['role'] == 'assistant' else "Usuário"
             prompt_parts.append(f"{role}: {msg['content']}")
         
         # Adicionar prompt final para a IA responder
         prompt_parts.append("Assistente:")
         full_prompt = "\n\n".join(prompt_parts)
+        model_name = serializer.validated_data.get('model', 'gemini-pro')
+        
+        cache_key = None
+        if cacheable:
+            cache_key = response_cache.build_cache_key(
+                messages[0]['content'], getattr(user, 'provincia', None), model_name,
+                tipo_usuario=getattr(user, 'tipo_usuario', None)
+            )
         
         # Função geradora para o streaming
         async def event_stream():
@@ -291,8 +385,9 @@ class AIChatStreamView(APIView):
             try:
                 async for chunk in ai_service.generate_text_stream(
                     prompt=full_prompt,
-                    model_name=serializer.validated_data.get('model', 'gemini-pro'),
-                    image_data=image_data
+                    model_name=model_name,
+                    image_data=image_data,
+                    cache_key=cache_key
                 ):
                     # Formato SSE: data: {json}\n\n
                     data = json.dumps(chunk, ensure_ascii=False)
@@ -311,25 +406,9 @@ class AIChatStreamView(APIView):
                 })
                 yield f"data: {error_data}\n\n"
         
-        # Função síncrona wrapper para StreamingHttpResponse
-        def sync_event_stream():
-            """Wrapper síncrono para o async generator"""
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                async_gen = event_stream()
-                while True:
-                    try:
-                        chunk = loop.run_until_complete(async_gen.__anext__())
-                        yield chunk
-                    except StopAsyncIteration:
-                        break
-            finally:
-                loop.close()
-        
         # Retornar resposta de streaming
         response = StreamingHttpResponse(
-            sync_event_stream(),
+            event_stream(),
             content_type='text/event-stream'
         )
         response['Cache-Control'] = 'no-cache'
@@ -354,13 +433,13 @@ class AIStatusView(APIView):
         })
 
 
-class TextGenerationView(APIView):
+class TextGenerationView(AsyncAPIView):
     """
     View para geração de texto simples
     """
     permission_classes = [permissions.IsAuthenticated]
     
-    def post(self, request):
+    async def post(self, request):
         serializer = TextGenerationSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -380,20 +459,13 @@ class TextGenerationView(APIView):
         start_time = time.time()
         
         # Gerar texto (simular async)
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(
-                ai_service.generate_text(prompt, model_name=model_name)
-            )
-        finally:
-            loop.close()
+        result = await ai_service.generate_text(prompt, model_name=model_name)
         
         processing_time = time.time() - start_time
         
         if result['success']:
             # Atualizar estatísticas de uso
-            self._update_usage_stats(request.user, processing_time, result.get('usage', {}))
+            usage.record_usage(request.user, 'general', processing_time, result.get('usage', {}))
 
             content = _extract_content_from_result(result)
             if not content:
@@ -413,28 +485,15 @@ class TextGenerationView(APIView):
                 'error': result['error']
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    def _update_usage_stats(self, user, processing_time, usage_info):
-        """Atualiza estatísticas de uso do usuário"""
-        today = timezone.now().date()
-        stats, created = AIUsageStats.objects.get_or_create(
-            user=user,
-            date=today,
-        )
-        
-        stats.total_requests = F('total_requests') + 1
-        stats.general_requests = F('general_requests') + 1
-        stats.total_processing_time = F('total_processing_time') + processing_time
-        stats.total_tokens_used = F('total_tokens_used') + usage_info.get('completion_tokens', 0)
-        stats.save()
 
 
-class ChatConversationView(APIView):
+class ChatConversationView(AsyncAPIView):
     """
     View para chat com contexto de conversa
     """
     permission_classes = [permissions.IsAuthenticated]
     
-    def post(self, request):
+    async def post(self, request):
         serializer = ChatRequestSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -446,7 +505,7 @@ class ChatConversationView(APIView):
         # Buscar ou criar conversa
         if conversation_id:
             try:
-                conversation = AIConversation.objects.get(
+                conversation = await AIConversation.objects.aget(
                     id=conversation_id,
                     user=request.user
                 )
@@ -455,55 +514,53 @@ class ChatConversationView(APIView):
                     'error': 'Conversa não encontrada'
                 }, status=status.HTTP_404_NOT_FOUND)
         else:
-            conversation = AIConversation.objects.create(
+            conversation = await AIConversation.objects.acreate(
                 user=request.user,
                 conversation_type=conversation_type,
                 title=message_content[:50] + "..." if len(message_content) > 50 else message_content
             )
         
         # Salvar mensagem do usuário
-        user_message = AIMessage.objects.create(
+        user_message = await AIMessage.objects.acreate(
             conversation=conversation,
             role='user',
             content=message_content
         )
         
-        # Obter histórico da conversa
-        previous_messages = AIMessage.objects.filter(
-            conversation=conversation
-        ).order_by('timestamp')
+        # Obter histórico da conversa: só as mensagens ainda não resumidas,
+        # das mais recentes para trás, até ao limite da janela de contexto
+        previous_messages = AIMessage.objects.filter(conversation=conversation)
+        if conversation.summary_until:
+            previous_messages = previous_messages.filter(timestamp__gt=conversation.summary_until)
+        previous_messages = previous_messages.order_by('-timestamp')[:conversation_context.max_window_messages()]
         
-        messages_for_ai = []
-        for msg in previous_messages:
-            messages_for_ai.append({
+        history = []
+        async for msg in previous_messages:
+            history.append({
                 'role': msg.role,
                 'content': msg.content
             })
+        history.reverse()
+        
+        messages_for_ai = conversation_context.with_summary(
+            conversation_context.build_context_window(history, conversation.summary),
+            conversation.summary
+        )
         
         # Processar com AI
         ai_service = FirebaseAIService()
         start_time = time.time()
         
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            if conversation_type == 'agriculture':
-                result = loop.run_until_complete(
-                    ai_service.agriculture_assistant(message_content)
-                )
-            else:
-                result = loop.run_until_complete(
-                    ai_service.chat_completion(messages_for_ai)
-                )
-        finally:
-            loop.close()
+        if conversation_type == 'agriculture':
+            result = await ai_service.agriculture_assistant(message_content)
+        else:
+            result = await ai_service.chat_completion(messages_for_ai)
         
         processing_time = time.time() - start_time
         
         if result['success']:
             # Salvar resposta da AI
-            ai_message = AIMessage.objects.create(
+            ai_message = await AIMessage.objects.acreate(
                 conversation=conversation,
                 role='assistant',
                 content=result['content'],
@@ -514,10 +571,13 @@ class ChatConversationView(APIView):
             
             # Atualizar conversa
             conversation.updated_at = timezone.now()
-            conversation.save()
+            await conversation.asave()
             
             # Atualizar estatísticas
-            self._update_chat_stats(request.user, conversation_type, processing_time, result.get('usage', {}))
+            usage.record_usage(request.user, conversation_type, processing_time, result.get('usage', {}))
+            
+            # Resumir em background os turnos que saíram da janela
+            conversation_context.schedule_summary_refresh(conversation.id)
             
             return Response({
                 'success': True,
@@ -535,35 +595,15 @@ class ChatConversationView(APIView):
                 'conversation_id': conversation.id
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    def _update_chat_stats(self, user, conversation_type, processing_time, usage_info):
-        """Atualiza estatísticas específicas do chat"""
-        today = timezone.now().date()
-        stats, created = AIUsageStats.objects.get_or_create(
-            user=user,
-            date=today,
-        )
-        
-        stats.total_requests = F('total_requests') + 1
-        stats.total_processing_time = F('total_processing_time') + processing_time
-        stats.total_tokens_used = F('total_tokens_used') + usage_info.get('completion_tokens', 0)
-        
-        if conversation_type == 'agriculture':
-            stats.agriculture_requests = F('agriculture_requests') + 1
-        elif conversation_type == 'pest_analysis':
-            stats.pest_analysis_requests = F('pest_analysis_requests') + 1
-        else:
-            stats.general_requests = F('general_requests') + 1
-        
-        stats.save()
 
 
-class AgricultureAssistantView(APIView):
+class AgricultureAssistantView(AsyncAPIView):
     """
     View específica para assistente agrícola
     """
     permission_classes = [permissions.IsAuthenticated]
     
-    def post(self, request):
+    async def post(self, request):
         query = request.data.get('query', '').strip()
         context = request.data.get('context', {})
         
@@ -575,19 +615,17 @@ class AgricultureAssistantView(APIView):
         ai_service = FirebaseAIService()
         start_time = time.time()
         
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(
-                ai_service.agriculture_assistant(query, context)
-            )
-        finally:
-            loop.close()
+        # O contexto faz parte do prompt, por isso entra na chave do cache
+        context_items = sorted(context.items()) if isinstance(context, dict) else []
+        cache_prompt = ' '.join([query] + [f"{key} {value}" for key, value in context_items])
+        cache_key = response_cache.build_cache_key(cache_prompt, getattr(request.user, 'provincia', None))
+        
+        result = await ai_service.agriculture_assistant(query, context, cache_key=cache_key)
         
         processing_time = time.time() - start_time
         
         if result['success']:
-            self._update_usage_stats(request.user, 'agriculture', processing_time, result.get('usage', {}))
+            usage.record_usage(request.user, 'agriculture', processing_time, result.get('usage', {}))
             
             return Response({
                 'success': True,
@@ -601,24 +639,15 @@ class AgricultureAssistantView(APIView):
                 'error': result['error']
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    def _update_usage_stats(self, user, request_type, processing_time, usage_info):
-        today = timezone.now().date()
-        stats, created = AIUsageStats.objects.get_or_create(user=user, date=today)
-        
-        stats.total_requests = F('total_requests') + 1
-        stats.agriculture_requests = F('agriculture_requests') + 1
-        stats.total_processing_time = F('total_processing_time') + processing_time
-        stats.total_tokens_used = F('total_tokens_used') + usage_info.get('completion_tokens', 0)
-        stats.save()
 
 
-class PestAnalysisView(APIView):
+class PestAnalysisView(AsyncAPIView):
     """
     View para análise de pragas e doenças
     """
     permission_classes = [permissions.IsAuthenticated]
     
-    def post(self, request):
+    async def post(self, request):
         description = request.data.get('description', '').strip()
         crop_type = request.data.get('crop_type')
         symptoms = request.data.get('symptoms', [])
@@ -631,19 +660,12 @@ class PestAnalysisView(APIView):
         ai_service = FirebaseAIService()
         start_time = time.time()
         
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(
-                ai_service.pest_disease_analysis(description, crop_type, symptoms)
-            )
-        finally:
-            loop.close()
+        result = await ai_service.pest_disease_analysis(description, crop_type, symptoms)
         
         processing_time = time.time() - start_time
         
         if result['success']:
-            self._update_usage_stats(request.user, processing_time, result.get('usage', {}))
+            usage.record_usage(request.user, 'pest_analysis', processing_time, result.get('usage', {}))
             
             return Response({
                 'success': True,
@@ -661,29 +683,48 @@ class PestAnalysisView(APIView):
                 'error': result['error']
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    def _update_usage_stats(self, user, processing_time, usage_info):
-        today = timezone.now().date()
-        stats, created = AIUsageStats.objects.get_or_create(user=user, date=today)
-        
-        stats.total_requests = F('total_requests') + 1
-        stats.pest_analysis_requests = F('pest_analysis_requests') + 1
-        stats.total_processing_time = F('total_processing_time') + processing_time
-        stats.total_tokens_used = F('total_tokens_used') + usage_info.get('completion_tokens', 0)
-        stats.save()
+
+
+# Tamanho do preview da última mensagem nas listagens
+LAST_MESSAGE_PREVIEW_CHARS = 120
+
+# Paginação por cursor das mensagens de uma conversa
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 200
+
+
+def _with_list_annotations(queryset):
+    """
+    Anota cada conversa com o número de mensagens e a última mensagem
+    (role, preview, timestamp), tudo numa única query.
+    """
+    conversation_messages = AIMessage.objects.filter(conversation=OuterRef('pk'))
+    last_message = conversation_messages.order_by('-timestamp', '-id')
+    # COUNT em subquery (e não JOIN + GROUP BY): cada subquery corre uma vez
+    # por conversa da página, usando o índice (conversation, timestamp)
+    message_count = conversation_messages.order_by().values('conversation').annotate(
+        total=Count('id')
+    ).values('total')
+    return queryset.annotate(
+        message_count=Coalesce(Subquery(message_count), 0),
+        last_message_role=Subquery(last_message.values('role')[:1]),
+        last_message_preview=Left(Subquery(last_message.values('content')[:1]), LAST_MESSAGE_PREVIEW_CHARS),
+        last_message_at=Subquery(last_message.values('timestamp')[:1]),
+    )
 
 
 class ConversationListView(generics.ListAPIView):
     """
     Listar conversas do usuário
     """
-    serializer_class = AIConversationSerializer
+    serializer_class = AIConversationListSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return AIConversation.objects.filter(
+        return _with_list_annotations(AIConversation.objects.filter(
             user=self.request.user,
             is_active=True
-        ).prefetch_related('messages')
+        ))
 
 
 class ConversationDetailView(generics.RetrieveAPIView):
@@ -749,6 +790,9 @@ class UsageStatsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
+        # Gravar já os contadores pendentes deste processo (ver ai/usage.py)
+        usage.flush()
+        
         # Últimos 30 dias
         from datetime import datetime, timedelta
         end_date = timezone.now().date()
@@ -808,10 +852,20 @@ class AIConversationViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return AIConversation.objects.filter(
+        queryset = AIConversation.objects.filter(
             user=self.request.user,
             is_active=True
-        ).prefetch_related('messages').order_by('-updated_at')
+        ).order_by('-updated_at')
+        if self.action == 'list':
+            return _with_list_annotations(queryset)
+        if self.action == 'retrieve':
+            return queryset.prefetch_related('messages')
+        return queryset
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return AIConversationListSerializer
+        return AIConversationSerializer
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -821,6 +875,51 @@ class AIConversationViewSet(viewsets.ModelViewSet):
         instance.is_active = False
         instance.save()
     
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """
+        Mensagens da conversa, paginadas por cursor (das mais recentes para trás)
+        GET /api/ai/conversations/{id}/messages/?before=<message_id>&limit=50
+        Retorna a página em ordem cronológica e `next_before` para a página anterior.
+        """
+        conversation = self.get_object()
+        
+        try:
+            limit = min(int(request.query_params.get('limit', MESSAGES_PAGE_SIZE)), MESSAGES_MAX_PAGE_SIZE)
+            before = request.query_params.get('before')
+            before = int(before) if before else None
+        except ValueError:
+            return Response(
+                {'error': 'before e limit devem ser inteiros'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if limit < 1:
+            limit = MESSAGES_PAGE_SIZE
+        
+        queryset = AIMessage.objects.filter(conversation=conversation)
+        if before:
+            cursor = AIMessage.objects.filter(conversation=conversation, id=before).values('timestamp', 'id').first()
+            if not cursor:
+                return Response(
+                    {'error': 'Mensagem do cursor não encontrada'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = queryset.filter(
+                Q(timestamp__lt=cursor['timestamp']) |
+                Q(timestamp=cursor['timestamp'], id__lt=cursor['id'])
+            )
+        
+        page = list(queryset.order_by('-timestamp', '-id')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        page.reverse()
+        
+        return Response({
+            'results': AIMessageSerializer(page, many=True).data,
+            'has_more': has_more,
+            'next_before': page[0].id if has_more else None
+        })
+    
     @action(detail=True, methods=['post'])
     def add_message(self, request, pk=None):
         """
@@ -0,0 +1,55 @@
+"""
+Prefetch do clima atual e da previsão de todas as localidades conhecidas
+
+Para correr no cron a cada WEATHER_CACHE_CURRENT_TTL (10 min), por exemplo:
+  */10 * * * * cd /app/backend && python manage.py prefetch_clima
+
+Uso:
+  python manage.py prefetch_clima
+  python manage.py prefetch_clima --workers 8 --calls-per-minute 600
+  python manage.py prefetch_clima --only maputo beira
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clima.services import weather_prefetch
+from clima.services.openweather import openweather_service
+
+
+class Command(BaseCommand):
+    help = 'Busca clima e previsão das localidades conhecidas para o cache e a base de dados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='threads em paralelo (padrão: WEATHER_PREFETCH_WORKERS)')
+        parser.add_argument('--calls-per-minute', type=int, default=None,
+                            help='limite de chamadas à API (padrão: OPENWEATHER_CALLS_PER_MINUTE)')
+        parser.add_argument('--only', nargs='+', help='chaves de exact_coordinates a buscar')
+
+    def handle(self, *args, **options):
+        if not openweather_service.api_key:
+            raise CommandError('OPENWEATHER_API_KEY não configurada')
+
+        if options['only']:
+            unknown = [key for key in options['only'] if key.lower() not in openweather_service.exact_coordinates]
+            if unknown:
+                raise CommandError(f"Localidades desconhecidas: {', '.join(unknown)}")
+            locations = [openweather_service.exact_coordinates[key.lower()] for key in options['only']]
+        else:
+            locations = weather_prefetch.known_locations()
+
+        start = time.monotonic()
+        fetched = weather_prefetch.prefetch_all(
+            locations, workers=options['workers'], calls_per_minute=options['calls_per_minute']
+        )
+        saved = weather_prefetch.save_results(fetched['results'])
+
+        for name, error in fetched['errors']:
+            self.stderr.write(f"⚠️ {name}: {error}")
+        self.stdout.write(
+            f"✅ {len(fetched['results'])}/{len(locations)} localidades em {time.monotonic() - start:.1f}s "
+            f"({saved['previsoes']} previsões, {saved['historicos']} registos históricos)"
+        )
+        if locations and not fetched['results']:
+            raise CommandError('Nenhuma localidade atualizada')
@@ -1,18 +1,125 @@
 """
 Serviço de integração com OpenWeather API
+
+As respostas ficam no cache Django, com validade por tipo de dado:
+  - clima atual: WEATHER_CACHE_CURRENT_TTL (10 min)
+  - previsão: WEATHER_CACHE_FORECAST_TTL (1 h)
+  - geocoding: WEATHER_CACHE_GEOCODING_TTL (7 dias)
+Clima e previsão são indexados pela célula de WEATHER_GRID_DEGREES onde caem
+as coordenadas, por isso agricultores vizinhos partilham a mesma entrada.
+Coordenadas a menos de WEATHER_NEAREST_RADIUS_KM de uma localidade conhecida
+ou de uma célula já usada ficam com essa entrada, mesmo do outro lado do
+limite da célula (clima.services.spatial_index).
+Depois de expirar, uma entrada continua a ser servida durante *_STALE
+segundos enquanto é atualizada em background (stale-while-revalidate), e
+também quando a API falha.
 """
+import hashlib
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import Future, ThreadPoolExecutor
 from django.conf import settings
+from django.core.cache import cache
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 import logging
 
+from .spatial_index import LocationIndex
+
 logger = logging.getLogger(__name__)
 
+
+def _build_session() -> requests.Session:
+    """Sessão HTTP partilhada: conexões keep-alive para a OpenWeather"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_session = _build_session()
+
+# Atualizações em background de entradas expiradas (no máximo uma por chave)
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='weather-refresh')
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+# Pedidos concorrentes à mesma chave sem cache esperam por um único fetch
+_fetch_locks = [threading.Lock() for _ in range(64)]
+
+# Centros das células da grelha já usadas neste processo
+_cell_index = LocationIndex(settings.WEATHER_NEAREST_RADIUS_KM)
+
+
+def snap_to_grid(lat: float, lon: float) -> tuple:
+    """Centro da célula da grelha WEATHER_GRID_DEGREES que contém (lat, lon)"""
+    grid = settings.WEATHER_GRID_DEGREES
+    return round(round(lat / grid) * grid, 4), round(round(lon / grid) * grid, 4)
+
+
+def _cell_key(kind: str, lat: float, lon: float) -> str:
+    cell_lat, cell_lon = snap_to_grid(lat, lon)
+    return f'clima:{kind}:{cell_lat:.4f}:{cell_lon:.4f}'
+
+
+def _location_key(kind: str, lat: float, lon: float) -> str:
+    # Localidade conhecida: chave própria, para não partilhar a entrada (e o
+    # ponto do fetch) com o centro da célula da grelha onde cai
+    return f'clima:{kind}:loc:{lat:.6f}:{lon:.6f}'
+
+
+def _store(key: str, value, ttl: int, stale_ttl: int):
+    cache.set(key, {'value': value, 'fresh_until': time.time() + ttl}, ttl + stale_ttl)
+
+
+def _refresh(key: str, fetch: Callable, ttl: int, stale_ttl: int):
+    try:
+        _store(key, fetch(), ttl, stale_ttl)
+    except Exception as e:
+        logger.warning(f"Erro ao atualizar {key}, mantendo dados anteriores: {e}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def _refresh_in_background(key: str, fetch: Callable, ttl: int, stale_ttl: int) -> Optional[Future]:
+    with _refreshing_lock:
+        if key in _refreshing:
+            return None
+        _refreshing.add(key)
+    return _refresh_executor.submit(_refresh, key, fetch, ttl, stale_ttl)
+
+
+def cached_fetch(key: str, fetch: Callable, ttl: int, stale_ttl: int = 0):
+    """
+    Valor de `key` no cache, ou fetch() (que levanta exceção em caso de erro).
+    Entradas expiradas há menos de stale_ttl são devolvidas de imediato e
+    atualizadas em background.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        if time.time() >= entry['fresh_until']:
+            _refresh_in_background(key, fetch, ttl, stale_ttl)
+        return entry['value']
+
+    with _fetch_locks[int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16) % len(_fetch_locks)]:
+        # Outro pedido pode ter acabado de buscar a mesma chave
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['value']
+        value = fetch()
+        _store(key, value, ttl, stale_ttl)
+        return value
+
+
 class OpenWeatherService:
     def __init__(self):
         self.api_key = settings.OPENWEATHER_API_KEY
         self.base_url = "https://api.openweathermap.org/data/2.5"
+        self.timeout = settings.OPENWEATHER_TIMEOUT
         
         # Coordenadas exatas do site OpenWeather para garantir dados idênticos
         # Capitais provinciais e cidades importantes de Moçambique
@@ -76,6 +183,51 @@ class OpenWeatherService:
             'vila-de-tete': {'lat': -16.1564, 'lon': 33.5867, 'name': 'Tete'},
         }
         self.geocoding_url = "https://api.openweathermap.org/geo/1.0"
+
+        # Índice espacial das localidades (sem repetir as variações de nome)
+        self.location_index = LocationIndex(settings.WEATHER_LOCATION_RADIUS_KM)
+        self.known_points = set()
+        for coords in self.exact_coordinates.values():
+            if (coords['lat'], coords['lon']) not in self.known_points:
+                self.known_points.add((coords['lat'], coords['lon']))
+                self.location_index.add(coords['lat'], coords['lon'], coords)
+
+    def find_location(self, lat: float, lon: float, radius_km: float = None) -> Optional[Dict]:
+        """
+        Localidade conhecida mais próxima de (lat, lon), até radius_km
+        (padrão WEATHER_LOCATION_RADIUS_KM)
+        """
+        if radius_km is None:
+            radius_km = settings.WEATHER_LOCATION_RADIUS_KM
+        match = self.location_index.nearest(lat, lon, radius_km)
+        return match[0] if match else None
+
+    def resolve_point(self, lat: float, lon: float) -> tuple:
+        """
+        Ponto cujo clima serve para (lat, lon): a localidade conhecida ou célula
+        já usada mais próxima até WEATHER_NEAREST_RADIUS_KM; senão o centro da
+        célula da grelha, que passa a servir os pedidos vizinhos
+        """
+        radius = settings.WEATHER_NEAREST_RADIUS_KM
+        matches = [
+            match for match in (
+                self.location_index.nearest(lat, lon, radius),
+                _cell_index.nearest(lat, lon, radius),
+            ) if match
+        ]
+        if matches:
+            point = min(matches, key=lambda match: match[1])[0]
+            return (point['lat'], point['lon']) if isinstance(point, dict) else point
+
+        point = snap_to_grid(lat, lon)
+        _cell_index.add(point[0], point[1], point)
+        return point
+
+    def cache_key(self, kind: str, point: tuple) -> str:
+        """Chave do cache para um ponto devolvido por resolve_point"""
+        if point in self.known_points:
+            return _location_key(kind, *point)
+        return _cell_key(kind, *point)
         
     def get_coordinates(self, city_name: str, country_code: str = "MZ") -> Optional[Dict]:
         """
@@ -89,136 +241,185 @@ class OpenWeatherService:
         
         # Fallback para geocoding API se não temos coordenadas exatas
         try:
-            url = f"{self.geocoding_url}/direct"
-            params = {
-                'q': f"{city_name},{country_code}",
-                'limit': 1,
-                'appid': self.api_key
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            if data:
-                return {
-                    'lat': data[0]['lat'],
-                    'lon': data[0]['lon'],
-                    'name': data[0]['name']
-                }
-            return None
+            key = 'clima:geo:' + hashlib.md5(f'{city_key},{country_code}'.lower().encode('utf-8')).hexdigest()
+            coords = cached_fetch(
+                key, lambda: self._fetch_coordinates(city_name, country_code),
+                settings.WEATHER_CACHE_GEOCODING_TTL
+            )
+            # {} = cidade não encontrada (também fica em cache)
+            return coords or None
             
         except Exception as e:
             logger.error(f"Erro ao obter coordenadas para {city_name}: {e}")
             return None
+
+    def _fetch_coordinates(self, city_name: str, country_code: str) -> Dict:
+        url = f"{self.geocoding_url}/direct"
+        params = {
+            'q': f"{city_name},{country_code}",
+            'limit': 1,
+            'appid': self.api_key
+        }
+        
+        response = _session.get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        
+        data = response.json()
+        if data:
+            return {
+                'lat': data[0]['lat'],
+                'lon': data[0]['lon'],
+                'name': data[0]['name']
+            }
+        return {}
     
     def get_current_weather(self, lat: float, lon: float) -> Optional[Dict]:
         """
-        Obter clima atual por coordenadas
+        Obter clima atual por coordenadas (partilhado pela célula da grelha)
         """
         try:
-            url = f"{self.base_url}/weather"
-            params = {
-                'lat': lat,
-                'lon': lon,
-                'appid': self.api_key,
-                'units': 'metric',
-                'lang': 'pt'
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            return {
-                'temperatura': data['main']['temp'],
-                'sensacao_termica': data['main']['feels_like'],
-                'temperatura_min': data['main']['temp_min'],
-                'temperatura_max': data['main']['temp_max'],
-                'umidade': data['main']['humidity'],
-                'pressao': data['main']['pressure'],
-                'descricao': data['weather'][0]['description'],
-                'condicao': data['weather'][0]['main'].lower(),
-                'icone': data['weather'][0]['icon'],
-                'velocidade_vento': data['wind']['speed'],
-                'direcao_vento': data['wind'].get('deg', 0),
-                'visibilidade': data.get('visibility', 10000) / 1000,  # em km
-                'pais': data['sys']['country'],
-                'data_atualizacao': datetime.fromtimestamp(data['dt']).isoformat()
-            }
+            point = self.resolve_point(lat, lon)
+            return cached_fetch(
+                self.cache_key('atual', point), lambda: self._fetch_current_weather(*point),
+                settings.WEATHER_CACHE_CURRENT_TTL, settings.WEATHER_CACHE_CURRENT_STALE
+            )
             
         except Exception as e:
             logger.error(f"Erro ao obter clima atual: {e}")
             return None
+
+    def _fetch_current_weather(self, lat: float, lon: float) -> Dict:
+        url = f"{self.base_url}/weather"
+        params = {
+            'lat': lat,
+            'lon': lon,
+            'appid': self.api_key,
+            'units': 'metric',
+            'lang': 'pt'
+        }
+        
+        response = _session.get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        
+        data = response.json()
+        
+        return {
+            'temperatura': data['main']['temp'],
+            'sensacao_termica': data['main']['feels_like'],
+            'temperatura_min': data['main']['temp_min'],
+            'temperatura_max': data['main']['temp_max'],
+            'umidade': data['main']['humidity'],
+            'pressao': data['main']['pressure'],
+            'descricao': data['weather'][0]['description'],
+            'condicao': data['weather'][0]['main'].lower(),
+            'icone': data['weather'][0]['icon'],
+            'velocidade_vento': data['wind']['speed'],
+            'direcao_vento': data['wind'].get('deg', 0),
+            'visibilidade': data.get('visibility', 10000) / 1000,  # em km
+            'pais': data['sys']['country'],
+            'data_atualizacao': datetime.fromtimestamp(data['dt']).isoformat()
+        }
     
     def get_forecast(self, lat: float, lon: float, days: int = 5) -> List[Dict]:
         """
         Obter previsão do tempo para os próximos dias
         """
         try:
-            url = f"{self.base_url}/forecast"
-            params = {
-                'lat': lat,
-                'lon': lon,
-                'appid': self.api_key,
-                'units': 'metric',
-                'lang': 'pt'
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            forecasts = []
-            
-            # OpenWeather retorna previsões de 3 em 3 horas
-            # Vamos agrupar por dia
-            daily_forecasts = {}
-            
-            for item in data['list'][:days * 8]:  # 8 previsões por dia (3h cada)
-                date = datetime.fromtimestamp(item['dt']).date()
-                
-                if date not in daily_forecasts:
-                    daily_forecasts[date] = {
-                        'data': date.isoformat(),
-                        'temperaturas': [],
-                        'umidades': [],
-                        'precipitacoes': [],
-                        'descricoes': [],
-                        'ventos': []
-                    }
-                
-                daily_forecasts[date]['temperaturas'].append(item['main']['temp'])
-                daily_forecasts[date]['umidades'].append(item['main']['humidity'])
-                daily_forecasts[date]['precipitacoes'].append(
-                    item.get('rain', {}).get('3h', 0)
-                )
-                daily_forecasts[date]['descricoes'].append(
-                    item['weather'][0]['description']
-                )
-                daily_forecasts[date]['ventos'].append(item['wind']['speed'])
-            
-            # Processar dados diários
-            for date, data_day in daily_forecasts.items():
-                forecasts.append({
-                    'data': data_day['data'],
-                    'temperatura_min': min(data_day['temperaturas']),
-                    'temperatura_max': max(data_day['temperaturas']),
-                    'condicao': 'clear',
-                    'descricao': max(set(data_day['descricoes']), 
-                                   key=data_day['descricoes'].count),
-                    'icone': '01d',
-                    'probabilidade_chuva': min(100, sum(data_day['precipitacoes']) * 10),
-                    'umidade': int(sum(data_day['umidades']) / len(data_day['umidades'])),
-                    'velocidade_vento': sum(data_day['ventos']) / len(data_day['ventos'])
-                })
-            
-            return forecasts
+            # Lista de 3 em 3 horas (5 dias) em cache; o agrupamento por dia é local
+            point = self.resolve_point(lat, lon)
+            items = cached_fetch(
+                self.cache_key('previsao', point), lambda: self._fetch_forecast_list(*point),
+                settings.WEATHER_CACHE_FORECAST_TTL, settings.WEATHER_CACHE_FORECAST_STALE
+            )
+            return self.summarize_forecast(items, days)
             
         except Exception as e:
             logger.error(f"Erro ao obter previsão: {e}")
             return []
+
+    def summarize_forecast(self, items: List[Dict], days: int = 5) -> List[Dict]:
+        """
+        Agrupar a previsão de 3 em 3 horas da OpenWeather em resumos diários
+        """
+        forecasts = []
+        daily_forecasts = {}
+        
+        for item in items[:days * 8]:  # 8 previsões por dia (3h cada)
+            date = datetime.fromtimestamp(item['dt']).date()
+            
+            if date not in daily_forecasts:
+                daily_forecasts[date] = {
+                    'data': date.isoformat(),
+                    'temperaturas': [],
+                    'umidades': [],
+                    'precipitacoes': [],
+                    'descricoes': [],
+                    'ventos': []
+                }
+            
+            daily_forecasts[date]['temperaturas'].append(item['main']['temp'])
+            daily_forecasts[date]['umidades'].append(item['main']['humidity'])
+            daily_forecasts[date]['precipitacoes'].append(
+                item.get('rain', {}).get('3h', 0)
+            )
+            daily_forecasts[date]['descricoes'].append(
+                item['weather'][0]['description']
+            )
+            daily_forecasts[date]['ventos'].append(item['wind']['speed'])
+        
+        # Processar dados diários
+        for date, data_day in daily_forecasts.items():
+            forecasts.append({
+                'data': data_day['data'],
+                'temperatura_min': min(data_day['temperaturas']),
+                'temperatura_max': max(data_day['temperaturas']),
+                'condicao': 'clear',
+                'descricao': max(set(data_day['descricoes']), 
+                               key=data_day['descricoes'].count),
+                'icone': '01d',
+                'probabilidade_chuva': min(100, sum(data_day['precipitacoes']) * 10),
+                'precipitacao': sum(data_day['precipitacoes']),
+                'umidade': int(sum(data_day['umidades']) / len(data_day['umidades'])),
+                'velocidade_vento': sum(data_day['ventos']) / len(data_day['ventos'])
+            })
+        
+        return forecasts
+
+    def refresh_current_weather(self, lat: float, lon: float) -> Dict:
+        """
+        Buscar o clima atual na API, ignorando o cache, e guardá-lo (prefetch).
+        Levanta exceção em caso de erro.
+        """
+        point = self.resolve_point(lat, lon)
+        value = self._fetch_current_weather(*point)
+        _store(self.cache_key('atual', point), value,
+               settings.WEATHER_CACHE_CURRENT_TTL, settings.WEATHER_CACHE_CURRENT_STALE)
+        return value
+
+    def refresh_forecast(self, lat: float, lon: float) -> List[Dict]:
+        """
+        Buscar a previsão (3 em 3 horas) na API, ignorando o cache, e guardá-la
+        (prefetch). Levanta exceção em caso de erro.
+        """
+        point = self.resolve_point(lat, lon)
+        items = self._fetch_forecast_list(*point)
+        _store(self.cache_key('previsao', point), items,
+               settings.WEATHER_CACHE_FORECAST_TTL, settings.WEATHER_CACHE_FORECAST_STALE)
+        return items
+    
+    def _fetch_forecast_list(self, lat: float, lon: float) -> List[Dict]:
+        url = f"{self.base_url}/forecast"
+        params = {
+            'lat': lat,
+            'lon': lon,
+            'appid': self.api_key,
+            'units': 'metric',
+            'lang': 'pt'
+        }
+        
+        response = _session.get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['list']
     
     def get_weather_alerts(self, lat: float, lon: float) -> List[Dict]:
         """
@@ -0,0 +1,63 @@
+"""
+Índice espacial em memória para pontos (lat, lon)
+
+Os pontos ficam em baldes de uma grelha com o tamanho do raio de procura, por
+isso a procura do mais próximo só olha para os baldes vizinhos (tempo constante
+em vez de percorrer todas as localidades). Distâncias pela fórmula de haversine.
+"""
+import math
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distância em km entre dois pontos"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class LocationIndex:
+    """Pontos com um valor associado, agrupados em baldes de `bucket_km`"""
+
+    def __init__(self, bucket_km: float):
+        self.bucket_degrees = max(bucket_km, 0.1) / KM_PER_DEGREE
+        self._buckets: Dict[Tuple[int, int], List[Tuple[float, float, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.bucket_degrees), math.floor(lon / self.bucket_degrees)
+
+    def __len__(self):
+        return sum(len(points) for points in self._buckets.values())
+
+    def add(self, lat: float, lon: float, value: Any):
+        with self._lock:
+            self._buckets.setdefault(self._bucket(lat, lon), []).append((lat, lon, value))
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def nearest(self, lat: float, lon: float, radius_km: float) -> Optional[Tuple[Any, float]]:
+        """(valor, distância em km) do ponto mais próximo até radius_km, ou None"""
+        lat_span = math.ceil(radius_km / KM_PER_DEGREE / self.bucket_degrees)
+        # Um grau de longitude encolhe com a latitude
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        lon_span = math.ceil(radius_km / (KM_PER_DEGREE * cos_lat) / self.bucket_degrees)
+        bucket_lat, bucket_lon = self._bucket(lat, lon)
+
+        best = None
+        with self._lock:
+            for i in range(bucket_lat - lat_span, bucket_lat + lat_span + 1):
+                for j in range(bucket_lon - lon_span, bucket_lon + lon_span + 1):
+                    for point_lat, point_lon, value in self._buckets.get((i, j), ()):
+                        distance = haversine_km(lat, lon, point_lat, point_lon)
+                        if distance <= radius_km and (best is None or distance < best[1]):
+                            best = (value, distance)
+        return best
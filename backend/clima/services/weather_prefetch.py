@@ -0,0 +1,206 @@
+"""
+Prefetch do clima das localidades conhecidas (OpenWeatherService.exact_coordinates)
+
+O comando `prefetch_clima` (cron) busca o clima atual e a previsão de todas as
+localidades em paralelo, com um número limitado de threads e respeitando o
+limite de chamadas por minuto da OpenWeather (OPENWEATHER_CALLS_PER_MINUTE,
+com espera e nova tentativa em respostas 429). Os resultados vão para o cache
+(como se tivessem sido pedidos por um utilizador) e para as tabelas
+PrevisaoClimatica/HistoricoClima, de onde a previsão das localidades
+conhecidas é servida sem chamar a API.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import HistoricoClima, PrevisaoClimatica
+from .openweather import OpenWeatherService, openweather_service
+
+logger = logging.getLogger(__name__)
+
+FONTE_PREFETCH = 'OpenWeather'
+
+
+class RateLimiter:
+    """Espaça as chamadas para não passar de `calls_per_minute` (partilhado entre threads)"""
+
+    def __init__(self, calls_per_minute: int):
+        self.interval = 60.0 / calls_per_minute if calls_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        """Depois de um 429 ninguém chama a API durante `seconds`"""
+        with self._lock:
+            self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+
+def known_locations(service: OpenWeatherService = None) -> List[Dict]:
+    """Localidades de exact_coordinates sem repetir as variações de nome"""
+    service = service or openweather_service
+    seen = set()
+    locations = []
+    for coords in service.exact_coordinates.values():
+        point = (coords['lat'], coords['lon'])
+        if point in seen:
+            continue
+        seen.add(point)
+        locations.append(coords)
+    return locations
+
+
+def _call(fetch, limiter: RateLimiter, max_retries: int):
+    for attempt in range(max_retries + 1):
+        limiter.wait()
+        try:
+            return fetch()
+        except requests.HTTPError as e:
+            response = e.response
+            if response is None or response.status_code != 429 or attempt == max_retries:
+                raise
+            retry_after = response.headers.get('Retry-After')
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt * 5
+            logger.warning(f"OpenWeather 429, a aguardar {delay:.0f}s (tentativa {attempt + 1}/{max_retries})")
+            limiter.pause(delay)
+
+
+def fetch_location(location: Dict, limiter: RateLimiter, service: OpenWeatherService = None,
+                   max_retries: int = 3) -> Dict:
+    """Clima atual e previsão (3 em 3 horas) de uma localidade, já guardados no cache"""
+    service = service or openweather_service
+    lat, lon = location['lat'], location['lon']
+    return {
+        'location': location,
+        'current': _call(lambda: service.refresh_current_weather(lat, lon), limiter, max_retries),
+        'forecast': _call(lambda: service.refresh_forecast(lat, lon), limiter, max_retries),
+    }
+
+
+def prefetch_all(locations: List[Dict], workers: int = None, calls_per_minute: int = None,
+                 service: OpenWeatherService = None) -> Dict:
+    """
+    Buscar todas as localidades em paralelo. Devolve {'results': [...],
+    'errors': [(nome, erro), ...]}; as escritas na base de dados ficam para
+    save_results (na thread do chamador).
+    """
+    workers = workers or settings.WEATHER_PREFETCH_WORKERS
+    limiter = RateLimiter(calls_per_minute if calls_per_minute is not None
+                          else settings.OPENWEATHER_CALLS_PER_MINUTE)
+    results, errors = [], []
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='weather-prefetch') as executor:
+        futures = {executor.submit(fetch_location, location, limiter, service): location
+                   for location in locations}
+        for future in as_completed(futures):
+            location = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors.append((location['name'], str(e)))
+
+    return {'results': results, 'errors': errors}
+
+
+def save_results(results: List[Dict], service: OpenWeatherService = None) -> Dict:
+    """Gravar previsões diárias e o registo do dia (upsert em lote)"""
+    service = service or openweather_service
+    previsoes = []
+    historicos = []
+    today = date.today()
+
+    for result in results:
+        location = result['location']
+        for day in service.summarize_forecast(result['forecast']):
+            previsoes.append(PrevisaoClimatica(
+                localizacao=location['name'],
+                latitude=location['lat'],
+                longitude=location['lon'],
+                data_previsao=day['data'],
+                temperatura_min=day['temperatura_min'],
+                temperatura_max=day['temperatura_max'],
+                umidade=day['umidade'],
+                precipitacao=day['precipitacao'],
+                velocidade_vento=day['velocidade_vento'],
+                condicao_clima=day['condicao'],
+                descricao=day['descricao'],
+                fonte_dados=FONTE_PREFETCH,
+            ))
+
+        # Registo do dia: observação atual + intervalos de 3h que ainda faltam hoje
+        current = result['current']
+        today_items = [item for item in result['forecast']
+                       if datetime.fromtimestamp(item['dt']).date() == today]
+        temperaturas = [current['temperatura']] + [item['main']['temp'] for item in today_items]
+        umidades = [current['umidade']] + [item['main']['humidity'] for item in today_items]
+        historicos.append(HistoricoClima(
+            localizacao=location['name'],
+            data=today,
+            temperatura_media=sum(temperaturas) / len(temperaturas),
+            precipitacao_total=sum(item.get('rain', {}).get('3h', 0) for item in today_items),
+            umidade_media=int(sum(umidades) / len(umidades)),
+            fonte_dados=FONTE_PREFETCH,
+        ))
+
+    PrevisaoClimatica.objects.bulk_create(
+        previsoes, update_conflicts=True, unique_fields=['localizacao', 'data_previsao'],
+        # data_criacao passa a ser a data da última atualização (usada em stored_forecast)
+        update_fields=['latitude', 'longitude', 'temperatura_min', 'temperatura_max', 'umidade',
+                       'precipitacao', 'velocidade_vento', 'condicao_clima', 'descricao', 'fonte_dados',
+                       'data_criacao']
+    )
+    HistoricoClima.objects.bulk_create(
+        historicos, update_conflicts=True, unique_fields=['localizacao', 'data'],
+        update_fields=['temperatura_media', 'precipitacao_total', 'umidade_media', 'fonte_dados']
+    )
+    return {'previsoes': len(previsoes), 'historicos': len(historicos)}
+
+
+def stored_forecast(localizacao: str, days: int = 5) -> Optional[List[Dict]]:
+    """
+    Previsão gravada pelo prefetch para uma localidade conhecida, no formato de
+    OpenWeatherService.get_forecast. None se não cobre os `days` dias pedidos
+    ou se o prefetch não corre há mais que a validade da previsão em cache.
+    """
+    today = date.today()
+    max_age = settings.WEATHER_CACHE_FORECAST_TTL + settings.WEATHER_CACHE_FORECAST_STALE
+    rows = list(
+        PrevisaoClimatica.objects
+        .filter(localizacao=localizacao, data_previsao__gte=today,
+                data_previsao__lt=today + timedelta(days=days),
+                data_criacao__gte=timezone.now() - timedelta(seconds=max_age))
+        .order_by('data_previsao')
+    )
+    # A OpenWeather só dá 5 dias; o último pode vir incompleto
+    if not rows or len(rows) < min(days, 5) - 1:
+        return None
+
+    return [
+        {
+            'data': row.data_previsao.isoformat(),
+            'temperatura_min': row.temperatura_min,
+            'temperatura_max': row.temperatura_max,
+            'condicao': row.condicao_clima,
+            'descricao': row.descricao,
+            'icone': '01d',
+            'probabilidade_chuva': min(100, row.precipitacao * 10),
+            'precipitacao': row.precipitacao,
+            'umidade': row.umidade,
+            'velocidade_vento': row.velocidade_vento,
+        }
+        for row in rows
+    ]
@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from datetime import datetime, timedelta
 from .services.openweather import openweather_service
+from .services.weather_prefetch import stored_forecast
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -28,6 +29,7 @@ def clima_atual_view(request):
                 weather_data = openweather_service.get_current_weather(latitude, longitude)
                 
                 if weather_data:
+                    localidade = openweather_service.find_location(latitude, longitude)
                     # Mapear os dados para o formato esperado pelo frontend
                     response_data = {
                         'temperatura': weather_data['temperatura'],
@@ -44,7 +46,8 @@ def clima_atual_view(request):
                         'pais': weather_data.get('pais', 'MZ'),
                         'data_hora': weather_data.get('data_atualizacao', datetime.now().isoformat()),
                         'fonte': 'openweather_api_gps',
-                        'coordenadas': {'lat': latitude, 'lon': longitude}
+                        'coordenadas': {'lat': latitude, 'lon': longitude},
+                        'localidade_proxima': localidade['name'] if localidade else None
                     }
                     print(f"✅ Retornando dados reais da API via GPS")
                     return Response(response_data)
@@ -250,7 +253,16 @@ def previsao_tempo_view(request):
             cidade = 'Maputo'  # Cidade padrão
             
         print(f"🔍 Buscando previsão para cidade: {cidade}")
-        
+
+        # Localidades conhecidas: previsão gravada pelo prefetch_clima
+        known = openweather_service.exact_coordinates.get(cidade.lower().strip())
+        if known:
+            previsao_gravada = stored_forecast(known['name'], dias)
+            if previsao_gravada:
+                for previsao in previsao_gravada:
+                    previsao['cidade'] = cidade
+                return Response(previsao_gravada)
+
         # Obter coordenadas da cidade
         coords = openweather_service.get_coordinates(cidade)
         
@@ -1,3 +1,283 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
 
-# Create your tests here.
+import requests
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from clima.models import HistoricoClima, PrevisaoClimatica
+from clima.services import openweather, weather_prefetch
+from clima.services.spatial_index import LocationIndex, haversine_km
+from clima.services.openweather import OpenWeatherService, openweather_service, snap_to_grid
+
+
+def _response(payload):
+    response = MagicMock()
+    response.json.return_value = payload
+    response.raise_for_status.return_value = None
+    return response
+
+
+CURRENT_PAYLOAD = {
+    'main': {'temp': 28.5, 'feels_like': 30.0, 'temp_min': 27.0, 'temp_max': 29.0, 'humidity': 70, 'pressure': 1012},
+    'weather': [{'description': 'céu limpo', 'main': 'Clear', 'icon': '01d'}],
+    'wind': {'speed': 3.2, 'deg': 90},
+    'visibility': 10000,
+    'sys': {'country': 'MZ'},
+    'dt': 1700000000,
+}
+
+FORECAST_PAYLOAD = {
+    'list': [
+        {
+            'dt': 1700000000 + i * 3 * 3600,
+            'main': {'temp': 25 + i % 5, 'humidity': 60},
+            'weather': [{'description': 'nuvens dispersas'}],
+            'wind': {'speed': 2.0},
+        }
+        for i in range(40)
+    ]
+}
+
+
+@override_settings(WEATHER_GRID_DEGREES=0.05, WEATHER_CACHE_CURRENT_TTL=600, WEATHER_CACHE_CURRENT_STALE=3600)
+class OpenWeatherCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        openweather._cell_index.clear()
+        self.service = OpenWeatherService()
+        patcher = patch.object(openweather._session, 'get')
+        self.http_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_nearby_coordinates_share_grid_cell(self):
+        self.assertEqual(snap_to_grid(-25.9662, 32.5674), snap_to_grid(-25.9581, 32.5610))
+        self.assertNotEqual(snap_to_grid(-25.9662, 32.5674), snap_to_grid(-25.80, 32.5674))
+
+        self.http_get.return_value = _response(CURRENT_PAYLOAD)
+        first = self.service.get_current_weather(-25.9662, 32.5674)
+        second = self.service.get_current_weather(-25.9581, 32.5610)
+
+        self.assertEqual(first['temperatura'], 28.5)
+        self.assertEqual(first, second)
+        self.assertEqual(self.http_get.call_count, 1)
+
+        self.service.get_current_weather(-25.80, 32.5674)
+        self.assertEqual(self.http_get.call_count, 2)
+
+    def test_points_across_cell_border_share_entry(self):
+        # -25.4749 e -25.4751 caem em células diferentes da grelha de 0.05°
+        self.assertNotEqual(snap_to_grid(-25.4749, 32.30), snap_to_grid(-25.4751, 32.30))
+
+        self.http_get.return_value = _response(CURRENT_PAYLOAD)
+        self.service.get_current_weather(-25.4749, 32.30)
+        self.service.get_current_weather(-25.4751, 32.30)
+        self.assertEqual(self.http_get.call_count, 1)
+
+    def test_known_location_fetched_at_exact_coordinates(self):
+        self.http_get.return_value = _response(CURRENT_PAYLOAD)
+        self.service.get_current_weather(-19.85, 34.83)
+
+        params = self.http_get.call_args.kwargs['params']
+        self.assertEqual((params['lat'], params['lon']), (-19.8436, 34.8389))
+
+    def test_known_location_not_served_from_its_grid_cell(self):
+        maputo = openweather_service.exact_coordinates['maputo']
+        gps = (-25.93, 32.53)
+        # O ponto GPS fica fora do raio de Maputo mas na mesma célula da grelha
+        self.assertEqual(snap_to_grid(*gps), snap_to_grid(maputo['lat'], maputo['lon']))
+
+        self.http_get.return_value = _response(CURRENT_PAYLOAD)
+        self.service.get_current_weather(*gps)
+        self.service.get_current_weather(maputo['lat'], maputo['lon'])
+
+        fetched = [(c.kwargs['params']['lat'], c.kwargs['params']['lon']) for c in self.http_get.call_args_list]
+        self.assertEqual(fetched, [snap_to_grid(*gps), (maputo['lat'], maputo['lon'])])
+
+    def test_find_location_by_coordinates(self):
+        self.assertEqual(self.service.find_location(-19.90, 34.90)['name'], 'Beira')
+        self.assertEqual(self.service.find_location(-25.97, 32.57)['name'], 'Maputo')
+        self.assertIsNone(self.service.find_location(-21.0, 31.0))
+
+    def test_stale_entry_served_while_revalidating(self):
+        self.http_get.return_value = _response(CURRENT_PAYLOAD)
+        now = openweather.time.time()
+        self.service.get_current_weather(-19.84, 34.84)
+
+        updated = dict(CURRENT_PAYLOAD, main=dict(CURRENT_PAYLOAD['main'], temp=31.0))
+        self.http_get.return_value = _response(updated)
+        futures = []
+        refresh = openweather._refresh_in_background
+
+        def track(*args):
+            future = refresh(*args)
+            futures.append(future)
+            return future
+
+        with patch.object(openweather.time, 'time', return_value=now + 601), \
+                patch.object(openweather, '_refresh_in_background', side_effect=track):
+            stale = self.service.get_current_weather(-19.84, 34.84)
+            self.assertEqual(stale['temperatura'], 28.5)
+            futures[0].result(timeout=5)
+
+        self.assertEqual(self.service.get_current_weather(-19.84, 34.84)['temperatura'], 31.0)
+        self.assertEqual(self.http_get.call_count, 2)
+
+    def test_stale_entry_kept_when_api_fails(self):
+        self.http_get.return_value = _response(CURRENT_PAYLOAD)
+        now = openweather.time.time()
+        self.service.get_current_weather(-15.11, 39.26)
+
+        self.http_get.side_effect = Exception('timeout')
+        # Atualização síncrona para o teste não depender da thread
+        with patch.object(openweather.time, 'time', return_value=now + 601), \
+                patch.object(openweather, '_refresh_in_background',
+                             side_effect=lambda *args: openweather._refresh(*args)):
+            self.assertEqual(self.service.get_current_weather(-15.11, 39.26)['temperatura'], 28.5)
+            self.assertEqual(self.service.get_current_weather(-15.11, 39.26)['temperatura'], 28.5)
+        self.assertEqual(self.http_get.call_count, 3)
+
+    def test_cold_miss_failure_is_not_cached(self):
+        self.http_get.side_effect = Exception('timeout')
+        self.assertIsNone(self.service.get_current_weather(-13.31, 35.24))
+
+        self.http_get.side_effect = None
+        self.http_get.return_value = _response(CURRENT_PAYLOAD)
+        self.assertEqual(self.service.get_current_weather(-13.31, 35.24)['temperatura'], 28.5)
+
+    def test_forecast_lengths_share_one_fetch(self):
+        self.http_get.return_value = _response(FORECAST_PAYLOAD)
+
+        five_days = self.service.get_forecast(-16.15, 33.58, 5)
+        two_days = self.service.get_forecast(-16.15, 33.58, 2)
+
+        self.assertGreaterEqual(len(five_days), len(two_days))
+        self.assertEqual(five_days[:len(two_days) - 1], two_days[:-1])
+        self.assertEqual(self.http_get.call_count, 1)
+
+    def test_geocoding_cached_including_not_found(self):
+        self.http_get.return_value = _response([{'lat': -14.1, 'lon': 38.2, 'name': 'Ribáuè'}])
+        self.assertEqual(self.service.get_coordinates('Ribáuè')['lat'], -14.1)
+        self.assertEqual(self.service.get_coordinates('ribáuè ')['lat'], -14.1)
+
+        self.http_get.return_value = _response([])
+        self.assertIsNone(self.service.get_coordinates('Inexistente'))
+        self.assertIsNone(self.service.get_coordinates('Inexistente'))
+        self.assertEqual(self.http_get.call_count, 2)
+
+    def test_exact_coordinates_skip_geocoding(self):
+        self.assertEqual(self.service.get_coordinates('Beira')['name'], 'Beira')
+        self.http_get.assert_not_called()
+
+
+class LocationIndexTests(TestCase):
+    def test_nearest_within_radius(self):
+        index = LocationIndex(bucket_km=5)
+        index.add(-25.966, 32.567, 'Maputo')
+        index.add(-25.962, 32.459, 'Matola')
+
+        self.assertEqual(index.nearest(-25.96, 32.55, 5)[0], 'Maputo')
+        self.assertEqual(index.nearest(-25.96, 32.47, 5)[0], 'Matola')
+        self.assertIsNone(index.nearest(-25.50, 32.55, 5))
+        # Raio maior que o balde também procura nos baldes mais distantes
+        self.assertEqual(index.nearest(-25.80, 32.55, 25)[0], 'Maputo')
+
+    def test_haversine_km(self):
+        # Maputo - Beira ~ 725 km
+        self.assertAlmostEqual(haversine_km(-25.966, 32.567, -19.844, 34.839), 725, delta=10)
+
+
+def _forecast_from_now():
+    start = int(openweather.time.time())
+    return {
+        'list': [
+            {
+                'dt': start + i * 3 * 3600,
+                'main': {'temp': 20 + i % 8, 'humidity': 55},
+                'weather': [{'description': 'chuva fraca'}],
+                'wind': {'speed': 4.0},
+                'rain': {'3h': 1.5},
+            }
+            for i in range(40)
+        ]
+    }
+
+
+@override_settings(OPENWEATHER_CALLS_PER_MINUTE=0, WEATHER_PREFETCH_WORKERS=2)
+class WeatherPrefetchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        openweather._cell_index.clear()
+        self.forecast = _forecast_from_now()
+        patcher = patch.object(openweather._session, 'get', side_effect=self._fake_get)
+        self.http_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _fake_get(self, url, params=None, timeout=None):
+        return _response(self.forecast if url.endswith('/forecast') else CURRENT_PAYLOAD)
+
+    def test_known_locations_skip_name_variants(self):
+        locations = weather_prefetch.known_locations()
+        names = [location['name'] for location in locations]
+        self.assertEqual(names.count('Maputo'), 1)
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_prefetch_fills_cache_and_tables(self):
+        locations = [openweather_service.exact_coordinates[key] for key in ('maputo', 'beira', 'tete')]
+        fetched = weather_prefetch.prefetch_all(locations)
+        self.assertEqual(len(fetched['results']), 3)
+        self.assertEqual(fetched['errors'], [])
+        self.assertEqual(self.http_get.call_count, 6)
+
+        saved = weather_prefetch.save_results(fetched['results'])
+        self.assertEqual(HistoricoClima.objects.count(), 3)
+        self.assertEqual(PrevisaoClimatica.objects.filter(localizacao='Beira').count(), saved['previsoes'] // 3)
+
+        # Segunda execução atualiza as mesmas linhas
+        weather_prefetch.save_results(weather_prefetch.prefetch_all(locations)['results'])
+        self.assertEqual(PrevisaoClimatica.objects.count(), saved['previsoes'])
+        self.assertEqual(HistoricoClima.objects.count(), 3)
+
+        # Pedidos de utilizadores já não chamam a API
+        calls = self.http_get.call_count
+        beira = openweather_service.exact_coordinates['beira']
+        self.assertEqual(openweather_service.get_current_weather(beira['lat'], beira['lon'])['temperatura'], 28.5)
+        response = self.client.get('/api/clima/previsao/', {'cidade': 'Beira', 'dias': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(response.json()[0]['precipitacao'], PrevisaoClimatica.objects.filter(
+            localizacao='Beira').order_by('data_previsao').first().precipitacao)
+        self.assertEqual(self.http_get.call_count, calls)
+
+    def test_stored_forecast_ignores_outdated_rows(self):
+        location = openweather_service.exact_coordinates['nampula']
+        weather_prefetch.save_results(weather_prefetch.prefetch_all([location])['results'])
+        self.assertIsNotNone(weather_prefetch.stored_forecast('Nampula', 3))
+
+        PrevisaoClimatica.objects.update(data_criacao=timezone.now() - timedelta(days=2))
+        self.assertIsNone(weather_prefetch.stored_forecast('Nampula', 3))
+
+    def test_rate_limited_call_is_retried(self):
+        limited = MagicMock(status_code=429, headers={'Retry-After': '1'})
+        fetch = MagicMock(side_effect=[requests.HTTPError(response=limited), {'ok': True}])
+        limiter = weather_prefetch.RateLimiter(0)
+
+        with patch.object(weather_prefetch.time, 'sleep') as sleep, \
+                self.assertLogs('clima.services.weather_prefetch', 'WARNING') as logs:
+            self.assertEqual(weather_prefetch._call(fetch, limiter, max_retries=3), {'ok': True})
+        self.assertEqual(fetch.call_count, 2)
+        sleep.assert_called_once()
+        self.assertIn('OpenWeather 429', logs.output[0])
+
+    def test_failed_location_reported_without_stopping_others(self):
+        def fake_get(url, params=None, timeout=None):
+            if params['lat'] == openweather_service.exact_coordinates['pemba']['lat']:
+                raise requests.ConnectionError('sem rede')
+            return self._fake_get(url, params, timeout)
+
+        self.http_get.side_effect = fake_get
+        locations = [openweather_service.exact_coordinates[key] for key in ('pemba', 'lichinga')]
+        fetched = weather_prefetch.prefetch_all(locations)
+        self.assertEqual([r['location']['name'] for r in fetched['results']], ['Lichinga'])
+        self.assertEqual(fetched['errors'][0][0], 'Pemba')
@@ -3,11 +3,18 @@
 
 import os
 import json
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Any
 from google.cloud import aiplatform
 from google.oauth2 import service_account
 from decouple import config
 from .config import get_firebase_app, is_firebase_configured
+from . import model_registry, response_cache
+from .model_registry import canonicalize_model_name
+from .markdown_renderer import IncrementalMarkdownRenderer, _format_inline, _process_table_cell, _markdown_to_html
 
 
 import threading
@@ -25,293 +32,89 @@ def get_model_usage_metrics():
     with _model_usage_lock:
         return dict(_model_usage_counter)
 
+# Hits/misses do cache de respostas (firebase/response_cache.py)
+_response_cache_counter = {'hits': 0, 'misses': 0}
 
-_SHORT_TO_CANONICAL = {
-    'gemini-pro': 'models/gemini-pro-latest',
-    'gemini-2.5-pro': 'models/gemini-2.5-pro',
-    'gemini-flash': 'models/gemini-1.5-flash-latest',
-    'gemini-1.5-flash': 'models/gemini-1.5-flash-latest',
-    'gemini-1.5-pro': 'models/gemini-1.5-pro-latest',
-    'gemini-2.5-flash': 'models/gemini-2.5-flash',
-    'gemini-flash-lite': 'models/gemini-flash-lite-latest',
-    'gemini-2.5-flash-lite': 'models/gemini-2.5-flash-lite',
-}
+def _log_response_cache(hit):
+    with _model_usage_lock:
+        _response_cache_counter['hits' if hit else 'misses'] += 1
 
-def canonicalize_model_name(name):
-    if not name:
-        return name
-    name = name.strip()
-    return _SHORT_TO_CANONICAL.get(name, name)
+def get_response_cache_metrics():
+    with _model_usage_lock:
+        hits = _response_cache_counter['hits']
+        misses = _response_cache_counter['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': round(hits / total, 4) if total else 0.0}
 
 
-def _format_inline(text: str) -> str:
-    """Formata elementos inline: negrito, itálico, código, links"""
-    import re
-    
-    # Escapar HTML especial primeiro (antes de processar markdown)
-    text = text.replace('&', '&amp;')
-    text = text.replace('<', '&lt;')
-    text = text.replace('>', '&gt;')
-    
-    # Código inline `código`
-    text = re.sub(r'`([^`]+)`', r'<code>\1</code>', text)
-    
-    # Links [texto](url)
-    text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2" target="_blank" rel="noopener noreferrer">\1</a>', text)
-    
-    # Negrito **texto** ou __texto__ (não capturar espaços nas pontas)
-    text = re.sub(r'\*\*([^\*\n]+?)\*\*', r'<strong>\1</strong>', text)
-    text = re.sub(r'__([^_\n]+?)__', r'<strong>\1</strong>', text)
-    
-    # Itálico *texto* ou _texto_ (mas não dentro de palavras ou números)
-    text = re.sub(r'(?<!\w)\*([^\*\n]+?)\*(?!\w)', r'<em>\1</em>', text)
-    text = re.sub(r'(?<!\w)_([^_\n]+?)_(?!\w)', r'<em>\1</em>', text)
-    
-    # Tachado ~~texto~~
-    text = re.sub(r'~~([^~\n]+?)~~', r'<del>\1</del>', text)
-    
-    return text
+# Executor limitado para as chamadas bloqueantes do SDK (generate_content,
+# send_message, iteração do streaming). Partilhado pelo processo inteiro para
+# que um único worker ASGI consiga manter muitas chamadas ao Gemini em curso
+# sem criar um event loop (ou thread) novo por request.
+_AI_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(config('GOOGLE_AI_MAX_CONCURRENCY', default='64')),
+    thread_name_prefix='ai-sdk'
+)
 
 
-def _process_table_cell(cell_text: str) -> str:
-    """
-    Processa conteúdo de célula de tabela, incluindo <br>, <ul>, <li>
-    Não escapa HTML dentro de células para permitir formatação rica
-    """
-    import re
-    
-    # Se contém tags HTML como <br>, <ul>, <li>, não escapar
-    if re.search(r'<(br|ul|li|ol|strong|em)', cell_text, re.IGNORECASE):
-        # Processar apenas markdown inline (negrito, itálico) sem escapar HTML existente
-        # Negrito **texto**
-        cell_text = re.sub(r'\*\*([^\*\n]+?)\*\*', r'<strong>\1</strong>', cell_text)
-        # Itálico *texto*
-        cell_text = re.sub(r'(?<!\w)\*([^\*\n]+?)\*(?!\w)', r'<em>\1</em>', cell_text)
-        return cell_text
-    else:
-        # Processar normalmente com escape
-        return _format_inline(cell_text)
-
-
-def _markdown_to_html(text: str) -> str:
+async def _run_blocking(func, *args, **kwargs):
+    """Executa uma chamada bloqueante do SDK no executor sem bloquear o event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_AI_EXECUTOR, functools.partial(func, *args, **kwargs))
+
+
+_STREAM_END = object()
+
+# Tamanho dos chunks ao reproduzir uma resposta do cache como streaming
+_CACHE_REPLAY_CHUNK_CHARS = 64
+
+
+def _stream_content_event(renderer: IncrementalMarkdownRenderer, chunk_text: str) -> Dict[str, Any]:
+    """Evento SSE de conteúdo: apenas o texto novo e o HTML dos blocos já completos"""
+    event = {'type': 'content', 'text': chunk_text, 'done': False}
+    html_delta = renderer.feed(chunk_text)
+    if html_delta:
+        event['html'] = html_delta
+    return event
+
+
+def _stream_done_event(renderer: IncrementalMarkdownRenderer, **extra) -> Dict[str, Any]:
     """
-    Converte markdown para HTML formatado com suporte completo a:
-    - Cabeçalhos (# ## ###)
-    - Negrito (**texto** ou __texto__)
-    - Itálico (*texto* ou _texto_)
-    - Listas numeradas (1. 2. 3.)
-    - Listas não-numeradas (- * +)
-    - Blocos de código (```codigo```)
-    - Código inline (`codigo`)
-    - Links [texto](url)
-    - Aspas/Citações (> texto)
-    - Linhas horizontais (---, ***, ___)
-    - Tabelas
+    Evento SSE final: HTML restante e tamanho (bytes UTF-8) + checksum do texto,
+    para o cliente validar o que acumulou sem o servidor reenviar a resposta inteira
     """
-    if not text:
-        return ''
-    
-    import re
-    
-    lines = text.split('\n')
-    html_lines = []
-    in_code_block = False
-    in_list = False
-    in_quote = False
-    code_language = ''
-    list_type = None  # 'ul' or 'ol'
-    last_was_block = False  # Track if last element was a block element
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        stripped = line.strip()
-        
-        # Blocos de código com ```
-        if stripped.startswith('```'):
-            if not in_code_block:
-                # Iniciar bloco de código
-                code_language = stripped[3:].strip() or 'plaintext'
-                html_lines.append(f'<pre class="code-block"><code class="language-{code_language}">')
-                in_code_block = True
-                last_was_block = True
-            else:
-                # Fechar bloco de código
-                html_lines.append('</code></pre>')
-                in_code_block = False
-                code_language = ''
-                last_was_block = True
-            i += 1
-            continue
-        
-        # Dentro de bloco de código - não processar markdown
-        if in_code_block:
-            # Escapar HTML
-            escaped = line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-            html_lines.append(escaped)
-            i += 1
-            continue
-        
-        # Linha vazia - fechar listas/quotes
-        if not stripped:
-            if in_list:
-                html_lines.append(f'</{list_type}>')
-                in_list = False
-                list_type = None
-            if in_quote:
-                html_lines.append('</blockquote>')
-                in_quote = False
-            # Não adicionar <br> após fechamento de blocos estruturais
-            # apenas entre parágrafos normais
-            i += 1
-            continue
-        
-        # Linhas horizontais (---, ***, ___)
-        if re.match(r'^(\-{3,}|\*{3,}|_{3,})$', stripped):
-            if in_list:
-                html_lines.append(f'</{list_type}>')
-                in_list = False
-            html_lines.append('<hr>')
-            last_was_block = True
-            i += 1
-            continue
-        
-        # Cabeçalhos
-        heading_match = re.match(r'^(#{1,6})\s+(.+)$', stripped)
-        if heading_match:
-            if in_list:
-                html_lines.append(f'</{list_type}>')
-                in_list = False
-            level = len(heading_match.group(1))
-            heading_text = _format_inline(heading_match.group(2))
-            html_lines.append(f'<h{level}>{heading_text}</h{level}>')
-            last_was_block = True
-            i += 1
-            continue
-        
-        # Citações/Blockquotes
-        if stripped.startswith('>'):
-            quote_text = _format_inline(stripped[1:].strip())
-            if not in_quote:
-                html_lines.append('<blockquote>')
-                in_quote = True
-            html_lines.append(f'<p>{quote_text}</p>')
-            last_was_block = False  # Dentro de quote
-            i += 1
-            continue
-        elif in_quote:
-            html_lines.append('</blockquote>')
-            in_quote = False
-            last_was_block = True
-        
-        # Listas numeradas
-        numbered_match = re.match(r'^(\d+)\.\s+(.+)$', stripped)
-        if numbered_match:
-            list_text = _format_inline(numbered_match.group(2))
-            if not in_list or list_type != 'ol':
-                if in_list:
-                    html_lines.append(f'</{list_type}>')
-                html_lines.append('<ol>')
-                in_list = True
-                list_type = 'ol'
-            html_lines.append(f'<li>{list_text}</li>')
-            last_was_block = False  # Dentro de lista
-            i += 1
-            continue
-        
-        # Listas não-numeradas (-, *, +)
-        bullet_match = re.match(r'^[\-\*\+]\s+(.+)$', stripped)
-        if bullet_match:
-            list_text = _format_inline(bullet_match.group(1))
-            if not in_list or list_type != 'ul':
-                if in_list:
-                    html_lines.append(f'</{list_type}>')
-                html_lines.append('<ul>')
-                in_list = True
-                list_type = 'ul'
-            html_lines.append(f'<li>{list_text}</li>')
-            last_was_block = False  # Dentro de lista
-            i += 1
-            continue
-        
-        # Se estava em lista mas linha não é item, fechar lista
-        if in_list:
-            html_lines.append(f'</{list_type}>')
-            in_list = False
-            list_type = None
-            last_was_block = True
-        
-        # Tabelas markdown (detectar linha com | ... | ... |)
-        if '|' in stripped and stripped.count('|') >= 2:
-            # Coletar todas as linhas da tabela
-            table_lines = []
-            table_start = i
-            
-            # Primeira linha (cabeçalhos)
-            if '|' in stripped:
-                table_lines.append(stripped)
-                i += 1
-                
-                # Verificar linha de separação (| :--- | :--- |)
-                if i < len(lines):
-                    sep_line = lines[i].strip()
-                    if '|' in sep_line and ('-' in sep_line or ':' in sep_line):
-                        table_lines.append(sep_line)
-                        i += 1
-                        
-                        # Coletar linhas de dados
-                        while i < len(lines):
-                            data_line = lines[i].strip()
-                            if data_line and '|' in data_line:
-                                table_lines.append(data_line)
-                                i += 1
-                            else:
-                                break
-                        
-                        # Converter para HTML
-                        if len(table_lines) >= 2:
-                            html_lines.append('<div class="table-wrapper"><table>')
-                            
-                            # Processar cabeçalhos
-                            headers = [cell.strip() for cell in table_lines[0].split('|') if cell.strip()]
-                            html_lines.append('<thead><tr>')
-                            for header in headers:
-                                html_lines.append(f'<th>{_process_table_cell(header)}</th>')
-                            html_lines.append('</tr></thead>')
-                            
-                            # Processar linhas de dados (pular linha de separação)
-                            if len(table_lines) > 2:
-                                html_lines.append('<tbody>')
-                                for row_line in table_lines[2:]:
-                                    cells = [cell.strip() for cell in row_line.split('|') if cell.strip()]
-                                    html_lines.append('<tr>')
-                                    for cell in cells:
-                                        html_lines.append(f'<td>{_process_table_cell(cell)}</td>')
-                                    html_lines.append('</tr>')
-                                html_lines.append('</tbody>')
-                            
-                            html_lines.append('</table></div>')
-                            last_was_block = True
-                            continue
-            
-            # Se não for tabela válida, voltar ao índice original
-            i = table_start
-        
-        # Parágrafos normais com formatação inline
-        formatted_line = _format_inline(stripped)
-        html_lines.append(f'<p>{formatted_line}</p>')
-        last_was_block = False
-        i += 1
-    
-    # Fechar tags abertas no final
-    if in_code_block:
-        html_lines.append('</code></pre>')
-    if in_list:
-        html_lines.append(f'</{list_type}>')
-    if in_quote:
-        html_lines.append('</blockquote>')
-    
-    return '\n'.join(html_lines)
+    return {
+        'type': 'done',
+        'done': True,
+        'html': renderer.finish(),
+        'length': renderer.text_length,
+        'checksum': renderer.text_checksum,
+        **extra
+    }
+
+
+def _cached_text_result(cached: Dict[str, Any]) -> Dict[str, Any]:
+    """Resultado de generate_text a partir de uma resposta guardada no cache"""
+    return {
+        'success': True,
+        'text': cached['text'],
+        'content': cached['text'],  # legacy key for compatibility
+        'content_html': _markdown_to_html(cached['text']),
+        'model': cached['model'],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        'cached': True
+    }
+
+
+def _replay_cached_stream(cached: Dict[str, Any]):
+    """Eventos SSE de uma resposta do cache, no mesmo formato do streaming do modelo"""
+    text = cached['text']
+    renderer = IncrementalMarkdownRenderer()
+    chunk_count = 0
+    for i in range(0, len(text), _CACHE_REPLAY_CHUNK_CHARS):
+        chunk_count += 1
+        yield _stream_content_event(renderer, text[i:i + _CACHE_REPLAY_CHUNK_CHARS])
+    yield _stream_done_event(renderer, model=cached['model'], chunks=chunk_count, cached=True)
 
 
 class FirebaseAIService:
@@ -326,6 +129,8 @@ class FirebaseAIService:
         self.is_configured = is_firebase_configured()
         # Modo de desenvolvimento mock: quando true, respostas serão simuladas
         self.dev_mock = config('FIREBASE_AI_DEV_MOCK', default='false').lower() in ('1', 'true', 'yes')
+        # Latência artificial (segundos) das respostas simuladas, útil para benchmarks de carga
+        self.dev_mock_latency = float(config('FIREBASE_AI_DEV_MOCK_LATENCY', default='0'))
         if self.dev_mock:
             print("⚠️ FIREBASE_AI_DEV_MOCK habilitado: usando respostas simuladas para AI")
         
@@ -334,18 +139,10 @@ class FirebaseAIService:
             self._initialize_vertex_ai()
     
     def _initialize_vertex_ai(self):
-        """Inicializa o cliente Google AI"""
+        """Inicializa o cliente Google AI (uma vez por processo, via model_registry)"""
         try:
-            import google.generativeai as genai
-            
-            # Configura o cliente com a API key do .env
             # Use decouple.config so local .env files are read when running Django locally
-            api_key = config('GOOGLE_AI_API_KEY', default=None)
-            if not api_key:
-                raise ValueError("GOOGLE_AI_API_KEY não encontrada nas variáveis de ambiente")
-                
-            genai.configure(api_key=api_key)
-            print("✅ Google AI inicializado com sucesso")
+            model_registry.ensure_configured()
             
         except ImportError as e:
             print(f"❌ Erro ao importar Google Generative AI: {e}")
@@ -356,18 +153,21 @@ class FirebaseAIService:
 
     def _get_generative_model(self, model_name: str = "gemini-pro"):
         """
-        Instancia um modelo generativo usando Google's Generative AI.
+        Obtém o modelo generativo do registry do processo (criado uma única vez).
         Retorna o modelo ou None em caso de erro.
         """
         try:
-            import google.generativeai as genai
             canon_name = canonicalize_model_name(model_name)
-            model = genai.GenerativeModel(canon_name)
-            print(f"✅ Modelo {canon_name} carregado via Google Generative AI")
+            model = model_registry.get_model(canon_name)
             return model, canon_name
         except Exception as e:
             print(f"❌ Erro ao carregar modelo {model_name}: {str(e)}")
             return None, None
+
+    async def _simulate_mock_latency(self):
+        """Simula a chamada bloqueante ao modelo no modo mock (passa pelo mesmo executor)"""
+        if self.dev_mock_latency > 0:
+            await _run_blocking(time.sleep, self.dev_mock_latency)
     
     async def generate_text(
         self,
@@ -376,27 +176,53 @@ class FirebaseAIService:
         max_output_tokens: int = 4096,  # Aumentado de 1024 para 4096
         temperature: float = 0.7,
         top_p: float = 0.8,
+        top_k: int = 40,
+        cache_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Gera texto usando Google's Generative AI.
+        Com `cache_key` (response_cache.build_cache_key), responde do cache de
+        respostas quando possível e guarda as respostas completas geradas.
+        """
+        if cache_key:
+            cached = await response_cache.get_response(cache_key)
+            _log_response_cache(cached is not None)
+            if cached:
+                return _cached_text_result(cached)
+
+        result = await self._generate_text(prompt, model_name, max_output_tokens, temperature, top_p, top_k)
+
+        if cache_key and result.get('success') and not result.get('truncated'):
+            await response_cache.store_response(cache_key, result.get('text', ''), result.get('model'))
+        return result
+
+    async def _generate_text(
+        self,
+        prompt: str,
+        model_name: str = None,
+        max_output_tokens: int = 4096,
+        temperature: float = 0.7,
+        top_p: float = 0.8,
         top_k: int = 40
     ) -> Dict[str, Any]:
         """
-        Gera texto usando Google's Generative AI
+        Gera texto usando Google's Generative AI (sem cache)
         """
         if self.dev_mock:
             # Retornar resposta simulada para desenvolvimento
+            await self._simulate_mock_latency()
+            mock_text = f"[DEV MOCK] Resposta simulada para: {prompt[:50]}..."
             return {
                 'success': True,
-                'text': f"[DEV MOCK] Resposta simulada para: {prompt[:50]}...",
+                'text': mock_text,
+                'content': mock_text,  # legacy key for compatibility
                 'model': 'dev-mock',
                 'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
             }
             
         # Load default/fallback models from env
-        default_model = config('GOOGLE_AI_DEFAULT_MODEL', default='models/gemini-1.5-flash-latest')
-        fallback_models = config('GOOGLE_AI_FALLBACK_MODELS', default='models/gemini-1.5-pro-latest,models/gemini-2.5-pro,models/gemini-flash-latest,models/gemini-2.5-flash')
-        fallback_list = [m.strip() for m in fallback_models.split(',') if m.strip()]
-        # Use provided model_name or default
-        requested_model = model_name or default_model
-        all_candidates = [requested_model] + [m for m in fallback_list if m != requested_model]
+        # Modelo pedido + fallbacks, começando pelo último modelo que funcionou
+        all_candidates = model_registry.candidate_chain(model_name)
 
         last_err = None
         def _extract_text_from_response(response) -> str:
@@ -470,7 +296,8 @@ class FirebaseAIService:
                 continue
             try:
                 # initial request
-                response = model.generate_content(
+                response = await _run_blocking(
+                    model.generate_content,
                     prompt,
                     generation_config={
                         'max_output_tokens': max_output_tokens,
@@ -513,7 +340,8 @@ class FirebaseAIService:
                     retry_tokens = min(max_output_tokens * (2 ** retries), env_cap)
                     print(f"🔁 Generation retry {retries}/{max_retries} with max_output_tokens={retry_tokens} due to finish_reason={finish_reason} or empty output")
                     try:
-                        response2 = model.generate_content(
+                        response2 = await _run_blocking(
+                            model.generate_content,
                             prompt,
                             generation_config={
                                 'max_output_tokens': retry_tokens,
@@ -567,7 +395,8 @@ class FirebaseAIService:
                             cont_prompt = f"Por favor, continue a resposta anterior.\n\nResposta anterior:\n{combined_text}\n\nContinue a partir daqui:" if combined_text else f"Por favor, continue a resposta para: {prompt}"
                             retry_tokens = min(int(config('GOOGLE_AI_MAX_OUTPUT_TOKENS', default='4096')), max_output_tokens * (2 ** (retries + cont_attempts)))
                             print(f"🔁 Continuation attempt {cont_attempts}/{max_retries} with max_output_tokens={retry_tokens}")
-                            response_cont = model.generate_content(
+                            response_cont = await _run_blocking(
+                                model.generate_content,
                                 cont_prompt,
                                 generation_config={
                                     'max_output_tokens': retry_tokens,
@@ -607,6 +436,7 @@ class FirebaseAIService:
                             break
 
                 _log_model_usage(resolved_name)
+                model_registry.remember_resolution(model_name, resolved_name)
 
                 # Prepare final return values (use combined_text/usage if retried)
                 final_text = combined_text
@@ -624,6 +454,7 @@ class FirebaseAIService:
                 }
             except Exception as e:
                 print(f"⚠️ Falha ao usar modelo {resolved_name}: {e}")
+                model_registry.mark_model_failed(resolved_name)
                 last_err = e
                 continue
         # If all candidates fail
@@ -632,135 +463,6 @@ class FirebaseAIService:
             'success': False,
             'error': f'Nenhum modelo disponível. Último erro: {last_err}'
         }
-            
-        try:
-            # Generate content using the model
-            try:
-                response = model.generate_content(
-                    prompt,
-                    generation_config={
-                        'max_output_tokens': max_output_tokens,
-                        'temperature': temperature,
-                        'top_p': top_p,
-                        'top_k': top_k
-                    }
-                )
-            except Exception as e:
-                # If the model is not found or not supported for generate_content,
-                # attempt to list available models and try them as fallbacks.
-                print(f"⚠️ Falha ao usar modelo {model_name}: {e}. Tentando fallbacks...")
-                try:
-                    import google.generativeai as genai
-                    available = []
-                    try:
-                        # list_models may return an iterable of model objects or dicts
-                        available = genai.list_models()
-                    except Exception:
-                        # If listing fails, fall back to a conservative candidate list
-                        available = []
-
-                    tried = []
-                    success = False
-                    last_err = None
-                    # normalize available into names if possible
-                    candidate_names = []
-                    for m in available:
-                        if isinstance(m, str):
-                            candidate_names.append(m)
-                        else:
-                            # try common attributes
-                            name = getattr(m, 'name', None) or m.get('name') if isinstance(m, dict) else None
-                            if name:
-                                candidate_names.append(name)
-
-                    # append some common candidates as last resort
-                    candidate_names.extend(['text-bison@001', 'text-bison', 'gemini-pro', 'gemini-1'])
-
-                    for cand in candidate_names:
-                        if not cand or cand in tried:
-                            continue
-                        tried.append(cand)
-                        try:
-                            cand_model = genai.GenerativeModel(cand)
-                            response = cand_model.generate_content(
-                                prompt,
-                                generation_config={
-                                    'max_output_tokens': max_output_tokens,
-                                    'temperature': temperature,
-                                    'top_p': top_p,
-                                    'top_k': top_k
-                                }
-                            )
-                            model_name = cand
-                            model = cand_model
-                            success = True
-                            break
-                        except Exception as e2:
-                            last_err = e2
-                            continue
-
-                    if not success:
-                        # re-raise the original exception if no fallback worked
-                        raise e
-                except Exception:
-                    # If fallback attempts fail, raise the original exception
-                    raise
-            
-            return {
-                'success': True,
-                'text': getattr(response, 'text', getattr(response, 'content', '')),
-                'model': model_name,
-                'usage': {
-                    'prompt_tokens': getattr(response, 'prompt_token_count', 0),
-                    'completion_tokens': (response.candidates[0].token_count if getattr(response, 'candidates', None) else getattr(response, 'token_count', 0)),
-                    'total_tokens': (getattr(response, 'prompt_token_count', 0) + (response.candidates[0].token_count if getattr(response, 'candidates', None) else getattr(response, 'token_count', 0)))
-                }
-            }
-            
-        except Exception as e:
-            print(f"❌ Erro ao gerar texto: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e)
-            }
-        """
-        Gera texto usando um modelo generativo
-        
-        Args:
-            prompt: Texto de entrada para o modelo
-            model_name: Nome do modelo (ex: 'gemini-pro')
-            max_output_tokens: Número máximo de tokens na resposta
-            temperature: Controla aleatoriedade (0.0-2.0)
-            top_p: Controla diversidade (0.0-1.0)
-            top_k: Limita o vocabulário considerado
-            
-        Returns:
-            Dicionário com resposta do modelo
-        """
-        # Modo de desenvolvimento: retornar resposta simulada rápida
-        if self.dev_mock:
-            sample = f"[MOCK] Resposta simulada para prompt: {prompt[:200]}"
-            return {
-                'success': True,
-                'content': sample,
-                'model': 'mock',
-                'usage': {
-                    'prompt_tokens': len(prompt.split()),
-                    'completion_tokens': len(sample.split()),
-                },
-                'metadata': {
-                    'temperature': temperature,
-                    'max_tokens': max_output_tokens
-                }
-            }
-
-        if not self.is_configured:
-            return {
-                'success': False,
-                'error': 'Firebase AI não está configurado'
-            }
-        
-        # (Firebase AI Logic legacy block omitted)
     
     async def generate_text_stream(
         self,
@@ -770,32 +472,72 @@ class FirebaseAIService:
         temperature: float = 0.7,
         top_p: float = 0.8,
         top_k: int = 40,
-        image_data: str = None  # Base64 image data for multimodal prompts
+        image_data: str = None,  # Base64 image data for multimodal prompts
+        cache_key: Optional[str] = None
     ):
         """
         Gera texto com streaming em tempo real (word-by-word)
-        Yields chunks de texto conforme são gerados pela IA
+        Yields chunks de texto conforme são gerados pela IA:
+        - content: {'text': delta de texto, 'html': delta HTML dos blocos completos (opcional)}
+        - done: {'html': delta HTML final, 'length': bytes UTF-8, 'checksum': 'sha256:...'}
+        Com `cache_key` (e sem imagem), uma resposta em cache é reproduzida com os
+        mesmos eventos (done traz 'cached': True) e uma resposta nova é guardada.
+        """
+        if image_data:
+            cache_key = None
+
+        if cache_key:
+            cached = await response_cache.get_response(cache_key)
+            _log_response_cache(cached is not None)
+            if cached:
+                for event in _replay_cached_stream(cached):
+                    yield event
+                return
+
+        text_parts = []
+        async for event in self._generate_text_stream(
+            prompt, model_name, max_output_tokens, temperature, top_p, top_k, image_data
+        ):
+            if cache_key:
+                if event['type'] == 'content':
+                    text_parts.append(event['text'])
+                elif event['type'] == 'done':
+                    # Só respostas completas: sem corte por max tokens e com o texto
+                    # recebido igual ao do modelo que terminou (se um modelo falhou a
+                    # meio, o texto dele também foi emitido e não deve ser guardado)
+                    text = ''.join(text_parts)
+                    complete = not event.get('truncated') and len(text.encode('utf-8')) == event.get('length')
+                    if complete:
+                        # Guardar antes de entregar o evento final: o consumidor
+                        # normalmente pára de iterar ao receber done
+                        await response_cache.store_response(cache_key, text, event.get('model'))
+            yield event
+
+    async def _generate_text_stream(
+        self,
+        prompt: str,
+        model_name: str = None,
+        max_output_tokens: int = 4096,
+        temperature: float = 0.7,
+        top_p: float = 0.8,
+        top_k: int = 40,
+        image_data: str = None
+    ):
+        """
+        Streaming do modelo (sem cache); ver generate_text_stream
         """
         if self.dev_mock:
             # Mock streaming para desenvolvimento
             mock_text = f"Resposta simulada em streaming para: {prompt[:50]}..."
+            renderer = IncrementalMarkdownRenderer()
             for word in mock_text.split():
-                yield {
-                    'type': 'content',
-                    'text': word + ' ',
-                    'done': False
-                }
-                import asyncio
+                yield _stream_content_event(renderer, word + ' ')
                 await asyncio.sleep(0.05)
-            yield {'type': 'done', 'done': True}
+            yield _stream_done_event(renderer, model='dev-mock')
             return
         
         # Load default/fallback models
-        default_model = config('GOOGLE_AI_DEFAULT_MODEL', default='models/gemini-1.5-flash-latest')
-        fallback_models = config('GOOGLE_AI_FALLBACK_MODELS', default='models/gemini-1.5-pro-latest,models/gemini-2.5-pro,models/gemini-flash-latest,models/gemini-2.5-flash')
-        fallback_list = [m.strip() for m in fallback_models.split(',') if m.strip()]
-        requested_model = model_name or default_model
-        all_candidates = [requested_model] + [m for m in fallback_list if m != requested_model]
+        all_candidates = model_registry.candidate_chain(model_name)
         
         last_err = None
         for candidate in all_candidates:
@@ -847,7 +589,8 @@ class FirebaseAIService:
                     content_parts = [prompt]
                 
                 # Generate content com streaming habilitado
-                response = model.generate_content(
+                response = await _run_blocking(
+                    model.generate_content,
                     content_parts,
                     generation_config={
                         'max_output_tokens': max_output_tokens,
@@ -858,11 +601,18 @@ class FirebaseAIService:
                     stream=True  # ATIVA O STREAMING!
                 )
                 
-                accumulated_text = ""
+                renderer = IncrementalMarkdownRenderer()
                 chunk_count = 0
+                finish_reason = None
+                skipped_chunks = 0
                 
-                # Itera sobre os chunks conforme chegam
-                for chunk in response:
+                # Itera sobre os chunks conforme chegam (cada next() bloqueia na rede,
+                # por isso corre no executor)
+                chunk_iter = iter(response)
+                while True:
+                    chunk = await _run_blocking(next, chunk_iter, _STREAM_END)
+                    if chunk is _STREAM_END:
+                        break
                     try:
                         # Extrai texto do chunk
                         chunk_text = ""
@@ -875,39 +625,34 @@ class FirebaseAIService:
                                         if hasattr(part, 'text'):
                                             chunk_text += part.text
                         
+                        if getattr(chunk, 'candidates', None):
+                            finish_reason = getattr(chunk.candidates[0], 'finish_reason', None) or finish_reason
+                        
                         if chunk_text:
-                            accumulated_text += chunk_text
                             chunk_count += 1
                             
-                            # Envia o chunk para o cliente
-                            yield {
-                                'type': 'content',
-                                'text': chunk_text,
-                                'accumulated': accumulated_text,
-                                'done': False
-                            }
+                            # Envia o chunk para o cliente (delta de texto + delta HTML)
+                            yield _stream_content_event(renderer, chunk_text)
                     
                     except Exception as e:
                         print(f"⚠️ Erro ao processar chunk: {e}")
+                        skipped_chunks += 1
                         continue
                 
                 # Finaliza o streaming
                 _log_model_usage(resolved_name)
+                model_registry.remember_resolution(model_name, resolved_name)
                 
-                yield {
-                    'type': 'done',
-                    'done': True,
-                    'total_text': accumulated_text,
-                    'content_html': _markdown_to_html(accumulated_text),
-                    'model': resolved_name,
-                    'chunks': chunk_count
-                }
+                # Cortada por max tokens ou com chunks perdidos: a resposta está incompleta
+                truncated = bool(skipped_chunks) or 'MAX' in str(getattr(finish_reason, 'name', finish_reason) or '').upper()
+                yield _stream_done_event(renderer, model=resolved_name, chunks=chunk_count, truncated=truncated)
                 
-                print(f"✅ Streaming completado: {chunk_count} chunks, {len(accumulated_text)} caracteres")
+                print(f"✅ Streaming completado: {chunk_count} chunks, {renderer.text_length} bytes")
                 return
                 
             except Exception as e:
                 print(f"⚠️ Falha no streaming com modelo {resolved_name}: {e}")
+                model_registry.mark_model_failed(resolved_name)
                 last_err = e
                 continue
         
@@ -937,6 +682,7 @@ class FirebaseAIService:
         """
         # Modo de desenvolvimento: resposta de chat mock
         if self.dev_mock:
+            await self._simulate_mock_latency()
             last = messages[-1]['content'] if messages else ''
             sample = f"[MOCK_CHAT] Echo: {last[:300]}"
             return {
@@ -957,8 +703,9 @@ class FirebaseAIService:
             }
         
         try:
-            # Tentar instanciar modelo com fallback
-            model, resolved_name = self._get_generative_model(model_name)
+            # Tentar instanciar modelo com fallback (usa a resolução em cache do registry)
+            requested_model = model_name
+            model, resolved_name = self._get_generative_model(model_registry.candidate_chain(model_name)[0])
             if model is None:
                 raise RuntimeError(f"Modelo de chat não disponível: tried candidates for '{model_name}'")
             
@@ -975,17 +722,18 @@ class FirebaseAIService:
             try:
                 chat = model.start_chat(history=history)
                 last_message = messages[-1]["content"]
-                response = chat.send_message(last_message)
+                response = await _run_blocking(chat.send_message, last_message)
             except Exception as e:
                 # tentar fallbacks de chat
                 last_exc = e
+                model_registry.mark_model_failed(resolved_name)
                 for fb in ["chat-bison@001", "text-bison@001"]:
                     try:
                         from vertexai.generative_models import GenerativeModel
                         fb_model = GenerativeModel(fb)
                         chat = fb_model.start_chat(history=history)
                         last_message = messages[-1]["content"]
-                        response = chat.send_message(last_message)
+                        response = await _run_blocking(chat.send_message, last_message)
                         model_name = fb
                         model = fb_model
                         break
@@ -1055,7 +803,7 @@ class FirebaseAIService:
                 retry_tokens = min(2048 * (2 ** (retries-1)), env_cap)
                 print(f"🔁 Chat retry {retries}/{max_retries} with max_output_tokens={retry_tokens} due to finish_reason={finish_reason} or empty output")
                 try:
-                    response2 = chat.send_message(last_message)
+                    response2 = await _run_blocking(chat.send_message, last_message)
                 except Exception as e:
                     print(f"⚠️ Chat retry attempt failed: {e}")
                     break
@@ -1098,6 +846,9 @@ class FirebaseAIService:
 
                 need_retry = (not combined_text) or (isinstance(finish_reason, str) and 'MAX' in finish_reason.upper())
 
+            if model_name == requested_model:
+                model_registry.remember_resolution(requested_model, resolved_name)
+
             return {
                 'success': True,
                 'content': combined_text,
@@ -1121,7 +872,8 @@ class FirebaseAIService:
         self,
         query: str,
         context: Optional[Dict[str, str]] = None,
-        language: str = "pt"
+        language: str = "pt",
+        cache_key: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Assistente especializado em agricultura
@@ -1130,6 +882,7 @@ class FirebaseAIService:
             query: Pergunta do usuário
             context: Contexto adicional (localização, cultura, etc.)
             language: Idioma da resposta
+            cache_key: Chave do cache de respostas (opcional)
             
         Returns:
             Resposta especializada em agricultura
@@ -1158,7 +911,8 @@ class FirebaseAIService:
         return await self.generate_text(
             prompt,
             temperature=0.7,
-            max_output_tokens=4096  # Aumentado para respostas mais detalhadas
+            max_output_tokens=4096,  # Aumentado para respostas mais detalhadas
+            cache_key=cache_key
         )
     
     async def pest_disease_analysis(
@@ -1221,5 +975,7 @@ class FirebaseAIService:
             'available_models': [
                 'gemini-pro',
                 'gemini-pro-vision'
-            ] if self.is_configured else []
+            ] if self.is_configured else [],
+            'model_registry': model_registry.get_registry_status(),
+            'response_cache': get_response_cache_metrics()
         }
\ No newline at end of file
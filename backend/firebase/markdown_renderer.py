@@ -0,0 +1,340 @@
+# Markdown Renderer - Backend
+# Conversão de markdown (respostas do Gemini) para HTML, em modo completo
+# (_markdown_to_html) ou incremental durante o streaming SSE.
+
+import re
+import hashlib
+
+
+# Padrões compilados uma única vez por processo
+_CODE_RE = re.compile(r'`([^`]+)`')
+_LINK_RE = re.compile(r'\[([^\]]+)\]\(([^\)]+)\)')
+_BOLD_STAR_RE = re.compile(r'\*\*([^\*\n]+?)\*\*')
+_BOLD_UNDERSCORE_RE = re.compile(r'__([^_\n]+?)__')
+_ITALIC_STAR_RE = re.compile(r'(?<!\w)\*([^\*\n]+?)\*(?!\w)')
+_ITALIC_UNDERSCORE_RE = re.compile(r'(?<!\w)_([^_\n]+?)_(?!\w)')
+_STRIKE_RE = re.compile(r'~~([^~\n]+?)~~')
+_CELL_HTML_RE = re.compile(r'<(br|ul|li|ol|strong|em)', re.IGNORECASE)
+
+# Classificação de uma linha num único match (a ordem das alternativas é a
+# ordem de prioridade): linha horizontal, cabeçalho, item numerado, item com marcador
+_BLOCK_RE = re.compile(
+    r'(?:(?P<hr>\-{3,}|\*{3,}|_{3,})'
+    r'|(?P<hashes>#{1,6})\s+(?P<heading>.+)'
+    r'|\d+\.\s+(?P<numbered>.+)'
+    r'|[\-\*\+]\s+(?P<bullet>.+))$'
+)
+
+
+def _format_inline(text: str) -> str:
+    """Formata elementos inline: negrito, itálico, código, links"""
+    # Escapar HTML especial primeiro (antes de processar markdown)
+    text = text.replace('&', '&amp;')
+    text = text.replace('<', '&lt;')
+    text = text.replace('>', '&gt;')
+
+    # Cada substituição só corre se o marcador existir no texto; a ordem é a
+    # mesma de sempre porque cada passo vê o resultado do anterior
+
+    # Código inline `código`
+    if '`' in text:
+        text = _CODE_RE.sub(r'<code>\1</code>', text)
+
+    # Links [texto](url)
+    if '](' in text:
+        text = _LINK_RE.sub(r'<a href="\2" target="_blank" rel="noopener noreferrer">\1</a>', text)
+
+    # Negrito **texto** ou __texto__ (não capturar espaços nas pontas)
+    if '**' in text:
+        text = _BOLD_STAR_RE.sub(r'<strong>\1</strong>', text)
+    if '__' in text:
+        text = _BOLD_UNDERSCORE_RE.sub(r'<strong>\1</strong>', text)
+
+    # Itálico *texto* ou _texto_ (mas não dentro de palavras ou números)
+    if '*' in text:
+        text = _ITALIC_STAR_RE.sub(r'<em>\1</em>', text)
+    if '_' in text:
+        text = _ITALIC_UNDERSCORE_RE.sub(r'<em>\1</em>', text)
+
+    # Tachado ~~texto~~
+    if '~~' in text:
+        text = _STRIKE_RE.sub(r'<del>\1</del>', text)
+
+    return text
+
+
+def _process_table_cell(cell_text: str) -> str:
+    """
+    Processa conteúdo de célula de tabela, incluindo <br>, <ul>, <li>
+    Não escapa HTML dentro de células para permitir formatação rica
+    """
+    # Se contém tags HTML como <br>, <ul>, <li>, não escapar
+    if '<' in cell_text and _CELL_HTML_RE.search(cell_text):
+        # Processar apenas markdown inline (negrito, itálico) sem escapar HTML existente
+        if '*' in cell_text:
+            # Negrito **texto**
+            cell_text = _BOLD_STAR_RE.sub(r'<strong>\1</strong>', cell_text)
+            # Itálico *texto*
+            cell_text = _ITALIC_STAR_RE.sub(r'<em>\1</em>', cell_text)
+        return cell_text
+    else:
+        # Processar normalmente com escape
+        return _format_inline(cell_text)
+
+
+class IncrementalMarkdownRenderer:
+    """
+    Renderer markdown -> HTML com estado, alimentado chunk a chunk.
+
+    Guarda o estado do parser (bloco de código aberto, lista, citação, tabela
+    pendente) e só processa linhas completas; `feed()` retorna apenas o HTML
+    dos blocos que ficaram fechados desde a chamada anterior e `finish()` o
+    restante. A concatenação de todos os deltas é idêntica a
+    `_markdown_to_html(texto_completo)`.
+
+    Também mantém o tamanho (bytes UTF-8) e o checksum SHA-256 do texto
+    recebido, enviados no evento final do stream.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._pending_html = []
+        self._has_output = False
+        self._finished = False
+        self._hasher = hashlib.sha256()
+        self.text_length = 0
+
+        self.in_code_block = False
+        self.in_list = False
+        self.in_quote = False
+        self.list_type = None  # 'ul' or 'ol'
+        self.table_lines = []  # linhas da tabela ainda não renderizada
+        self.table_state = None  # None, 'header' (à espera do separador) ou 'body'
+
+    @property
+    def text_checksum(self) -> str:
+        return f'sha256:{self._hasher.hexdigest()}'
+
+    def feed(self, text: str) -> str:
+        """Adiciona texto e retorna o delta HTML dos blocos completados"""
+        if not text:
+            return ''
+        encoded = text.encode('utf-8')
+        self._hasher.update(encoded)
+        self.text_length += len(encoded)
+
+        self._buffer += text
+        if '\n' not in self._buffer:
+            return ''
+        *complete_lines, self._buffer = self._buffer.split('\n')
+        for line in complete_lines:
+            self._process_line(line)
+        return self._flush()
+
+    def finish(self) -> str:
+        """Processa a última linha, fecha tags abertas e retorna o delta final"""
+        if self._finished:
+            return ''
+        self._finished = True
+        if self.text_length == 0:
+            return ''
+
+        self._process_line(self._buffer)
+        self._buffer = ''
+        if self.table_state:
+            self._end_table()
+
+        # Fechar tags abertas no final
+        if self.in_code_block:
+            self._pending_html.append('</code></pre>')
+        if self.in_list:
+            self._pending_html.append(f'</{self.list_type}>')
+        if self.in_quote:
+            self._pending_html.append('</blockquote>')
+        return self._flush()
+
+    def _flush(self) -> str:
+        if not self._pending_html:
+            return ''
+        delta = '\n'.join(self._pending_html)
+        if self._has_output:
+            delta = '\n' + delta
+        self._has_output = True
+        self._pending_html = []
+        return delta
+
+    def _close_list(self):
+        self._pending_html.append(f'</{self.list_type}>')
+        self.in_list = False
+        self.list_type = None
+
+    def _end_table(self):
+        """Tabela pendente terminou: renderizar, ou tratar o cabeçalho como parágrafo"""
+        html_lines = self._pending_html
+        if self.table_state == 'header':
+            html_lines.append(f'<p>{_format_inline(self.table_lines[0])}</p>')
+        else:
+            html_lines.append('<div class="table-wrapper"><table>')
+
+            # Processar cabeçalhos
+            headers = [cell.strip() for cell in self.table_lines[0].split('|') if cell.strip()]
+            html_lines.append('<thead><tr>')
+            for header in headers:
+                html_lines.append(f'<th>{_process_table_cell(header)}</th>')
+            html_lines.append('</tr></thead>')
+
+            # Processar linhas de dados (pular linha de separação)
+            if len(self.table_lines) > 2:
+                html_lines.append('<tbody>')
+                for row_line in self.table_lines[2:]:
+                    cells = [cell.strip() for cell in row_line.split('|') if cell.strip()]
+                    html_lines.append('<tr>')
+                    for cell in cells:
+                        html_lines.append(f'<td>{_process_table_cell(cell)}</td>')
+                    html_lines.append('</tr>')
+                html_lines.append('</tbody>')
+
+            html_lines.append('</table></div>')
+        self.table_lines = []
+        self.table_state = None
+
+    def _process_line(self, line: str):
+        stripped = line.strip()
+        html_lines = self._pending_html
+
+        # Tabela em construção: a linha decide se a tabela continua
+        if self.table_state == 'header':
+            # Verificar linha de separação (| :--- | :--- |)
+            if '|' in stripped and ('-' in stripped or ':' in stripped):
+                self.table_lines.append(stripped)
+                self.table_state = 'body'
+                return
+            self._end_table()
+        elif self.table_state == 'body':
+            # Coletar linhas de dados
+            if stripped and '|' in stripped:
+                self.table_lines.append(stripped)
+                return
+            self._end_table()
+
+        # Blocos de código com ```
+        if stripped.startswith('```'):
+            if not self.in_code_block:
+                # Iniciar bloco de código
+                code_language = stripped[3:].strip() or 'plaintext'
+                html_lines.append(f'<pre class="code-block"><code class="language-{code_language}">')
+                self.in_code_block = True
+            else:
+                # Fechar bloco de código
+                html_lines.append('</code></pre>')
+                self.in_code_block = False
+            return
+
+        # Dentro de bloco de código - não processar markdown
+        if self.in_code_block:
+            # Escapar HTML
+            escaped = line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            html_lines.append(escaped)
+            return
+
+        # Linha vazia - fechar listas/quotes
+        if not stripped:
+            if self.in_list:
+                self._close_list()
+            if self.in_quote:
+                html_lines.append('</blockquote>')
+                self.in_quote = False
+            return
+
+        block = _BLOCK_RE.match(stripped)
+
+        # Linhas horizontais (---, ***, ___)
+        if block and block.group('hr'):
+            if self.in_list:
+                html_lines.append(f'</{self.list_type}>')
+                self.in_list = False
+            html_lines.append('<hr>')
+            return
+
+        # Cabeçalhos
+        if block and block.group('hashes'):
+            if self.in_list:
+                html_lines.append(f'</{self.list_type}>')
+                self.in_list = False
+            level = len(block.group('hashes'))
+            heading_text = _format_inline(block.group('heading'))
+            html_lines.append(f'<h{level}>{heading_text}</h{level}>')
+            return
+
+        # Citações/Blockquotes
+        if stripped[0] == '>':
+            quote_text = _format_inline(stripped[1:].strip())
+            if not self.in_quote:
+                html_lines.append('<blockquote>')
+                self.in_quote = True
+            html_lines.append(f'<p>{quote_text}</p>')
+            return
+        elif self.in_quote:
+            html_lines.append('</blockquote>')
+            self.in_quote = False
+
+        # Listas numeradas
+        if block and block.group('numbered') is not None:
+            list_text = _format_inline(block.group('numbered'))
+            if not self.in_list or self.list_type != 'ol':
+                if self.in_list:
+                    html_lines.append(f'</{self.list_type}>')
+                html_lines.append('<ol>')
+                self.in_list = True
+                self.list_type = 'ol'
+            html_lines.append(f'<li>{list_text}</li>')
+            return
+
+        # Listas não-numeradas (-, *, +)
+        if block and block.group('bullet') is not None:
+            list_text = _format_inline(block.group('bullet'))
+            if not self.in_list or self.list_type != 'ul':
+                if self.in_list:
+                    html_lines.append(f'</{self.list_type}>')
+                html_lines.append('<ul>')
+                self.in_list = True
+                self.list_type = 'ul'
+            html_lines.append(f'<li>{list_text}</li>')
+            return
+
+        # Se estava em lista mas linha não é item, fechar lista
+        if self.in_list:
+            self._close_list()
+
+        # Tabelas markdown (detectar linha com | ... | ... |): aguardar a
+        # próxima linha para saber se existe separador
+        if stripped.count('|') >= 2:
+            self.table_lines = [stripped]
+            self.table_state = 'header'
+            return
+
+        # Parágrafos normais com formatação inline
+        formatted_line = _format_inline(stripped)
+        html_lines.append(f'<p>{formatted_line}</p>')
+
+
+def _markdown_to_html(text: str) -> str:
+    """
+    Converte markdown para HTML formatado com suporte completo a:
+    - Cabeçalhos (# ## ###)
+    - Negrito (**texto** ou __texto__)
+    - Itálico (*texto* ou _texto_)
+    - Listas numeradas (1. 2. 3.)
+    - Listas não-numeradas (- * +)
+    - Blocos de código (```codigo```)
+    - Código inline (`codigo`)
+    - Links [texto](url)
+    - Aspas/Citações (> texto)
+    - Linhas horizontais (---, ***, ___)
+    - Tabelas
+    """
+    if not text:
+        return ''
+
+    renderer = IncrementalMarkdownRenderer()
+    return renderer.feed(text) + renderer.finish()
@@ -0,0 +1,179 @@
+# Registry de modelos generativos - Backend
+# Mantém, ao nível do processo, o cliente Google AI configurado, os handles
+# de GenerativeModel já construídos e a resolução "modelo pedido -> modelo que
+# funciona", para que cada mensagem de chat não pague configuração nem sondagem
+# de modelos que falharam recentemente.
+
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+from decouple import config
+
+
+_lock = threading.Lock()
+_configured_api_key = None
+_models = {}        # nome canónico -> genai.GenerativeModel
+_resolutions = {}   # nome pedido -> (nome canónico que funcionou, expira_em)
+_failures = {}      # nome canónico -> expira_em
+
+
+_SHORT_TO_CANONICAL = {
+    'gemini-pro': 'models/gemini-pro-latest',
+    'gemini-2.5-pro': 'models/gemini-2.5-pro',
+    'gemini-flash': 'models/gemini-1.5-flash-latest',
+    'gemini-1.5-flash': 'models/gemini-1.5-flash-latest',
+    'gemini-1.5-pro': 'models/gemini-1.5-pro-latest',
+    'gemini-2.5-flash': 'models/gemini-2.5-flash',
+    'gemini-flash-lite': 'models/gemini-flash-lite-latest',
+    'gemini-2.5-flash-lite': 'models/gemini-2.5-flash-lite',
+}
+
+def canonicalize_model_name(name):
+    if not name:
+        return name
+    name = name.strip()
+    return _SHORT_TO_CANONICAL.get(name, name)
+
+
+def _resolution_ttl() -> float:
+    return float(config('GOOGLE_AI_MODEL_RESOLUTION_TTL', default='3600'))
+
+
+def _failure_ttl() -> float:
+    return float(config('GOOGLE_AI_MODEL_FAILURE_TTL', default='300'))
+
+
+def ensure_configured() -> bool:
+    """
+    Configura o SDK google.generativeai uma única vez por processo
+    (ou novamente se a API key mudar). Retorna True se o cliente está pronto.
+    """
+    global _configured_api_key
+
+    api_key = config('GOOGLE_AI_API_KEY', default=None)
+    if not api_key:
+        raise ValueError("GOOGLE_AI_API_KEY não encontrada nas variáveis de ambiente")
+
+    if _configured_api_key == api_key:
+        return True
+
+    import google.generativeai as genai
+
+    with _lock:
+        if _configured_api_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_api_key = api_key
+            # Handles antigos apontam para o cliente anterior
+            _models.clear()
+            print("✅ Google AI inicializado com sucesso")
+    return True
+
+
+def get_model(canonical_name: str):
+    """Retorna o GenerativeModel em cache para o nome canónico, criando-o se necessário"""
+    model = _models.get(canonical_name)
+    if model is not None:
+        return model
+
+    import google.generativeai as genai
+
+    with _lock:
+        model = _models.get(canonical_name)
+        if model is None:
+            model = genai.GenerativeModel(canonical_name)
+            _models[canonical_name] = model
+            print(f"✅ Modelo {canonical_name} carregado via Google Generative AI")
+    return model
+
+
+def default_model_chain() -> Tuple[str, List[str]]:
+    """Retorna (modelo por defeito, lista de fallbacks) a partir do ambiente"""
+    default_model = config('GOOGLE_AI_DEFAULT_MODEL', default='models/gemini-1.5-flash-latest')
+    fallback_models = config('GOOGLE_AI_FALLBACK_MODELS', default='models/gemini-1.5-pro-latest,models/gemini-2.5-pro,models/gemini-flash-latest,models/gemini-2.5-flash')
+    fallback_list = [m.strip() for m in fallback_models.split(',') if m.strip()]
+    return default_model, fallback_list
+
+
+def candidate_chain(requested_model: Optional[str]) -> List[str]:
+    """
+    Ordem de modelos a tentar para um pedido:
+    1. o modelo que funcionou da última vez para este nome (se ainda válido),
+    2. o modelo pedido e os fallbacks configurados,
+    com os modelos que falharam recentemente empurrados para o fim.
+    """
+    default_model, fallback_list = default_model_chain()
+    requested_model = requested_model or default_model
+    candidates = [requested_model] + [m for m in fallback_list if m != requested_model]
+
+    now = time.monotonic()
+    with _lock:
+        resolved = _resolutions.get(requested_model)
+        if resolved and resolved[1] > now:
+            candidates = [resolved[0]] + [c for c in candidates if c != resolved[0]]
+        recently_failed = {name for name, expires in _failures.items() if expires > now}
+
+    healthy = [c for c in candidates if canonicalize_model_name(c) not in recently_failed]
+    failed = [c for c in candidates if canonicalize_model_name(c) in recently_failed]
+    return healthy + failed
+
+
+def remember_resolution(requested_model: Optional[str], canonical_name: str):
+    """Regista o modelo que respondeu com sucesso a um pedido"""
+    if not canonical_name:
+        return
+    requested_model = requested_model or default_model_chain()[0]
+    with _lock:
+        _resolutions[requested_model] = (canonical_name, time.monotonic() + _resolution_ttl())
+        _failures.pop(canonical_name, None)
+
+
+def mark_model_failed(canonical_name: str):
+    """Marca um modelo como indisponível durante GOOGLE_AI_MODEL_FAILURE_TTL segundos"""
+    if not canonical_name:
+        return
+    with _lock:
+        _failures[canonical_name] = time.monotonic() + _failure_ttl()
+        for requested, (resolved, _) in list(_resolutions.items()):
+            if resolved == canonical_name:
+                del _resolutions[requested]
+
+
+def warm_up():
+    """
+    Configura o cliente e pré-carrega os modelos por defeito e de fallback.
+    Chamado no arranque da app (AiConfig.ready); nunca levanta exceções.
+    """
+    if config('FIREBASE_AI_DEV_MOCK', default='false').lower() in ('1', 'true', 'yes'):
+        return
+    if not config('GOOGLE_AI_API_KEY', default=None):
+        return
+
+    try:
+        ensure_configured()
+        default_model, fallback_list = default_model_chain()
+        for name in [default_model] + fallback_list:
+            get_model(canonicalize_model_name(name))
+    except Exception as e:
+        print(f"⚠️ Falha no warm-up dos modelos Google AI: {e}")
+
+
+def get_registry_status() -> Dict[str, object]:
+    """Estado do registry para diagnóstico"""
+    now = time.monotonic()
+    with _lock:
+        return {
+            'configured': _configured_api_key is not None,
+            'loaded_models': sorted(_models.keys()),
+            'resolutions': {k: v[0] for k, v in _resolutions.items() if v[1] > now},
+            'recently_failed': sorted(k for k, v in _failures.items() if v > now),
+        }
+
+
+def reset():
+    """Limpa todo o estado (útil em testes)"""
+    global _configured_api_key
+    with _lock:
+        _configured_api_key = None
+        _models.clear()
+        _resolutions.clear()
+        _failures.clear()
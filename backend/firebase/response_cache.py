@@ -0,0 +1,89 @@
+# Cache de respostas da IA - Backend
+# Perguntas agrícolas repetem-se muito ("quando plantar milho em Nampula"); a
+# resposta do Gemini é guardada no cache Django (alias 'ai_responses', TTL +
+# despejo LRU) com chave = pergunta normalizada + província + tipo de utilizador
+# + modelo. O prompt das perguntas guardadas não pode ter dados pessoais (nome):
+# a mesma resposta é servida a todos os utilizadores com a mesma chave.
+
+import re
+import hashlib
+import unicodedata
+from typing import Any, Dict, Optional
+from decouple import config
+from .model_registry import canonicalize_model_name, default_model_chain
+
+
+CACHE_ALIAS = 'ai_responses'
+
+_WORD_RE = re.compile(r'\w+')
+
+# Só artigos, preposições (e contrações) e cumprimentos, já sem acentos como o
+# texto normalizado. Advérbios, conjunções, pronomes e verbos ficam: "plantar
+# mais cedo" e "plantar cedo" (ou "milho ou feijao") pedem respostas diferentes.
+_STOPWORDS = frozenset('''
+a o as os um uma uns umas
+ao aos da das de do dos em na nas no nos pela pelas pelo pelos para por com
+ola oi obrigado obrigada favor
+'''.split())
+
+
+def _enabled() -> bool:
+    return config('AI_RESPONSE_CACHE_ENABLED', default='true').lower() in ('1', 'true', 'yes')
+
+
+def cache_ttl() -> int:
+    return int(config('AI_RESPONSE_CACHE_TTL', default='86400'))
+
+
+def _fold(text: str) -> str:
+    """Minúsculas e sem acentos"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    Normaliza a pergunta para a chave do cache: minúsculas, sem acentos,
+    sem pontuação e sem stopwords.
+    "Quando plantar Milho em Nampula?" -> "quando plantar milho nampula"
+    """
+    words = _WORD_RE.findall(_fold(text or ''))
+    return ' '.join(w for w in words if w not in _STOPWORDS)
+
+
+def build_cache_key(prompt: str, provincia: Optional[str], model_name: Optional[str] = None,
+                    tipo_usuario: Optional[str] = None) -> Optional[str]:
+    """Chave do cache, ou None se o cache está desligado ou a pergunta fica vazia"""
+    if not _enabled():
+        return None
+    normalized = normalize_prompt(prompt)
+    if not normalized:
+        return None
+    model = canonicalize_model_name(model_name or default_model_chain()[0])
+    raw = '|'.join([normalized, _fold(provincia or '').strip(), model, (tipo_usuario or '').strip().lower()])
+    return 'ai_resp:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _get_cache():
+    from django.conf import settings
+    from django.core.cache import caches
+    return caches[CACHE_ALIAS if CACHE_ALIAS in settings.CACHES else 'default']
+
+
+async def get_response(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Resposta guardada ({'text', 'model'}) ou None; erros do backend contam como miss"""
+    try:
+        return await _get_cache().aget(cache_key)
+    except Exception as e:
+        print(f"⚠️ Erro ao ler cache de respostas: {e}")
+        return None
+
+
+async def store_response(cache_key: str, text: str, model: str):
+    """Guarda a resposta durante AI_RESPONSE_CACHE_TTL segundos"""
+    if not text:
+        return
+    try:
+        await _get_cache().aset(cache_key, {'text': text, 'model': model}, timeout=cache_ttl())
+    except Exception as e:
+        print(f"⚠️ Erro ao gravar cache de respostas: {e}")
@@ -3,6 +3,7 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status, generics
 from .services.twilio_service import twilio_service
+from .services import recipients, scheduler
 from .models import Notificacao, AlertSubscription
 from .serializers import AlertSubscriptionSerializer
 from users.models import User
@@ -17,12 +18,22 @@ logger = logging.getLogger(__name__)
 def enviar_notificacao_view(request):
     """
     View para enviar notificações via SMS/WhatsApp
+
+    Destinatários por ids (destinatarios) e/ou por filtros no formato de
+    CampanhaNotificacao.filtros_usuario (provincia, distrito,
+    culturas_interesse, tipo_usuario; só técnicos e administradores).
+    As notificações são agendadas pelas preferências de cada utilizador
+    (scheduler: horário, canais por tipo, resumos) e ficam no outbox (status
+    'pendente') até o worker `manage.py enviar_notificacoes` as enviar; a
+    resposta (202) é imediata.
     """
     try:
         tipo = request.data.get('tipo', 'geral')
         titulo = request.data.get('titulo', '')
         mensagem = request.data.get('mensagem', '')
         destinatarios = request.data.get('destinatarios', [])
+        filtros = request.data.get('filtros') or {}
+        prioridade = request.data.get('prioridade', 'normal')
         
         if not mensagem:
             return Response(
@@ -30,61 +41,46 @@ def enviar_notificacao_view(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        resultados = []
+        erros = recipients.validate_filters(filtros)
+        if erros:
+            return Response({'erro': erros}, status=status.HTTP_400_BAD_REQUEST)
+        if filtros and not (request.user.is_staff or request.user.tipo_usuario in ('tecnico', 'admin')):
+            return Response(
+                {'erro': 'Apenas técnicos e administradores podem enviar por filtros'},
+                status=status.HTTP_403_FORBIDDEN
+            )
         
         # Se destinatários não especificados, enviar para o utilizador actual
-        if not destinatarios:
+        if not destinatarios and not filtros:
             destinatarios = [request.user.id]
+        try:
+            if not isinstance(destinatarios, list):
+                raise TypeError
+            destinatarios = [int(user_id) for user_id in destinatarios]
+        except (TypeError, ValueError):
+            return Response(
+                {'erro': 'destinatarios deve ser uma lista de ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        users = recipients.resolve_recipients(filtros, ids=destinatarios or None)
+        resultado = scheduler.schedule(users, titulo, mensagem, tipo=tipo, prioridade=prioridade)
         
-        for user_id in destinatarios:
-            try:
-                user = User.objects.get(id=user_id)
-                
-                user_data = {
-                    'first_name': user.first_name,
-                    'telefone': user.telefone,
-                    'receber_sms': user.receber_sms,
-                    'receber_whatsapp': user.receber_whatsapp,
-                    'localizacao': user.localizacao
-                }
-                
-                # Criar notificação no banco
-                notificacao = Notificacao.objects.create(
-                    usuario=user,
-                    titulo=titulo,
-                    mensagem=mensagem,
-                    tipo_notificacao=tipo
-                )
-                
-                # Enviar via SMS se habilitado
-                if user.receber_sms and user.telefone:
-                    sms_result = twilio_service.send_sms(user.telefone, mensagem)
-                    if sms_result and sms_result.get('success'):
-                        notificacao.entregue_sms = True
-                        resultados.append(sms_result)
-                
-                # Enviar via WhatsApp se habilitado
-                if user.receber_whatsapp and user.telefone:
-                    whatsapp_result = twilio_service.send_whatsapp(user.telefone, mensagem)
-                    if whatsapp_result and whatsapp_result.get('success'):
-                        notificacao.entregue_whatsapp = True
-                        resultados.append(whatsapp_result)
-                
-                notificacao.save()
-                
-            except User.DoesNotExist:
-                logger.error(f"Utilizador {user_id} não encontrado")
-                continue
-            except Exception as e:
-                logger.error(f"Erro ao enviar para utilizador {user_id}: {e}")
-                continue
+        encontrados = set(resultado['usuarios'])
+        nao_encontrados = [user_id for user_id in destinatarios if user_id not in encontrados]
+        for user_id in nao_encontrados:
+            logger.error(f"Utilizador {user_id} não encontrado")
         
         return Response({
             'success': True,
-            'mensagem': 'Notificações enviadas',
-            'resultados': resultados,
-            'total_enviadas': len(resultados)
-        })
+            'mensagem': 'Notificações em fila para envio',
+            'total_destinatarios': len(resultado['usuarios']),
+            'total_enfileiradas': resultado['enfileiradas'],
+            'total_adiadas': resultado['adiadas'],
+            'sem_canal': resultado['sem_canal'],
+            'ignoradas': resultado['ignoradas'],
+            'nao_encontrados': nao_encontrados
+        }, status=status.HTTP_202_ACCEPTED)
         
     except Exception as e:
         logger.error(f"Erro ao enviar notificações: {e}")
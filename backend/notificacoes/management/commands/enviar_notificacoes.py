@@ -0,0 +1,55 @@
+"""
+Worker do outbox de notificações (notificacoes.services.outbox)
+
+Podem correr vários workers em paralelo: cada lote é reservado com
+SELECT ... FOR UPDATE SKIP LOCKED.
+
+Uso:
+  python manage.py enviar_notificacoes
+  python manage.py enviar_notificacoes --once
+  python manage.py enviar_notificacoes --workers 16 --batch-size 200
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from notificacoes.services import outbox
+
+
+class Command(BaseCommand):
+    help = 'Envia as notificações SMS/WhatsApp pendentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='esvaziar a fila e sair')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='envios em paralelo (padrão: NOTIFICATION_SEND_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='notificações por lote (padrão: NOTIFICATION_BATCH_SIZE)')
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='segundos de espera com a fila vazia')
+
+    def handle(self, *args, **options):
+        totals = {'enviadas': 0, 'reagendadas': 0, 'falhadas': 0}
+        try:
+            while True:
+                close_old_connections()
+                counts = outbox.process_batch(options['batch_size'], options['workers'])
+                if counts['reservadas']:
+                    for key in totals:
+                        totals[key] += counts[key]
+                    self.stdout.write(
+                        f"📤 {counts['enviadas']} enviadas, {counts['reagendadas']} reagendadas, "
+                        f"{counts['falhadas']} falhadas"
+                    )
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            f"✅ Total: {totals['enviadas']} enviadas, {totals['reagendadas']} reagendadas, "
+            f"{totals['falhadas']} falhadas"
+        )
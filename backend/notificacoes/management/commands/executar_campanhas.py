@@ -0,0 +1,56 @@
+"""
+Executar campanhas de notificação (notificacoes.services.campaigns)
+
+Sem argumentos executa as campanhas 'agendada' cuja data_agendamento já
+chegou e retoma as interrompidas a meio cujo lease expirou (para o cron).
+Com --id executa ou retoma uma campanha agendada, pausada ou interrompida;
+uma campanha ainda com o lease de outro processo só com --force (quando se
+sabe que esse processo morreu: senão as mensagens são enviadas duas vezes).
+
+Uso:
+  python manage.py executar_campanhas
+  python manage.py executar_campanhas --id 12
+  python manage.py executar_campanhas --id 12 --force
+  python manage.py executar_campanhas --id 12 --workers 16 --chunk-size 1000
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from notificacoes.services import campaigns
+
+
+class Command(BaseCommand):
+    help = 'Executa as campanhas de notificação agendadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--id', type=int, help='campanha a executar ou retomar')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='envios em paralelo (padrão: CAMPAIGN_SEND_WORKERS)')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='utilizadores por checkpoint (padrão: CAMPAIGN_CHUNK_SIZE)')
+        parser.add_argument('--force', action='store_true',
+                            help='com --id: retomar mesmo com o lease de outra execução ainda válido')
+
+    def handle(self, *args, **options):
+        if options['id']:
+            ids = [options['id']]
+        else:
+            ids = list(campaigns.due_campaigns().values_list('id', flat=True))
+
+        for campanha_id in ids:
+            try:
+                totals = campaigns.run(
+                    campanha_id, options['chunk_size'], options['workers'],
+                    from_status=campaigns.RUNNABLE_STATUS if options['id'] else ('agendada', 'em_execucao'),
+                    force=bool(options['id'] and options['force'])
+                )
+            except ValueError as e:
+                if options['id']:
+                    raise CommandError(str(e))
+                continue  # outro processo já a iniciou
+            self.stdout.write(
+                f"📣 Campanha {campanha_id} {totals['status']}: {totals['envios']} envios, "
+                f"{totals['sucessos']} sucessos, {totals['falhas']} falhas, "
+                f"{totals['adiadas']} adiadas para a janela do utilizador, {totals['ignoradas']} sem este tipo"
+            )
+        if not ids:
+            self.stdout.write("✅ Nenhuma campanha por executar")
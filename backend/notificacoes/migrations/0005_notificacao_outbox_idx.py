@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificacoes', '0004_alertsubscription_canal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificacao',
+            index=models.Index(condition=models.Q(('status', 'pendente')), fields=['agendada_para', 'id'], name='notif_pendente_agendada_idx'),
+        ),
+    ]
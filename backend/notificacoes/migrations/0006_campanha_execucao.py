@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificacoes', '0005_notificacao_outbox_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campanhanotificacao',
+            name='data_conclusao',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='campanhanotificacao',
+            name='status',
+            field=models.CharField(choices=[('rascunho', 'Rascunho'), ('agendada', 'Agendada'), ('em_execucao', 'Em execução'), ('pausada', 'Pausada'), ('concluida', 'Concluída')], db_index=True, default='rascunho', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='campanhanotificacao',
+            name='ultimo_usuario_id',
+            field=models.IntegerField(default=0),
+        ),
+    ]
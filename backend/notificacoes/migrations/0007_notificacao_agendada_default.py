@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:53
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def backfill_agendada_para(apps, schema_editor):
+    # Pendentes antigas sem agendada_para: o claim já não as procura por IS NULL
+    Notificacao = apps.get_model('notificacoes', 'Notificacao')
+    Notificacao.objects.filter(status='pendente', agendada_para__isnull=True).update(
+        agendada_para=models.F('data_criacao')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificacoes', '0006_campanha_execucao'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notificacao',
+            name='agendada_para',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+        migrations.RunPython(backfill_agendada_para, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:41
+
+from django.db import migrations, models
+
+
+def backfill_status(apps, schema_editor):
+    # A 0006 deixou todas as campanhas antigas em 'rascunho': as que já têm
+    # data_agendamento ficam 'agendada' (para o cron), as já executadas 'concluida'
+    CampanhaNotificacao = apps.get_model('notificacoes', 'CampanhaNotificacao')
+    antigas = CampanhaNotificacao.objects.filter(status='rascunho')
+    antigas.filter(models.Q(data_execucao__isnull=False) | models.Q(total_envios__gt=0)).update(status='concluida')
+    antigas.filter(data_agendamento__isnull=False).update(status='agendada')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificacoes', '0007_notificacao_agendada_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campanhanotificacao',
+            name='execucao_expira_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_status, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from users.models import User
 
 class TipoNotificacao(models.Model):
@@ -46,7 +47,8 @@ class Notificacao(models.Model):
         ],
         default='normal'
     )
-    agendada_para = models.DateTimeField(null=True, blank=True)
+    # Quando sai da fila do outbox (sempre preenchido, para o claim usar só o índice)
+    agendada_para = models.DateTimeField(null=True, blank=True, default=timezone.now)
     tentativas_envio = models.IntegerField(default=0)
     ultima_tentativa = models.DateTimeField(null=True, blank=True)
     data_envio = models.DateTimeField(null=True, blank=True)
@@ -58,6 +60,11 @@ class Notificacao(models.Model):
     
     class Meta:
         ordering = ['-data_criacao']
+        indexes = [
+            # Fila do outbox: pendentes cuja próxima tentativa já chegou
+            models.Index(fields=['agendada_para', 'id'], name='notif_pendente_agendada_idx',
+                         condition=models.Q(status='pendente')),
+        ]
     
     def __str__(self):
         return f"{self.titulo} - {self.usuario.username} ({self.canal})"
@@ -131,6 +138,14 @@ class AlertSubscription(models.Model):
         return f"{self.usuario.username} - {self.cultura} em {self.regiao}"
 
 class CampanhaNotificacao(models.Model):
+    STATUS_CHOICES = [
+        ('rascunho', 'Rascunho'),
+        ('agendada', 'Agendada'),
+        ('em_execucao', 'Em execução'),
+        ('pausada', 'Pausada'),
+        ('concluida', 'Concluída'),
+    ]
+
     nome = models.CharField(max_length=200)
     descricao = models.TextField(blank=True)
     tipo = models.ForeignKey(TipoNotificacao, on_delete=models.CASCADE)
@@ -146,6 +161,13 @@ class CampanhaNotificacao(models.Model):
     total_falhas = models.IntegerField(default=0)
     data_criacao = models.DateTimeField(auto_now_add=True)
     data_execucao = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='rascunho', db_index=True)
+    # Checkpoint: utilizadores até este id já foram processados (retoma após paragem)
+    ultimo_usuario_id = models.IntegerField(default=0)
+    # Lease da execução em curso, renovado a cada bloco: outra execução só
+    # começa depois de expirar (processo morto) ou com --force
+    execucao_expira_em = models.DateTimeField(null=True, blank=True)
+    data_conclusao = models.DateTimeField(null=True, blank=True)
     criada_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='campanhas_criadas')
     
     def __str__(self):
@@ -0,0 +1,268 @@
+"""
+Execução de campanhas (CampanhaNotificacao)
+
+Destinatários: usuarios_alvo (se definidos) e/ou filtros_usuario, lidos por
+ordem de id com cursor no servidor, em blocos de CAMPAIGN_CHUNK_SIZE. Para
+cada bloco:
+  1. título e conteúdo são gerados com os templates da campanha (compilados
+     uma vez por execução; sintaxe de templates Django, ex.: {{ nome }});
+  2. as preferências de cada utilizador (PreferenciaNotificacao) decidem
+     como no agendamento (scheduler.plan, com o tipo da campanha e
+     prioridade 'normal'): tipo desactivado (receber_*) -> não recebe;
+     canal_<tipo> define os canais aceites; fora de horario_inicio..
+     horario_fim o SMS/WhatsApp fica no outbox para o balde da próxima
+     janela, em vez de sair já;
+  3. as restantes mensagens são enviadas em paralelo (CAMPAIGN_SEND_WORKERS),
+     cada uma à espera da sua vez nos limites do canal e da conta Twilio
+     (throttle);
+  4. numa transação: Notificacao com o resultado (bulk_create) e as adiadas
+     como pendentes, contadores da campanha incrementados com F() e o
+     checkpoint (ultimo_usuario_id).
+
+As adiadas são enviadas pelo worker do outbox e não entram nos contadores
+da campanha (total_envios conta só os envios feitos pela campanha).
+
+Uma campanha parada (status 'pausada' ou processo interrompido) retoma do
+checkpoint; um bloco interrompido a meio pode ser reenviado. Cada execução
+tem um lease (execucao_expira_em, CAMPAIGN_LEASE_SECONDS) renovado no início
+de cada bloco: enquanto está válido nenhuma outra execução arranca (só com
+force=True / --force), e uma execução que perdeu o lease pára no bloco
+seguinte. Uma campanha 'em_execucao' com o lease expirado (processo morto)
+é retomada pelo cron. O checkpoint nunca recua (Greatest).
+
+Uma campanha entra na fila do cron com status 'agendada' (e
+data_agendamento, opcional); as criadas como 'rascunho' não são executadas
+até alguém as passar a 'agendada'.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+from django.template import Context, Engine
+from django.utils import timezone
+
+from ..models import CampanhaNotificacao, Notificacao, PreferenciaNotificacao
+from . import recipients, scheduler, throttle
+from .twilio_service import twilio_service
+
+logger = logging.getLogger(__name__)
+
+# Mensagens de texto: sem escape de HTML
+_template_engine = Engine(autoescape=False)
+
+# Campos do utilizador disponíveis nos templates (e carregados da base de dados)
+TEMPLATE_FIELDS = ('first_name', 'last_name', 'username', 'provincia', 'distrito', 'localizacao',
+                   'culturas_interesse')
+
+RUNNABLE_STATUS = ('agendada', 'pausada', 'em_execucao')
+
+
+def _lease_free(now: datetime) -> Q:
+    return Q(execucao_expira_em__isnull=True) | Q(execucao_expira_em__lt=now)
+
+
+def due_campaigns():
+    """Campanhas agendadas cuja data já chegou e execuções abandonadas (lease expirado)"""
+    now = timezone.now()
+    agendadas = Q(status='agendada') & (Q(data_agendamento__isnull=True) | Q(data_agendamento__lte=now))
+    abandonadas = Q(status='em_execucao') & _lease_free(now)
+    return CampanhaNotificacao.objects.filter(agendadas | abandonadas).order_by('data_agendamento', 'id')
+
+
+def target_users(campanha: CampanhaNotificacao):
+    """Destinatários ainda por processar, por ordem de id"""
+    users = recipients.resolve_recipients(campanha.filtros_usuario or {})
+    if campanha.usuarios_alvo.exists():
+        users = users.filter(id__in=campanha.usuarios_alvo.values('id'))
+    fields = set(recipients.CONTACT_FIELDS) | set(TEMPLATE_FIELDS)
+    return users.filter(id__gt=campanha.ultimo_usuario_id).only(*fields).order_by('id')
+
+
+def _context(user) -> Context:
+    return Context({
+        'nome': user.first_name or user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'provincia': user.provincia or '',
+        'distrito': user.distrito or '',
+        'localizacao': user.localizacao or '',
+        'culturas': ', '.join(user.culturas_interesse or []),
+    })
+
+
+def _chunks(iterator: Iterator, size: int) -> Iterator[List]:
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _send(message: Dict) -> Dict:
+    """Enviar uma mensagem respeitando os limites; nunca levanta exceção"""
+    if message['canal'] == 'app':
+        return {'success': True}
+    throttle.acquire(message['canal'])
+    try:
+        send = twilio_service.send_whatsapp if message['canal'] == 'whatsapp' else twilio_service.send_sms
+        return send(message['telefone'], message['conteudo']) or {'success': False, 'error': 'Twilio não configurado'}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+
+def _stop_requested(campanha_id: int) -> bool:
+    return CampanhaNotificacao.objects.filter(id=campanha_id, status='pausada').exists()
+
+
+def start(campanha_id: int, from_status=RUNNABLE_STATUS, force: bool = False) -> Optional[CampanhaNotificacao]:
+    """
+    Passar a campanha a 'em_execucao' com um lease novo (None se não está num
+    estado de from_status, ou se outra execução ainda tem o lease e não há force)
+    """
+    now = timezone.now()
+    campanhas = CampanhaNotificacao.objects.filter(id=campanha_id, status__in=from_status)
+    if not force:
+        campanhas = campanhas.filter(_lease_free(now))
+    updated = campanhas.update(
+        status='em_execucao', data_execucao=now,
+        execucao_expira_em=now + timedelta(seconds=settings.CAMPAIGN_LEASE_SECONDS)
+    )
+    return CampanhaNotificacao.objects.select_related('tipo').get(id=campanha_id) if updated else None
+
+
+def _renew_lease(campanha_id: int, lease: datetime) -> Optional[datetime]:
+    """Novo lease, ou None se outra execução ficou com a campanha"""
+    renewed = timezone.now() + timedelta(seconds=settings.CAMPAIGN_LEASE_SECONDS)
+    updated = CampanhaNotificacao.objects.filter(id=campanha_id, execucao_expira_em=lease).update(
+        execucao_expira_em=renewed
+    )
+    return renewed if updated else None
+
+
+def run(campanha_id: int, chunk_size: int = None, workers: int = None, from_status=RUNNABLE_STATUS,
+        force: bool = False) -> Dict:
+    """
+    Executar (ou retomar) uma campanha. Devolve os totais desta execução e o
+    estado final ('concluida', 'pausada' ou 'interrompida' se outra execução
+    ficou com a campanha). ValueError se a campanha não está num dos estados
+    from_status (ex.: já concluída) ou está a ser executada noutro processo.
+    """
+    campanha = start(campanha_id, from_status, force)
+    if campanha is None:
+        raise ValueError(
+            f"Campanha {campanha_id} não pode ser executada (estado fora de {', '.join(from_status)} "
+            f"ou em execução noutro processo; use --force se esse processo morreu)"
+        )
+    lease = campanha.execucao_expira_em
+
+    chunk_size = chunk_size or settings.CAMPAIGN_CHUNK_SIZE
+    titulo_template = _template_engine.from_string(campanha.titulo_template)
+    conteudo_template = _template_engine.from_string(campanha.conteudo_template)
+    canais = [canal for canal in campanha.canais if canal in ('sms', 'whatsapp', 'app')]
+    totals = {'envios': 0, 'sucessos': 0, 'falhas': 0, 'adiadas': 0, 'ignoradas': 0, 'status': 'concluida'}
+
+    users = target_users(campanha).iterator(chunk_size=chunk_size)
+    with ThreadPoolExecutor(max_workers=workers or settings.CAMPAIGN_SEND_WORKERS,
+                            thread_name_prefix='campanha') as executor:
+        for chunk in _chunks(users, chunk_size):
+            if _stop_requested(campanha.id):
+                totals['status'] = 'pausada'
+                break
+            lease = _renew_lease(campanha.id, lease)
+            if lease is None:
+                totals['status'] = 'interrompida'
+                logger.warning(f"Campanha {campanha.id}: outra execução ficou com a campanha, a parar")
+                break
+
+            now = timezone.now()
+            prefs = {pref.usuario_id: pref for pref in
+                     PreferenciaNotificacao.objects.filter(usuario_id__in=[user.id for user in chunk])}
+            messages = []
+            deferred = []
+            for user in chunk:
+                channels, when = scheduler.plan(user, prefs.get(user.id), campanha.tipo.nome, 'normal', now)
+                if channels is None:
+                    totals['ignoradas'] += 1
+                    continue
+                user_channels = [canal for canal in canais if canal in channels + ['app']]
+                if not user_channels:
+                    continue
+                context = _context(user)
+                titulo = titulo_template.render(context)
+                conteudo = conteudo_template.render(context)
+                for canal in user_channels:
+                    message = {'usuario_id': user.id, 'telefone': user.telefone, 'canal': canal,
+                               'titulo': titulo, 'conteudo': conteudo}
+                    if when is not None and canal != 'app':
+                        deferred.append(dict(message, agendada_para=when))
+                    else:
+                        messages.append(message)
+
+            results = list(executor.map(_send, messages))
+            _record_chunk(campanha, chunk[-1].id, messages, results, deferred, totals)
+
+    if totals['status'] == 'concluida':
+        CampanhaNotificacao.objects.filter(id=campanha.id, status='em_execucao', execucao_expira_em=lease).update(
+            status='concluida', data_conclusao=timezone.now(), execucao_expira_em=None
+        )
+    elif totals['status'] == 'pausada':
+        # Libertar o lease: a retoma pode começar já
+        CampanhaNotificacao.objects.filter(id=campanha.id, execucao_expira_em=lease).update(execucao_expira_em=None)
+    logger.info(f"Campanha {campanha.id}: {totals}")
+    return totals
+
+
+def _record_chunk(campanha: CampanhaNotificacao, last_user_id: int, messages: List[Dict],
+                  results: List[Dict], deferred: List[Dict], totals: Dict):
+    now = timezone.now()
+    rows = []
+    sucessos = 0
+    for message, result in zip(messages, results):
+        ok = bool(result.get('success'))
+        sucessos += ok
+        rows.append(Notificacao(
+            usuario_id=message['usuario_id'],
+            tipo=campanha.tipo,
+            titulo=message['titulo'],
+            conteudo=message['conteudo'],
+            canal=message['canal'],
+            status='enviada' if ok else 'falhada',
+            tentativas_envio=0 if message['canal'] == 'app' else 1,
+            ultima_tentativa=None if message['canal'] == 'app' else now,
+            data_envio=now if ok else None,
+            erro_envio='' if ok else str(result.get('error', '')),
+            metadados={'campanha_id': campanha.id, 'sid': result.get('sid')},
+        ))
+    envios = len(rows)
+    falhas = envios - sucessos
+    for message in deferred:
+        rows.append(Notificacao(
+            usuario_id=message['usuario_id'],
+            tipo=campanha.tipo,
+            titulo=message['titulo'],
+            conteudo=message['conteudo'],
+            canal=message['canal'],
+            agendada_para=message['agendada_para'],
+            metadados={'campanha_id': campanha.id},
+        ))
+
+    with transaction.atomic():
+        Notificacao.objects.bulk_create(rows, batch_size=settings.NOTIFICATION_INSERT_BATCH_SIZE)
+        CampanhaNotificacao.objects.filter(id=campanha.id).update(
+            total_envios=F('total_envios') + envios,
+            total_sucessos=F('total_sucessos') + sucessos,
+            total_falhas=F('total_falhas') + falhas,
+            # Nunca recuar o checkpoint (ex.: execução antiga que ainda grava um bloco)
+            ultimo_usuario_id=Greatest(F('ultimo_usuario_id'), Value(last_user_id)),
+        )
+
+    totals['envios'] += envios
+    totals['sucessos'] += sucessos
+    totals['falhas'] += falhas
+    totals['adiadas'] += len(deferred)
@@ -0,0 +1,211 @@
+"""
+Outbox de notificações SMS/WhatsApp
+
+A API só grava as Notificacao (status 'pendente') e responde logo; o envio é
+feito pelo worker `python manage.py enviar_notificacoes`, que pode correr em
+vários processos ao mesmo tempo:
+  1. reserva um lote de pendentes já devidas (agendada_para <= agora, pelo
+     índice parcial notif_pendente_agendada_idx) com SELECT ... FOR UPDATE
+     SKIP LOCKED (cada linha fica com um só worker) e adia agendada_para pelo
+     NOTIFICATION_LEASE_SECONDS (se o worker morrer, a linha volta à fila);
+  2. envia o lote em paralelo (NOTIFICATION_SEND_WORKERS threads);
+  3. grava o resultado: 'enviada', ou nova tentativa com backoff exponencial
+     em agendada_para, ou 'falhada' ao fim de NOTIFICATION_MAX_ATTEMPTS.
+     A gravação é condicional ao lease (agendada_para ainda igual ao do
+     passo 1): se o lote demorou mais do que o lease e outro worker já
+     reservou a linha, o resultado deste é descartado para não sobrepor o
+     do novo dono.
+Cada tentativa fica registada em LogEnvio.
+"""
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.utils import timezone
+
+from ..models import LogEnvio, Notificacao, TipoNotificacao
+from .twilio_service import twilio_service
+
+logger = logging.getLogger(__name__)
+
+# Canais entregues pelo worker (os restantes não passam pelo outbox)
+SEND_CHANNELS = ('sms', 'whatsapp')
+
+
+def get_tipo(nome: str) -> TipoNotificacao:
+    tipo, _ = TipoNotificacao.objects.get_or_create(nome=nome)
+    return tipo
+
+
+def channels_for(user) -> List[str]:
+    """Canais de envio que o utilizador aceita"""
+    if not user.telefone:
+        return []
+    channels = []
+    if user.receber_sms:
+        channels.append('sms')
+    if user.receber_whatsapp:
+        channels.append('whatsapp')
+    return channels
+
+
+def enqueue(users: Iterable, titulo: str, conteudo: str, tipo: str = 'geral', prioridade: str = 'normal',
+            agendada_para: Optional[datetime] = None, metadados: Optional[Dict] = None) -> Dict:
+    """
+    Criar uma Notificacao pendente por utilizador e canal, com bulk_create em
+    lotes de NOTIFICATION_INSERT_BATCH_SIZE (tudo numa transação). `users`
+    pode ser um QuerySet: é lido com cursor no servidor, aos poucos.
+    Devolve {'enfileiradas': n, 'usuarios': [ids], 'sem_canal': [ids sem canal]}.
+    """
+    batch_size = settings.NOTIFICATION_INSERT_BATCH_SIZE
+    tipo_notificacao = get_tipo(tipo)
+    agendada_para = agendada_para or timezone.now()
+    if isinstance(users, QuerySet):
+        users = users.iterator(chunk_size=batch_size)
+
+    rows = []
+    enfileiradas = 0
+    usuarios = []
+    sem_canal = []
+    with transaction.atomic():
+        for user in users:
+            usuarios.append(user.id)
+            channels = channels_for(user)
+            if not channels:
+                sem_canal.append(user.id)
+            for canal in channels:
+                rows.append(Notificacao(
+                    usuario_id=user.id,
+                    tipo=tipo_notificacao,
+                    titulo=titulo,
+                    conteudo=conteudo,
+                    canal=canal,
+                    prioridade=prioridade,
+                    agendada_para=agendada_para,
+                    metadados=metadados or {},
+                ))
+            if len(rows) >= batch_size:
+                Notificacao.objects.bulk_create(rows, batch_size=batch_size)
+                enfileiradas += len(rows)
+                rows = []
+        if rows:
+            Notificacao.objects.bulk_create(rows, batch_size=batch_size)
+            enfileiradas += len(rows)
+
+    return {'enfileiradas': enfileiradas, 'usuarios': usuarios, 'sem_canal': sem_canal}
+
+
+def retry_delay(tentativa: int) -> int:
+    """Segundos até à próxima tentativa (backoff exponencial com teto)"""
+    delay = settings.NOTIFICATION_RETRY_BASE_SECONDS * 2 ** max(tentativa - 1, 0)
+    return min(delay, settings.NOTIFICATION_RETRY_MAX_SECONDS)
+
+
+def claim(limit: int) -> List[Notificacao]:
+    """Reservar até `limit` notificações devidas para este worker"""
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=settings.NOTIFICATION_LEASE_SECONDS)
+    with transaction.atomic():
+        rows = list(
+            Notificacao.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('usuario')
+            .filter(status='pendente', canal__in=SEND_CHANNELS, agendada_para__lte=now)
+            .order_by('agendada_para', 'id')[:limit]
+        )
+        if rows:
+            Notificacao.objects.filter(id__in=[row.id for row in rows]).update(
+                tentativas_envio=F('tentativas_envio') + 1,
+                ultima_tentativa=now,
+                agendada_para=lease_until,
+            )
+    for row in rows:
+        row.tentativas_envio += 1
+        row.ultima_tentativa = now
+        row.agendada_para = lease_until
+    return rows
+
+
+def deliver(notificacao: Notificacao) -> Dict:
+    """Enviar uma notificação pelo seu canal; nunca levanta exceção"""
+    telefone = notificacao.usuario.telefone
+    start = time.monotonic()
+    try:
+        if not telefone:
+            result = {'success': False, 'error': 'Utilizador sem telefone'}
+        elif notificacao.canal == 'whatsapp':
+            result = twilio_service.send_whatsapp(telefone, notificacao.conteudo)
+        else:
+            result = twilio_service.send_sms(telefone, notificacao.conteudo)
+        if result is None:
+            result = {'success': False, 'error': 'Twilio não configurado'}
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    result['elapsed'] = time.monotonic() - start
+    return result
+
+
+def _apply_result(notificacao: Notificacao, result: Dict, now: datetime) -> LogEnvio:
+    if result.get('success'):
+        notificacao.status = 'enviada'
+        notificacao.data_envio = now
+        notificacao.erro_envio = ''
+        notificacao.metadados = {**notificacao.metadados, 'sid': result.get('sid')}
+    elif notificacao.tentativas_envio >= settings.NOTIFICATION_MAX_ATTEMPTS:
+        notificacao.status = 'falhada'
+        notificacao.erro_envio = result.get('error', '')
+    else:
+        notificacao.erro_envio = result.get('error', '')
+        notificacao.agendada_para = now + timedelta(seconds=retry_delay(notificacao.tentativas_envio))
+
+    return LogEnvio(
+        notificacao=notificacao,
+        tentativa=notificacao.tentativas_envio,
+        status_tentativa='sucesso' if result.get('success') else 'falha',
+        resposta_api=json.dumps({k: v for k, v in result.items() if k != 'elapsed'}, default=str),
+        codigo_resposta=str(result.get('status') or '')[:10],
+        tempo_resposta=result['elapsed'],
+    )
+
+
+def process_batch(limit: int = None, workers: int = None) -> Dict:
+    """Reservar, enviar e gravar um lote. Devolve contagens do lote."""
+    rows = claim(limit or settings.NOTIFICATION_BATCH_SIZE)
+    if not rows:
+        return {'reservadas': 0, 'enviadas': 0, 'reagendadas': 0, 'falhadas': 0, 'perdidas': 0}
+    lease_until = rows[0].agendada_para
+
+    with ThreadPoolExecutor(max_workers=workers or settings.NOTIFICATION_SEND_WORKERS,
+                            thread_name_prefix='notif-send') as executor:
+        results = list(executor.map(deliver, rows))
+
+    now = timezone.now()
+    logs = [_apply_result(row, result, now) for row, result in zip(rows, results)]
+    with transaction.atomic():
+        # Só grava as linhas que ainda têm o lease deste worker (bloqueadas até ao commit)
+        owned = set(
+            Notificacao.objects.select_for_update()
+            .filter(id__in=[row.id for row in rows], status='pendente', agendada_para=lease_until)
+            .values_list('id', flat=True)
+        )
+        kept = [row for row in rows if row.id in owned]
+        if len(kept) < len(rows):
+            logger.warning("Lease expirado em %s notificações: resultado descartado", len(rows) - len(kept))
+        Notificacao.objects.bulk_update(
+            kept, ['status', 'data_envio', 'erro_envio', 'agendada_para', 'metadados'], batch_size=500
+        )
+        # A tentativa aconteceu de facto: o LogEnvio fica sempre
+        LogEnvio.objects.bulk_create(logs, batch_size=500)
+
+    counts = {'reservadas': len(rows), 'enviadas': 0, 'reagendadas': 0, 'falhadas': 0,
+              'perdidas': len(rows) - len(kept)}
+    for row in kept:
+        key = {'enviada': 'enviadas', 'falhada': 'falhadas'}.get(row.status, 'reagendadas')
+        counts[key] += 1
+    return counts
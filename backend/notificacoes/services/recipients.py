@@ -0,0 +1,69 @@
+"""
+Resolução de destinatários de notificações numa só query
+
+Os filtros seguem o formato de CampanhaNotificacao.filtros_usuario:
+  {
+    "provincia": "Nampula" | ["Nampula", "Zambézia"],
+    "distrito": "Ribáuè" | [...],
+    "culturas_interesse": "milho" | ["milho", "feijao"],   # qualquer uma
+    "tipo_usuario": "agricultor" | [...]
+  }
+Cada filtro aceita um valor ou uma lista (OU entre os valores, E entre os
+filtros); provincia/distrito ignoram maiúsculas.
+"""
+from typing import Dict, Iterable, List, Optional
+
+from django.db.models import Q, QuerySet
+
+from users.models import User
+
+FILTER_FIELDS = ('provincia', 'distrito', 'culturas_interesse', 'tipo_usuario')
+
+# Campos usados por outbox.enqueue (o resto do utilizador não é carregado)
+CONTACT_FIELDS = ('id', 'telefone', 'receber_sms', 'receber_whatsapp')
+
+
+def _as_list(value) -> List:
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+def validate_filters(filtros: Dict) -> List[str]:
+    """Erros de formato dos filtros (lista vazia se estão válidos)"""
+    if not isinstance(filtros, dict):
+        return ['filtros deve ser um objeto']
+    errors = []
+    for key, value in filtros.items():
+        if key not in FILTER_FIELDS:
+            errors.append(f"Filtro desconhecido: {key}")
+        elif not all(isinstance(item, str) and item.strip() for item in _as_list(value)):
+            errors.append(f"Filtro {key} deve ser texto ou lista de textos")
+    return errors
+
+
+def resolve_recipients(filtros: Optional[Dict] = None, ids: Optional[Iterable[int]] = None) -> QuerySet:
+    """
+    Utilizadores ativos que correspondem aos filtros e/ou ids, só com os
+    campos de contacto. É uma única query; para listas grandes usar
+    .iterator(chunk_size=...) (cursor no servidor).
+    """
+    errors = validate_filters(filtros or {})
+    if errors:
+        raise ValueError('; '.join(errors))
+
+    users = User.objects.filter(ativo=True, is_active=True)
+    if ids is not None:
+        users = users.filter(id__in=list(ids))
+
+    for key, value in (filtros or {}).items():
+        values = [item.strip() for item in _as_list(value)]
+        condition = Q()
+        for item in values:
+            if key == 'culturas_interesse':
+                condition |= Q(culturas_interesse__contains=[item.lower()])
+            elif key in ('provincia', 'distrito'):
+                condition |= Q(**{f'{key}__iexact': item})
+            else:
+                condition |= Q(**{key: item})
+        users = users.filter(condition)
+
+    return users.only(*CONTACT_FIELDS).order_by('id')
@@ -0,0 +1,249 @@
+"""
+Agendamento de notificações pelas preferências do utilizador (PreferenciaNotificacao)
+
+schedule() põe as mensagens no outbox como outbox.enqueue, mas para cada
+utilizador:
+  - tipo desactivado (receber_clima=False, ...) -> a mensagem não é criada;
+  - canal: canal_<tipo> das preferências ou, sem preferência, os canais do
+    perfil; 'app' fica logo disponível na aplicação, sem custo de envio;
+  - 'urgente' sai já, a qualquer hora (se receber_alertas_urgentes);
+  - as restantes saem já dentro de horario_inicio..horario_fim, ou ficam
+    para o início da próxima janela;
+  - clima não urgente segue frequencia_clima: 'diaria' e 'semanal' guardam
+    'baixa'/'normal' para o resumo da próxima janela (do dia seguinte ou do
+    SCHEDULER_WEEKLY_DIGEST_WEEKDAY); 'importantes' só envia por SMS/WhatsApp
+    as de prioridade 'alta' (as outras ficam na app).
+
+Cada mensagem adiada vai para um balde = início da janela + prioridade:
+alta, normal e baixa ocupam faixas seguidas de SCHEDULER_SPREAD_SECONDS e,
+dentro da faixa, cada utilizador tem um desvio fixo (id), para espalhar os
+envios. Mensagens do mesmo utilizador no mesmo balde e canal juntam-se num
+resumo (até SCHEDULER_DIGEST_MAX_ITEMS). O worker do outbox esvazia os
+baldes devidos com o índice parcial de agendada_para.
+
+Utilizadores sem PreferenciaNotificacao recebem logo, como antes.
+"""
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, QuerySet, TextField, Value, When
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from ..models import Notificacao, PreferenciaNotificacao
+from . import outbox
+
+logger = logging.getLogger(__name__)
+
+# Prefixo do nome do TipoNotificacao -> sufixo dos campos receber_*/canal_*
+CATEGORIAS = (('clima', 'clima'), ('praga', 'pragas'), ('mercado', 'mercado'), ('recomenda', 'recomendacoes'))
+
+# Faixa de cada prioridade dentro do balde ('urgente' nunca é adiada)
+PRIORITY_SLOTS = {'alta': 0, 'normal': 1, 'baixa': 2}
+
+DIGEST_PRIORITIES = ('baixa', 'normal')
+
+
+def categoria(tipo: str) -> Optional[str]:
+    for prefixo, nome in CATEGORIAS:
+        if tipo.startswith(prefixo):
+            return nome
+    return None
+
+
+def in_window(local: datetime, inicio: time, fim: time) -> bool:
+    """`local` está dentro da janela (que pode passar a meia-noite)?"""
+    if inicio == fim:
+        return True
+    now = local.time()
+    if inicio < fim:
+        return inicio <= now < fim
+    return now >= inicio or now < fim
+
+
+def next_window_start(local: datetime, inicio: time, weekday: int = None) -> datetime:
+    """Próximo início de janela depois de `local` (num dado dia da semana, se weekday)"""
+    day = local.date()
+    while True:
+        start = timezone.make_aware(datetime.combine(day, inicio), local.tzinfo)
+        if start > local and (weekday is None or start.weekday() == weekday):
+            return start
+        day += timedelta(days=1)
+
+
+def bucket(window_start: datetime, prioridade: str, user_id: int) -> datetime:
+    spread = settings.SCHEDULER_SPREAD_SECONDS
+    offset = PRIORITY_SLOTS.get(prioridade, PRIORITY_SLOTS['normal']) * spread
+    if spread:
+        offset += user_id % spread
+    return window_start + timedelta(seconds=offset)
+
+
+def plan(user, prefs: Optional[PreferenciaNotificacao], tipo: str, prioridade: str,
+         now: datetime) -> Tuple[Optional[List[str]], Optional[datetime]]:
+    """
+    Canais e balde (None = enviar já) de uma mensagem para um utilizador.
+    Canais None: o utilizador desactivou este tipo; []: não tem canal.
+    """
+    if prefs is None:
+        return outbox.channels_for(user), None
+
+    urgente = prioridade == 'urgente'
+    cat = categoria(tipo)
+    if urgente and prefs.receber_alertas_urgentes:
+        enabled = True
+    else:
+        enabled = getattr(prefs, f'receber_{cat}') if cat else True
+    if not enabled:
+        return None, None
+
+    if cat:
+        canal = getattr(prefs, f'canal_{cat}')
+        if canal in outbox.SEND_CHANNELS:
+            channels = [canal] if user.telefone else []
+        else:
+            # Email e push não são enviados pelo outbox: ficam na app
+            channels = ['app']
+    else:
+        channels = outbox.channels_for(user)
+
+    if urgente:
+        return channels, None
+
+    local = timezone.localtime(now)
+    if cat == 'clima' and prioridade in DIGEST_PRIORITIES:
+        if prefs.frequencia_clima == 'importantes':
+            return ['app'], None
+        weekday = settings.SCHEDULER_WEEKLY_DIGEST_WEEKDAY if prefs.frequencia_clima == 'semanal' else None
+        start = next_window_start(local, prefs.horario_inicio, weekday)
+        return channels, bucket(start, prioridade, user.id)
+
+    if in_window(local, prefs.horario_inicio, prefs.horario_fim):
+        return channels, None
+    start = next_window_start(local, prefs.horario_inicio)
+    return channels, bucket(start, prioridade, user.id)
+
+
+def _digest_item(titulo: str, conteudo: str) -> str:
+    return f"• {titulo}\n{conteudo}" if titulo else f"• {conteudo}"
+
+
+def _merge(ids: List[int], itens: int, metadados: Dict, titulo: str, conteudo: str):
+    """
+    Acrescentar a mesma mensagem a vários resumos pendentes com `itens`
+    mensagens, num só UPDATE (a primeira mensagem passa a item do resumo).
+    """
+    if itens == 1:
+        first = Case(
+            When(titulo='', then=Concat(Value('• '), F('conteudo'), output_field=TextField())),
+            default=Concat(Value('• '), F('titulo'), Value('\n'), F('conteudo'), output_field=TextField()),
+            output_field=TextField(),
+        )
+    else:
+        first = F('conteudo')
+    Notificacao.objects.filter(id__in=ids).update(
+        titulo=f"Resumo AgroAlerta ({itens + 1} mensagens)",
+        conteudo=Concat(first, Value('\n\n' + _digest_item(titulo, conteudo)), output_field=TextField()),
+        metadados={**metadados, 'itens': itens + 1},
+    )
+
+
+def schedule(users: Iterable, titulo: str, conteudo: str, tipo: str = 'geral', prioridade: str = 'normal',
+             metadados: Optional[Dict] = None) -> Dict:
+    """
+    Agendar uma mensagem para cada utilizador segundo as suas preferências.
+    `users` pode ser um QuerySet (lido com cursor no servidor); as
+    preferências são carregadas por lote. Devolve {'enfileiradas': n,
+    'adiadas': n, 'agrupadas': n, 'na_app': n, 'ignoradas': [ids],
+    'usuarios': [ids], 'sem_canal': [ids]} ('agrupadas' = juntas a um resumo
+    que já estava na fila).
+    """
+    batch_size = settings.NOTIFICATION_INSERT_BATCH_SIZE
+    tipo_notificacao = outbox.get_tipo(tipo)
+    metadados = metadados or {}
+    if isinstance(users, QuerySet):
+        users = users.iterator(chunk_size=batch_size)
+    users = iter(users)
+
+    now = timezone.now()
+    result = {'enfileiradas': 0, 'adiadas': 0, 'agrupadas': 0, 'na_app': 0,
+              'ignoradas': [], 'usuarios': [], 'sem_canal': []}
+    with transaction.atomic():
+        while True:
+            chunk = list(islice(users, batch_size))
+            if not chunk:
+                break
+            _schedule_chunk(chunk, titulo, conteudo, tipo_notificacao, prioridade, metadados, now, result)
+    return result
+
+
+def _schedule_chunk(chunk, titulo, conteudo, tipo_notificacao, prioridade, metadados, now, result):
+    ids = [user.id for user in chunk]
+    prefs = {pref.usuario_id: pref for pref in PreferenciaNotificacao.objects.filter(usuario_id__in=ids)}
+
+    rows = []
+    deferred = []
+    for user in chunk:
+        result['usuarios'].append(user.id)
+        channels, when = plan(user, prefs.get(user.id), tipo_notificacao.nome, prioridade, now)
+        if channels is None:
+            result['ignoradas'].append(user.id)
+            continue
+        if not channels:
+            result['sem_canal'].append(user.id)
+            continue
+        for canal in channels:
+            if canal == 'app':
+                result['na_app'] += 1
+                rows.append(Notificacao(
+                    usuario_id=user.id, tipo=tipo_notificacao, titulo=titulo, conteudo=conteudo, canal='app',
+                    prioridade=prioridade, status='enviada', data_envio=now, metadados=metadados,
+                ))
+                continue
+            result['enfileiradas'] += 1
+            if when is None:
+                rows.append(Notificacao(
+                    usuario_id=user.id, tipo=tipo_notificacao, titulo=titulo, conteudo=conteudo, canal=canal,
+                    prioridade=prioridade, agendada_para=now, metadados=metadados,
+                ))
+            else:
+                result['adiadas'] += 1
+                deferred.append((user.id, canal, when))
+
+    if deferred:
+        existing = {}
+        pending = (
+            Notificacao.objects.select_for_update()
+            .filter(status='pendente', usuario_id__in={key[0] for key in deferred},
+                    agendada_para__in={key[2] for key in deferred}, metadados__resumo=True)
+            .only('id', 'usuario_id', 'canal', 'agendada_para', 'metadados')
+            .order_by('id')
+        )
+        for row in pending:
+            if row.metadados.get('itens', 1) < settings.SCHEDULER_DIGEST_MAX_ITEMS:
+                existing.setdefault((row.usuario_id, row.canal, row.agendada_para), row)
+
+        # Resumos a actualizar, agrupados por (itens, metadados): um UPDATE por grupo
+        merged = defaultdict(list)
+        for key in deferred:
+            row = existing.get(key)
+            if row is not None:
+                merged[(row.metadados.get('itens', 1), json.dumps(row.metadados, sort_keys=True))].append(row.id)
+                continue
+            user_id, canal, when = key
+            rows.append(Notificacao(
+                usuario_id=user_id, tipo=tipo_notificacao, titulo=titulo, conteudo=conteudo, canal=canal,
+                prioridade=prioridade, agendada_para=when,
+                metadados={**metadados, 'resumo': True, 'itens': 1},
+            ))
+        for (itens, row_metadados), ids in merged.items():
+            _merge(ids, itens, json.loads(row_metadados), titulo, conteudo)
+            result['agrupadas'] += len(ids)
+
+    Notificacao.objects.bulk_create(rows, batch_size=settings.NOTIFICATION_INSERT_BATCH_SIZE)
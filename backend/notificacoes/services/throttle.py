@@ -0,0 +1,69 @@
+"""
+Limites de envio (token bucket) partilhados pelas threads do processo
+
+Cada mensagem tem de obter uma ficha do balde do canal (sms/whatsapp) e do
+balde da conta Twilio, para que campanhas em paralelo no mesmo processo não
+ultrapassem, juntas, o limite da conta.
+"""
+import threading
+import time
+from typing import Dict, Tuple
+
+from django.conf import settings
+
+
+class TokenBucket:
+    """`rate` fichas por segundo, até `burst` acumuladas"""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Esperar até haver uma ficha (sem limite se rate <= 0)"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # A ficha fica reservada já; quem chega depois espera a seguir
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+_buckets: Dict[Tuple[str, str], TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def _bucket(account: str, channel: str, rate: float) -> TokenBucket:
+    key = (account, channel)
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None or bucket.rate != rate:
+            bucket = _buckets[key] = TokenBucket(rate)
+        return bucket
+
+
+def channel_rate(channel: str) -> float:
+    return {
+        'sms': settings.TWILIO_SMS_PER_SECOND,
+        'whatsapp': settings.TWILIO_WHATSAPP_PER_SECOND,
+    }.get(channel, 0)
+
+
+def acquire(channel: str, account: str = None):
+    """Esperar pela vez de enviar uma mensagem por `channel` com a conta `account`"""
+    account = account or settings.TWILIO_ACCOUNT_SID
+    _bucket(account, channel, channel_rate(channel)).acquire()
+    _bucket(account, '*', settings.TWILIO_ACCOUNT_PER_SECOND).acquire()
+
+
+def reset():
+    with _buckets_lock:
+        _buckets.clear()
@@ -1,167 +1,250 @@
 """
 Serviço de integração com Twilio para WhatsApp e SMS
+
+Todos os envios partilham um pool de ligações HTTP keep-alive e, por canal,
+um limite de pedidos em simultâneo (TWILIO_SMS_CONCURRENCY /
+TWILIO_WHATSAPP_CONCURRENCY). Uma resposta 429 pausa o canal e reduz esse
+limite (ChannelLimiter); a mensagem é reenviada até TWILIO_MAX_RETRIES vezes.
+send_many e os alertas (um utilizador ou uma lista) enviam em paralelo.
 """
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
 from django.conf import settings
-from typing import Dict, Optional, List
+from typing import Callable, Dict, Optional, List, Union
 import logging
 
 logger = logging.getLogger(__name__)
 
+CHANNEL_LABELS = {'sms': 'SMS', 'whatsapp': 'WhatsApp'}
+
+
+def pooled_http_client(pool_size: int, timeout: float = None) -> TwilioHttpClient:
+    """Cliente HTTP do SDK com uma sessão keep-alive de até pool_size ligações"""
+    http_client = TwilioHttpClient(pool_connections=True, timeout=timeout)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    http_client.session.mount('https://', adapter)
+    http_client.session.mount('http://', adapter)
+    return http_client
+
+
+class ChannelLimiter:
+    """
+    Pedidos em simultâneo de um canal, ajustados às respostas 429: um 429
+    reduz o limite para metade e pausa o canal (base, 2*base, ... até
+    maximum); cada `limit` envios aceites sobem o limite em 1 (até
+    concurrency) e reduzem a pausa para metade. Os 429 de pedidos iniciados
+    antes da última redução contam uma só vez.
+    """
+
+    def __init__(self, concurrency: int, base: float, maximum: float):
+        self.concurrency = concurrency
+        self.limit = concurrency
+        self.base = base
+        self.maximum = maximum
+        self.delay = 0.0
+        self._until = 0.0
+        self._throttled_at = 0.0
+        self._active = 0
+        self._accepted = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> float:
+        """Esperar pela vez de enviar; devolve o instante de início do pedido"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self._until:
+                    self._cond.wait(self._until - now)
+                elif self._active >= self.limit:
+                    self._cond.wait()
+                else:
+                    self._active += 1
+                    return now
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def throttled(self, started: float) -> float:
+        with self._cond:
+            if started >= self._throttled_at:
+                now = time.monotonic()
+                self.limit = max(1, self.limit // 2)
+                self.delay = min(self.maximum, self.delay * 2 if self.delay else self.base)
+                self._until = now + self.delay
+                self._throttled_at = now
+            self._accepted = 0
+            return self.delay
+
+    def succeeded(self):
+        with self._cond:
+            self._accepted += 1
+            if self._accepted >= self.limit:
+                self._accepted = 0
+                self.limit = min(self.concurrency, self.limit + 1)
+                self.delay = self.delay / 2 if self.delay / 2 >= self.base else 0.0
+                self._cond.notify_all()
+
+
 class TwilioService:
     def __init__(self):
         self.account_sid = settings.TWILIO_ACCOUNT_SID
         self.auth_token = settings.TWILIO_AUTH_TOKEN
         self.phone_number = settings.TWILIO_PHONE_NUMBER
         self.whatsapp_number = f"whatsapp:{self.phone_number}"
-        
+        self.max_retries = settings.TWILIO_MAX_RETRIES
+        self.group_identical = settings.TWILIO_GROUP_IDENTICAL
+
+        self.concurrency = {
+            'sms': settings.TWILIO_SMS_CONCURRENCY,
+            'whatsapp': settings.TWILIO_WHATSAPP_CONCURRENCY,
+        }
+        self.limiters = {
+            canal: ChannelLimiter(n, settings.TWILIO_BACKOFF_BASE_SECONDS, settings.TWILIO_BACKOFF_MAX_SECONDS)
+            for canal, n in self.concurrency.items()
+        }
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
         if self.account_sid and self.auth_token:
-            self.client = Client(self.account_sid, self.auth_token)
+            self.client = Client(
+                self.account_sid, self.auth_token,
+                http_client=pooled_http_client(sum(self.concurrency.values()), settings.TWILIO_TIMEOUT)
+            )
         else:
             self.client = None
             logger.warning("Credenciais do Twilio não configuradas")
-    
-    def send_sms(self, to_phone: str, message: str) -> Optional[Dict]:
-        """
-        Enviar SMS para um número de telefone
-        """
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=sum(self.concurrency.values()),
+                                                    thread_name_prefix='twilio')
+            return self._executor
+
+    @staticmethod
+    def _format_phone(to_phone: str) -> str:
+        # Garantir que o número tenha o código do país
+        if not to_phone.startswith('+'):
+            to_phone = f"+258{to_phone.lstrip('0')}"
+        return to_phone
+
+    def _send(self, channel: str, to_phone: str, message: str) -> Optional[Dict]:
         if not self.client:
             logger.error("Cliente Twilio não configurado")
             return None
-            
+
         try:
-            # Garantir que o número tenha o código do país
-            if not to_phone.startswith('+'):
-                to_phone = f"+258{to_phone.lstrip('0')}"
-            
-            message_obj = self.client.messages.create(
-                body=message,
-                from_=self.phone_number,
-                to=to_phone
-            )
-            
+            to_phone = self._format_phone(to_phone)
+            if channel == 'whatsapp':
+                # Formato WhatsApp do Twilio
+                from_, to = self.whatsapp_number, f"whatsapp:{to_phone}"
+            else:
+                from_, to = self.phone_number, to_phone
+
+            limiter = self.limiters[channel]
+            attempt = 0
+            while True:
+                started = limiter.acquire()
+                try:
+                    message_obj = self.client.messages.create(body=message, from_=from_, to=to)
+                    break
+                except TwilioRestException as e:
+                    if e.status != 429 or attempt >= self.max_retries:
+                        raise
+                    attempt += 1
+                    delay = limiter.throttled(started)
+                    logger.warning(f"Twilio 429 ({CHANNEL_LABELS[channel]}): tentativa {attempt + 1} após {delay:.1f}s")
+                finally:
+                    limiter.release()
+            limiter.succeeded()
+
             return {
                 'sid': message_obj.sid,
                 'status': message_obj.status,
                 'to': to_phone,
-                'type': 'sms',
+                'type': channel,
                 'success': True
             }
-            
+
         except Exception as e:
-            logger.error(f"Erro ao enviar SMS para {to_phone}: {e}")
+            logger.error(f"Erro ao enviar {CHANNEL_LABELS[channel]} para {to_phone}: {e}")
             return {
                 'error': str(e),
                 'to': to_phone,
-                'type': 'sms',
+                'type': channel,
                 'success': False
             }
-    
+
+    def send_sms(self, to_phone: str, message: str) -> Optional[Dict]:
+        """
+        Enviar SMS para um número de telefone
+        """
+        return self._send('sms', to_phone, message)
+
     def send_whatsapp(self, to_phone: str, message: str) -> Optional[Dict]:
         """
         Enviar mensagem via WhatsApp
         """
-        if not self.client:
-            logger.error("Cliente Twilio não configurado")
-            return None
-            
-        try:
-            # Garantir que o número tenha o código do país
-            if not to_phone.startswith('+'):
-                to_phone = f"+258{to_phone.lstrip('0')}"
-            
-            # Formato WhatsApp do Twilio
-            whatsapp_to = f"whatsapp:{to_phone}"
-            
-            message_obj = self.client.messages.create(
-                body=message,
-                from_=self.whatsapp_number,
-                to=whatsapp_to
-            )
-            
-            return {
-                'sid': message_obj.sid,
-                'status': message_obj.status,
-                'to': to_phone,
-                'type': 'whatsapp',
-                'success': True
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro ao enviar WhatsApp para {to_phone}: {e}")
-            return {
-                'error': str(e),
-                'to': to_phone,
-                'type': 'whatsapp',
-                'success': False
-            }
-    
-    def send_weather_alert(self, user_data: Dict, alert_data: Dict) -> List[Dict]:
+        return self._send('whatsapp', to_phone, message)
+
+    def send_many(self, messages: List[Dict], group_identical: bool = None) -> List[Optional[Dict]]:
         """
-        Enviar alerta climático para o utilizador
+        Enviar em paralelo mensagens {'canal', 'telefone', 'mensagem'}; devolve
+        os resultados pela mesma ordem. Com group_identical, mensagens iguais
+        (canal, número e texto) são enviadas uma só vez e partilham o resultado.
         """
-        results = []
-        
-        # Criar mensagem personalizada
-        message = self._create_weather_alert_message(user_data, alert_data)
-        
-        # Enviar SMS se habilitado
-        if user_data.get('receber_sms') and user_data.get('telefone'):
-            sms_result = self.send_sms(user_data['telefone'], message)
-            if sms_result:
-                results.append(sms_result)
-        
-        # Enviar WhatsApp se habilitado
-        if user_data.get('receber_whatsapp') and user_data.get('telefone'):
-            whatsapp_result = self.send_whatsapp(user_data['telefone'], message)
-            if whatsapp_result:
-                results.append(whatsapp_result)
-        
+        if group_identical is None:
+            group_identical = self.group_identical
+        keys = [(m['canal'], m['telefone'], m['mensagem']) for m in messages]
+        unique = list(dict.fromkeys(keys)) if group_identical else keys
+        futures = [self._pool().submit(self._send, *key) for key in unique]
+        results = [future.result() for future in futures]
+        if group_identical:
+            by_key = dict(zip(unique, results))
+            return [by_key[key] for key in keys]
         return results
-    
-    def send_pest_detection_alert(self, user_data: Dict, pest_data: Dict) -> List[Dict]:
+
+    def _send_alerts(self, users: Union[Dict, List[Dict]], build_message: Callable[[Dict], str]) -> List[Dict]:
+        if isinstance(users, dict):
+            users = [users]
+
+        messages = []
+        for user_data in users:
+            if not user_data.get('telefone'):
+                continue
+            message = build_message(user_data)
+            # Enviar SMS e/ou WhatsApp conforme as preferências
+            if user_data.get('receber_sms'):
+                messages.append({'canal': 'sms', 'telefone': user_data['telefone'], 'mensagem': message})
+            if user_data.get('receber_whatsapp'):
+                messages.append({'canal': 'whatsapp', 'telefone': user_data['telefone'], 'mensagem': message})
+
+        return [result for result in self.send_many(messages) if result]
+
+    def send_weather_alert(self, user_data: Union[Dict, List[Dict]], alert_data: Dict) -> List[Dict]:
         """
-        Enviar alerta de detecção de praga
+        Enviar alerta climático para um utilizador ou uma lista de utilizadores
         """
-        results = []
-        
-        message = self._create_pest_alert_message(user_data, pest_data)
-        
-        # Enviar SMS se habilitado
-        if user_data.get('receber_sms') and user_data.get('telefone'):
-            sms_result = self.send_sms(user_data['telefone'], message)
-            if sms_result:
-                results.append(sms_result)
-        
-        # Enviar WhatsApp se habilitado
-        if user_data.get('receber_whatsapp') and user_data.get('telefone'):
-            whatsapp_result = self.send_whatsapp(user_data['telefone'], message)
-            if whatsapp_result:
-                results.append(whatsapp_result)
-        
-        return results
-    
-    def send_market_price_update(self, user_data: Dict, market_data: Dict) -> List[Dict]:
+        return self._send_alerts(user_data, lambda user: self._create_weather_alert_message(user, alert_data))
+
+    def send_pest_detection_alert(self, user_data: Union[Dict, List[Dict]], pest_data: Dict) -> List[Dict]:
         """
-        Enviar atualizações de preços de mercado
+        Enviar alerta de detecção de praga para um ou vários utilizadores
         """
-        results = []
-        
-        message = self._create_market_alert_message(user_data, market_data)
-        
-        # Enviar SMS se habilitado
-        if user_data.get('receber_sms') and user_data.get('telefone'):
-            sms_result = self.send_sms(user_data['telefone'], message)
-            if sms_result:
-                results.append(sms_result)
-        
-        # Enviar WhatsApp se habilitado
-        if user_data.get('receber_whatsapp') and user_data.get('telefone'):
-            whatsapp_result = self.send_whatsapp(user_data['telefone'], message)
-            if whatsapp_result:
-                results.append(whatsapp_result)
-        
-        return results
+        return self._send_alerts(user_data, lambda user: self._create_pest_alert_message(user, pest_data))
+
+    def send_market_price_update(self, user_data: Union[Dict, List[Dict]], market_data: Dict) -> List[Dict]:
+        """
+        Enviar atualizações de preços de mercado para um ou vários utilizadores
+        """
+        return self._send_alerts(user_data, lambda user: self._create_market_alert_message(user, market_data))
     
     def _create_weather_alert_message(self, user_data: Dict, alert_data: Dict) -> str:
         """
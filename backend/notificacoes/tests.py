@@ -1,3 +1,613 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import datetime, time as dtime, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from twilio.base.exceptions import TwilioRestException
+
+from users.models import User
+from .models import CampanhaNotificacao, LogEnvio, Notificacao, PreferenciaNotificacao
+from .services import campaigns, outbox, recipients, scheduler, throttle
+from .services.twilio_service import TwilioService
+
+SEND_SMS = 'notificacoes.services.twilio_service.twilio_service.send_sms'
+SEND_WHATSAPP = 'notificacoes.services.twilio_service.twilio_service.send_whatsapp'
+
+
+def _sent(to_phone, message):
+    return {'sid': 'SM123', 'status': 'queued', 'to': to_phone, 'type': 'sms', 'success': True}
+
+
+@override_settings(NOTIFICATION_MAX_ATTEMPTS=3, NOTIFICATION_RETRY_BASE_SECONDS=30,
+                   NOTIFICATION_RETRY_MAX_SECONDS=3600, NOTIFICATION_LEASE_SECONDS=300)
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        self.sms_user = User.objects.create_user(username='sms', password='x', telefone='841234567')
+        self.both_user = User.objects.create_user(username='ambos', password='x', telefone='851234567',
+                                                  receber_whatsapp=True)
+        self.no_phone = User.objects.create_user(username='sem_telefone', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.sms_user)
+
+    def test_view_enqueues_without_sending(self):
+        with mock.patch(SEND_SMS) as send_sms:
+            response = self.client.post('/api/notificacoes/enviar/', {
+                'titulo': 'Chuva forte',
+                'mensagem': 'Proteja as culturas',
+                'destinatarios': [self.sms_user.id, self.both_user.id, self.no_phone.id, 999999],
+            }, format='json')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['total_enfileiradas'], 3)
+        self.assertEqual(response.data['sem_canal'], [self.no_phone.id])
+        self.assertEqual(response.data['nao_encontrados'], [999999])
+        send_sms.assert_not_called()
+        self.assertEqual(
+            sorted(Notificacao.objects.filter(status='pendente').values_list('canal', flat=True)),
+            ['sms', 'sms', 'whatsapp']
+        )
+
+    def test_view_rejects_invalid_recipients(self):
+        response = self.client.post('/api/notificacoes/enviar/', {
+            'mensagem': 'Olá', 'destinatarios': ['abc']
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_worker_sends_and_logs(self):
+        outbox.enqueue([self.sms_user, self.both_user], 'Praga', 'Lagarta do cartucho detectada')
+
+        with mock.patch(SEND_SMS, side_effect=_sent) as send_sms, \
+                mock.patch(SEND_WHATSAPP, side_effect=_sent) as send_whatsapp:
+            counts = outbox.process_batch()
+
+        self.assertEqual(counts['enviadas'], 3)
+        self.assertEqual(send_sms.call_count, 2)
+        send_whatsapp.assert_called_once_with('851234567', 'Lagarta do cartucho detectada')
+        self.assertFalse(Notificacao.objects.exclude(status='enviada').exists())
+        notificacao = Notificacao.objects.filter(canal='sms').first()
+        self.assertEqual(notificacao.metadados['sid'], 'SM123')
+        self.assertIsNotNone(notificacao.data_envio)
+        self.assertEqual(LogEnvio.objects.filter(status_tentativa='sucesso').count(), 3)
+
+    def test_failure_is_retried_with_backoff_until_max_attempts(self):
+        outbox.enqueue([self.sms_user], 'Mercado', 'Preço do milho subiu')
+        failure = {'success': False, 'error': 'Twilio 500', 'type': 'sms'}
+
+        for attempt, delay in ((1, 30), (2, 60)):
+            with mock.patch(SEND_SMS, return_value=dict(failure)):
+                before = timezone.now()
+                self.assertEqual(outbox.process_batch()['reagendadas'], 1)
+            notificacao = Notificacao.objects.get()
+            self.assertEqual(notificacao.status, 'pendente')
+            self.assertEqual(notificacao.tentativas_envio, attempt)
+            self.assertAlmostEqual((notificacao.agendada_para - before).total_seconds(), delay, delta=5)
+
+            # Antes do backoff terminar não é reservada
+            self.assertEqual(outbox.process_batch()['reservadas'], 0)
+            Notificacao.objects.update(agendada_para=timezone.now() - timedelta(seconds=1))
+
+        with mock.patch(SEND_SMS, return_value=dict(failure)):
+            self.assertEqual(outbox.process_batch()['falhadas'], 1)
+        notificacao = Notificacao.objects.get()
+        self.assertEqual(notificacao.status, 'falhada')
+        self.assertEqual(notificacao.erro_envio, 'Twilio 500')
+        self.assertEqual(list(notificacao.logs_envio.order_by('tentativa').values_list('tentativa', flat=True)),
+                         [1, 2, 3])
+
+    def test_claimed_rows_are_leased(self):
+        outbox.enqueue([self.sms_user], 'Clima', 'Vento forte')
+        self.assertEqual(len(outbox.claim(10)), 1)
+        self.assertEqual(outbox.claim(10), [])
+
+        # Worker morreu: a linha volta à fila ao fim do lease
+        Notificacao.objects.update(agendada_para=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(outbox.claim(10)[0].tentativas_envio, 2)
+
+    def test_future_scheduled_rows_wait(self):
+        outbox.enqueue([self.sms_user], 'Clima', 'Amanhã', agendada_para=timezone.now() + timedelta(hours=1))
+        self.assertEqual(outbox.claim(10), [])
+
+
+class NotificationOutboxLockingTests(TransactionTestCase):
+    def test_locked_rows_are_skipped_by_other_workers(self):
+        user = User.objects.create_user(username='sms', password='x', telefone='841234567')
+        outbox.enqueue([user, user], 'Clima', 'Chuva')
+        first, second = Notificacao.objects.order_by('id')
+        claimed = []
+
+        def other_worker():
+            try:
+                claimed.extend(row.id for row in outbox.claim(10))
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            # Outro worker tem a primeira linha reservada
+            list(Notificacao.objects.select_for_update().filter(id=first.id))
+            thread = threading.Thread(target=other_worker)
+            thread.start()
+            thread.join(timeout=10)
+
+        self.assertEqual(claimed, [second.id])
+
+    @override_settings(NOTIFICATION_LEASE_SECONDS=300, NOTIFICATION_MAX_ATTEMPTS=5)
+    def test_result_dropped_when_lease_was_taken_over(self):
+        user = User.objects.create_user(username='sms', password='x', telefone='841234567')
+        outbox.enqueue([user], 'Clima', 'Chuva')
+        reclaimed = []
+
+        def slow_send(to_phone, message):
+            # O envio demorou mais do que o lease: outro worker reserva a linha e já a enviou
+            try:
+                Notificacao.objects.update(agendada_para=timezone.now() - timedelta(seconds=1))
+                reclaimed.extend(outbox.claim(10))
+                Notificacao.objects.update(status='enviada', metadados={'sid': 'SM-novo'})
+            finally:
+                connection.close()
+            return {'success': False, 'error': 'Twilio timeout'}
+
+        with mock.patch(SEND_SMS, side_effect=slow_send):
+            counts = outbox.process_batch(workers=1)
+
+        self.assertEqual(len(reclaimed), 1)
+        self.assertEqual(counts['perdidas'], 1)
+        self.assertEqual(counts['reagendadas'], 0)
+        notificacao = Notificacao.objects.get()
+        self.assertEqual(notificacao.status, 'enviada')
+        self.assertEqual(notificacao.metadados, {'sid': 'SM-novo'})
+        self.assertEqual(notificacao.tentativas_envio, 2)
+        self.assertEqual(LogEnvio.objects.filter(notificacao=notificacao).count(), 1)
+
+
+@override_settings(NOTIFICATION_INSERT_BATCH_SIZE=100)
+class RecipientResolutionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users = []
+        for i in range(300):
+            users.append(User(
+                username=f'agricultor{i}', telefone=f'84{i:07d}',
+                provincia=['Nampula', 'Zambézia', 'Manica'][i % 3],
+                distrito=['Ribáuè', 'Mocuba', 'Sussundenga'][i % 3],
+                culturas_interesse=[['milho'], ['feijao', 'milho'], ['mandioca']][i % 3],
+                receber_whatsapp=(i % 10 == 0),
+            ))
+        User.objects.bulk_create(users)
+        cls.tecnico = User.objects.create_user(username='tecnico', password='x', tipo_usuario='tecnico')
+
+    def test_filters_match_campaign_format(self):
+        self.assertEqual(recipients.resolve_recipients({'provincia': 'nampula'}).count(), 100)
+        self.assertEqual(recipients.resolve_recipients({'provincia': ['Nampula', 'Manica']}).count(), 200)
+        self.assertEqual(recipients.resolve_recipients({'culturas_interesse': 'milho'}).count(), 200)
+        self.assertEqual(recipients.resolve_recipients(
+            {'culturas_interesse': ['milho'], 'distrito': 'Mocuba'}).count(), 100)
+        self.assertEqual(recipients.resolve_recipients({'tipo_usuario': 'tecnico'}).get(), self.tecnico)
+
+        User.objects.filter(provincia='Manica').update(ativo=False)
+        self.assertEqual(recipients.resolve_recipients({'distrito': 'Sussundenga'}).count(), 0)
+
+        with self.assertRaises(ValueError):
+            recipients.resolve_recipients({'senha': 'x'})
+
+    def test_bulk_enqueue_uses_constant_queries(self):
+        users = recipients.resolve_recipients({'culturas_interesse': ['milho', 'mandioca']})
+        # get_or_create do tipo (4, com savepoint), transação (2), cursor dos
+        # utilizadores (1) e um INSERT por cada ~100 notificações (330 -> 5)
+        with self.assertNumQueries(12):
+            result = outbox.enqueue(users, 'Campanha', 'Vacinação de gado na sexta-feira')
+
+        self.assertEqual(len(result['usuarios']), 300)
+        self.assertEqual(result['enfileiradas'], 330)
+        self.assertEqual(Notificacao.objects.filter(canal='whatsapp').count(), 30)
+
+    def test_view_sends_by_filters(self):
+        client = APIClient()
+        client.force_authenticate(self.tecnico)
+        response = client.post('/api/notificacoes/enviar/', {
+            'mensagem': 'Chuva forte amanhã', 'filtros': {'provincia': 'Zambézia'}
+        }, format='json')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['total_destinatarios'], 100)
+        self.assertEqual(Notificacao.objects.count(), 100 + 10)
+
+    def test_view_rejects_filters_from_farmers(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(username='agricultor0'))
+        response = client.post('/api/notificacoes/enviar/', {
+            'mensagem': 'Spam', 'filtros': {'provincia': 'Nampula'}
+        }, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Notificacao.objects.exists())
+
+
+@override_settings(TWILIO_SMS_PER_SECOND=0, TWILIO_WHATSAPP_PER_SECOND=0, TWILIO_ACCOUNT_PER_SECOND=0,
+                   CAMPAIGN_CHUNK_SIZE=10, CAMPAIGN_SEND_WORKERS=4)
+class CampaignRunnerTests(TestCase):
+    def setUp(self):
+        users = [
+            User(username=f'agricultor{i}', first_name=f'Nome{i}', telefone=f'84{i:07d}',
+                 provincia='Nampula' if i < 25 else 'Manica', culturas_interesse=['milho'],
+                 receber_whatsapp=(i % 5 == 0))
+            for i in range(30)
+        ]
+        User.objects.bulk_create(users)
+        self.campanha = CampanhaNotificacao.objects.create(
+            nome='Vacinação', tipo=outbox.get_tipo('campanha'),
+            titulo_template='Olá {{ nome }}',
+            conteudo_template='{{ nome }}, vacinação em {{ provincia }} & arredores ({{ culturas }})',
+            canais=['sms', 'whatsapp'], filtros_usuario={'provincia': 'Nampula'}, status='agendada',
+        )
+
+    def test_campaign_renders_sends_and_counts(self):
+        with mock.patch(SEND_SMS, side_effect=_sent) as send_sms, \
+                mock.patch(SEND_WHATSAPP, return_value={'success': False, 'error': 'Janela de 24h'}):
+            totals = campaigns.run(self.campanha.id)
+
+        self.assertEqual(totals, {'envios': 30, 'sucessos': 25, 'falhas': 5, 'adiadas': 0, 'ignoradas': 0,
+                                  'status': 'concluida'})
+        self.assertEqual(send_sms.call_count, 25)
+        send_sms.assert_any_call('840000003', 'Nome3, vacinação em Nampula & arredores (milho)')
+
+        self.campanha.refresh_from_db()
+        self.assertEqual(self.campanha.status, 'concluida')
+        self.assertEqual((self.campanha.total_envios, self.campanha.total_sucessos, self.campanha.total_falhas),
+                         (30, 25, 5))
+        self.assertEqual(self.campanha.ultimo_usuario_id, User.objects.get(username='agricultor24').id)
+        notificacao = Notificacao.objects.get(usuario__username='agricultor3')
+        self.assertEqual(notificacao.titulo, 'Olá Nome3')
+        self.assertEqual(notificacao.metadados['campanha_id'], self.campanha.id)
+        self.assertEqual(Notificacao.objects.filter(status='falhada', canal='whatsapp').count(), 5)
+
+    def test_paused_campaign_resumes_from_checkpoint(self):
+        checks = iter([False, False, True])
+        with mock.patch.object(campaigns, '_stop_requested', side_effect=lambda campanha_id: next(checks)), \
+                mock.patch(SEND_SMS, side_effect=_sent), mock.patch(SEND_WHATSAPP, side_effect=_sent):
+            totals = campaigns.run(self.campanha.id)
+        self.assertEqual(totals['status'], 'pausada')
+        self.campanha.refresh_from_db()
+        self.assertEqual(self.campanha.ultimo_usuario_id, User.objects.get(username='agricultor19').id)
+        CampanhaNotificacao.objects.filter(id=self.campanha.id).update(status='pausada')
+
+        with mock.patch(SEND_SMS, side_effect=_sent), mock.patch(SEND_WHATSAPP, side_effect=_sent):
+            totals = campaigns.run(self.campanha.id)
+        self.assertEqual(totals['status'], 'concluida')
+
+        self.campanha.refresh_from_db()
+        self.assertEqual(self.campanha.total_envios, 30)
+        self.assertEqual(Notificacao.objects.filter(canal='sms').values('usuario').distinct().count(), 25)
+        self.assertEqual(Notificacao.objects.filter(canal='sms').count(), 25)
+
+        with self.assertRaises(ValueError):
+            campaigns.run(self.campanha.id)
+
+    def test_campaign_follows_user_preferences(self):
+        tipo = outbox.get_tipo('mercado_precos')
+        CampanhaNotificacao.objects.filter(id=self.campanha.id).update(tipo=tipo, canais=['sms', 'whatsapp'])
+        noite = User.objects.get(username='agricultor1')
+        sem_mercado = User.objects.get(username='agricultor2')
+        whatsapp = User.objects.get(username='agricultor3')
+        PreferenciaNotificacao.objects.create(usuario=noite, horario_inicio=dtime(6, 0), horario_fim=dtime(18, 0))
+        PreferenciaNotificacao.objects.create(usuario=sem_mercado, receber_mercado=False)
+        PreferenciaNotificacao.objects.create(usuario=whatsapp, canal_mercado='whatsapp',
+                                              horario_inicio=dtime(0, 0), horario_fim=dtime(0, 0))
+
+        # 22:00 em Maputo: fora da janela de agricultor1
+        with mock.patch('notificacoes.services.campaigns.timezone.now', return_value=_local(2026, 10, 14, 22, 0)), \
+                mock.patch(SEND_SMS, side_effect=_sent) as send_sms, mock.patch(SEND_WHATSAPP, side_effect=_sent):
+            totals = campaigns.run(self.campanha.id)
+
+        self.assertEqual((totals['adiadas'], totals['ignoradas']), (1, 1))
+        # 25 SMS + 5 WhatsApp, menos os SMS de agricultor1 (adiado) e agricultor2; agricultor3 só por WhatsApp
+        self.assertEqual(totals['envios'], 28)
+        sent_to = {call.args[0] for call in send_sms.call_args_list}
+        self.assertNotIn(noite.telefone, sent_to)
+        self.assertNotIn(sem_mercado.telefone, sent_to)
+        self.assertNotIn(whatsapp.telefone, sent_to)
+        self.assertFalse(Notificacao.objects.filter(usuario=sem_mercado).exists())
+        self.assertEqual(Notificacao.objects.get(usuario=whatsapp).canal, 'whatsapp')
+
+        adiada = Notificacao.objects.get(usuario=noite)
+        self.assertEqual((adiada.status, adiada.canal), ('pendente', 'sms'))
+        self.assertEqual(adiada.agendada_para,
+                         scheduler.bucket(_local(2026, 10, 15, 6, 0), 'normal', noite.id))
+        self.assertEqual(adiada.metadados['campanha_id'], self.campanha.id)
+
+    def test_running_campaign_is_not_started_twice(self):
+        campaigns.start(self.campanha.id)
+        with mock.patch(SEND_SMS, side_effect=_sent) as send_sms, mock.patch(SEND_WHATSAPP, side_effect=_sent):
+            with self.assertRaises(ValueError):
+                campaigns.run(self.campanha.id)
+            with self.assertRaises(CommandError):
+                call_command('executar_campanhas', id=self.campanha.id, stdout=StringIO())
+            call_command('executar_campanhas', stdout=StringIO())
+        send_sms.assert_not_called()
+
+        # Lease expirado (processo morto): o cron retoma do checkpoint
+        CampanhaNotificacao.objects.filter(id=self.campanha.id).update(
+            execucao_expira_em=timezone.now() - timedelta(seconds=1)
+        )
+        with mock.patch(SEND_SMS, side_effect=_sent) as send_sms, mock.patch(SEND_WHATSAPP, side_effect=_sent):
+            call_command('executar_campanhas', stdout=StringIO())
+        self.assertEqual(send_sms.call_count, 25)
+        self.campanha.refresh_from_db()
+        self.assertEqual((self.campanha.status, self.campanha.execucao_expira_em), ('concluida', None))
+
+    def test_force_takes_over_and_old_run_stops(self):
+        checks = []
+
+        def takeover_after_first_chunk(campanha_id):
+            checks.append(campanha_id)
+            if len(checks) == 2:
+                # Outro processo arranca com --force enquanto este ainda corre
+                self.assertIsNotNone(campaigns.start(campanha_id, force=True))
+            return False
+
+        with mock.patch.object(campaigns, '_stop_requested', side_effect=takeover_after_first_chunk), \
+                mock.patch(SEND_SMS, side_effect=_sent) as send_sms, mock.patch(SEND_WHATSAPP, side_effect=_sent):
+            totals = campaigns.run(self.campanha.id)
+
+        self.assertEqual(totals['status'], 'interrompida')
+        self.assertEqual(send_sms.call_count, 10)  # só o primeiro bloco
+        self.campanha.refresh_from_db()
+        self.assertEqual(self.campanha.status, 'em_execucao')
+        self.assertEqual(self.campanha.ultimo_usuario_id, User.objects.get(username='agricultor9').id)
+
+    def test_checkpoint_never_moves_back(self):
+        last = User.objects.get(username='agricultor24').id
+        CampanhaNotificacao.objects.filter(id=self.campanha.id).update(ultimo_usuario_id=last)
+        totals = {'envios': 0, 'sucessos': 0, 'falhas': 0, 'adiadas': 0}
+        campaigns._record_chunk(self.campanha, last - 10, [], [], [], totals)
+        self.campanha.refresh_from_db()
+        self.assertEqual(self.campanha.ultimo_usuario_id, last)
+
+    def test_migration_backfills_scheduled_campaigns(self):
+        from importlib import import_module
+        from django.apps import apps
+        migration = import_module('notificacoes.migrations.0008_campanha_lease')
+
+        CampanhaNotificacao.objects.filter(id=self.campanha.id).update(status='rascunho')
+        agendada = CampanhaNotificacao.objects.create(
+            nome='Antiga', tipo=self.campanha.tipo, titulo_template='x', conteudo_template='y',
+            data_agendamento=timezone.now() - timedelta(days=1),
+        )
+        executada = CampanhaNotificacao.objects.create(
+            nome='Enviada', tipo=self.campanha.tipo, titulo_template='x', conteudo_template='y',
+            data_agendamento=timezone.now() - timedelta(days=2), total_envios=40,
+        )
+        migration.backfill_status(apps, None)
+        self.assertEqual(
+            dict(CampanhaNotificacao.objects.values_list('id', 'status')),
+            {self.campanha.id: 'rascunho', agendada.id: 'agendada', executada.id: 'concluida'}
+        )
+        self.assertEqual(list(campaigns.due_campaigns()), [agendada])
+
+    def test_command_runs_due_campaigns_only(self):
+        CampanhaNotificacao.objects.create(
+            nome='Futura', tipo=self.campanha.tipo, titulo_template='x', conteudo_template='y',
+            canais=['sms'], status='agendada', data_agendamento=timezone.now() + timedelta(days=1),
+        )
+        with mock.patch(SEND_SMS, side_effect=_sent), mock.patch(SEND_WHATSAPP, side_effect=_sent):
+            call_command('executar_campanhas', stdout=StringIO())
+
+        self.assertEqual(
+            dict(CampanhaNotificacao.objects.values_list('nome', 'status')),
+            {'Vacinação': 'concluida', 'Futura': 'agendada'}
+        )
+
+
+class ThrottleTests(TestCase):
+    def test_token_bucket_spaces_calls(self):
+        bucket = throttle.TokenBucket(rate=50, burst=1)
+        start = time.monotonic()
+        for _ in range(11):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    @override_settings(TWILIO_SMS_PER_SECOND=0, TWILIO_WHATSAPP_PER_SECOND=0, TWILIO_ACCOUNT_PER_SECOND=100)
+    def test_channels_share_account_limit(self):
+        throttle.reset()
+        start = time.monotonic()
+        for canal in ['sms', 'whatsapp'] * 60:
+            throttle.acquire(canal, account='AC1')
+        # 100 de rajada e 20 a 100/s
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+
+@override_settings(TWILIO_ACCOUNT_SID='AC' + '0' * 32, TWILIO_AUTH_TOKEN='token', TWILIO_PHONE_NUMBER='+258840000000',
+                   TWILIO_SMS_CONCURRENCY=2, TWILIO_WHATSAPP_CONCURRENCY=3, TWILIO_MAX_RETRIES=2,
+                   TWILIO_BACKOFF_BASE_SECONDS=0.01, TWILIO_BACKOFF_MAX_SECONDS=0.05, TWILIO_GROUP_IDENTICAL=True)
+class TwilioServiceTests(TestCase):
+    def setUp(self):
+        self.service = TwilioService()
+        self.create = mock.Mock(return_value=mock.Mock(sid='SM1', status='queued'))
+        self.service.client = mock.Mock()
+        self.service.client.messages.create = self.create
+
+    def test_client_uses_shared_keep_alive_pool(self):
+        service = TwilioService()
+        adapter = service.client.http_client.session.get_adapter('https://api.twilio.com')
+        self.assertEqual(adapter._pool_maxsize, 5)
+
+    def test_429_backs_off_and_retries(self):
+        self.create.side_effect = [TwilioRestException(429, 'uri', 'Too Many Requests'),
+                                   mock.Mock(sid='SM2', status='queued')]
+        result = self.service.send_sms('841234567', 'Olá')
+        self.assertTrue(result['success'])
+        self.assertEqual(result['to'], '+258841234567')
+        self.assertEqual(self.create.call_count, 2)
+        # Após o 429: pausa 0.01 e limite 1; o envio aceite repõe ambos
+        self.assertEqual(self.service.limiters['sms'].delay, 0)
+        self.assertEqual(self.service.limiters['sms'].limit, 2)
+
+    def test_429_gives_up_after_max_retries(self):
+        self.create.side_effect = TwilioRestException(429, 'uri', 'Too Many Requests')
+        result = self.service.send_whatsapp('841234567', 'Olá')
+        self.assertFalse(result['success'])
+        self.assertEqual(self.create.call_count, 3)
+        self.assertEqual(self.service.limiters['whatsapp'].delay, 0.02)
+        self.assertEqual(self.service.limiters['whatsapp'].limit, 1)
+        self.assertEqual(self.create.call_args.kwargs['to'], 'whatsapp:+258841234567')
+
+    def test_channel_concurrency_is_limited(self):
+        active = {'sms': 0, 'whatsapp': 0}
+        peak = {'sms': 0, 'whatsapp': 0}
+        lock = threading.Lock()
+
+        def create(body, from_, to):
+            canal = 'whatsapp' if to.startswith('whatsapp:') else 'sms'
+            with lock:
+                active[canal] += 1
+                peak[canal] = max(peak[canal], active[canal])
+            time.sleep(0.02)
+            with lock:
+                active[canal] -= 1
+            return mock.Mock(sid='SM1', status='queued')
+
+        self.create.side_effect = create
+        messages = [{'canal': canal, 'telefone': f'84000{i:04d}', 'mensagem': 'Olá'}
+                    for i in range(10) for canal in ('sms', 'whatsapp')]
+        results = self.service.send_many(messages)
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(peak, {'sms': 2, 'whatsapp': 3})
+
+    def test_identical_messages_are_grouped(self):
+        messages = [{'canal': 'sms', 'telefone': '841234567', 'mensagem': 'Olá'}] * 3
+        results = self.service.send_many(messages)
+        self.assertEqual(self.create.call_count, 1)
+        self.assertEqual(len(results), 3)
+        self.service.send_many(messages, group_identical=False)
+        self.assertEqual(self.create.call_count, 4)
+
+    def test_alerts_accept_one_user_or_a_list(self):
+        users = [
+            {'first_name': 'Ana', 'telefone': '841111111', 'receber_sms': True, 'receber_whatsapp': True},
+            {'first_name': 'Rui', 'telefone': '842222222', 'receber_sms': True},
+            {'first_name': 'Sem telefone', 'receber_sms': True},
+        ]
+        alert = {'titulo': 'Chuva forte', 'tipo_alerta': 'chuva_forte', 'nivel': 'alto'}
+        self.assertEqual(len(self.service.send_weather_alert(users, alert)), 3)
+        self.assertEqual(len(self.service.send_pest_detection_alert(users[1], {'nome': 'Lagarta'})), 1)
+        self.assertEqual(len(self.service.send_market_price_update(users, {'cultura': 'milho', 'preco': 25})), 3)
+        bodies = {call.kwargs['to']: call.kwargs['body'] for call in self.create.call_args_list}
+        self.assertIn('Olá Rui!', bodies['+258842222222'])
+
+
+def _local(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+@override_settings(SCHEDULER_SPREAD_SECONDS=900, SCHEDULER_DIGEST_MAX_ITEMS=3, SCHEDULER_WEEKLY_DIGEST_WEEKDAY=0)
+class NotificationSchedulerTests(TestCase):
+    # Quarta-feira, 14/10/2026, hora de Maputo
+    NIGHT = (2026, 10, 14, 22, 0)
+    DAY = (2026, 10, 14, 10, 0)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='agricultor', password='x', telefone='841234567')
+        self.prefs = PreferenciaNotificacao.objects.create(usuario=self.user, canal_mercado='whatsapp',
+                                                           frequencia_clima='diaria')
+
+    def schedule(self, when, **kwargs):
+        kwargs.setdefault('tipo', 'mercado')
+        with mock.patch('notificacoes.services.scheduler.timezone.now', return_value=_local(*when)):
+            return scheduler.schedule([self.user], kwargs.pop('titulo', 'Milho'), kwargs.pop('conteudo', '25 MZN/kg'),
+                                      **kwargs)
+
+    def expected_bucket(self, day, prioridade='normal'):
+        slot = {'alta': 0, 'normal': 1, 'baixa': 2}[prioridade]
+        return _local(*day, 7, 0) + timedelta(seconds=slot * 900 + self.user.id % 900)
+
+    def test_quiet_hours_defer_to_window_bucket(self):
+        result = self.schedule(self.NIGHT, prioridade='baixa')
+        self.assertEqual((result['enfileiradas'], result['adiadas']), (1, 1))
+        notificacao = Notificacao.objects.get()
+        self.assertEqual(notificacao.canal, 'whatsapp')
+        self.assertEqual(notificacao.agendada_para, self.expected_bucket((2026, 10, 15), 'baixa'))
+        self.assertLess(scheduler.bucket(_local(2026, 10, 15, 7, 0), 'alta', self.user.id), notificacao.agendada_para)
+
+    def test_in_window_and_urgent_are_sent_now(self):
+        self.schedule(self.DAY)
+        self.schedule(self.NIGHT, prioridade='urgente')
+        self.assertEqual(sorted(Notificacao.objects.values_list('agendada_para', flat=True)),
+                         [_local(*self.DAY), _local(*self.NIGHT)])
+
+    def test_window_across_midnight(self):
+        self.assertTrue(scheduler.in_window(_local(2026, 10, 14, 23, 0), dtime(22, 0), dtime(6, 0)))
+        self.assertFalse(scheduler.in_window(_local(2026, 10, 14, 12, 0), dtime(22, 0), dtime(6, 0)))
+        self.assertEqual(scheduler.next_window_start(_local(2026, 10, 14, 23, 0), dtime(22, 0)),
+                         _local(2026, 10, 15, 22, 0))
+
+    def test_deferred_messages_merge_into_digest(self):
+        self.schedule(self.NIGHT, titulo='Milho', conteudo='25 MZN/kg')
+        result = self.schedule(self.NIGHT, titulo='Feijão', conteudo='60 MZN/kg')
+        self.assertEqual(result['agrupadas'], 1)
+        digest = Notificacao.objects.get()
+        self.assertEqual(digest.titulo, 'Resumo AgroAlerta (2 mensagens)')
+        self.assertEqual(digest.conteudo, '• Milho\n25 MZN/kg\n\n• Feijão\n60 MZN/kg')
+
+        # Resumo cheio (SCHEDULER_DIGEST_MAX_ITEMS=3): começa outro no mesmo balde
+        self.schedule(self.NIGHT)
+        self.schedule(self.NIGHT)
+        self.assertEqual(sorted(Notificacao.objects.values_list('metadados__itens', flat=True)), [1, 3])
+
+        # Prioridade diferente: outro balde
+        self.schedule(self.NIGHT, prioridade='alta')
+        self.assertEqual(Notificacao.objects.count(), 3)
+
+    def test_weather_frequency(self):
+        self.prefs.canal_clima = 'sms'
+        self.prefs.save()
+        # Diária: mesmo dentro do horário vai para o resumo do dia seguinte
+        self.schedule(self.DAY, tipo='clima', titulo='Chuva', conteudo='10mm amanhã')
+        self.schedule(self.DAY, tipo='clima', titulo='Vento', conteudo='30 km/h')
+        digest = Notificacao.objects.get()
+        self.assertEqual((digest.canal, digest.metadados['itens']), ('sms', 2))
+        self.assertEqual(digest.agendada_para, self.expected_bucket((2026, 10, 15)))
+
+        Notificacao.objects.all().delete()
+        self.prefs.frequencia_clima = 'semanal'
+        self.prefs.save()
+        self.schedule(self.DAY, tipo='clima')
+        self.assertEqual(Notificacao.objects.get().agendada_para, self.expected_bucket((2026, 10, 19)))
+
+        Notificacao.objects.all().delete()
+        self.prefs.frequencia_clima = 'importantes'
+        self.prefs.save()
+        result = self.schedule(self.DAY, tipo='clima')
+        self.assertEqual((result['na_app'], result['enfileiradas']), (1, 0))
+        self.assertEqual(Notificacao.objects.get().status, 'enviada')
+        self.schedule(self.DAY, tipo='clima', prioridade='alta')
+        self.assertTrue(Notificacao.objects.filter(canal='sms', status='pendente').exists())
+
+    def test_disabled_type_is_ignored_unless_urgent(self):
+        self.prefs.receber_mercado = False
+        self.prefs.save()
+        self.assertEqual(self.schedule(self.DAY)['ignoradas'], [self.user.id])
+        self.assertEqual(self.schedule(self.DAY, prioridade='urgente')['enfileiradas'], 1)
+
+    def test_worker_drains_only_due_buckets(self):
+        self.schedule(self.NIGHT)
+        due = self.expected_bucket((2026, 10, 15))
+        with mock.patch('notificacoes.services.outbox.timezone.now', return_value=due - timedelta(seconds=1)):
+            self.assertEqual(outbox.claim(10), [])
+        with mock.patch('notificacoes.services.outbox.timezone.now', return_value=due):
+            self.assertEqual(len(outbox.claim(10)), 1)
+
+    def test_preferences_loaded_per_batch(self):
+        for i in range(20):
+            user = User.objects.create_user(username=f'u{i}', password='x', telefone=f'8400000{i:02d}')
+            PreferenciaNotificacao.objects.create(usuario=user)
+        users = recipients.resolve_recipients({})
+        # tipo, cursor dos utilizadores, preferências, resumos já na fila, INSERT (+ savepoints)
+        with self.assertNumQueries(10):
+            with mock.patch('notificacoes.services.scheduler.timezone.now', return_value=_local(*self.NIGHT)):
+                result = scheduler.schedule(users, 'Mercado', 'Milho a 25 MZN/kg', tipo='mercado')
+        self.assertEqual(result['adiadas'], 21)
@@ -1,108 +1,168 @@
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, parser_classes
+from rest_framework.parsers import JSONParser, FormParser, MultiPartParser, FileUploadParser
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils import timezone
 from .services.huggingface_service import huggingface_service
-from .models import DeteccaoPraga, TipoPraga, Cultura
-from notificacoes.services.twilio_service import twilio_service
+from .services import detection_jobs, image_dedup, image_derivatives, pest_catalogue
+from .models import DeteccaoPraga, Cultura
 import base64
-import uuid
+import json
 import logging
+import os
+import shutil
+import tempfile
+import zipfile
 
 logger = logging.getLogger(__name__)
 
+
+class ImageUploadParser(FileUploadParser):
+    """
+    Imagem enviada como corpo binário (Content-Type: image/jpeg, image/png...).
+    Tal como no multipart, os upload handlers do Django gravam-na em ficheiro
+    temporário acima de FILE_UPLOAD_MAX_MEMORY_SIZE.
+    """
+    media_type = 'image/*'
+
+    def get_filename(self, stream, media_type, parser_context):
+        return super().get_filename(stream, media_type, parser_context) or 'upload'
+
+
+def _request_param(request, *names, default=None):
+    """Primeiro valor presente no corpo ou na query string (aceita nomes alternativos)"""
+    for name in names:
+        value = request.data.get(name) or request.query_params.get(name)
+        if value:
+            return value
+    return default
+
+
+def _save_detection(request, analysis_result, image_source, fingerprint, crop_type, location, observacoes=''):
+    """
+    Salvar DeteccaoPraga quando a análise indica pragas, mapeando para os
+    campos atuais do modelo e persistindo a imagem. Retorna o registro ou None.
+    """
+    if not analysis_result.get('pest_detection', {}).get('pests_detected'):
+        return None
+
+    try:
+        detection = DeteccaoPraga(
+            usuario=request.user,
+            cultura=Cultura.objects.filter(nome__iexact=crop_type).first() if crop_type else None,
+            tipo_cultura=crop_type or '',
+            localizacao=location or 'Não especificado',
+            observacoes_usuario=observacoes or '',
+            imagem_sha256=fingerprint.sha256,
+            data_conclusao=timezone.now()
+        )
+        detection_jobs.apply_analysis(detection, analysis_result)
+
+        # Imagens iguais partilham o mesmo ficheiro (nome = SHA-256)
+        detection.imagem.name = image_dedup.store_image(image_source, fingerprint)
+
+        detection.save()
+        image_derivatives.schedule(detection)
+        return detection
+    except Exception as e:
+        logger.error(f"Erro ao salvar DeteccaoPraga: {e}")
+        return None
+
+
+def _wants_async(request):
+    return str(_request_param(request, 'async', default='')).lower() in ('1', 'true', 'yes') \
+        or 'respond-async' in request.headers.get('Prefer', '')
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@parser_classes([JSONParser, MultiPartParser, FormParser, ImageUploadParser])
 def detectar_praga_view(request):
     """
     View para detectar pragas em imagens usando HuggingFace AI
+
+    A imagem pode vir como:
+    - multipart/form-data, campo 'image' ou 'file' (recomendado);
+    - corpo binário com Content-Type image/*, parâmetros na query string;
+    - JSON com a imagem em base64 no campo 'image' (clientes antigos).
+
+    Com ?async=true (ou Prefer: respond-async) responde logo 202 com o id da
+    detecção; o resultado fica em /api/pragas/deteccoes/<id>/ e é enviado para
+    'webhook_url', se indicado.
     """
     try:
         # Obter dados da requisição
-        image_data = request.data.get('image')
-        crop_type = request.data.get('crop_type', 'desconhecido')
-        location = request.data.get('location', request.user.localizacao)
+        image_data = request.data.get('image') or request.data.get('file')
+        crop_type = _request_param(request, 'crop_type', 'cultura', default='desconhecido')
+        location = _request_param(request, 'location', 'localizacao', default=request.user.localizacao)
         
         if not image_data:
             return Response(
                 {'erro': 'Imagem é obrigatória'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        # Processar imagem (se base64, converter para bytes)
-        if isinstance(image_data, str) and image_data.startswith('data:'):
-            # Remover prefixo data:image/...;base64,
-            image_data = image_data.split(',')[1]
-        
-        # Analisar imagem com IA
-        analysis_result = huggingface_service.analyze_crop_health(
-            image_data, crop_type
-        )
-
-        # Se a análise indicar deteções, salvar registro corretamente mapeando
-        # para os campos atuais do modelo DeteccaoPraga e persistir a imagem
-        pests = analysis_result.get('pest_detection', {}).get('pests_detected', [])
-        confidence = analysis_result.get('pest_detection', {}).get('confidence')
-
-        if pests:
-            # Tentar resolver tipo de praga por nome (se houver)
-            top_name = pests[0].get('name') if isinstance(pests, list) and pests else None
-            praga_obj = None
-            if top_name:
-                praga_obj = TipoPraga.objects.filter(nome__iexact=top_name).first()
-
-            # Salvar imagem recebida (base64) em storage e anexar ao registro
-            saved_filename = None
-            decoded_bytes = None
-            try:
-                if isinstance(image_data, str):
-                    decoded_bytes = base64.b64decode(image_data)
-                    saved_filename = "deteccao_" + uuid.uuid4().hex[:12] + ".jpg"
-            except Exception as e:
-                logger.warning(f"Falha ao decodificar imagem enviada: {e}")
 
+        if hasattr(image_data, 'read'):
+            # Upload em ficheiro: usado diretamente, sem copiar para memória
+            if image_data.size > settings.PEST_UPLOAD_MAX_BYTES:
+                return Response(
+                    {'erro': 'Imagem demasiado grande'},
+                    status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                )
+            image_source = image_data
+        else:
+            # Processar imagem (se base64, converter para bytes)
+            if isinstance(image_data, str) and image_data.startswith('data:'):
+                # Remover prefixo data:image/...;base64,
+                image_data = image_data.split(',')[1]
             try:
-                detection = DeteccaoPraga(
-                    usuario=request.user,
-                    cultura=Cultura.objects.filter(nome__iexact=crop_type).first() if crop_type else None,
-                    resultado_ia=analysis_result,
-                    praga_detectada=praga_obj,
-                    confianca_deteccao=confidence,
-                    localizacao=location or 'Não especificado',
-                    observacoes_usuario=request.data.get('coordinates', '') or ''
+                image_source = base64.b64decode(image_data)
+            except Exception:
+                return Response(
+                    {'erro': 'Imagem inválida'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
 
-                # Se conseguimos decodificar a imagem, salve-a no campo ImageField
-                if saved_filename and decoded_bytes is not None:
-                    detection.imagem.save(saved_filename, ContentFile(decoded_bytes), save=False)
-
-                detection.save()
-
-                # Enviar notificação se confiança alta
-                if confidence and confidence > 0.7:
-                    user_data = {
-                        'first_name': request.user.first_name,
-                        'telefone': request.user.telefone,
-                        'receber_sms': request.user.receber_sms,
-                        'receber_whatsapp': request.user.receber_whatsapp,
-                        'localizacao': location
-                    }
-
-                    pest_data = {
-                        'nome': top_name,
-                        'confidence_score': confidence,
-                        'localizacao': location,
-                        'culturas_afetadas': [crop_type]
-                    }
-
-                    # Enviar notificação via Twilio
-                    twilio_service.send_pest_detection_alert(user_data, pest_data)
-
-                analysis_result['detection_id'] = detection.id
-            except Exception as e:
-                logger.error(f"Erro ao salvar DeteccaoPraga: {e}")
+        # Hash da imagem: cache das análises e nome do ficheiro no storage
+        fingerprint = image_dedup.fingerprint(image_source)
+        observacoes = _request_param(request, 'coordinates', 'observacoes', default='')
+
+        if _wants_async(request):
+            webhook_url = _request_param(request, 'webhook_url', default='')
+            webhook_error = detection_jobs.validate_webhook_url(webhook_url) if webhook_url else None
+            if webhook_error:
+                return Response({'erro': webhook_error}, status=status.HTTP_400_BAD_REQUEST)
+
+            detection = detection_jobs.create_job(
+                request.user, image_source, fingerprint, crop_type, location, observacoes, webhook_url
+            )
+            status_url = request.build_absolute_uri(reverse('pragas:deteccao-status', args=[detection.id]))
+            return Response(
+                dict(detection_jobs.job_payload(detection), status_url=status_url),
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Location': status_url}
+            )
+
+        # Analisar imagem com IA
+        analysis_result = huggingface_service.analyze_crop_health(
+            image_source, crop_type, fingerprint=fingerprint
+        )
+
+        # Se a análise indicar deteções, salvar registro e notificar
+        detection = _save_detection(
+            request, analysis_result, image_source, fingerprint, crop_type, location, observacoes=observacoes
+        )
+        if detection:
+            # Enviar notificação se confiança alta
+            detection_jobs.notify_pest_detection(request.user, analysis_result['pest_detection'], crop_type, location)
+            analysis_result['detection_id'] = detection.id
         
         return Response(analysis_result)
         
@@ -113,33 +173,203 @@ def detectar_praga_view(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def deteccao_status_view(request, deteccao_id):
+    """
+    Estado de uma detecção (assíncrona ou não): pendente, processando,
+    concluida (com 'result') ou erro
+    """
+    detection = DeteccaoPraga.objects.filter(id=deteccao_id, usuario=request.user).first()
+    if not detection:
+        return Response({'erro': 'Detecção não encontrada'}, status=status.HTTP_404_NOT_FOUND)
+
+    detection_jobs.requeue_if_stale(detection)
+    headers = {}
+    if detection.status in ('pendente', 'processando'):
+        headers['Retry-After'] = '2'
+    return Response(detection_jobs.job_payload(detection), headers=headers)
+
+
+_ZIP_CONTENT_TYPES = ('application/zip', 'application/x-zip-compressed')
+_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif')
+
+
+def _extract_zip_images(upload):
+    """Imagens de um .zip, cada uma num ficheiro temporário (vai para disco acima de 2.5 MB)"""
+    images = []
+    try:
+        archive = zipfile.ZipFile(upload)
+    except zipfile.BadZipFile:
+        raise ValueError(f'Arquivo zip inválido: {upload.name}')
+
+    for info in archive.infolist():
+        filename = os.path.basename(info.filename)
+        if info.is_dir() or filename.startswith('.') or '__MACOSX' in info.filename:
+            continue
+        if not filename.lower().endswith(_IMAGE_EXTENSIONS):
+            continue
+        # Tamanho descomprimido declarado: protege contra zip bombs
+        if info.file_size > settings.PEST_UPLOAD_MAX_BYTES:
+            raise ValueError(f'Imagem demasiado grande: {filename}')
+        if len(images) >= settings.PEST_BATCH_MAX_IMAGES:
+            break
+        extracted = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        with archive.open(info) as member:
+            shutil.copyfileobj(member, extracted)
+        extracted.seek(0)
+        images.append((info.filename, extracted))
+    return images
+
+
+def _collect_batch_images(request):
+    """[(nome, ficheiro)] dos campos 'images'/'image'/'file'; arquivos .zip são expandidos"""
+    images = []
+    for field in ('images', 'image', 'file'):
+        for upload in request.FILES.getlist(field):
+            if upload.size > settings.PEST_UPLOAD_MAX_BYTES and not upload.name.lower().endswith('.zip'):
+                raise ValueError(f'Imagem demasiado grande: {upload.name}')
+            if upload.content_type in _ZIP_CONTENT_TYPES or upload.name.lower().endswith('.zip'):
+                images.extend(_extract_zip_images(upload))
+            else:
+                images.append((upload.name, upload))
+    return images
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser, FormParser])
+def detectar_pragas_lote_view(request):
+    """
+    Análise de várias imagens de um campo (levantamento de campo).
+
+    Aceita multipart com várias imagens no campo 'images' (ou 'image'/'file')
+    e/ou arquivos .zip. As imagens são analisadas em paralelo (no máximo
+    PEST_BATCH_WORKERS de cada vez) e a resposta traz o resultado de cada
+    imagem e a saúde agregada do campo.
+
+    Com ?stream=true (ou Accept: text/event-stream) a resposta é SSE: um
+    evento 'result' por imagem assim que termina e um evento 'done' final
+    com a saúde do campo.
+    """
+    try:
+        crop_type = _request_param(request, 'crop_type', 'cultura', default='desconhecido')
+        location = _request_param(request, 'location', 'localizacao', default=request.user.localizacao)
+
+        try:
+            images = _collect_batch_images(request)
+        except ValueError as e:
+            return Response({'erro': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not images:
+            return Response(
+                {'erro': 'Pelo menos uma imagem é obrigatória'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(images) > settings.PEST_BATCH_MAX_IMAGES:
+            return Response(
+                {'erro': f'Máximo de {settings.PEST_BATCH_MAX_IMAGES} imagens por lote'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        keyed_images = [(index, source) for index, (_, source) in enumerate(images)]
+
+        def saved_result(index, fingerprint, analysis):
+            """Resultado de uma imagem, já com a detecção salva"""
+            name, source = images[index]
+            result = dict(analysis, index=index, filename=name)
+            detection = _save_detection(request, analysis, source, fingerprint, crop_type, location)
+            if detection:
+                result['detection_id'] = detection.id
+            return result
+
+        def analyzed_images():
+            """Análises por ordem de conclusão"""
+            for index, fingerprint, analysis in huggingface_service.analyze_batch(keyed_images, crop_type):
+                yield saved_result(index, fingerprint, analysis)
+
+        def field_summary(results):
+            field = huggingface_service.calculate_field_health(results, crop_type)
+            # Um único alerta por levantamento, para a praga mais confiante
+            top_pest = max(
+                (r['pest_detection'] for r in results if r.get('detection_id')),
+                key=lambda p: p.get('confidence') or 0.0,
+                default=None
+            )
+            if top_pest:
+                detection_jobs.notify_pest_detection(request.user, top_pest, crop_type, location)
+            return field
+
+        stream = str(request.query_params.get('stream', '')).lower() in ('1', 'true', 'yes') \
+            or 'text/event-stream' in request.headers.get('Accept', '')
+
+        if stream:
+            # Async generator: sob ASGI o StreamingHttpResponse envia cada evento
+            # assim que a imagem termina (um generator síncrono seria lido todo
+            # antes do primeiro byte)
+            async def event_stream():
+                results = []
+                try:
+                    async for index, fingerprint, analysis in huggingface_service.analyze_batch_async(
+                        keyed_images, crop_type
+                    ):
+                        result = await sync_to_async(saved_result)(index, fingerprint, analysis)
+                        results.append(result)
+                        data = json.dumps(dict(result, type='result', total=len(images)), ensure_ascii=False)
+                        yield f"data: {data}\n\n"
+                    data = json.dumps({
+                        'type': 'done',
+                        'field': await sync_to_async(field_summary)(results),
+                        'total': len(images),
+                        'done': True
+                    }, ensure_ascii=False)
+                    yield f"data: {data}\n\n"
+                except Exception as e:
+                    logger.error(f"Erro no streaming do lote: {e}")
+                    error_data = json.dumps({'type': 'error', 'error': str(e), 'done': True})
+                    yield f"data: {error_data}\n\n"
+
+            response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'  # Desabilita buffering no nginx
+            return response
+
+        results = sorted(analyzed_images(), key=lambda r: r['index'])
+        return Response({
+            'results': results,
+            'field': field_summary(results),
+            'total': len(images)
+        })
+
+    except Exception as e:
+        logger.error(f"Erro na análise em lote: {e}")
+        return Response(
+            {'erro': 'Erro interno do servidor', 'detalhes': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def listar_pragas_view(request):
     """
     View para listar pragas conhecidas
+
+    O catálogo vem pré-calculado do cache (por filtro de cultura), com ETag e
+    Last-Modified: clientes com If-None-Match/If-Modified-Since recebem 304.
     """
     try:
-        pragas = TipoPraga.objects.all()
-        cultura = request.GET.get('cultura')
-        
-        if cultura:
-            pragas = pragas.filter(culturas_afetadas__nome__icontains=cultura)
-        
-        data = []
-        for praga in pragas:
-            culturas_nomes = [c.nome for c in praga.culturas_afetadas.all()]
-            data.append({
-                'id': praga.id,
-                'nome': praga.nome,
-                'nome_cientifico': praga.nome_cientifico,
-                'tipo': praga.tipo,
-                'descricao': praga.descricao,
-                'culturas_afetadas': culturas_nomes,
-                'sintomas': praga.sintomas
-            })
-        
-        return Response(data)
+        catalogue = pest_catalogue.get_catalogue(request.GET.get('cultura'))
+        etag = catalogue['etag']
+        last_modified = int(catalogue['last_modified'])
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = Response(catalogue['data'])
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        return response
         
     except Exception as e:
         logger.error(f"Erro ao listar pragas: {e}")
@@ -156,8 +386,8 @@ def historico_deteccoes_view(request):
     """
     try:
         deteccoes = DeteccaoPraga.objects.filter(
-            agricultor=request.user
-        ).order_by('-data_deteccao')[:20]
+            usuario=request.user
+        ).select_related('praga_detectada').order_by('-data_deteccao')[:20]
         
         data = []
         for deteccao in deteccoes:
@@ -166,9 +396,13 @@ def historico_deteccoes_view(request):
                 'data_deteccao': deteccao.data_deteccao,
                 'localizacao': deteccao.localizacao,
                 'tipo_cultura': deteccao.tipo_cultura,
-                'confianca': deteccao.confianca,
-                'resultado_analise': deteccao.resultado_analise,
-                'coordenadas': deteccao.coordenadas
+                'status': deteccao.status,
+                'praga': deteccao.praga_detectada.nome if deteccao.praga_detectada else None,
+                'confianca': deteccao.confianca_deteccao,
+                'resultado_analise': deteccao.resultado_ia,
+                'imagem': deteccao.imagem.url if deteccao.imagem else None,
+                # thumb/medium/webp para a lista, em vez da foto original
+                'imagem_derivados': image_derivatives.urls(deteccao)
             })
         
         return Response(data)
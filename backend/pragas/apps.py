@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PragasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pragas'
+
+    def ready(self):
+        from . import signals  # noqa: F401 (invalidação do catálogo)
@@ -0,0 +1,150 @@
+"""
+Servidor local que imita a API de inferência do HuggingFace, para testes e
+benchmarks sem rede nem chave de API (e um modelo ONNX sintético para o
+backend local, write_stub_onnx_model).
+
+Responde a POST /<modelo> com resultados fixos depois de uma latência
+configurável por modelo (detecção de objetos -> lista de deteções,
+classificação -> lista de rótulos). Atende pedidos em paralelo.
+
+Uso:
+  python -m pragas.inference_stub --port 8765 --pest-latency 0.3 --disease-latency 0.5
+  HUGGINGFACE_API_URL=http://127.0.0.1:8765 python manage.py runserver
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+PEST_RESULTS = [
+    {'score': 0.91, 'label': 'caterpillar', 'box': {'xmin': 10, 'ymin': 20, 'xmax': 120, 'ymax': 140}},
+    {'score': 0.12, 'label': 'leaf', 'box': {'xmin': 0, 'ymin': 0, 'xmax': 200, 'ymax': 200}},
+]
+
+DISEASE_RESULTS = [
+    {'score': 0.64, 'label': 'leaf rust'},
+    {'score': 0.21, 'label': 'healthy'},
+    {'score': 0.05, 'label': 'mosaic'},
+]
+
+
+def write_stub_onnx_model(path, labels, input_size=224, width=32, depth=1, favour=0, seed=0):
+    """
+    Grava um classificador ONNX sintético (convoluções + pooling + camada
+    linear) para testar e medir o backend local sem um modelo real.
+    O viés da classe `favour` domina, por isso a previsão é conhecida.
+    depth=3 dá um custo por imagem da ordem do MobileNetV2 (~0.3 GFLOPs).
+    Requer os pacotes onnx e numpy.
+    """
+    import numpy as np
+    from onnx import TensorProto, helper, save_model
+
+    rng = np.random.default_rng(seed)
+
+    def weight(name, *shape):
+        values = (rng.standard_normal(shape) * 0.05).astype(np.float32)
+        return helper.make_tensor(name, TensorProto.FLOAT, shape, values.flatten().tolist())
+
+    initializers = [weight('conv0_w', width, 3, 3, 3)]
+    nodes = [
+        helper.make_node('Conv', ['input', 'conv0_w'], ['x0'], kernel_shape=[3, 3], strides=[2, 2], pads=[1, 1, 1, 1]),
+        helper.make_node('Relu', ['x0'], ['r0']),
+    ]
+    for i in range(1, depth + 1):
+        initializers.append(weight(f'conv{i}_w', width, width, 3, 3))
+        nodes.append(helper.make_node('Conv', [f'r{i - 1}', f'conv{i}_w'], [f'x{i}'], kernel_shape=[3, 3], pads=[1, 1, 1, 1]))
+        nodes.append(helper.make_node('Relu', [f'x{i}'], [f'r{i}']))
+
+    bias = np.zeros(len(labels), dtype=np.float32)
+    bias[favour] = 8.0
+    initializers.append(weight('fc_w', width, len(labels)))
+    initializers.append(helper.make_tensor('fc_b', TensorProto.FLOAT, [len(labels)], bias.tolist()))
+    nodes += [
+        helper.make_node('GlobalAveragePool', [f'r{depth}'], ['pooled']),
+        helper.make_node('Flatten', ['pooled'], ['features']),
+        helper.make_node('Gemm', ['features', 'fc_w', 'fc_b'], ['logits']),
+    ]
+
+    graph = helper.make_graph(
+        nodes, 'stub_classifier',
+        [helper.make_tensor_value_info('input', TensorProto.FLOAT, ['batch', 3, input_size, input_size])],
+        [helper.make_tensor_value_info('logits', TensorProto.FLOAT, ['batch', len(labels)])],
+        initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 8
+    helper.set_model_props(model, {'labels': json.dumps(labels)})
+    save_model(model, path)
+    return path
+
+
+class InferenceStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), pest_latency=0.0, disease_latency=0.0):
+        super().__init__(address, _StubHandler)
+        self.pest_latency = pest_latency
+        self.disease_latency = disease_latency
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve numa thread em background; retorna o próprio servidor"""
+        self._thread = threading.Thread(target=self.serve_forever, name='hf-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        with self.server._count_lock:
+            self.server.request_count += 1
+
+        # facebook/detr-* é detecção de objetos; o resto é classificação
+        if 'detr' in self.path:
+            latency, results = self.server.pest_latency, PEST_RESULTS
+        else:
+            latency, results = self.server.disease_latency, DISEASE_RESULTS
+        if latency:
+            time.sleep(latency)
+
+        body = json.dumps(results).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--pest-latency', type=float, default=0.3, help='segundos')
+    parser.add_argument('--disease-latency', type=float, default=0.5, help='segundos')
+    args = parser.parse_args()
+
+    server = InferenceStubServer(('127.0.0.1', args.port), args.pest_latency, args.disease_latency)
+    print(f"🧪 Stub de inferência em {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,45 @@
+"""
+Gerar os derivados (thumb/medium/webp) das imagens já guardadas
+
+Uso:
+  python manage.py gerar_derivados
+  python manage.py gerar_derivados --limit 500
+"""
+from django.core.management.base import BaseCommand
+
+from pragas.models import DeteccaoPraga
+from pragas.services import image_derivatives
+from projetos.models import CostTracking, FieldPhoto, Project
+
+# (modelo, campo de imagem)
+IMAGE_FIELDS = [
+    (DeteccaoPraga, 'imagem'),
+    (FieldPhoto, 'imagem'),
+    (Project, 'foto_capa'),
+    (CostTracking, 'nota_fiscal'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Gera as versões reduzidas das imagens que ainda não as têm'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=0, help='máximo de imagens por modelo (0 = todas)')
+
+    def handle(self, *args, **options):
+        for model, field_name in IMAGE_FIELDS:
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True}) \
+                .values_list('pk', field_name, f'{field_name}_derivados').order_by('pk')
+            generated = failed = 0
+            for pk, name, derivados in rows.iterator():
+                if (derivados or {}).get('source') == name:
+                    continue
+                if options['limit'] and generated + failed >= options['limit']:
+                    break
+                try:
+                    image_derivatives.generate_for(model, pk, field_name, name)
+                    generated += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"⚠️ {model.__name__} {pk} ({name}): {e}")
+            self.stdout.write(f"✅ {model.__name__}.{field_name}: {generated} geradas, {failed} com erro")
@@ -0,0 +1,24 @@
+"""
+Retomar as detecções assíncronas perdidas (pendentes/a processar há mais de
+PEST_JOB_STALE_SECONDS, ex.: o worker reiniciou a meio)
+
+Uso (cron, ex.: a cada 5 minutos):
+  python manage.py retomar_deteccoes
+  python manage.py retomar_deteccoes --limit 50
+"""
+from django.core.management.base import BaseCommand
+
+from pragas.services import detection_jobs
+
+
+class Command(BaseCommand):
+    help = 'Volta a pôr na fila e analisa as detecções assíncronas paradas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=0, help='máximo de detecções (0 = todas)')
+
+    def handle(self, *args, **options):
+        requeued = detection_jobs.requeue_stale_jobs(limit=options['limit'])
+        # Os jobs correm no pool deste processo: esperar que acabem antes de sair
+        detection_jobs.wait_for_jobs()
+        self.stdout.write(f"✅ {len(requeued)} detecções retomadas")
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pragas', '0003_alter_metodocontrole_tipo_controle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deteccaopraga',
+            name='imagem_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
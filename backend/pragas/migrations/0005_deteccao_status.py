@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pragas', '0004_deteccao_imagem_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deteccaopraga',
+            name='data_conclusao',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deteccaopraga',
+            name='data_inicio_processamento',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deteccaopraga',
+            name='erro_processamento',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='deteccaopraga',
+            name='status',
+            field=models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluida', 'Concluída'), ('erro', 'Erro')], db_index=True, default='concluida', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='deteccaopraga',
+            name='tipo_cultura',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='deteccaopraga',
+            name='webhook_url',
+            field=models.URLField(blank=True, max_length=500),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pragas', '0005_deteccao_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deteccaopraga',
+            name='imagem_derivados',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
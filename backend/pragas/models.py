@@ -53,8 +53,19 @@ class MetodoControle(models.Model):
         return f"{self.praga.nome} - {self.get_tipo_controle_display()}"
 
 class DeteccaoPraga(models.Model):
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluida', 'Concluída'),
+        ('erro', 'Erro'),
+    ]
+
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
     imagem = models.ImageField(upload_to='deteccoes_pragas/')
+    # SHA-256 da imagem original; o ficheiro é partilhado entre detecções iguais
+    imagem_sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    # Versões reduzidas (pragas.services.image_derivatives)
+    imagem_derivados = models.JSONField(default=dict, blank=True)
     cultura = models.ForeignKey(Cultura, on_delete=models.SET_NULL, null=True)
     resultado_ia = models.JSONField(blank=True, null=True)
     praga_detectada = models.ForeignKey(TipoPraga, on_delete=models.SET_NULL, null=True, blank=True)
@@ -70,6 +81,14 @@ class DeteccaoPraga(models.Model):
         related_name='verificacoes_praga'
     )
     data_deteccao = models.DateTimeField(auto_now_add=True)
+
+    # Detecção assíncrona: o registo é criado no upload e a análise corre em background
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='concluida', db_index=True)
+    tipo_cultura = models.CharField(max_length=100, blank=True)
+    webhook_url = models.URLField(max_length=500, blank=True)
+    erro_processamento = models.TextField(blank=True)
+    data_inicio_processamento = models.DateTimeField(null=True, blank=True)
+    data_conclusao = models.DateTimeField(null=True, blank=True)
     
     def __str__(self):
         return f"Detecção {self.id} - {self.usuario.username}"
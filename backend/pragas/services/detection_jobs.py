@@ -0,0 +1,365 @@
+"""
+Detecção de pragas assíncrona (jobs)
+
+Com ?async=true o upload cria logo a DeteccaoPraga (status 'pendente') com a
+imagem já gravada e responde 202 com o id. A análise corre num pool de threads
+do processo (PEST_JOB_WORKERS), fora do worker HTTP, e o resultado fica no
+próprio registo. O cliente consulta /api/pragas/deteccoes/<id>/ ou recebe:
+  - uma notificação in-app (Notificacao, canal 'app');
+  - um POST JSON no webhook_url indicado no upload (assinado com
+    PEST_JOB_WEBHOOK_SECRET, se definido). O host tem de estar em
+    PEST_JOB_WEBHOOK_ALLOWED_HOSTS (se definido) e resolver só para endereços
+    públicos (nada de loopback, rede privada, link-local ou reservados); o
+    envio liga ao IP validado (sem voltar a resolver o nome) e os redirects
+    não são seguidos.
+
+Jobs perdidos (ex.: worker reiniciado a meio) voltam à fila depois de
+PEST_JOB_STALE_SECONDS: quando o estado é consultado ou pela varredura
+`python manage.py retomar_deteccoes` (correr no cron, ex.: a cada 5 minutos),
+que os analisa no próprio processo do comando.
+"""
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple, Union, BinaryIO
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from notificacoes.services.twilio_service import twilio_service
+from . import image_dedup, image_derivatives
+from .huggingface_service import huggingface_service
+from ..models import Cultura, DeteccaoPraga, TipoPraga
+
+logger = logging.getLogger(__name__)
+
+_job_executor = ThreadPoolExecutor(
+    max_workers=settings.PEST_JOB_WORKERS,
+    thread_name_prefix='pest-job'
+)
+_queued = set()
+_queued_lock = threading.Lock()
+
+
+def apply_analysis(detection: DeteccaoPraga, analysis_result: Dict):
+    """Copiar o resultado da análise para os campos da detecção (sem gravar)"""
+    pest_detection = analysis_result.get('pest_detection', {})
+    pests = pest_detection.get('pests_detected') or []
+
+    # Tentar resolver tipo de praga por nome (se houver)
+    top_name = pests[0].get('name') if pests else None
+    detection.praga_detectada = TipoPraga.objects.filter(nome__iexact=top_name).first() if top_name else None
+    detection.confianca_deteccao = pest_detection.get('confidence') if pests else None
+    detection.resultado_ia = analysis_result
+
+
+def notify_pest_detection(user, pest_detection: Dict, crop_type: str, location: str):
+    """Alerta por SMS/WhatsApp quando a praga principal tem confiança alta"""
+    pests = pest_detection.get('pests_detected') or []
+    confidence = pest_detection.get('confidence')
+    if not pests or not confidence or confidence <= 0.7:
+        return
+
+    user_data = {
+        'first_name': user.first_name,
+        'telefone': user.telefone,
+        'receber_sms': user.receber_sms,
+        'receber_whatsapp': user.receber_whatsapp,
+        'localizacao': location
+    }
+
+    pest_data = {
+        'nome': pests[0].get('name'),
+        'confidence_score': confidence,
+        'localizacao': location,
+        'culturas_afetadas': [crop_type]
+    }
+
+    try:
+        # Enviar notificação via Twilio
+        twilio_service.send_pest_detection_alert(user_data, pest_data)
+    except Exception as e:
+        logger.error(f"Erro ao enviar alerta de praga: {e}")
+
+
+def _resolve(hostname: str):
+    """Endereços IP do host (vazio se não resolve)"""
+    try:
+        infos = socket.getaddrinfo(hostname, None, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        return []
+    return [ipaddress.ip_address(info[4][0].split('%')[0]) for info in infos]
+
+
+def _is_public(address) -> bool:
+    return address.is_global and not address.is_multicast
+
+
+def _check_webhook_url(url: str):
+    """(erro ou None, endereços IP validados do host)"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return 'webhook_url deve ser um URL http(s)', []
+    allowed = settings.PEST_JOB_WEBHOOK_ALLOWED_HOSTS
+    if allowed and parsed.hostname not in allowed:
+        return 'Host do webhook_url não permitido', []
+    addresses = _resolve(parsed.hostname)
+    if not addresses:
+        return 'Host do webhook_url não encontrado', []
+    # Evitar pedidos do servidor para a rede interna ou metadados da cloud (SSRF)
+    if not all(_is_public(address) for address in addresses):
+        return 'Host do webhook_url não permitido', []
+    return None, addresses
+
+
+def validate_webhook_url(url: str) -> Optional[str]:
+    """Mensagem de erro se o webhook não é aceite, ou None"""
+    return _check_webhook_url(url)[0]
+
+
+def create_job(user, image_source: Union[bytes, BinaryIO], fingerprint: image_dedup.ImageFingerprint,
+               crop_type: str, location: str, observacoes: str = '', webhook_url: str = '') -> DeteccaoPraga:
+    """Gravar a imagem e a detecção pendente, e pôr a análise na fila"""
+    detection = DeteccaoPraga(
+        usuario=user,
+        cultura=Cultura.objects.filter(nome__iexact=crop_type).first() if crop_type else None,
+        tipo_cultura=crop_type or '',
+        localizacao=location or 'Não especificado',
+        observacoes_usuario=observacoes or '',
+        imagem_sha256=fingerprint.sha256,
+        webhook_url=webhook_url or '',
+        status='pendente'
+    )
+    detection.imagem.name = image_dedup.store_image(image_source, fingerprint)
+    detection.save()
+    image_derivatives.schedule(detection)
+    submit(detection.id, fingerprint)
+    return detection
+
+
+def submit(detection_id: int, fingerprint: Optional[image_dedup.ImageFingerprint] = None):
+    """Agendar a análise (no máximo uma vez por detecção neste processo)"""
+    with _queued_lock:
+        if detection_id in _queued:
+            return
+        _queued.add(detection_id)
+    _job_executor.submit(_run_in_background, detection_id, fingerprint)
+
+
+def _stale_cutoff():
+    return timezone.now() - timedelta(seconds=settings.PEST_JOB_STALE_SECONDS)
+
+
+def _requeue(detection_id: int, cutoff) -> bool:
+    """Repor em 'pendente' (condicional: só se ninguém lhe pegou entretanto) e agendar"""
+    updated = DeteccaoPraga.objects.filter(
+        Q(data_inicio_processamento__isnull=True) | Q(data_inicio_processamento__lte=cutoff),
+        id=detection_id, status__in=['pendente', 'processando']
+    ).update(status='pendente', data_inicio_processamento=None)
+    if updated:
+        print(f"🔁 Detecção {detection_id} voltou à fila")
+        submit(detection_id)
+    return bool(updated)
+
+
+def requeue_if_stale(detection: DeteccaoPraga) -> bool:
+    """Voltar a pôr na fila um job pendente/a processar há mais de PEST_JOB_STALE_SECONDS"""
+    if detection.status not in ('pendente', 'processando'):
+        return False
+    cutoff = _stale_cutoff()
+    started = detection.data_inicio_processamento or detection.data_deteccao
+    if started > cutoff:
+        return False
+
+    if _requeue(detection.id, cutoff):
+        detection.status = 'pendente'
+        return True
+    return False
+
+
+def requeue_stale_jobs(limit: int = 0) -> List[int]:
+    """Varrer os jobs pendentes/a processar há mais de PEST_JOB_STALE_SECONDS e pô-los na fila"""
+    cutoff = _stale_cutoff()
+    stale = DeteccaoPraga.objects.filter(
+        Q(data_inicio_processamento__lte=cutoff)
+        | Q(data_inicio_processamento__isnull=True, data_deteccao__lte=cutoff),
+        status__in=['pendente', 'processando']
+    ).order_by('data_deteccao').values_list('id', flat=True)
+    if limit:
+        stale = stale[:limit]
+    return [detection_id for detection_id in stale if _requeue(detection_id, cutoff)]
+
+
+def wait_for_jobs():
+    """Esperar que os jobs agendados neste processo terminem (comandos de gestão)"""
+    _job_executor.shutdown(wait=True)
+
+
+def _run_in_background(detection_id: int, fingerprint: Optional[image_dedup.ImageFingerprint]):
+    try:
+        run_detection(detection_id, fingerprint)
+    except Exception as e:
+        print(f"⚠️ Erro no job de detecção {detection_id}: {e}")
+    finally:
+        connection.close()
+        with _queued_lock:
+            _queued.discard(detection_id)
+
+
+def run_detection(detection_id: int, fingerprint: Optional[image_dedup.ImageFingerprint] = None) -> bool:
+    """Analisar uma detecção pendente; retorna False se outro worker já a tem"""
+    # Reclamar o job: só um worker passa de 'pendente' a 'processando'
+    claimed = DeteccaoPraga.objects.filter(id=detection_id, status='pendente').update(
+        status='processando', data_inicio_processamento=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    detection = DeteccaoPraga.objects.select_related('usuario').get(id=detection_id)
+    crop_type = detection.tipo_cultura or 'desconhecido'
+    try:
+        with detection.imagem.open('rb') as image:
+            if fingerprint is None:
+                fingerprint = image_dedup.fingerprint(image)
+                image.seek(0)
+            analysis_result = huggingface_service.analyze_crop_health(image, crop_type, fingerprint=fingerprint)
+
+        apply_analysis(detection, analysis_result)
+        detection.status = 'concluida'
+        detection.erro_processamento = ''
+    except Exception as e:
+        logger.error(f"Erro ao processar detecção {detection_id}: {e}")
+        detection.status = 'erro'
+        detection.erro_processamento = str(e)
+    detection.data_conclusao = timezone.now()
+    detection.save(update_fields=[
+        'resultado_ia', 'praga_detectada', 'confianca_deteccao',
+        'status', 'erro_processamento', 'data_conclusao'
+    ])
+
+    if detection.status == 'concluida':
+        notify_pest_detection(detection.usuario, detection.resultado_ia['pest_detection'],
+                              crop_type, detection.localizacao)
+    _notify_completion(detection)
+    return True
+
+
+def job_payload(detection: DeteccaoPraga) -> Dict:
+    """Estado do job (resposta do endpoint de estado e corpo do webhook)"""
+    payload = {
+        'job_id': detection.id,
+        'detection_id': detection.id,
+        'status': detection.status,
+        'crop_type': detection.tipo_cultura,
+        'submitted_at': detection.data_deteccao.isoformat(),
+        'completed_at': detection.data_conclusao.isoformat() if detection.data_conclusao else None,
+    }
+    if detection.status == 'concluida':
+        payload['result'] = detection.resultado_ia
+    elif detection.status == 'erro':
+        payload['erro'] = detection.erro_processamento
+    return payload
+
+
+def _notify_completion(detection: DeteccaoPraga):
+    """Notificação in-app e webhook, sem deixar falhas afetarem o resultado gravado"""
+    try:
+        _create_app_notification(detection)
+    except Exception as e:
+        logger.error(f"Erro ao criar notificação da detecção {detection.id}: {e}")
+
+    if detection.webhook_url:
+        try:
+            _post_webhook(detection.webhook_url, job_payload(detection))
+        except Exception as e:
+            logger.error(f"Erro no webhook da detecção {detection.id}: {e}")
+
+
+def _create_app_notification(detection: DeteccaoPraga):
+    from notificacoes.models import Notificacao, TipoNotificacao
+
+    tipo, _ = TipoNotificacao.objects.get_or_create(
+        nome='deteccao_praga', defaults={'descricao': 'Resultado de detecção de pragas'}
+    )
+    if detection.status == 'erro':
+        titulo, conteudo = 'Análise falhou', 'Não foi possível analisar a imagem. Tente novamente.'
+    else:
+        pests = detection.resultado_ia.get('pest_detection', {}).get('pests_detected') or []
+        titulo = 'Análise concluída'
+        conteudo = f"Praga detectada: {pests[0].get('name')}" if pests else 'Nenhuma praga detectada'
+
+    Notificacao.objects.create(
+        usuario=detection.usuario,
+        tipo=tipo,
+        titulo=titulo,
+        conteudo=conteudo,
+        canal='app',
+        status='enviada',
+        data_envio=timezone.now(),
+        metadados={'detection_id': detection.id, 'status': detection.status}
+    )
+
+
+class _PinnedAdapter(HTTPAdapter):
+    """Liga ao IP já validado mas verifica o certificado (e envia o SNI) do host original"""
+
+    def __init__(self, hostname: str, **kwargs):
+        self.hostname = hostname
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        # Só usados em https (o PoolManager descarta-os nas ligações http)
+        kwargs['server_hostname'] = self.hostname
+        kwargs['assert_hostname'] = self.hostname
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _pinned_request(url: str, address) -> Tuple[str, str]:
+    """URL com o host trocado pelo IP validado, e o cabeçalho Host original"""
+    parsed = urlparse(url)
+    host = f'[{address}]' if address.version == 6 else str(address)
+    port = f':{parsed.port}' if parsed.port else ''
+    userinfo = parsed.netloc.rpartition('@')[0]
+    netloc = f'{userinfo}@{host}{port}' if userinfo else f'{host}{port}'
+    host_header = parsed.hostname if ':' not in parsed.hostname else f'[{parsed.hostname}]'
+    return parsed._replace(netloc=netloc).geturl(), host_header + port
+
+
+def _webhook_session(url: str) -> requests.Session:
+    parsed = urlparse(url)
+    session = requests.Session()
+    session.trust_env = False  # sem proxies do ambiente: o pedido vai mesmo para o IP validado
+    session.mount(f'{parsed.scheme}://', _PinnedAdapter(parsed.hostname))
+    return session
+
+
+def _post_webhook(url: str, payload: Dict):
+    # Resolver e validar uma única vez e ligar a esse IP: se o requests voltasse a
+    # resolver o nome, um DNS com TTL 0 podia apontá-lo entretanto para a rede
+    # interna (DNS rebinding)
+    error, addresses = _check_webhook_url(url)
+    if error:
+        raise ValueError(f"{error}: {url}")
+    pinned_url, host_header = _pinned_request(url, addresses[0])
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+    headers = {'Content-Type': 'application/json', 'Host': host_header}
+    if settings.PEST_JOB_WEBHOOK_SECRET:
+        signature = hmac.new(settings.PEST_JOB_WEBHOOK_SECRET.encode('utf-8'), body, hashlib.sha256).hexdigest()
+        headers['X-Lura-Signature'] = f'sha256={signature}'
+    with _webhook_session(url) as session:
+        response = session.post(pinned_url, data=body, headers=headers, timeout=settings.PEST_JOB_WEBHOOK_TIMEOUT,
+                                allow_redirects=False)
+    if response.is_redirect:
+        raise ValueError(f"Webhook respondeu com redirect ({response.status_code}), não seguido")
+    response.raise_for_status()
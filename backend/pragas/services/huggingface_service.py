@@ -2,19 +2,48 @@
 Serviço de integração com HuggingFace para detecção de pragas e análise de imagens
 """
 import requests
+from requests.adapters import HTTPAdapter
+import asyncio
 import base64
-from PIL import Image
-import io
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.conf import settings
-from typing import Dict, List, Optional, Union
+from typing import AsyncIterator, BinaryIO, Dict, Hashable, Iterator, List, Optional, Tuple, Union
 import logging
 
+from . import image_dedup, image_derivatives, local_inference
+
 logger = logging.getLogger(__name__)
 
+
+def _build_session() -> requests.Session:
+    """Sessão HTTP partilhada: reutiliza conexões keep-alive para a API de inferência"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.HUGGINGFACE_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_session = _build_session()
+
+# Detecção de pragas e classificação de doenças correm em paralelo
+_inference_executor = ThreadPoolExecutor(
+    max_workers=settings.HUGGINGFACE_POOL_SIZE,
+    thread_name_prefix='hf-inference'
+)
+
+# Imagens de lotes (levantamentos de campo) analisadas em simultâneo, no total
+_batch_executor = ThreadPoolExecutor(
+    max_workers=settings.PEST_BATCH_WORKERS,
+    thread_name_prefix='hf-batch'
+)
+
+
 class HuggingFaceService:
     def __init__(self):
         self.api_key = settings.HUGGINGFACE_API_KEY
-        self.base_url = "https://api-inference.huggingface.co/models"
+        self.base_url = settings.HUGGINGFACE_API_URL.rstrip('/')
+        self.timeout = settings.HUGGINGFACE_TIMEOUT
         
         # Modelos específicos para agricultura
         self.models = {
@@ -29,68 +58,91 @@ class HuggingFaceService:
             "Content-Type": "application/json"
         } if self.api_key else {}
     
+    def prepare_image(self, image_data: Union[bytes, str, BinaryIO]) -> bytes:
+        """
+        Decodificar (se base64) e pré-processar a imagem uma única vez
+        """
+        # Se receber base64, converter para bytes
+        if isinstance(image_data, str):
+            image_data = base64.b64decode(image_data)
+        return self._preprocess_image(image_data)
+
     def detect_pest_in_image(self, image_data: Union[bytes, str]) -> Optional[Dict]:
         """
         Detectar pragas em uma imagem
         """
         try:
-            # Se receber base64, converter para bytes
-            if isinstance(image_data, str):
-                image_data = base64.b64decode(image_data)
-            
-            # Processar imagem
-            processed_image = self._preprocess_image(image_data)
-            
+            return self._detect_pest(self.prepare_image(image_data))[0]
+        except Exception as e:
+            logger.error(f"Erro ao detectar pragas: {e}")
+            return self._get_mock_pest_detection()
+
+    def classify_plant_disease(self, image_data: Union[bytes, str]) -> Optional[Dict]:
+        """
+        Classificar doenças em plantas
+        """
+        try:
+            return self._classify_disease(self.prepare_image(image_data))[0]
+        except Exception as e:
+            logger.error(f"Erro ao classificar doença: {e}")
+            return self._get_mock_disease_detection()
+
+    def _post_image(self, model_key: str, processed_image: bytes) -> requests.Response:
+        model_url = f"{self.base_url}/{self.models[model_key]}"
+        return _session.post(
+            model_url,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            data=processed_image,
+            timeout=self.timeout
+        )
+
+    def _detect_pest(self, processed_image: bytes) -> Tuple[Dict, bool]:
+        """
+        Detecção de pragas sobre a imagem já pré-processada.
+        Retorna (resultado, False se for o fallback mock)
+        """
+        try:
+            # Modelo local (PEST_INFERENCE_BACKEND=onnx), sem chamada à API
+            local = local_inference.get_backend()
+            if local and local.supports('pest_detection'):
+                return self._interpret_pest_detection(local.predict('pest_detection', processed_image)), True
+
             # Usar modelo de detecção de objetos
-            model_url = f"{self.base_url}/{self.models['pest_detection']}"
-            
-            response = requests.post(
-                model_url,
-                headers={"Authorization": f"Bearer {self.api_key}"},
-                data=processed_image,
-                timeout=30
-            )
-            
+            response = self._post_image('pest_detection', processed_image)
+
             if response.status_code == 200:
                 results = response.json()
-                return self._interpret_pest_detection(results)
+                return self._interpret_pest_detection(results), True
             else:
                 logger.error(f"Erro na API HuggingFace: {response.status_code}")
-                return self._get_mock_pest_detection()
-                
+                return self._get_mock_pest_detection(), False
+
         except Exception as e:
             logger.error(f"Erro ao detectar pragas: {e}")
-            return self._get_mock_pest_detection()
-    
-    def classify_plant_disease(self, image_data: Union[bytes, str]) -> Optional[Dict]:
+            return self._get_mock_pest_detection(), False
+
+    def _classify_disease(self, processed_image: bytes) -> Tuple[Dict, bool]:
         """
-        Classificar doenças em plantas
+        Classificação de doenças sobre a imagem já pré-processada.
+        Retorna (resultado, False se for o fallback mock)
         """
         try:
-            if isinstance(image_data, str):
-                image_data = base64.b64decode(image_data)
-            
-            processed_image = self._preprocess_image(image_data)
-            
+            local = local_inference.get_backend()
+            if local and local.supports('plant_classification'):
+                return self._interpret_disease_classification(local.predict('plant_classification', processed_image)), True
+
             # Usar modelo de classificação
-            model_url = f"{self.base_url}/{self.models['plant_classification']}"
-            
-            response = requests.post(
-                model_url,
-                headers={"Authorization": f"Bearer {self.api_key}"},
-                data=processed_image,
-                timeout=30
-            )
-            
+            response = self._post_image('plant_classification', processed_image)
+
             if response.status_code == 200:
                 results = response.json()
-                return self._interpret_disease_classification(results)
+                return self._interpret_disease_classification(results), True
             else:
-                return self._get_mock_disease_detection()
-                
+                return self._get_mock_disease_detection(), False
+
         except Exception as e:
             logger.error(f"Erro ao classificar doença: {e}")
-            return self._get_mock_disease_detection()
+            return self._get_mock_disease_detection(), False
     
     def generate_recommendation(self, context: str) -> Optional[str]:
         """
@@ -108,11 +160,11 @@ class HuggingFaceService:
                 }
             }
             
-            response = requests.post(
+            response = _session.post(
                 model_url,
                 headers=self.headers,
                 json=payload,
-                timeout=30
+                timeout=self.timeout
             )
             
             if response.status_code == 200:
@@ -127,59 +179,190 @@ class HuggingFaceService:
             logger.error(f"Erro ao gerar recomendação: {e}")
             return self._get_contextual_recommendation(context)
     
-    def analyze_crop_health(self, image_data: Union[bytes, str], crop_type: str) -> Dict:
+    def analyze_crop_health(self, image_data: Union[bytes, str, BinaryIO], crop_type: str,
+                            fingerprint: Optional[image_dedup.ImageFingerprint] = None) -> Dict:
         """
         Análise completa da saúde da cultura
         """
         try:
-            # Combinar detecção de pragas e doenças
-            pest_result = self.detect_pest_in_image(image_data)
-            disease_result = self.classify_plant_disease(image_data)
-            
-            # Análise da saúde geral
-            health_score = self._calculate_health_score(pest_result, disease_result)
-            
-            # Gerar recomendações específicas
-            recommendations = self._generate_crop_recommendations(
-                crop_type, pest_result, disease_result, health_score
-            )
-            
-            return {
-                'health_score': health_score,
-                'pest_detection': pest_result,
-                'disease_detection': disease_result,
-                'recommendations': recommendations,
-                'crop_type': crop_type,
-                'analysis_date': self._get_current_timestamp()
-            }
+            pest_result, disease_result, cached = self._infer_image(image_data, fingerprint)
+            return self._build_crop_analysis(crop_type, pest_result, disease_result, cached)
             
         except Exception as e:
             logger.error(f"Erro na análise da cultura: {e}")
             return self._get_mock_crop_analysis(crop_type)
+
+    def _group_batch(self, images, fingerprints):
+        """{sha256: [chaves]} e [(imagem, fingerprint)] a analisar (uma por sha256)"""
+        keys_by_sha = {}
+        unique = []
+        for (key, source), fp in zip(images, fingerprints):
+            if fp.sha256 not in keys_by_sha:
+                keys_by_sha[fp.sha256] = []
+                unique.append((source, fp))
+            keys_by_sha[fp.sha256].append(key)
+        return keys_by_sha, unique
+
+    def analyze_batch(self, images: List[Tuple[Hashable, Union[bytes, BinaryIO]]],
+                      crop_type: str) -> Iterator[Tuple[Hashable, image_dedup.ImageFingerprint, Dict]]:
+        """
+        Analisar várias imagens (levantamento de campo) num pool limitado a
+        PEST_BATCH_WORKERS imagens em simultâneo.
+        Recebe [(chave, imagem)] e produz (chave, fingerprint, análise) à medida
+        que cada imagem termina. Imagens iguais no lote são analisadas uma vez.
+        """
+        fingerprints = list(_batch_executor.map(lambda item: image_dedup.fingerprint(item[1]), images))
+        keys_by_sha, unique = self._group_batch(images, fingerprints)
+        futures = {
+            _batch_executor.submit(self.analyze_crop_health, source, crop_type, fp): fp
+            for source, fp in unique
+        }
+
+        try:
+            for future in as_completed(futures):
+                fp = futures[future]
+                analysis = future.result()
+                for key in keys_by_sha[fp.sha256]:
+                    yield key, fp, analysis
+        finally:
+            # Cliente desligou a meio do streaming: não analisar o resto
+            for future in futures:
+                future.cancel()
+
+    async def analyze_batch_async(self, images: List[Tuple[Hashable, Union[bytes, BinaryIO]]],
+                                  crop_type: str) -> AsyncIterator[Tuple[Hashable, image_dedup.ImageFingerprint, Dict]]:
+        """
+        analyze_batch para streaming sob ASGI: as imagens correm no mesmo pool
+        e o event loop espera pelos futures (asyncio.wrap_future), sem bloquear
+        """
+        fingerprints = await asyncio.gather(*(
+            asyncio.wrap_future(_batch_executor.submit(image_dedup.fingerprint, source)) for _, source in images
+        ))
+        keys_by_sha, unique = self._group_batch(images, fingerprints)
+
+        async def analyze(source, fp):
+            future = _batch_executor.submit(self.analyze_crop_health, source, crop_type, fp)
+            return fp, await asyncio.wrap_future(future)
+
+        tasks = [asyncio.ensure_future(analyze(source, fp)) for source, fp in unique]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                fp, analysis = await next_done
+                for key in keys_by_sha[fp.sha256]:
+                    yield key, fp, analysis
+        finally:
+            # Cancelar a task cancela também o future do pool ainda não iniciado
+            for task in tasks:
+                task.cancel()
+
+    def calculate_field_health(self, analyses: List[Dict], crop_type: str) -> Dict:
+        """
+        Saúde agregada de um campo a partir das análises de várias imagens:
+        média dos scores de cada imagem (_calculate_health_score), incidência de
+        pragas e doenças e recomendações para o conjunto
+        """
+        scores = [analysis['health_score'] for analysis in analyses]
+        pests = {}
+        diseases = {}
+        images_with_pests = 0
+
+        for analysis in analyses:
+            detected = (analysis.get('pest_detection') or {}).get('pests_detected') or []
+            if detected:
+                images_with_pests += 1
+            for pest in detected:
+                entry = pests.setdefault(pest['name'], {'name': pest['name'], 'images': 0, 'confidence': 0.0})
+                entry['images'] += 1
+                entry['confidence'] = max(entry['confidence'], pest['confidence'])
+            for disease in (analysis.get('disease_detection') or {}).get('diseases_detected') or []:
+                if 'saudável' in disease['name'].lower():
+                    continue
+                entry = diseases.setdefault(disease['name'], {'name': disease['name'], 'images': 0, 'confidence': 0.0})
+                entry['images'] += 1
+                entry['confidence'] = max(entry['confidence'], disease['confidence'])
+
+        pests = sorted(pests.values(), key=lambda p: (-p['images'], -p['confidence']))
+        diseases = sorted(diseases.values(), key=lambda d: (-d['images'], -d['confidence']))
+        health_score = round(sum(scores) / len(scores), 1) if scores else 100.0
+
+        recommendations = self._generate_crop_recommendations(
+            crop_type,
+            {'pests_detected': pests},
+            {'diseases_detected': diseases},
+            health_score
+        )
+
+        return {
+            'health_score': health_score,
+            'min_health_score': min(scores) if scores else 100.0,
+            'images_analyzed': len(analyses),
+            'images_with_pests': images_with_pests,
+            'pest_incidence': round(images_with_pests / len(analyses), 3) if analyses else 0.0,
+            'pests': pests,
+            'diseases': diseases,
+            'recommendations': recommendations,
+            'crop_type': crop_type
+        }
+
+    def _infer_image(self, image_data: Union[bytes, str, BinaryIO],
+                     fingerprint: Optional[image_dedup.ImageFingerprint] = None) -> Tuple[Dict, Dict, bool]:
+        """
+        Inferências de pragas e doenças de uma imagem: (pragas, doenças, veio do cache)
+        """
+        if isinstance(image_data, str):
+            image_data = base64.b64decode(image_data)
+
+        # Foto repetida (mesmo SHA-256 ou dHash próximo): reutilizar as inferências
+        fingerprint = fingerprint or image_dedup.fingerprint(image_data)
+        cached = image_dedup.get_cached_inference(fingerprint)
+        if cached:
+            return cached['pest_detection'], cached['disease_detection'], True
+
+        # Imagem pré-processada uma vez; as duas inferências correm em
+        # paralelo, a latência é a da mais lenta
+        processed_image = self._preprocess_image(image_data)
+        pest_future = _inference_executor.submit(self._detect_pest, processed_image)
+        disease_future = _inference_executor.submit(self._classify_disease, processed_image)
+        pest_result, pest_ok = pest_future.result()
+        disease_result, disease_ok = disease_future.result()
+        # Resultados de fallback não vão para o cache
+        if pest_ok and disease_ok:
+            image_dedup.store_inference(fingerprint, pest_result, disease_result)
+        return pest_result, disease_result, False
+
+    def _build_crop_analysis(self, crop_type: str, pest_result: Dict, disease_result: Dict,
+                             cached: bool = False) -> Dict:
+        # Análise da saúde geral
+        health_score = self._calculate_health_score(pest_result, disease_result)
+        
+        # Gerar recomendações específicas
+        recommendations = self._generate_crop_recommendations(
+            crop_type, pest_result, disease_result, health_score
+        )
+        
+        return {
+            'health_score': health_score,
+            'pest_detection': pest_result,
+            'disease_detection': disease_result,
+            'recommendations': recommendations,
+            'crop_type': crop_type,
+            'analysis_date': self._get_current_timestamp(),
+            'cached': cached
+        }
     
-    def _preprocess_image(self, image_data: bytes) -> bytes:
+    def _preprocess_image(self, image_data: Union[bytes, BinaryIO]) -> bytes:
         """
-        Pré-processar imagem para análise
+        Pré-processar imagem para análise (bytes ou ficheiro aberto)
         """
         try:
-            # Abrir imagem
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Redimensionar se muito grande
-            if image.size[0] > 1024 or image.size[1] > 1024:
-                image.thumbnail((1024, 1024), Image.Resampling.LANCZOS)
-            
-            # Converter para RGB se necessário
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Salvar como bytes
-            output = io.BytesIO()
-            image.save(output, format='JPEG', quality=85)
-            return output.getvalue()
-            
+            # Reduzir a 1024px e converter para JPEG RGB (mesmo código dos derivados)
+            return image_derivatives.resize_image(image_data, 1024)
+
         except Exception as e:
             logger.error(f"Erro ao processar imagem: {e}")
+            if not isinstance(image_data, bytes):
+                image_data.seek(0)
+                return image_data.read()
             return image_data
     
     def _interpret_pest_detection(self, results: List[Dict]) -> Dict:
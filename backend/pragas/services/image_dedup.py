@@ -0,0 +1,198 @@
+"""
+Deduplicação de imagens de pragas por conteúdo
+
+Cada imagem recebida é identificada por:
+- SHA-256 dos bytes originais (duplicados exatos);
+- dHash perceptual de 64 bits (a mesma foto recomprimida, redimensionada ou
+  reenviada pelo WhatsApp dá o mesmo hash ou difere em poucos bits).
+
+O resultado das inferências (pragas + doenças) fica no cache Django por
+PEST_ANALYSIS_CACHE_TTL segundos, indexado pelos dois hashes. Os quasi-
+duplicados são encontrados por bandas: o dHash é partido em 4 blocos de 16
+bits e, se dois hashes diferem em no máximo 3 bits, pelo menos um bloco é igual.
+
+No storage o ficheiro tem o SHA-256 no nome, por isso imagens iguais
+partilham um único ficheiro em media/deteccoes_pragas/.
+"""
+import io
+import hashlib
+import logging
+from typing import BinaryIO, Dict, NamedTuple, Optional, Union
+from decouple import config
+from django.core.cache import cache
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = 'deteccoes_pragas'
+
+_PHASH_BANDS = 4
+_PHASH_BAND_CHARS = 16 // _PHASH_BANDS
+# Hashes guardados por banda (os mais recentes)
+_PHASH_BAND_MAX_ENTRIES = 32
+
+# Leitura em blocos para não carregar uploads grandes inteiros em memória
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+_FLAT_HASHES = frozenset(['0' * 16, 'f' * 16])
+
+_FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif', 'BMP': 'bmp'}
+
+
+class ImageFingerprint(NamedTuple):
+    sha256: str
+    phash: Optional[str]  # None se a imagem não puder ser aberta
+    extension: str
+
+
+def _enabled() -> bool:
+    return config('PEST_ANALYSIS_CACHE_ENABLED', default='true').lower() in ('1', 'true', 'yes')
+
+
+def cache_ttl() -> int:
+    return int(config('PEST_ANALYSIS_CACHE_TTL', default='604800'))
+
+
+def phash_max_distance() -> int:
+    """Distância de Hamming máxima para considerar duas fotos a mesma (0-3)"""
+    return min(int(config('PEST_PHASH_MAX_DISTANCE', default='3')), _PHASH_BANDS - 1)
+
+
+def difference_hash(image: Image.Image) -> str:
+    """dHash: compara cada pixel com o vizinho da direita numa miniatura 9x8 em tons de cinza"""
+    pixels = list(image.convert('L').resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f'{bits:016x}'
+
+
+def hamming_distance(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def _sha256(source: Union[bytes, BinaryIO]) -> str:
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    source.seek(0)
+    for chunk in iter(lambda: source.read(_HASH_CHUNK_BYTES), b''):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+def fingerprint(source: Union[bytes, BinaryIO]) -> ImageFingerprint:
+    """Aceita os bytes da imagem ou um ficheiro aberto (ex.: upload em disco)"""
+    sha256 = _sha256(source)
+    try:
+        image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        extension = _FORMAT_EXTENSIONS.get(image.format, 'jpg')
+        # JPEG: descodificar já reduzido (muito mais rápido em fotos grandes)
+        image.draft('L', (64, 64))
+        phash = difference_hash(image)
+        # Imagem lisa (toda escura, desfocada...): o dHash não a distingue de outras
+        if phash in _FLAT_HASHES:
+            phash = None
+        return ImageFingerprint(sha256, phash, extension)
+    except Exception as e:
+        logger.warning(f"Não foi possível calcular o hash perceptual: {e}")
+        return ImageFingerprint(sha256, None, 'jpg')
+    finally:
+        if not isinstance(source, bytes):
+            source.seek(0)
+
+
+def _sha_key(sha256: str) -> str:
+    return f'pest_analysis:sha:{sha256}'
+
+
+def _phash_key(phash: str) -> str:
+    return f'pest_analysis:phash:{phash}'
+
+
+def _band_keys(phash: str):
+    return [
+        f'pest_analysis:band:{i}:{phash[i * _PHASH_BAND_CHARS:(i + 1) * _PHASH_BAND_CHARS]}'
+        for i in range(_PHASH_BANDS)
+    ]
+
+
+def _nearest_phash(phash: str) -> Optional[str]:
+    max_distance = phash_max_distance()
+    if max_distance <= 0:
+        return None
+    candidates = set()
+    for hashes in cache.get_many(_band_keys(phash)).values():
+        candidates.update(hashes)
+    candidates.discard(phash)
+    scored = sorted((hamming_distance(phash, c), c) for c in candidates)
+    if scored and scored[0][0] <= max_distance:
+        return scored[0][1]
+    return None
+
+
+def get_cached_inference(fp: ImageFingerprint) -> Optional[Dict]:
+    """
+    Inferências guardadas para esta imagem ({'pest_detection', 'disease_detection'}):
+    primeiro pelo SHA-256, depois pelo dHash exato e por fim pelo dHash mais próximo
+    """
+    if not _enabled():
+        return None
+    try:
+        cached = cache.get(_sha_key(fp.sha256))
+        if cached is None and fp.phash:
+            cached = cache.get(_phash_key(fp.phash))
+            if cached is None:
+                nearest = _nearest_phash(fp.phash)
+                if nearest:
+                    cached = cache.get(_phash_key(nearest))
+        return cached
+    except Exception as e:
+        logger.warning(f"Erro ao ler cache de análises: {e}")
+        return None
+
+
+def _band_lists(phash: str):
+    keys = _band_keys(phash)
+    stored = cache.get_many(keys)
+    return [stored.get(key, []) for key in keys]
+
+
+def store_inference(fp: ImageFingerprint, pest_result: Dict, disease_result: Dict):
+    if not _enabled():
+        return
+    value = {'pest_detection': pest_result, 'disease_detection': disease_result}
+    ttl = cache_ttl()
+    try:
+        entries = {_sha_key(fp.sha256): value}
+        if fp.phash:
+            entries[_phash_key(fp.phash)] = value
+            for key, hashes in zip(_band_keys(fp.phash), _band_lists(fp.phash)):
+                if fp.phash not in hashes:
+                    entries[key] = (hashes + [fp.phash])[-_PHASH_BAND_MAX_ENTRIES:]
+        cache.set_many(entries, timeout=ttl)
+    except Exception as e:
+        logger.warning(f"Erro ao gravar cache de análises: {e}")
+
+
+def image_storage_name(fp: ImageFingerprint) -> str:
+    return f'{IMAGE_DIR}/{fp.sha256}.{fp.extension}'
+
+
+def store_image(source: Union[bytes, BinaryIO], fp: ImageFingerprint) -> str:
+    """
+    Grava a imagem com o SHA-256 no nome e retorna o nome no storage;
+    se já existe, reutiliza o ficheiro sem escrever de novo
+    """
+    name = image_storage_name(fp)
+    if default_storage.exists(name):
+        return name
+    if isinstance(source, bytes):
+        return default_storage.save(name, ContentFile(source))
+    source.seek(0)
+    # Copiado em blocos (File.chunks), sem ler o upload inteiro
+    return default_storage.save(name, source if isinstance(source, File) else File(source))
@@ -0,0 +1,156 @@
+"""
+Versões reduzidas (derivados) das imagens guardadas
+
+As fotos de deteções, do campo, capas de projetos e notas fiscais ficam no
+storage em resolução original. Depois do upload, um passo em background gera:
+  thumb  - JPEG até IMAGE_THUMB_SIZE px (listas, histórico)
+  medium - JPEG até IMAGE_MEDIUM_SIZE px (ecrã de detalhe)
+  webp   - WebP até IMAGE_MEDIUM_SIZE px (clientes que o suportam)
+
+Os derivados ficam em media/derivados/<caminho do original>_<variante>.<ext>
+e os nomes são registados no campo JSON <campo>_derivados do modelo, com a
+chave 'source' (nome do original a que correspondem). Imagens com o mesmo
+nome (ex.: deteções deduplicadas por SHA-256) partilham os derivados.
+
+O código PIL (draft + thumbnail + RGB) é o mesmo do pré-processamento das
+imagens para a IA (HuggingFaceService._preprocess_image).
+"""
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, Optional, Union
+from decouple import config
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+
+DERIVATIVES_DIR = 'derivados'
+
+_FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+_derivatives_executor = ThreadPoolExecutor(
+    max_workers=int(config('IMAGE_DERIVATIVES_WORKERS', default='2')),
+    thread_name_prefix='image-derivatives'
+)
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def variants() -> Dict[str, tuple]:
+    """variante -> (lado máximo em px, formato)"""
+    thumb = int(config('IMAGE_THUMB_SIZE', default='320'))
+    medium = int(config('IMAGE_MEDIUM_SIZE', default='1024'))
+    return {
+        'thumb': (thumb, 'JPEG'),
+        'medium': (medium, 'JPEG'),
+        'webp': (medium, 'WEBP'),
+    }
+
+
+def open_image(source: Union[bytes, BinaryIO], max_size: int) -> Image.Image:
+    """Abrir a imagem; JPEG é descodificado já reduzido a >= max_size px"""
+    if isinstance(source, bytes):
+        image = Image.open(io.BytesIO(source))
+    else:
+        source.seek(0)
+        image = Image.open(source)
+    image.draft('RGB', (max_size, max_size))
+    return image
+
+
+def fit(image: Image.Image, max_size: int) -> Image.Image:
+    """Reduzir para caber em max_size x max_size (sem ampliar) e converter para RGB"""
+    if image.size[0] > max_size or image.size[1] > max_size:
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def encode(image: Image.Image, fmt: str = 'JPEG', quality: int = 85) -> bytes:
+    output = io.BytesIO()
+    if fmt == 'WEBP':
+        image.save(output, format=fmt, quality=quality, method=4)
+    else:
+        image.save(output, format=fmt, quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def resize_image(source: Union[bytes, BinaryIO], max_size: int, fmt: str = 'JPEG', quality: int = 85) -> bytes:
+    return encode(fit(open_image(source, max_size), max_size), fmt, quality)
+
+
+def derivative_name(name: str, variant: str, fmt: str) -> str:
+    stem = os.path.splitext(name)[0]
+    return f'{DERIVATIVES_DIR}/{stem}_{variant}.{_FORMAT_EXTENSIONS[fmt]}'
+
+
+def generate(name: str) -> Dict[str, str]:
+    """
+    Gerar (ou reutilizar) os derivados do ficheiro `name` do storage.
+    Retorna {'source': name, variante: nome do derivado}
+    """
+    sizes = variants()
+    names = {variant: derivative_name(name, variant, fmt) for variant, (_, fmt) in sizes.items()}
+    missing = [variant for variant, derived in names.items() if not default_storage.exists(derived)]
+
+    if missing:
+        largest = max(size for size, _ in sizes.values())
+        with default_storage.open(name, 'rb') as f:
+            # Uma descodificação para todas as variantes, da maior para a menor
+            image = ImageOps.exif_transpose(open_image(f, largest))
+            image = fit(image, largest)
+            for variant in sorted(missing, key=lambda v: -sizes[v][0]):
+                size, fmt = sizes[variant]
+                image = fit(image, size)
+                default_storage.save(names[variant], ContentFile(encode(image, fmt, 80 if fmt == 'WEBP' else 85)))
+
+    return dict(names, source=name)
+
+
+def generate_for(model, pk, field_name: str, name: str) -> Dict[str, str]:
+    """Gerar os derivados e registá-los no objeto (se a imagem não foi trocada entretanto)"""
+    derivados = generate(name)
+    model.objects.filter(pk=pk, **{field_name: name}).update(**{f'{field_name}_derivados': derivados})
+    return derivados
+
+
+def _generate_in_background(model, pk, field_name: str, name: str):
+    try:
+        generate_for(model, pk, field_name, name)
+    except Exception as e:
+        print(f"⚠️ Erro ao gerar derivados de {name}: {e}")
+    finally:
+        connection.close()
+        with _pending_lock:
+            _pending.discard((model, pk, name))
+
+
+def schedule(instance, field_name: str = 'imagem'):
+    """
+    Agendar os derivados de instance.<field_name> depois do commit, se a
+    imagem ainda não os tem (no máximo uma vez por imagem de cada vez)
+    """
+    field_file = getattr(instance, field_name)
+    derivados = getattr(instance, f'{field_name}_derivados') or {}
+    if not field_file or derivados.get('source') == field_file.name:
+        return
+
+    key = (type(instance), instance.pk, field_file.name)
+    with _pending_lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+    transaction.on_commit(lambda: _derivatives_executor.submit(_generate_in_background, *key[:2], field_name, key[2]))
+
+
+def urls(instance, field_name: str = 'imagem') -> Optional[Dict[str, str]]:
+    """URLs dos derivados já gerados da imagem atual, ou None"""
+    field_file = getattr(instance, field_name)
+    derivados = getattr(instance, f'{field_name}_derivados') or {}
+    if not field_file or derivados.get('source') != field_file.name:
+        return None
+    return {variant: default_storage.url(derived) for variant, derived in derivados.items() if variant != 'source'}
@@ -0,0 +1,212 @@
+"""
+Inferência local (CPU) de pragas e doenças com ONNX Runtime
+
+Alternativa à Inference API do HuggingFace para instalações sem ligação
+estável: com PEST_INFERENCE_BACKEND=onnx os dois modelos (classificadores de
+imagem exportados para ONNX) são carregados uma vez por worker e devolvem os
+resultados no mesmo formato da API ([{'label', 'score'}]), interpretados pelas
+mesmas funções do HuggingFaceService.
+
+Pedidos concorrentes ao mesmo modelo (ex.: análise em lote) são agrupados
+num único session.run com até PEST_ONNX_BATCH_SIZE imagens.
+
+Configuração:
+  PEST_ONNX_PEST_MODEL / PEST_ONNX_DISEASE_MODEL    caminhos dos modelos .onnx
+  PEST_ONNX_PEST_LABELS / PEST_ONNX_DISEASE_LABELS  rótulos (JSON ou um por linha);
+                                                    por omissão, metadado 'labels' do modelo
+  PEST_ONNX_THREADS       threads por sessão (0 = decidido pelo ONNX Runtime)
+  PEST_ONNX_BATCH_SIZE    imagens por execução
+  PEST_ONNX_BATCH_WAIT_MS espera máxima para juntar pedidos num lote
+"""
+import io
+import json
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+from decouple import config
+from PIL import Image
+
+try:
+    import numpy as np
+    import onnxruntime as ort
+except ImportError:
+    np = None
+    ort = None
+
+# Normalização ImageNet (ViT, MobileNet, EfficientNet...)
+_DEFAULT_MEAN = '0.485,0.456,0.406'
+_DEFAULT_STD = '0.229,0.224,0.225'
+
+TOP_K = 5
+
+# model_key do HuggingFaceService -> variável com o caminho do modelo
+_MODEL_SETTINGS = {
+    'pest_detection': 'PEST_ONNX_PEST',
+    'plant_classification': 'PEST_ONNX_DISEASE',
+}
+
+
+def backend_name() -> str:
+    return config('PEST_INFERENCE_BACKEND', default='huggingface').lower()
+
+
+def _load_labels(path: str, session) -> List[str]:
+    if path:
+        with open(path, encoding='utf-8') as f:
+            content = f.read()
+        try:
+            return json.loads(content)
+        except ValueError:
+            return [line.strip() for line in content.splitlines() if line.strip()]
+    metadata = session.get_modelmeta().custom_metadata_map
+    if 'labels' in metadata:
+        return json.loads(metadata['labels'])
+    raise ValueError('Rótulos não encontrados (defina *_LABELS ou o metadado "labels" no modelo)')
+
+
+class OnnxImageClassifier:
+    """Classificador de imagem ONNX: entrada NCHW float32, saída logits ou probabilidades"""
+
+    def __init__(self, model_path: str, labels_path: str = '', threads: int = 0):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        height, width = model_input.shape[2:4]
+        # Dimensões simbólicas (ex.: 'height') ficam em 224
+        self.input_size = (
+            width if isinstance(width, int) else 224,
+            height if isinstance(height, int) else 224,
+        )
+        self.labels = _load_labels(labels_path, self.session)
+        self.mean = np.array([float(v) for v in config('PEST_ONNX_MEAN', default=_DEFAULT_MEAN).split(',')],
+                             dtype=np.float32).reshape(3, 1, 1)
+        self.std = np.array([float(v) for v in config('PEST_ONNX_STD', default=_DEFAULT_STD).split(',')],
+                            dtype=np.float32).reshape(3, 1, 1)
+
+    def to_tensor(self, image_bytes: bytes):
+        image = Image.open(io.BytesIO(image_bytes))
+        image.draft('RGB', self.input_size)
+        image = image.convert('RGB').resize(self.input_size, Image.Resampling.BILINEAR)
+        array = np.asarray(image, dtype=np.float32).transpose(2, 0, 1) / 255.0
+        return (array - self.mean) / self.std
+
+    def predict_batch(self, images: List[bytes]) -> List[List[Dict]]:
+        return self.run([self.to_tensor(image) for image in images])
+
+    def run(self, tensors) -> List[List[Dict]]:
+        """Uma execução do modelo para vários tensores (3, H, W)"""
+        scores = self.session.run(None, {self.input_name: np.stack(tensors)})[0]
+
+        # Logits -> probabilidades (softmax), se o modelo ainda não as devolve
+        if scores.min() < 0 or not np.allclose(scores.sum(axis=1), 1.0, atol=1e-3):
+            scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+            scores /= scores.sum(axis=1, keepdims=True)
+
+        results = []
+        for row in scores:
+            top = np.argsort(row)[::-1][:TOP_K]
+            results.append([{'label': self.labels[i], 'score': float(row[i])} for i in top])
+        return results
+
+
+class _MicroBatcher:
+    """Junta pedidos concorrentes num único predict_batch (até batch_size imagens)"""
+
+    def __init__(self, classifier: OnnxImageClassifier, batch_size: int, wait_seconds: float, name: str):
+        self.classifier = classifier
+        self.batch_size = max(1, batch_size)
+        self.wait_seconds = wait_seconds
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name=f'onnx-{name}', daemon=True).start()
+
+    def predict(self, image_bytes: bytes) -> List[Dict]:
+        # Descodificação na thread do pedido (em paralelo); só o modelo é partilhado
+        tensor = self.classifier.to_tensor(image_bytes)
+        future = Future()
+        self._queue.put((tensor, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            try:
+                while len(items) < self.batch_size:
+                    items.append(self._queue.get(timeout=self.wait_seconds))
+            except queue.Empty:
+                pass
+            try:
+                results = self.classifier.run([tensor for tensor, _ in items])
+                for (_, future), result in zip(items, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+
+
+class LocalInferenceBackend:
+    def __init__(self):
+        threads = int(config('PEST_ONNX_THREADS', default='0'))
+        batch_size = int(config('PEST_ONNX_BATCH_SIZE', default='8'))
+        wait_seconds = float(config('PEST_ONNX_BATCH_WAIT_MS', default='5')) / 1000
+        self.classifiers = {}
+        self._batchers = {}
+        for model_key, prefix in _MODEL_SETTINGS.items():
+            model_path = config(f'{prefix}_MODEL', default='')
+            if not model_path:
+                continue
+            classifier = OnnxImageClassifier(model_path, config(f'{prefix}_LABELS', default=''), threads)
+            self.classifiers[model_key] = classifier
+            self._batchers[model_key] = _MicroBatcher(classifier, batch_size, wait_seconds, model_key)
+
+    def supports(self, model_key: str) -> bool:
+        return model_key in self.classifiers
+
+    def predict(self, model_key: str, image_bytes: bytes) -> List[Dict]:
+        """Resultado de uma imagem no formato da Inference API"""
+        return self._batchers[model_key].predict(image_bytes)
+
+    def predict_batch(self, model_key: str, images: List[bytes]) -> List[List[Dict]]:
+        return self.classifiers[model_key].predict_batch(images)
+
+
+_backend = None
+_backend_loaded = False
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> Optional[LocalInferenceBackend]:
+    """
+    Backend local do processo (carregado uma vez por worker), ou None se
+    PEST_INFERENCE_BACKEND não é 'onnx' ou os modelos não puderam ser carregados
+    """
+    global _backend, _backend_loaded
+    if backend_name() != 'onnx':
+        return None
+    if _backend_loaded:
+        return _backend
+    with _backend_lock:
+        if not _backend_loaded:
+            try:
+                if ort is None:
+                    raise ImportError('onnxruntime e numpy não estão instalados')
+                _backend = LocalInferenceBackend()
+                print(f"✅ Inferência local ONNX carregada: {', '.join(_backend.classifiers) or 'nenhum modelo'}")
+            except Exception as e:
+                print(f"❌ Erro ao carregar inferência local, usando a API do HuggingFace: {e}")
+                _backend = None
+            _backend_loaded = True
+    return _backend
+
+
+def reset_backend():
+    """Descarta o backend carregado (testes, troca de modelos)"""
+    global _backend, _backend_loaded
+    with _backend_lock:
+        _backend = None
+        _backend_loaded = False
@@ -0,0 +1,101 @@
+"""
+Catálogo de pragas pré-calculado (/api/pragas/listar/)
+
+O catálogo só muda pelo admin, mas é dos endpoints mais chamados (sincronização
+offline da app). A lista serializada fica no cache Django por filtro de cultura,
+com um ETag (hash do conteúdo) e a data da última alteração, para respostas
+304 aos clientes que já a têm.
+
+A versão do catálogo é um carimbo de tempo no cache, sem expiração, renovado
+só pelos sinais de TipoPraga/Cultura (pragas.signals). Com cache local por
+processo (sem REDIS_URL) os outros workers só veem a alteração quando as
+entradas expiram (PEST_CATALOGUE_CACHE_TTL).
+
+O Last-Modified vem do conteúdo: guarda-se (sem expiração) o ETag e a data
+de cada filtro, e a data só avança quando o ETag muda. Recalcular uma
+entrada expirada, ou perder a versão (cache limpo, worker reiniciado), não
+muda o Last-Modified de um catálogo igual.
+"""
+import hashlib
+import json
+import time
+from typing import Dict, Optional
+from decouple import config
+from django.core.cache import cache
+
+from ..models import TipoPraga
+
+_VERSION_KEY = 'pragas:catalogo:versao'
+
+
+def cache_ttl() -> int:
+    return int(config('PEST_CATALOGUE_CACHE_TTL', default='300'))
+
+
+def current_version() -> float:
+    """Carimbo (epoch) da última alteração conhecida do catálogo"""
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        cache.add(_VERSION_KEY, time.time(), None)
+        version = cache.get(_VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """Nova versão: as entradas antigas deixam de ser usadas e expiram sozinhas"""
+    cache.set(_VERSION_KEY, time.time(), None)
+
+
+def _last_modified(cultura_hash: str, etag: str) -> float:
+    """Data da última alteração do conteúdo deste filtro (só avança quando o ETag muda)"""
+    key = 'pragas:catalogo:alterado:{}'.format(cultura_hash)
+    stamp = cache.get(key)
+    if stamp and stamp['etag'] == etag:
+        return stamp['last_modified']
+    last_modified = time.time()
+    cache.set(key, {'etag': etag, 'last_modified': last_modified}, None)
+    return last_modified
+
+
+def _normalize(cultura: Optional[str]) -> str:
+    return (cultura or '').strip().lower()
+
+
+def build(cultura: Optional[str] = None):
+    """Lista de pragas serializada (2 queries: pragas + culturas em prefetch)"""
+    pragas = TipoPraga.objects.prefetch_related('culturas_afetadas').order_by('id')
+    if cultura:
+        pragas = pragas.filter(culturas_afetadas__nome__icontains=cultura).distinct()
+
+    return [
+        {
+            'id': praga.id,
+            'nome': praga.nome,
+            'nome_cientifico': praga.nome_cientifico,
+            'tipo': praga.tipo,
+            'descricao': praga.descricao,
+            'culturas_afetadas': [c.nome for c in praga.culturas_afetadas.all()],
+            'sintomas': praga.sintomas
+        }
+        for praga in pragas
+    ]
+
+
+def get_catalogue(cultura: Optional[str] = None) -> Dict:
+    """{'data', 'etag', 'last_modified'} do cache, ou calculado e guardado"""
+    cultura = _normalize(cultura)
+    cultura_hash = hashlib.md5(cultura.encode('utf-8')).hexdigest()
+    key = 'pragas:catalogo:{}:{}'.format(current_version(), cultura_hash)
+
+    entry = cache.get(key)
+    if entry is None:
+        data = build(cultura)
+        body = json.dumps(data, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        entry = {
+            'data': data,
+            'etag': etag,
+            'last_modified': _last_modified(cultura_hash, etag),
+        }
+        cache.set(key, entry, cache_ttl())
+    return entry
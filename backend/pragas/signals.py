@@ -0,0 +1,23 @@
+"""
+Invalidação do catálogo de pragas (pragas.services.pest_catalogue) quando
+pragas, culturas ou a relação entre elas mudam
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Cultura, TipoPraga
+from .services import pest_catalogue
+
+
+@receiver(post_save, sender=TipoPraga)
+@receiver(post_delete, sender=TipoPraga)
+@receiver(post_save, sender=Cultura)
+@receiver(post_delete, sender=Cultura)
+def invalidate_catalogue(sender, **kwargs):
+    pest_catalogue.invalidate()
+
+
+@receiver(m2m_changed, sender=TipoPraga.culturas_afetadas.through)
+def invalidate_catalogue_cultures(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        pest_catalogue.invalidate()
@@ -1,3 +1,869 @@
-from django.test import TestCase
+import asyncio
+import base64
+import contextlib
+import io
+import ipaddress
+import itertools
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image, ImageDraw
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .inference_stub import InferenceStubServer, write_stub_onnx_model
+from .models import Cultura, DeteccaoPraga, TipoPraga
+from .services import detection_jobs, image_dedup, image_derivatives, local_inference, pest_catalogue
+from .services.huggingface_service import HuggingFaceService, huggingface_service
+
+try:
+    import onnx  # noqa: F401 (modelos sintéticos)
+    HAS_ONNX = local_inference.ort is not None
+except ImportError:
+    HAS_ONNX = False
+
+User = get_user_model()
+
+STUB_LATENCY = 0.3
+
+
+def _leaf_image(rotate=0) -> Image.Image:
+    image = Image.linear_gradient('L').resize((320, 240)).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((40, 30, 200, 180), fill=(30, 140, 40))
+    draw.rectangle((220, 60, 300, 220), fill=(150, 90, 20))
+    return image.rotate(rotate)
+
+
+def _encode(image: Image.Image, fmt='PNG', **options) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format=fmt, **options)
+    return output.getvalue()
+
+
+def _sample_image_b64() -> str:
+    return base64.b64encode(_encode(_leaf_image())).decode('ascii')
+
+
+class AnalyzeCropHealthTests(SimpleTestCase):
+    """Pragas e doenças contra o stub local: uma decodificação, inferências em paralelo"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = InferenceStubServer(pest_latency=STUB_LATENCY, disease_latency=STUB_LATENCY).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.service = HuggingFaceService()
+        self.service.base_url = self.stub.url
+
+    def test_results_are_interpreted(self):
+        result = self.service.analyze_crop_health(_sample_image_b64(), 'milho')
+
+        pests = result['pest_detection']['pests_detected']
+        self.assertEqual([p['name'] for p in pests], ['Lagarta'])
+        self.assertAlmostEqual(result['pest_detection']['confidence'], 0.91)
+        diseases = result['disease_detection']['diseases_detected']
+        self.assertEqual([d['name'] for d in diseases], ['Ferrugem', 'Planta saudável'])
+        self.assertLess(result['health_score'], 100.0)
+        self.assertEqual(result['crop_type'], 'milho')
+
+    def test_image_preprocessed_once(self):
+        with mock.patch.object(self.service, '_preprocess_image', wraps=self.service._preprocess_image) as preprocess:
+            self.service.analyze_crop_health(_sample_image_b64(), 'milho')
+        self.assertEqual(preprocess.call_count, 1)
+
+    def test_latency_is_max_not_sum(self):
+        image = _sample_image_b64()
+        self.service.analyze_crop_health(image, 'milho')  # aquece as conexões
+        cache.clear()
+
+        requests_before = self.stub.request_count
+        start = time.perf_counter()
+        self.service.analyze_crop_health(image, 'milho')
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(self.stub.request_count - requests_before, 2)
+        self.assertLess(elapsed, STUB_LATENCY * 1.7)
+
+
+class ImageDedupTests(SimpleTestCase):
+    """Fotos repetidas reutilizam a análise sem chamar a API de inferência"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = InferenceStubServer(pest_latency=STUB_LATENCY, disease_latency=STUB_LATENCY).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.service = HuggingFaceService()
+        self.service.base_url = self.stub.url
+
+    def test_fingerprint(self):
+        original = image_dedup.fingerprint(_encode(_leaf_image()))
+        recompressed = image_dedup.fingerprint(_encode(_leaf_image(), 'JPEG', quality=60))
+        other = image_dedup.fingerprint(_encode(_leaf_image(rotate=180)))
+
+        self.assertNotEqual(original.sha256, recompressed.sha256)
+        self.assertEqual((original.extension, recompressed.extension), ('png', 'jpg'))
+        self.assertLessEqual(image_dedup.hamming_distance(original.phash, recompressed.phash), 3)
+        self.assertGreater(image_dedup.hamming_distance(original.phash, other.phash), 3)
+        self.assertIsNone(image_dedup.fingerprint(_encode(Image.new('RGB', (64, 48), (40, 160, 60)))).phash)
+
+    def test_exact_and_near_duplicates_hit_cache(self):
+        first = self.service.analyze_crop_health(_encode(_leaf_image()), 'milho')
+        requests_after_first = self.stub.request_count
+
+        start = time.perf_counter()
+        exact = self.service.analyze_crop_health(_encode(_leaf_image()), 'tomate')
+        elapsed = time.perf_counter() - start
+        near = self.service.analyze_crop_health(_encode(_leaf_image(), 'JPEG', quality=60), 'milho')
+
+        self.assertFalse(first['cached'])
+        self.assertTrue(exact['cached'])
+        self.assertTrue(near['cached'])
+        self.assertLess(elapsed, STUB_LATENCY / 3)
+        self.assertEqual(self.stub.request_count, requests_after_first)
+        self.assertEqual(exact['pest_detection'], first['pest_detection'])
+        self.assertEqual(exact['crop_type'], 'tomate')
+
+        different = self.service.analyze_crop_health(_encode(_leaf_image(rotate=180)), 'milho')
+        self.assertFalse(different['cached'])
+        self.assertEqual(self.stub.request_count, requests_after_first + 2)
+
+    def test_fallback_not_cached(self):
+        self.service.base_url = 'http://127.0.0.1:9'  # porta fechada
+        image = _encode(_leaf_image())
+        self.service.analyze_crop_health(image, 'milho')
+        self.assertIsNone(image_dedup.get_cached_inference(image_dedup.fingerprint(image)))
+
+
+class DetectarPragaViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = InferenceStubServer().start()
+        cls.media_root = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='agricultor', password='x', localizacao='Nampula')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_detection_saved_with_stub_results(self):
+        with override_settings(MEDIA_ROOT=self.media_root), \
+                mock.patch.object(huggingface_service, 'base_url', self.stub.url), \
+                mock.patch('notificacoes.services.twilio_service.twilio_service.send_pest_detection_alert') as alert:
+            response = self.client.post('/api/pragas/detectar/', {
+                'image': 'data:image/png;base64,' + _sample_image_b64(),
+                'crop_type': 'milho',
+            }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['pest_detection']['pests_detected'][0]['name'], 'Lagarta')
+        detection = DeteccaoPraga.objects.get(id=response.data['detection_id'])
+        self.assertEqual(detection.localizacao, 'Nampula')
+        self.assertAlmostEqual(detection.confianca_deteccao, 0.91)
+        alert.assert_called_once()
+
+    def test_identical_uploads_share_file(self):
+        payload = {'image': _sample_image_b64(), 'crop_type': 'milho'}
+        with override_settings(MEDIA_ROOT=self.media_root), \
+                mock.patch.object(huggingface_service, 'base_url', self.stub.url), \
+                mock.patch('notificacoes.services.twilio_service.twilio_service.send_pest_detection_alert'):
+            first = self.client.post('/api/pragas/detectar/', payload, format='json')
+            second = self.client.post('/api/pragas/detectar/', payload, format='json')
+
+            self.assertTrue(second.data['cached'])
+            detections = DeteccaoPraga.objects.filter(id__in=[first.data['detection_id'], second.data['detection_id']])
+            self.assertEqual(len({d.imagem.name for d in detections}), 1)
+            self.assertEqual(len({d.imagem_sha256 for d in detections}), 1)
+            self.assertEqual(len(os.listdir(os.path.join(self.media_root, image_dedup.IMAGE_DIR))), 1)
+
+    def _post_with_stub(self, *args, **kwargs):
+        with override_settings(MEDIA_ROOT=self.media_root), \
+                mock.patch.object(huggingface_service, 'base_url', self.stub.url), \
+                mock.patch('notificacoes.services.twilio_service.twilio_service.send_pest_detection_alert'):
+            return self.client.post(*args, **kwargs)
+
+    def test_multipart_upload(self):
+        # Formato enviado pelo frontend (apiService.uploadFile)
+        upload = SimpleUploadedFile('folha.jpg', _encode(_leaf_image(), 'JPEG'), content_type='image/jpeg')
+        response = self._post_with_stub('/api/pragas/detectar/', {
+            'file': upload, 'cultura': 'tomate', 'localizacao': 'Sofala',
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['crop_type'], 'tomate')
+        detection = DeteccaoPraga.objects.get(id=response.data['detection_id'])
+        self.assertEqual(detection.localizacao, 'Sofala')
+        self.assertTrue(detection.imagem.name.endswith('.jpg'))
+
+    def test_binary_upload(self):
+        image = _encode(_leaf_image(), 'PNG')
+        response = self._post_with_stub(
+            '/api/pragas/detectar/?crop_type=milho', image, content_type='image/png'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        detection = DeteccaoPraga.objects.get(id=response.data['detection_id'])
+        self.assertEqual(detection.imagem_sha256, image_dedup.fingerprint(image).sha256)
+
+    @override_settings(PEST_UPLOAD_MAX_BYTES=1024)
+    def test_upload_too_large(self):
+        upload = SimpleUploadedFile('folha.png', _encode(_leaf_image()), content_type='image/png')
+        response = self.client.post('/api/pragas/detectar/', {'image': upload}, format='multipart')
+        self.assertEqual(response.status_code, 413)
+
+
+class BatchDetectionViewTests(TestCase):
+    """Levantamento de campo: várias imagens analisadas em paralelo"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = InferenceStubServer(pest_latency=STUB_LATENCY, disease_latency=STUB_LATENCY).start()
+        cls.media_root = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='extensionista', password='x', localizacao='Manica')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.async_client = AsyncClient()
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def _photos(self, count):
+        return [
+            SimpleUploadedFile(f'foto_{i}.png', _encode(_leaf_image(rotate=i * 7)), content_type='image/png')
+            for i in range(count)
+        ]
+
+    @contextlib.contextmanager
+    def _patched(self):
+        with override_settings(MEDIA_ROOT=self.media_root), \
+                mock.patch.dict(os.environ, {'PEST_ANALYSIS_CACHE_ENABLED': 'false'}), \
+                mock.patch.object(huggingface_service, 'base_url', self.stub.url), \
+                mock.patch('notificacoes.services.twilio_service.twilio_service.send_pest_detection_alert') as alert:
+            yield alert
+
+    def _post(self, data, url='/api/pragas/detectar/lote/', **extra):
+        with self._patched() as alert:
+            response = self.client.post(url, data, format='multipart', **extra)
+        response.alert = alert
+        return response
+
+    async def _read_events(self, chunks):
+        return [json.loads(chunk.decode()[len('data: '):]) async for chunk in chunks]
+
+    def test_images_analyzed_in_parallel(self):
+        photos = self._photos(6)
+        requests_before = self.stub.request_count
+        start = time.perf_counter()
+        response = self._post({'images': photos, 'cultura': 'milho'})
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['index'] for r in response.data['results']], list(range(6)))
+        self.assertEqual(response.data['results'][2]['filename'], 'foto_2.png')
+        self.assertEqual(self.stub.request_count - requests_before, 12)
+        # Sequencialmente seriam 6 x STUB_LATENCY
+        self.assertLess(elapsed, STUB_LATENCY * 3)
+
+        field = response.data['field']
+        self.assertEqual(field['images_analyzed'], 6)
+        self.assertEqual(field['images_with_pests'], 6)
+        self.assertEqual(field['pests'][0]['name'], 'Lagarta')
+        self.assertEqual(DeteccaoPraga.objects.filter(usuario=self.user).count(), 6)
+        # Um único alerta para o levantamento inteiro
+        response.alert.assert_called_once()
+
+    def test_duplicate_images_analyzed_once(self):
+        image = _encode(_leaf_image())
+        photos = [SimpleUploadedFile(f'foto_{i}.png', image, content_type='image/png') for i in range(3)]
+        requests_before = self.stub.request_count
+        response = self._post({'images': photos})
+
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(self.stub.request_count - requests_before, 2)
+
+    def test_zip_upload(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('campo/foto_a.jpg', _encode(_leaf_image(), 'JPEG'))
+            zf.writestr('campo/foto_b.png', _encode(_leaf_image(rotate=90)))
+            zf.writestr('campo/notas.txt', 'milho, talhão 3')
+            zf.writestr('__MACOSX/campo/._foto_a.jpg', b'')
+        upload = SimpleUploadedFile('campo.zip', archive.getvalue(), content_type='application/zip')
+        response = self._post({'file': upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['filename'] for r in response.data['results']], ['campo/foto_a.jpg', 'campo/foto_b.png'])
+
+    async def test_stream_partial_results(self):
+        with self._patched():
+            response = await self.async_client.post(
+                '/api/pragas/detectar/lote/?stream=true', {'images': self._photos(3)}, headers=self.auth
+            )
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            events = await self._read_events(response.streaming_content)
+
+        self.assertEqual([e['type'] for e in events], ['result', 'result', 'result', 'done'])
+        self.assertEqual(sorted(e['index'] for e in events[:3]), [0, 1, 2])
+        self.assertEqual(events[-1]['field']['images_analyzed'], 3)
+
+    async def test_stream_sends_each_result_when_ready(self):
+        # Só a primeira imagem termina; as outras esperam por `release`
+        release = threading.Event()
+        calls = itertools.count()
+        analyze = huggingface_service.analyze_crop_health
+
+        def analyze_first_only(source, crop_type, fingerprint):
+            if next(calls):
+                release.wait(timeout=10)
+            return analyze(source, crop_type, fingerprint)
+
+        try:
+            with self._patched(), mock.patch.object(huggingface_service, 'analyze_crop_health', analyze_first_only):
+                response = await self.async_client.post(
+                    '/api/pragas/detectar/lote/?stream=true', {'images': self._photos(3)}, headers=self.auth
+                )
+                events = response.streaming_content.__aiter__()
+                first = await asyncio.wait_for(events.__anext__(), timeout=5)
+                self.assertEqual(json.loads(first.decode()[len('data: '):])['type'], 'result')
+                self.assertFalse(release.is_set())
+
+                release.set()
+                rest = await self._read_events(events)
+        finally:
+            release.set()
+        self.assertEqual([e['type'] for e in rest], ['result', 'result', 'done'])
+
+    def test_validation(self):
+        self.assertEqual(self._post({'cultura': 'milho'}).status_code, 400)
+        with override_settings(PEST_BATCH_MAX_IMAGES=2):
+            self.assertEqual(self._post({'images': self._photos(3)}).status_code, 400)
+
+
+class _WebhookReceiver(ThreadingHTTPServer):
+    """Servidor local que regista os POSTs recebidos (path, cabeçalhos, corpo)"""
+
+    def __init__(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                receiver.requests.append((self.path, dict(self.headers), body))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.requests = []
+        self.port = self.server_port
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class AsyncDetectionTests(TestCase):
+    """Upload com ?async=true: 202 imediato, análise no job, estado por polling"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = InferenceStubServer(pest_latency=STUB_LATENCY).start()
+        cls.media_root = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='agricultor', password='x', localizacao='Nampula')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Os jobs correm aqui, na thread do teste (a transação do TestCase não é visível noutras threads)
+        self.submitted = []
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        for patcher in (
+            mock.patch.object(huggingface_service, 'base_url', self.stub.url),
+            mock.patch.object(detection_jobs, 'submit', lambda detection_id, fp=None: self.submitted.append((detection_id, fp))),
+            mock.patch('notificacoes.services.twilio_service.twilio_service.send_pest_detection_alert'),
+            mock.patch.object(detection_jobs, '_resolve', self._resolve),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.dns = {'cliente.example': ['93.184.216.34'], 'interno.example': ['10.0.0.5'],
+                    'misto.example': ['93.184.216.34', '127.0.0.1']}
+        self.requests_before = self.stub.request_count
+
+    def _resolve(self, hostname):
+        # DNS de teste; IPs literais resolvem para eles próprios
+        try:
+            return [ipaddress.ip_address(hostname)]
+        except ValueError:
+            return [ipaddress.ip_address(ip) for ip in self.dns.get(hostname, [])]
+
+    @contextlib.contextmanager
+    def _webhook_post(self, **kwargs):
+        """session.post dos webhooks (a sessão real, com o adapter, é criada na mesma)"""
+        make_session = detection_jobs._webhook_session
+
+        def session(url):
+            webhook_session = make_session(url)
+            webhook_session.post = post
+            return webhook_session
+
+        post = mock.Mock(**kwargs)
+        with mock.patch.object(detection_jobs, '_webhook_session', session):
+            yield post
+
+    def _upload(self, **params):
+        upload = SimpleUploadedFile('folha.jpg', _encode(_leaf_image(), 'JPEG'), content_type='image/jpeg')
+        return self.client.post('/api/pragas/detectar/?async=true', dict({'file': upload, 'cultura': 'milho'}, **params),
+                                format='multipart')
+
+    def _run_jobs(self):
+        for detection_id, fp in self.submitted:
+            detection_jobs.run_detection(detection_id, fp)
+
+    def test_upload_returns_before_analysis(self):
+        start = time.perf_counter()
+        response = self._upload()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(response.status_code, 202)
+        self.assertLess(elapsed, STUB_LATENCY)
+        self.assertEqual(self.stub.request_count, self.requests_before)
+        self.assertEqual(response.data['status'], 'pendente')
+        self.assertTrue(response['Location'].endswith(f"/api/pragas/deteccoes/{response.data['job_id']}/"))
+
+        status_response = self.client.get(response['Location'])
+        self.assertEqual(status_response.data['status'], 'pendente')
+        self.assertEqual(status_response['Retry-After'], '2')
+
+    def test_result_stored_and_notified(self):
+        from notificacoes.models import Notificacao
+
+        job_id = self._upload().data['job_id']
+        self._run_jobs()
+
+        response = self.client.get(f'/api/pragas/deteccoes/{job_id}/')
+        self.assertEqual(response.data['status'], 'concluida')
+        self.assertEqual(response.data['result']['pest_detection']['pests_detected'][0]['name'], 'Lagarta')
+        detection = DeteccaoPraga.objects.get(id=job_id)
+        self.assertAlmostEqual(detection.confianca_deteccao, 0.91)
+        self.assertIsNotNone(detection.data_conclusao)
+        notification = Notificacao.objects.get(usuario=self.user, canal='app')
+        self.assertEqual(notification.metadados['detection_id'], job_id)
+
+    def test_job_runs_once(self):
+        self._upload()
+        detection_id, fp = self.submitted[0]
+        self.assertTrue(detection_jobs.run_detection(detection_id, fp))
+        self.assertFalse(detection_jobs.run_detection(detection_id, fp))
+        self.assertEqual(self.stub.request_count - self.requests_before, 2)
+
+    def test_webhook(self):
+        with override_settings(PEST_JOB_WEBHOOK_SECRET='segredo'), \
+                self._webhook_post(return_value=mock.Mock(is_redirect=False, status_code=200)) as post, \
+                self.assertNoLogs('pragas.services.detection_jobs', 'ERROR'):
+            job_id = self._upload(webhook_url='https://cliente.example/hooks/lura').data['job_id']
+            self._run_jobs()
+
+        args, kwargs = post.call_args
+        # Ligação ao IP validado; Host (e SNI/certificado, no adapter) do nome original
+        self.assertEqual(args[0], 'https://93.184.216.34/hooks/lura')
+        self.assertEqual(kwargs['headers']['Host'], 'cliente.example')
+        self.assertFalse(kwargs['allow_redirects'])
+        body = json.loads(kwargs['data'])
+        self.assertEqual((body['job_id'], body['status']), (job_id, 'concluida'))
+        self.assertTrue(kwargs['headers']['X-Lura-Signature'].startswith('sha256='))
+
+    def test_invalid_webhook_rejected(self):
+        self.assertEqual(self._upload(webhook_url='ftp://cliente.example/x').status_code, 400)
+        with override_settings(PEST_JOB_WEBHOOK_ALLOWED_HOSTS=['hooks.example']):
+            self.assertEqual(self._upload(webhook_url='http://169.254.169.254/').status_code, 400)
+        self.assertFalse(DeteccaoPraga.objects.exists())
+
+    def test_internal_webhook_hosts_rejected(self):
+        # Sem lista de hosts permitidos, só endereços públicos são aceites
+        for url in ('http://127.0.0.1:8000/admin/', 'http://localhost/', 'http://169.254.169.254/latest/meta-data/',
+                    'http://10.0.0.5/', 'http://192.168.1.1/', 'http://[::1]/', 'http://[fd00::1]/',
+                    'http://0.0.0.0/', 'http://interno.example/hook', 'http://misto.example/hook',
+                    'http://desconhecido.example/hook'):
+            with self.subTest(url=url):
+                response = self._upload(webhook_url=url)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('webhook_url', response.data['erro'])
+        self.assertFalse(DeteccaoPraga.objects.exists())
+
+    def test_webhook_not_sent_if_host_now_internal(self):
+        with self._webhook_post() as post:
+            job_id = self._upload(webhook_url='https://cliente.example/hooks/lura').data['job_id']
+            # DNS rebinding: entre o upload e o envio o host passa a apontar para a rede interna
+            self.dns['cliente.example'] = ['127.0.0.1']
+            self._run_jobs()
+        post.assert_not_called()
+        self.assertEqual(DeteccaoPraga.objects.get(id=job_id).status, 'concluida')
+
+    def test_webhook_not_sent_to_rebound_address(self):
+        # O DNS responde com um IP público à validação e com a rede interna a seguir
+        # (TTL 0): o envio tem de ir para o IP validado, sem voltar a resolver o nome
+        receiver = _WebhookReceiver()
+        lookups = []
+        real_getaddrinfo = socket.getaddrinfo
+
+        def rebinding_getaddrinfo(host, port, *args, **kwargs):
+            lookups.append(host)
+            if host == 'cliente.example':
+                return real_getaddrinfo('127.0.0.1', port, *args, **kwargs)
+            raise socket.gaierror('sem rede nos testes')
+
+        url = f'http://cliente.example:{receiver.port}/hooks/lura'
+        try:
+            self._upload(webhook_url=url)
+            with mock.patch('socket.getaddrinfo', rebinding_getaddrinfo), \
+                    self.assertLogs('pragas.services.detection_jobs', 'ERROR'):
+                self._run_jobs()
+        finally:
+            receiver.stop()
+        self.assertEqual(receiver.requests, [])
+        self.assertNotIn('cliente.example', lookups)
+        self.assertIn('93.184.216.34', lookups)
+
+    def test_webhook_sent_with_original_host_header(self):
+        receiver = _WebhookReceiver()
+        self.dns['cliente.example'] = ['127.0.0.1']
+        try:
+            with mock.patch.object(detection_jobs, '_is_public', return_value=True):
+                job_id = self._upload(webhook_url=f'http://cliente.example:{receiver.port}/hooks/lura').data['job_id']
+                self._run_jobs()
+        finally:
+            receiver.stop()
+        [(path, headers, body)] = receiver.requests
+        self.assertEqual(path, '/hooks/lura')
+        self.assertEqual(headers['Host'], f'cliente.example:{receiver.port}')
+        self.assertEqual(json.loads(body)['job_id'], job_id)
+
+    def test_pinned_adapter_checks_original_hostname(self):
+        url, host = detection_jobs._pinned_request('https://cliente.example:8443/x?y=1',
+                                                   ipaddress.ip_address('2606:2800:220:1::1'))
+        self.assertEqual((url, host), ('https://[2606:2800:220:1::1]:8443/x?y=1', 'cliente.example:8443'))
+        adapter = detection_jobs._PinnedAdapter('cliente.example')
+        self.assertEqual(adapter.poolmanager.connection_pool_kw['server_hostname'], 'cliente.example')
+        self.assertEqual(adapter.poolmanager.connection_pool_kw['assert_hostname'], 'cliente.example')
+
+    def test_webhook_redirect_not_followed(self):
+        redirect = mock.Mock(is_redirect=True, status_code=302)
+        with self._webhook_post(return_value=redirect) as post, \
+                self.assertLogs('pragas.services.detection_jobs', 'ERROR') as logs:
+            self._upload(webhook_url='https://cliente.example/hooks/lura')
+            self._run_jobs()
+        self.assertEqual(post.call_count, 1)
+        self.assertIn('redirect', logs.output[0])
+
+    def test_stale_job_requeued(self):
+        job_id = self._upload().data['job_id']
+        DeteccaoPraga.objects.filter(id=job_id).update(
+            status='processando', data_inicio_processamento=timezone.now() - timedelta(hours=1)
+        )
+        self.submitted.clear()
+
+        response = self.client.get(f'/api/pragas/deteccoes/{job_id}/')
+        self.assertEqual(response.data['status'], 'pendente')
+        self.assertEqual([detection_id for detection_id, _ in self.submitted], [job_id])
+
+    def test_sweep_requeues_stale_jobs_without_polling(self):
+        stale_id = self._upload().data['job_id']
+        lost_id = self._upload().data['job_id']
+        fresh_id = self._upload().data['job_id']
+        old = timezone.now() - timedelta(hours=1)
+        DeteccaoPraga.objects.filter(id=stale_id).update(status='processando', data_inicio_processamento=old)
+        DeteccaoPraga.objects.filter(id=lost_id).update(data_deteccao=old)
+        DeteccaoPraga.objects.filter(id=fresh_id).update(status='processando', data_inicio_processamento=timezone.now())
+        self.submitted.clear()
+
+        with mock.patch.object(detection_jobs, 'wait_for_jobs') as wait:
+            call_command('retomar_deteccoes', stdout=io.StringIO())
+        wait.assert_called_once()
+        self.assertCountEqual([detection_id for detection_id, _ in self.submitted], [stale_id, lost_id])
+        self.assertEqual(DeteccaoPraga.objects.get(id=stale_id).status, 'pendente')
+        self.assertEqual(DeteccaoPraga.objects.get(id=fresh_id).status, 'processando')
+
+        # Já repostos: a varredura seguinte não os volta a agendar
+        self.submitted.clear()
+        self.assertEqual(detection_jobs.requeue_stale_jobs(), [lost_id])
+
+    def test_other_users_job_not_visible(self):
+        job_id = self._upload().data['job_id']
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='outro', password='x'))
+        self.assertEqual(other.get(f'/api/pragas/deteccoes/{job_id}/').status_code, 404)
+
+
+class ImageDerivativesTests(SimpleTestCase):
+    """Versões thumb/medium/webp geradas uma vez a partir do original no storage"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def _store(self, image_bytes, name='campo_fotos/folha.jpg'):
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        return default_storage.save(name, ContentFile(image_bytes))
+
+    def test_variants_generated(self):
+        from django.core.files.storage import default_storage
+
+        name = self._store(_encode(_leaf_image().resize((3000, 2000)), 'JPEG', quality=95))
+        derivados = image_derivatives.generate(name)
+
+        self.assertEqual(derivados['source'], name)
+        expected = {'thumb': ('JPEG', 320), 'medium': ('JPEG', 1024), 'webp': ('WEBP', 1024)}
+        for variant, (fmt, size) in expected.items():
+            with default_storage.open(derivados[variant]) as f:
+                image = Image.open(f)
+                self.assertEqual((image.format, max(image.size)), (fmt, size))
+        self.assertLess(default_storage.size(derivados['thumb']) * 10, default_storage.size(name))
+
+    def test_exif_orientation_applied(self):
+        image = _leaf_image().resize((400, 300))
+        exif = image.getexif()
+        exif[0x0112] = 6  # rodada 90° no telemóvel
+        name = self._store(_encode(image, 'JPEG', exif=exif))
+
+        derivados = image_derivatives.generate(name)
+        with open(os.path.join(self.media_root, derivados['thumb']), 'rb') as f:
+            self.assertEqual(Image.open(f).size, (240, 320))
+
+    def test_existing_derivatives_reused(self):
+        name = self._store(_encode(_leaf_image(), 'JPEG'))
+        image_derivatives.generate(name)
+        with mock.patch('pragas.services.image_derivatives.default_storage.save') as save:
+            image_derivatives.generate(name)
+        save.assert_not_called()
+
+    def test_urls_only_for_current_image(self):
+        detection = DeteccaoPraga(imagem='deteccoes_pragas/a.jpg')
+        self.assertIsNone(image_derivatives.urls(detection))
+
+        detection.imagem_derivados = {'source': 'deteccoes_pragas/a.jpg', 'thumb': 'derivados/deteccoes_pragas/a_thumb.jpg'}
+        self.assertEqual(image_derivatives.urls(detection), {'thumb': '/media/derivados/deteccoes_pragas/a_thumb.jpg'})
+        detection.imagem.name = 'deteccoes_pragas/b.jpg'
+        self.assertIsNone(image_derivatives.urls(detection))
+
+
+class PestCatalogueTests(TestCase):
+    """Catálogo pré-calculado: sem N+1, 304 por ETag/Last-Modified, invalidado por sinais"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.milho = Cultura.objects.create(nome='Milho')
+        self.tomate = Cultura.objects.create(nome='Tomate')
+        for i in range(5):
+            praga = TipoPraga.objects.create(nome=f'Praga {i}', tipo='inseto', descricao='d', sintomas='s')
+            praga.culturas_afetadas.add(self.milho, self.tomate)
+
+    def test_queries_prefetched_and_cached(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/pragas/listar/')
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(response.data[0]['culturas_afetadas'], ['Milho', 'Tomate'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/pragas/listar/').data, response.data)
+
+    def test_not_modified(self):
+        response = self.client.get('/api/pragas/listar/')
+
+        cached = self.client.get('/api/pragas/listar/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        since = self.client.get('/api/pragas/listar/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+    def test_last_modified_moves_only_when_content_changes(self):
+        clock = mock.Mock()
+        with mock.patch.object(pest_catalogue, 'time', clock):
+            clock.time.return_value = 1_700_000_000
+            last_modified = self.client.get('/api/pragas/listar/')['Last-Modified']
+
+            # Entradas e versão perdidas (cache limpo, worker reiniciado) mais tarde: o conteúdo é o mesmo
+            clock.time.return_value += 3600
+            cache.delete(pest_catalogue._VERSION_KEY)
+            response = self.client.get('/api/pragas/listar/', HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(self.client.get('/api/pragas/listar/')['Last-Modified'], last_modified)
+
+            clock.time.return_value += 3600
+            TipoPraga.objects.filter(nome='Praga 0').update(nome='Lagarta')
+            pest_catalogue.invalidate()
+            response = self.client.get('/api/pragas/listar/', HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['Last-Modified'], last_modified)
+
+    def test_filter_by_cultura(self):
+        praga = TipoPraga.objects.create(nome='Broca', tipo='inseto', descricao='d', sintomas='s')
+        praga.culturas_afetadas.add(self.tomate)
+
+        self.assertEqual(len(self.client.get('/api/pragas/listar/', {'cultura': 'milho'}).data), 5)
+        tomate = self.client.get('/api/pragas/listar/', {'cultura': 'Tomate'})
+        self.assertEqual(len(tomate.data), 6)
+        self.assertNotEqual(tomate['ETag'], self.client.get('/api/pragas/listar/', {'cultura': 'milho'})['ETag'])
+
+    def test_invalidated_by_admin_changes(self):
+        etag = self.client.get('/api/pragas/listar/')['ETag']
+
+        praga = TipoPraga.objects.get(nome='Praga 0')
+        praga.culturas_afetadas.remove(self.tomate)
+        response = self.client.get('/api/pragas/listar/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['culturas_afetadas'], ['Milho'])
+
+        praga.nome = 'Lagarta do cartucho'
+        praga.save()
+        self.assertEqual(self.client.get('/api/pragas/listar/').data[0]['nome'], 'Lagarta do cartucho')
+
+        self.milho.delete()
+        self.assertEqual(self.client.get('/api/pragas/listar/').data[0]['culturas_afetadas'], [])
+
+
+class PreprocessImageTests(SimpleTestCase):
+    def test_file_handle_matches_bytes(self):
+        service = HuggingFaceService()
+        image = _encode(_leaf_image().resize((2400, 1800)), 'JPEG')
+        processed = service._preprocess_image(io.BytesIO(image))
+
+        self.assertEqual(processed, service._preprocess_image(image))
+        self.assertEqual(Image.open(io.BytesIO(processed)).size, (1024, 768))
+
+
+@unittest.skipUnless(HAS_ONNX, 'onnxruntime/onnx não instalados')
+class LocalInferenceTests(SimpleTestCase):
+    """Backend ONNX local: mesmo formato de resultado, sem chamadas HTTP"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.model_dir = tempfile.mkdtemp()
+        cls.stub = InferenceStubServer().start()
+        cls.env = {
+            'PEST_INFERENCE_BACKEND': 'onnx',
+            'PEST_ONNX_PEST_MODEL': write_stub_onnx_model(
+                os.path.join(cls.model_dir, 'pragas.onnx'), ['caterpillar', 'aphid', 'leaf'], input_size=64),
+            'PEST_ONNX_DISEASE_MODEL': write_stub_onnx_model(
+                os.path.join(cls.model_dir, 'doencas.onnx'), ['leaf rust', 'healthy'], input_size=64),
+            'PEST_ONNX_BATCH_WAIT_MS': '50',
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+        shutil.rmtree(cls.model_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.dict(os.environ, self.env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        local_inference.reset_backend()
+        self.addCleanup(local_inference.reset_backend)
+        self.service = HuggingFaceService()
+        self.service.base_url = self.stub.url
+
+    def test_output_contract(self):
+        backend = local_inference.get_backend()
+        result = backend.predict('pest_detection', _encode(_leaf_image()))
+
+        self.assertEqual(result[0]['label'], 'caterpillar')
+        self.assertEqual({tuple(sorted(r)) for r in result}, {('label', 'score')})
+        self.assertAlmostEqual(sum(r['score'] for r in result), 1.0, places=4)
+
+    def test_analysis_without_http(self):
+        requests_before = self.stub.request_count
+        result = self.service.analyze_crop_health(_sample_image_b64(), 'milho')
+
+        self.assertEqual(self.stub.request_count, requests_before)
+        self.assertEqual([p['name'] for p in result['pest_detection']['pests_detected']], ['Lagarta'])
+        self.assertEqual(result['disease_detection']['diseases_detected'][0]['name'], 'Ferrugem')
+
+    def test_concurrent_requests_are_batched(self):
+        backend = local_inference.get_backend()
+        classifier = backend.classifiers['pest_detection']
+        images = [_encode(_leaf_image(rotate=angle)) for angle in (0, 10, 20, 30)]
+
+        with mock.patch.object(classifier, 'run', wraps=classifier.run) as run:
+            with ThreadPoolExecutor(max_workers=4) as workers:
+                results = list(workers.map(lambda image: backend.predict('pest_detection', image), images))
+
+        self.assertEqual(len(results), 4)
+        self.assertLess(run.call_count, 4)
+        self.assertEqual(sum(len(call.args[0]) for call in run.call_args_list), 4)
+
+    def test_missing_models_fall_back_to_api(self):
+        with mock.patch.dict(os.environ, {'PEST_ONNX_PEST_MODEL': '/nao/existe.onnx'}):
+            local_inference.reset_backend()
+            self.assertIsNone(local_inference.get_backend())
+            requests_before = self.stub.request_count
+            self.service.analyze_crop_health(_sample_image_b64(), 'milho')
+        self.assertEqual(self.stub.request_count - requests_before, 2)
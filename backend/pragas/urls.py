@@ -2,6 +2,8 @@ from django.urls import path
 from . import views
 from .api_views import (
     detectar_praga_view,
+    detectar_pragas_lote_view,
+    deteccao_status_view,
     listar_pragas_view, 
     historico_deteccoes_view,
     gerar_recomendacao_view
@@ -11,6 +13,8 @@ app_name = 'pragas'
 
 urlpatterns = [
     path('detectar/', detectar_praga_view, name='detectar-praga'),
+    path('detectar/lote/', detectar_pragas_lote_view, name='detectar-pragas-lote'),
+    path('deteccoes/<int:deteccao_id>/', deteccao_status_view, name='deteccao-status'),
     path('listar/', listar_pragas_view, name='listar-pragas'),
     path('historico/', historico_deteccoes_view, name='historico-deteccoes'),
     path('recomendacao/', gerar_recomendacao_view, name='gerar-recomendacao'),
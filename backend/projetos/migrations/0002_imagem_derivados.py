@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projetos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='costtracking',
+            name='nota_fiscal_derivados',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='fieldphoto',
+            name='imagem_derivados',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='foto_capa_derivados',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
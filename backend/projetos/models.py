@@ -19,6 +19,7 @@ class Project(models.Model):
     ], default='planejamento')
     localizacao_gps = models.CharField(max_length=100, blank=True)
     foto_capa = models.ImageField(upload_to='projetos/', null=True, blank=True)
+    foto_capa_derivados = models.JSONField(default=dict, blank=True)  # thumb/medium/webp
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -66,6 +67,7 @@ class FieldPhoto(models.Model):
     """Fotos do campo com análise IA"""
     atividade = models.ForeignKey(FieldActivity, on_delete=models.CASCADE, related_name='fotos')
     imagem = models.ImageField(upload_to='campo_fotos/')
+    imagem_derivados = models.JSONField(default=dict, blank=True)  # thumb/medium/webp
     analise_ia_json = models.JSONField(default=dict)  # {altura_cm, saude, pragas_detectadas}
     gps_coords = models.CharField(max_length=100, blank=True)
     data_captura = models.DateTimeField(auto_now_add=True)
@@ -86,3 +88,4 @@ class CostTracking(models.Model):
     valor_real = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     data = models.DateField()
     nota_fiscal = models.ImageField(upload_to='notas_fiscais/', null=True, blank=True)
+    nota_fiscal_derivados = models.JSONField(default=dict, blank=True)  # thumb/medium/webp
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from pragas.services import image_derivatives
 from .models import Project, ProjectDashboard, FieldActivity, FieldPhoto, CostTracking
 
 
@@ -10,6 +11,10 @@ class DashboardSerializer(serializers.ModelSerializer):
 
 class ProjectSerializer(serializers.ModelSerializer):
     dashboard = DashboardSerializer(read_only=True)
+    foto_capa_derivados = serializers.SerializerMethodField()
+
+    def get_foto_capa_derivados(self, obj):
+        return image_derivatives.urls(obj, 'foto_capa')
     
     class Meta:
         model = Project
@@ -22,7 +27,11 @@ class FieldActivitySerializer(serializers.ModelSerializer):
     
     def get_fotos(self, obj):
         try:
-            return [{'id': foto.id, 'imagem': foto.imagem.url} for foto in obj.fotos.all()]
+            # Derivados (thumb/medium/webp) em vez da foto original nas listas
+            return [
+                {'id': foto.id, 'imagem': foto.imagem.url, 'derivados': image_derivatives.urls(foto)}
+                for foto in obj.fotos.all()
+            ]
         except:
             return []
     
@@ -34,11 +43,15 @@ class FieldActivitySerializer(serializers.ModelSerializer):
 
 class CostTrackingSerializer(serializers.ModelSerializer):
     variacao_percent = serializers.SerializerMethodField()
+    nota_fiscal_derivados = serializers.SerializerMethodField()
     
     def get_variacao_percent(self, obj):
         if obj.valor_orcado == 0:
             return 0
         return ((obj.valor_real - obj.valor_orcado) / obj.valor_orcado) * 100
+
+    def get_nota_fiscal_derivados(self, obj):
+        return image_derivatives.urls(obj, 'nota_fiscal')
     
     class Meta:
         model = CostTracking
@@ -46,6 +59,11 @@ class CostTrackingSerializer(serializers.ModelSerializer):
 
 
 class FieldPhotoSerializer(serializers.ModelSerializer):
+    imagem_derivados = serializers.SerializerMethodField()
+
+    def get_imagem_derivados(self, obj):
+        return image_derivatives.urls(obj)
+
     class Meta:
         model = FieldPhoto
         fields = '__all__'
@@ -1,3 +1,74 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from pragas.services import image_derivatives
+from .models import FieldActivity, FieldPhoto, Project, ProjectDashboard
+from .views import FieldPhotoViewSet
+
+User = get_user_model()
+
+
+class FieldPhotoDerivativesTests(TestCase):
+    """Fotos do campo: derivados gerados depois do upload e expostos no dashboard"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.user = User.objects.create_user(username='agricultor', password='x')
+        self.project = Project.objects.create(
+            usuario=self.user, nome='Milho 2025', cultura='Milho', area_hectares=2,
+            data_plantio=date(2025, 1, 10), data_colheita_estimada=date(2025, 5, 10), orcamento_total=1000
+        )
+        ProjectDashboard.objects.create(project=self.project, fase_atual='plantio')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _upload_photo(self):
+        output = io.BytesIO()
+        Image.linear_gradient('L').resize((2400, 1800)).convert('RGB').save(output, format='JPEG')
+        upload = SimpleUploadedFile('campo.jpg', output.getvalue(), content_type='image/jpeg')
+
+        # O passo em background corre aqui (a transação do teste não é visível noutras threads)
+        with mock.patch.object(image_derivatives, '_derivatives_executor') as executor, \
+                self.captureOnCommitCallbacks(execute=True):
+            view = FieldPhotoViewSet.as_view({'post': 'create'})
+            request = APIRequestFactory().post('/api/projetos/fotos/', {
+                'project': self.project.id, 'imagem': upload
+            }, format='multipart')
+            force_authenticate(request, self.user)
+            response = view(request)
+        self.assertEqual(response.status_code, 201)
+        _, model, pk, field_name, name = executor.submit.call_args.args
+        image_derivatives.generate_for(model, pk, field_name, name)
+        return FieldPhoto.objects.get(pk=pk)
+
+    def test_derivatives_in_dashboard(self):
+        photo = self._upload_photo()
+        self.assertEqual(photo.imagem_derivados['source'], photo.imagem.name)
+
+        response = self.client.get(f'/api/projetos/{self.project.id}/dashboard/')
+        foto = response.data['atividades_recentes'][0]['fotos'][0]
+        self.assertEqual(set(foto['derivados']), {'thumb', 'medium', 'webp'})
+        self.assertTrue(foto['derivados']['webp'].endswith('_webp.webp'))
+
+    def test_dashboard_before_derivatives(self):
+        activity = FieldActivity.objects.create(project=self.project, tipo='inspecao', descricao='x', data=date.today())
+        FieldPhoto.objects.create(atividade=activity, imagem='campo_fotos/antiga.jpg')
+
+        response = self.client.get(f'/api/projetos/{self.project.id}/dashboard/')
+        foto = response.data['atividades_recentes'][0]['fotos'][0]
+        self.assertIsNone(foto['derivados'])
+        self.assertEqual(foto['imagem'], '/media/campo_fotos/antiga.jpg')
@@ -3,6 +3,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
+from pragas.services import image_derivatives
 from .models import Project, ProjectDashboard, FieldActivity, CostTracking, FieldPhoto
 from .serializers import (ProjectSerializer, DashboardSerializer, 
                           FieldActivitySerializer, CostTrackingSerializer, FieldPhotoSerializer)
@@ -23,6 +24,10 @@ class ProjectViewSet(viewsets.ModelViewSet):
             fase_atual='plantio',
             dias_restantes=(project.data_colheita_estimada - project.data_plantio).days
         )
+        image_derivatives.schedule(project, 'foto_capa')
+
+    def perform_update(self, serializer):
+        image_derivatives.schedule(serializer.save(), 'foto_capa')
     
     @action(detail=True, methods=['get'])
     def dashboard(self, request, pk=None):
@@ -34,7 +39,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
             'project': ProjectSerializer(project).data,
             'dashboard': DashboardSerializer(dashboard).data,
             'atividades_recentes': FieldActivitySerializer(
-                project.atividades.all()[:5], many=True
+                project.atividades.prefetch_related('fotos')[:5], many=True
             ).data,
             'custos': CostTrackingSerializer(
                 project.custos.all(), many=True
@@ -51,7 +56,7 @@ class FieldActivityViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return FieldActivity.objects.filter(
             project__usuario=self.request.user
-        )
+        ).prefetch_related('fotos')
     
     def create(self, request, *args, **kwargs):
         # Validar que o projeto pertence ao usuário
@@ -78,6 +83,12 @@ class CostTrackingViewSet(viewsets.ModelViewSet):
         return CostTracking.objects.filter(
             project__usuario=self.request.user
         )
+
+    def perform_create(self, serializer):
+        image_derivatives.schedule(serializer.save(), 'nota_fiscal')
+
+    def perform_update(self, serializer):
+        image_derivatives.schedule(serializer.save(), 'nota_fiscal')
     
     def create(self, request, *args, **kwargs):
         # Validar que o projeto pertence ao usuário
@@ -103,6 +114,12 @@ class FieldPhotoViewSet(viewsets.ModelViewSet):
         return FieldPhoto.objects.filter(
             atividade__project__usuario=self.request.user
         )
+
+    def perform_create(self, serializer):
+        image_derivatives.schedule(serializer.save())
+
+    def perform_update(self, serializer):
+        image_derivatives.schedule(serializer.save())
     
     def create(self, request, *args, **kwargs):
         # Criar atividade automática para a foto
@@ -17,6 +17,8 @@ interface Conversation {
   id: string;
   title: string;
   messages: ChatMessage[];
+  messagesLoaded?: boolean; // a listagem não traz mensagens; carregadas ao abrir a conversa
+  messageCount?: number;
   createdAt: Date;
   updatedAt: Date;
 }
@@ -177,32 +179,32 @@ function ChatbotPageContent() {
       
       console.log(`✅ [LOAD] Recebidas ${backendConversations.length} conversas do backend`);
       
-      // Converter formato backend para formato frontend
+      // Converter formato backend para formato frontend (a listagem é leve:
+      // apenas contagem e preview; as mensagens vêm de /messages/ ao abrir)
       const formattedConversations: Conversation[] = backendConversations.map((conv: any) => ({
         id: conv.id.toString(),
         title: conv.title || 'Nova Conversa',
-        messages: conv.messages?.map((msg: any) => ({
-          id: msg.id,
-          role: msg.role,
-          content: msg.content,
-          content_html: msg.metadata?.content_html,
-          timestamp: msg.timestamp ? new Date(msg.timestamp) : new Date()
-        })) || [],
+        messages: [],
+        messagesLoaded: false,
+        messageCount: conv.message_count ?? 0,
         createdAt: new Date(conv.created_at),
         updatedAt: new Date(conv.updated_at)
       }));
 
-      console.log(`💾 [LOAD] Conversas formatadas:`, formattedConversations.map(c => ({id: c.id, title: c.title, msgs: c.messages.length})));
-      setConversations(formattedConversations);
+      console.log(`💾 [LOAD] Conversas formatadas:`, formattedConversations.map(c => ({id: c.id, title: c.title, msgs: c.messageCount})));
       
       // Carregar última conversa ativa ou criar nova
       if (formattedConversations.length > 0) {
         const lastId = localStorage.getItem('agroalerta_active_conversation');
         const activeConv = formattedConversations.find(c => c.id === lastId) || formattedConversations[0];
         console.log(`🎯 [LOAD] Ativando conversa: ${activeConv.id}`);
+        activeConv.messages = await loadConversationMessages(activeConv.id);
+        activeConv.messagesLoaded = true;
+        setConversations(formattedConversations);
         setActiveConversationId(activeConv.id);
         setMessages(activeConv.messages);
       } else {
+        setConversations(formattedConversations);
         // Se não houver conversas, criar uma nova
         console.log('➕ [LOAD] Nenhuma conversa existente, criando nova...');
         await createNewConversationInBackend();
@@ -214,6 +216,45 @@ function ChatbotPageContent() {
     }
   };
 
+  /**
+   * Carrega as mensagens de uma conversa, página a página (cursor `before`)
+   */
+  const loadConversationMessages = async (conversationId: string): Promise<ChatMessage[]> => {
+    const token = localStorage.getItem('access_token');
+    if (!token) return [];
+
+    const loaded: ChatMessage[] = [];
+    let before: number | null = null;
+    try {
+      do {
+        const query: string = before ? `?limit=200&before=${before}` : '?limit=200';
+        const response: Response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/ai/conversations/${conversationId}/messages/${query}`, {
+          headers: {
+            'Authorization': `Bearer ${token}`
+          }
+        });
+        if (!response.ok) {
+          throw new Error(`Erro ao carregar mensagens: ${response.status}`);
+        }
+        const page = await response.json();
+        const pageMessages: ChatMessage[] = page.results.map((msg: any) => ({
+          id: msg.id,
+          role: msg.role,
+          content: msg.content,
+          content_html: msg.metadata?.content_html,
+          timestamp: msg.timestamp ? new Date(msg.timestamp) : new Date()
+        }));
+        // Páginas chegam das mais recentes para as mais antigas
+        loaded.unshift(...pageMessages);
+        before = page.next_before;
+      } while (before);
+      console.log(`✅ [LOAD] ${loaded.length} mensagens carregadas da conversa ${conversationId}`);
+    } catch (error) {
+      console.error('❌ [LOAD] Erro ao carregar mensagens:', error);
+    }
+    return loaded;
+  };
+
   /**
    * Cria nova conversa no backend
    */
@@ -479,20 +520,25 @@ function ChatbotPageContent() {
     if (activeConversationId === convId) {
       const remaining = conversations.filter(c => c.id !== convId);
       if (remaining.length > 0) {
-        setActiveConversationId(remaining[0].id);
-        setMessages(remaining[0].messages);
+        await switchConversation(remaining[0].id);
       } else {
         createNewConversation();
       }
     }
   };
 
-  const switchConversation = (convId: string) => {
+  const switchConversation = async (convId: string) => {
     const conv = conversations.find(c => c.id === convId);
     if (conv) {
       setActiveConversationId(conv.id);
       setMessages(conv.messages);
       setError(null);
+
+      if (!conv.messagesLoaded && /^\d+$/.test(conv.id)) {
+        const loaded = await loadConversationMessages(conv.id);
+        setConversations(prev => prev.map(c => c.id === conv.id ? { ...c, messages: loaded, messagesLoaded: true } : c));
+        setMessages(loaded);
+      }
     }
   };
 
@@ -617,6 +663,8 @@ function ChatbotPageContent() {
         },
         body: JSON.stringify({
           messages: historyForChat,
+          // Conversa do backend: o servidor usa o resumo das mensagens antigas
+          ...(ensuredConversationId && /^\d+$/.test(String(ensuredConversationId)) ? { conversation_id: Number(ensuredConversationId) } : {}),
           ...(imageToSend ? { image_data: imageToSend } : {})
         }),
         // IMPORTANTE: Não definir timeout muito curto para streams longos
@@ -659,8 +707,11 @@ function ChatbotPageContent() {
                 const parsed = JSON.parse(data);
                 
                 if (parsed.type === 'content') {
-                  // Atualizar texto acumulado
+                  // Atualizar texto acumulado (o servidor envia apenas deltas)
                   accumulatedText += parsed.text;
+                  if (parsed.html) {
+                    finalHtml += parsed.html;
+                  }
                   
                   // Atualizar mensagem em tempo real
                   setMessages(prev => {
@@ -675,11 +726,11 @@ function ChatbotPageContent() {
                 } else if (parsed.type === 'done') {
                   isDone = true;
                   streamSuccessful = true;
-                  // Usar total_text se disponível, caso contrário manter o acumulado
-                  if (parsed.total_text && parsed.total_text.length > 0) {
-                    accumulatedText = parsed.total_text;
+                  finalHtml += parsed.html || '';
+                  // Validar o texto acumulado com o tamanho enviado pelo servidor
+                  if (typeof parsed.length === 'number' && new TextEncoder().encode(accumulatedText).length !== parsed.length) {
+                    console.warn(`⚠️ [STREAM] Tamanho divergente: ${new TextEncoder().encode(accumulatedText).length} != ${parsed.length} bytes`);
                   }
-                  finalHtml = parsed.content_html || '';
                   
                   console.log(`✅ [STREAM] Completado: ${accumulatedText.length} caracteres`);
                   console.log(`📝 [STREAM] HTML: ${finalHtml.length} caracteres`);
@@ -0,0 +1,94 @@
+"""
+Benchmark de carga: views de IA com event loop por request vs. stack async.
+
+Usa o backend FIREBASE_AI_DEV_MOCK com latência artificial
+(FIREBASE_AI_DEV_MOCK_LATENCY) para simular o tempo de resposta do Gemini.
+
+Modos comparados:
+  sync  - comportamento antigo: N workers síncronos (gunicorn sync), cada um
+          cria um event loop novo por request e bloqueia até a resposta.
+  async - um único event loop (um worker uvicorn) com todas as requests em
+          curso ao mesmo tempo, limitado apenas por GOOGLE_AI_MAX_CONCURRENCY.
+
+Uso:
+  python scripts/benchmark_ai_async.py --requests 300 --latency 0.5 --sync-workers 3
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+# Ensure backend code is importable
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def _configure_env(args):
+    os.environ['FIREBASE_AI_DEV_MOCK'] = 'true'
+    os.environ['FIREBASE_AI_DEV_MOCK_LATENCY'] = str(args.latency)
+    os.environ.setdefault('GOOGLE_AI_MAX_CONCURRENCY', str(max(args.requests, 64)))
+
+
+def _summary(label, latencies, wall):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    print(f"[{label}] requests={len(latencies)} wall={wall:.2f}s "
+          f"throughput={len(latencies) / wall:.1f} req/s "
+          f"p50={statistics.median(latencies) * 1000:.0f}ms p95={p95 * 1000:.0f}ms")
+
+
+def run_sync_mode(args):
+    from firebase.ai_service import FirebaseAIService
+
+    def handle_request(i):
+        # Reproduz o padrão antigo das views: event loop novo por request
+        start = time.perf_counter()
+        ai_service = FirebaseAIService()
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(ai_service.generate_text(f"Pergunta {i}"))
+        finally:
+            loop.close()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sync_workers) as workers:
+        latencies = list(workers.map(handle_request, range(args.requests)))
+    _summary(f"sync x{args.sync_workers} workers", latencies, time.perf_counter() - start)
+
+
+def run_async_mode(args):
+    from firebase.ai_service import FirebaseAIService
+
+    async def handle_request(i):
+        start = time.perf_counter()
+        ai_service = FirebaseAIService()
+        await ai_service.generate_text(f"Pergunta {i}")
+        return time.perf_counter() - start
+
+    async def main():
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(handle_request(i) for i in range(args.requests)))
+        _summary("async x1 worker", latencies, time.perf_counter() - start)
+
+    asyncio.run(main())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.5, help='latência simulada do modelo (s)')
+    parser.add_argument('--sync-workers', type=int, default=3)
+    parser.add_argument('--mode', choices=['sync', 'async', 'both'], default='both')
+    args = parser.parse_args()
+
+    _configure_env(args)
+    if args.mode in ('sync', 'both'):
+        run_sync_mode(args)
+    if args.mode in ('async', 'both'):
+        run_async_mode(args)
@@ -0,0 +1,220 @@
+"""
+Benchmark dos índices das tabelas de chat da IA (ai.AIConversation,
+ai.AIMessage, ai.AIUsageStats) com um volume de dados realista.
+
+Popula a base de dados configurada (variáveis DB_* do backend) com
+utilizadores "bench_idx_*", conversas, --messages mensagens e um ano de
+estatísticas diárias, sempre com a mesma semente (repetível). Depois mostra o
+plano (EXPLAIN ANALYZE) das queries e a latência dos endpoints:
+  list    - GET /api/ai/conversations/
+  detail  - GET /api/ai/conversations/{id}/messages/ (e o histórico completo)
+  usage   - GET /api/ai/usage/
+
+Com --compare as medições são repetidas sem os índices compostos
+(removidos temporariamente e recriados no fim).
+
+Uso:
+  python scripts/benchmark_ai_indexes.py --messages 1000000
+  python scripts/benchmark_ai_indexes.py --skip-seed --compare --runs 50
+  python scripts/benchmark_ai_indexes.py --cleanup
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+from datetime import timedelta
+
+# Ensure backend code is importable
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agroalerta.settings')
+os.environ.setdefault('ALLOWED_HOSTS', 'testserver,localhost')
+
+import django
+django.setup()
+
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ai.models import AIConversation, AIMessage, AIUsageStats
+from ai.views import _with_list_annotations
+from users.models import User
+
+USER_PREFIX = 'bench_idx_'
+SEED = 42
+BATCH_SIZE = 10000
+COMPOSITE_INDEXES = [
+    (AIConversation, 'ai_conv_user_active_upd_idx'),
+    (AIMessage, 'ai_msg_conv_ts_idx'),
+]
+
+SAMPLE_TEXTS = [
+    'Quando devo plantar milho em Nampula?',
+    'As folhas do tomate estão amarelas com manchas castanhas, o que pode ser?',
+    'Qual a melhor época para semear feijão nhemba?',
+    'Recomende um tratamento orgânico para a lagarta do funil.',
+    'O milho deve ser semeado no início das chuvas, com espaçamento de 75 x 25 cm. ' * 4,
+    'Para o míldio use calda bordalesa a 1% e evite regar as folhas ao fim do dia. ' * 6,
+]
+
+
+def bench_users():
+    return User.objects.filter(username__startswith=USER_PREFIX)
+
+
+def cleanup():
+    deleted, _ = bench_users().delete()
+    print(f"🧹 Removidos {deleted} registos de benchmark")
+
+
+def seed(args):
+    rng = random.Random(SEED)
+    conversations_total = args.users * args.conversations_per_user
+    messages_per_conversation = max(1, args.messages // conversations_total)
+    now = timezone.now()
+    start = time.perf_counter()
+
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(username=f'{USER_PREFIX}{i}', provincia='Nampula') for i in range(args.users)
+        ])
+
+        conversations = []
+        for user in users:
+            for c in range(args.conversations_per_user):
+                updated = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+                conversations.append(AIConversation(
+                    user=user,
+                    title=f'Conversa {c}',
+                    created_at=updated - timedelta(days=1),
+                    updated_at=updated,
+                    is_active=rng.random() > 0.1,
+                ))
+        conversations = AIConversation.objects.bulk_create(conversations, batch_size=BATCH_SIZE)
+        # auto_now sobrescreve updated_at no bulk_create; repor a distribuição
+        for conversation in conversations:
+            conversation.updated_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+        AIConversation.objects.bulk_update(conversations, ['updated_at'], batch_size=BATCH_SIZE)
+
+        batch = []
+        created = 0
+        for conversation in conversations:
+            started = conversation.updated_at - timedelta(hours=2)
+            for m in range(messages_per_conversation):
+                batch.append(AIMessage(
+                    conversation=conversation,
+                    role='user' if m % 2 == 0 else 'assistant',
+                    content=rng.choice(SAMPLE_TEXTS),
+                    timestamp=started + timedelta(seconds=m * 30),
+                ))
+                if len(batch) >= BATCH_SIZE:
+                    AIMessage.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+                    print(f"\r   mensagens: {created:,}", end='', flush=True)
+        if batch:
+            AIMessage.objects.bulk_create(batch)
+            created += len(batch)
+        print(f"\r   mensagens: {created:,}")
+
+        today = now.date()
+        AIUsageStats.objects.bulk_create([
+            AIUsageStats(user=user, date=today - timedelta(days=d), total_requests=rng.randint(0, 50))
+            for user in users for d in range(365)
+        ], batch_size=BATCH_SIZE)
+
+    with connection.cursor() as cursor:
+        for model in (AIConversation, AIMessage, AIUsageStats):
+            cursor.execute(f'ANALYZE {model._meta.db_table}')
+    print(f"🌱 Seed: {args.users} utilizadores, {len(conversations):,} conversas, "
+          f"{created:,} mensagens em {time.perf_counter() - start:.1f}s")
+
+
+def set_composite_indexes(enabled):
+    with connection.schema_editor(atomic=False) as editor:
+        for model, name in COMPOSITE_INDEXES:
+            index = next(i for i in model._meta.indexes if i.name == name)
+            if enabled:
+                editor.add_index(model, index)
+            else:
+                editor.remove_index(model, index)
+    with connection.cursor() as cursor:
+        for model, _ in COMPOSITE_INDEXES:
+            cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+
+def explain(label, queryset):
+    print(f"\n--- EXPLAIN ANALYZE: {label}")
+    print(queryset.explain(analyze=True))
+
+
+def time_endpoint(client, url, runs):
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, (url, response.status_code)
+    latencies.sort()
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    return statistics.median(latencies) * 1000, p95 * 1000
+
+
+def measure(label, runs):
+    user = bench_users().order_by('id').first()
+    if user is None:
+        print("❌ Sem dados de benchmark; corra sem --skip-seed")
+        sys.exit(1)
+    conversation = AIConversation.objects.filter(user=user, is_active=True).order_by('-updated_at').first()
+    today = timezone.now().date()
+
+    print(f"\n===== {label} =====")
+    explain('list', _with_list_annotations(AIConversation.objects.filter(user=user, is_active=True))[:20])
+    explain('detail (página por cursor)', AIMessage.objects.filter(conversation=conversation).order_by('-timestamp', '-id')[:51])
+    explain('detail (histórico completo)', AIMessage.objects.filter(conversation=conversation).order_by('timestamp'))
+    explain('usage', AIUsageStats.objects.filter(user=user, date__gte=today - timedelta(days=30), date__lte=today).order_by('-date'))
+
+    client = APIClient()
+    client.force_authenticate(user)
+    print()
+    for name, url in [
+        ('list', '/api/ai/conversations/'),
+        ('detail', f'/api/ai/conversations/{conversation.id}/messages/'),
+        ('usage', '/api/ai/usage/'),
+    ]:
+        p50, p95 = time_endpoint(client, url, runs)
+        print(f"[{label}] {name:<7} p50={p50:.1f}ms p95={p95:.1f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--conversations-per-user', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=30, help='pedidos por endpoint')
+    parser.add_argument('--skip-seed', action='store_true', help='reutilizar os dados já criados')
+    parser.add_argument('--compare', action='store_true', help='medir também sem os índices compostos')
+    parser.add_argument('--cleanup', action='store_true', help='apenas remover os dados de benchmark')
+    args = parser.parse_args()
+
+    if args.cleanup:
+        cleanup()
+        sys.exit(0)
+
+    if not args.skip_seed:
+        cleanup()
+        seed(args)
+
+    measure('com índices', args.runs)
+    if args.compare:
+        set_composite_indexes(False)
+        try:
+            measure('sem índices', args.runs)
+        finally:
+            set_composite_indexes(True)
@@ -0,0 +1,139 @@
+"""
+Benchmark do motor de campanhas (notificacoes.services.campaigns).
+
+Corre numa base de dados de teste criada e destruída pelo próprio script
+(como o manage.py test), com --users agricultores, e envia para um servidor
+HTTP local que imita a API de mensagens da Twilio (resposta 201 depois de
+--latency-ms). O cliente Twilio real (SDK) é apontado para esse servidor.
+
+Modos comparados:
+  sequencial  - um envio de cada vez (como o envio inline antigo).
+  paralelo    - --workers envios em paralelo, sem limites de taxa.
+  limitado    - --workers envios em paralelo com TWILIO_ACCOUNT_PER_SECOND
+                = --rate; mostra a taxa observada no servidor.
+
+Uso:
+  python scripts/benchmark_campaign.py --users 2000 --workers 16
+  python scripts/benchmark_campaign.py --users 1000 --rate 50 --latency-ms 150
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Ensure backend code is importable
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agroalerta.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment
+from twilio.rest import Client
+
+from notificacoes.models import CampanhaNotificacao, Notificacao
+from notificacoes.services import campaigns, outbox, throttle
+from notificacoes.services.twilio_service import twilio_service
+from users.models import User
+
+ACCOUNT_SID = 'AC' + '0' * 32
+
+
+class FakeTwilio(BaseHTTPRequestHandler):
+    latency = 0.05
+    timestamps = []
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.latency)
+        with self.lock:
+            FakeTwilio.timestamps.append(time.monotonic())
+            sid = f'SM{len(FakeTwilio.timestamps):032d}'
+        body = json.dumps({'sid': sid, 'status': 'queued', 'account_sid': ACCOUNT_SID}).encode()
+        self.send_response(201)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def seed(count):
+    User.objects.bulk_create([
+        User(username=f'agricultor{i}', first_name=f'Nome{i}', telefone=f'84{i:07d}', provincia='Nampula')
+        for i in range(count)
+    ], batch_size=5000)
+    return CampanhaNotificacao.objects.create(
+        nome='Benchmark', tipo=outbox.get_tipo('campanha'), titulo_template='Olá {{ nome }}',
+        conteudo_template='{{ nome }}, vacinação do gado em {{ provincia }} na sexta-feira.',
+        canais=['sms'], filtros_usuario={'provincia': 'Nampula'},
+    )
+
+
+def measure(label, campanha, workers, rate):
+    Notificacao.objects.all().delete()
+    CampanhaNotificacao.objects.filter(id=campanha.id).update(
+        status='agendada', ultimo_usuario_id=0, total_envios=0, total_sucessos=0, total_falhas=0
+    )
+    FakeTwilio.timestamps = []
+    throttle.reset()
+    with override_settings(TWILIO_SMS_PER_SECOND=0, TWILIO_ACCOUNT_PER_SECOND=rate,
+                           TWILIO_ACCOUNT_SID=ACCOUNT_SID):
+        start = time.perf_counter()
+        totals = campaigns.run(campanha.id, workers=workers)
+        elapsed = time.perf_counter() - start
+
+    stamps = FakeTwilio.timestamps
+    observed = (len(stamps) - 1) / (stamps[-1] - stamps[0]) if len(stamps) > 1 else 0
+    print(f"[{label:<10}] {totals['sucessos']}/{totals['envios']} enviadas em {elapsed:6.2f}s "
+          f"= {totals['envios'] / elapsed:7.1f} msg/s (servidor: {observed:7.1f} msg/s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=100, help='limite da conta (msg/s) no modo limitado')
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--sequential-users', type=int, default=200,
+                        help='no modo sequencial só os primeiros N (é lento)')
+    args = parser.parse_args()
+
+    FakeTwilio.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTwilio)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    twilio_service.client = Client(ACCOUNT_SID, 'token')
+    twilio_service.client.api.base_url = f'http://127.0.0.1:{server.server_port}'
+    twilio_service.phone_number = '+258840000000'
+
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        campanha = seed(args.users)
+        print(f"🧪 {args.users} destinatários, latência {args.latency_ms:.0f}ms")
+
+        sample = User.objects.order_by('id').values_list('id', flat=True)[:args.sequential_users]
+        sequencial = CampanhaNotificacao.objects.create(
+            nome='Sequencial', tipo=campanha.tipo, titulo_template=campanha.titulo_template,
+            conteudo_template=campanha.conteudo_template, canais=['sms'],
+        )
+        sequencial.usuarios_alvo.set(list(sample))
+
+        measure('sequencial', sequencial, 1, 0)
+        measure('paralelo', campanha, args.workers, 0)
+        measure('limitado', campanha, args.workers, args.rate)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        server.shutdown()
@@ -0,0 +1,101 @@
+"""
+Benchmark dos derivados de imagens (pragas.services.image_derivatives).
+
+Para cada foto mede o tamanho do original e das variantes thumb/medium/webp
+e o tempo de geração. Mede também os bytes de imagem de um dashboard de
+projeto (5 atividades recentes com --photos-per-activity fotos cada),
+descarregando as fotos originais ou os thumbnails.
+
+As fotos sintéticas (gradiente + formas + ruído, 12 MP) comprimem de forma
+parecida com fotos reais de campo. Com --image usa fotos reais.
+
+Uso:
+  python scripts/benchmark_image_derivatives.py --photos 10
+  python scripts/benchmark_image_derivatives.py --image campo1.jpg campo2.jpg
+"""
+import os
+import sys
+import io
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+# Ensure backend code is importable
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agroalerta.settings')
+
+import django
+django.setup()
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test.utils import override_settings
+from PIL import Image, ImageDraw
+
+from pragas.services import image_derivatives
+
+
+def make_photo(seed, megapixels):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    base = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    draw = ImageDraw.Draw(base)
+    for i in range(40):
+        x, y = (seed * 97 + i * 389) % width, (seed * 53 + i * 211) % height
+        draw.ellipse((x, y, x + width // 8, y + height // 10), fill=(40 + i * 3 % 80, 110 + i % 90, 30))
+    noise = Image.effect_noise((width, height), 25).convert('RGB')
+    output = io.BytesIO()
+    Image.blend(base, noise, 0.15).save(output, format='JPEG', quality=92)
+    return output.getvalue()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--photos', type=int, default=10)
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--photos-per-activity', type=int, default=2)
+    parser.add_argument('--image', nargs='+', help='fotos reais a usar')
+    args = parser.parse_args()
+
+    media_root = tempfile.mkdtemp(prefix='lura_derivados_')
+    try:
+        with override_settings(MEDIA_ROOT=media_root):
+            if args.image:
+                photos = []
+                for path in args.image:
+                    with open(path, 'rb') as f:
+                        photos.append(f.read())
+            else:
+                photos = [make_photo(i, args.megapixels) for i in range(args.photos)]
+
+            sizes = {'original': [], 'thumb': [], 'medium': [], 'webp': []}
+            timings = []
+            for i, photo in enumerate(photos):
+                name = default_storage.save(f'campo_fotos/foto_{i}.jpg', ContentFile(photo))
+                start = time.perf_counter()
+                derivados = image_derivatives.generate(name)
+                timings.append(time.perf_counter() - start)
+                sizes['original'].append(default_storage.size(name))
+                for variant in ('thumb', 'medium', 'webp'):
+                    sizes[variant].append(default_storage.size(derivados[variant]))
+
+            print(f"📷 {len(photos)} fotos; geração p50={statistics.median(timings) * 1000:.0f}ms "
+                  f"max={max(timings) * 1000:.0f}ms por foto")
+            original = statistics.mean(sizes['original'])
+            for variant, values in sizes.items():
+                size = statistics.mean(values)
+                print(f"[{variant:<8}] média={size / 1024:8.1f} KB ({original / size:5.1f}x menor)")
+
+            per_dashboard = 5 * args.photos_per_activity
+            before = original * per_dashboard
+            after = statistics.mean(sizes['thumb']) * per_dashboard
+            print(f"Dashboard ({per_dashboard} fotos): {before / 1e6:.1f} MB -> {after / 1e6:.2f} MB "
+                  f"({before / after:.0f}x menos bytes)")
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
@@ -0,0 +1,99 @@
+"""
+Micro-benchmarks do renderer markdown -> HTML (firebase/markdown_renderer.py).
+
+Antes de medir, confirma que o renderer continua a produzir exatamente o HTML
+do corpus de referência (backend/ai/test_data/markdown_golden.json); sai com
+código 1 se algum caso divergir.
+
+Casos medidos (µs por chamada, melhor de --repeat rodadas):
+  inline     - _format_inline numa frase com negrito, itálico, código e link
+  plain      - _format_inline em texto sem marcadores (caminho rápido)
+  cell       - _process_table_cell com HTML rico
+  table      - tabela de 6 linhas x 4 colunas
+  document   - corpus completo do test_markdown_formatting.py
+  response   - resposta longa (~--tokens tokens) completa
+  streaming  - mesma resposta alimentada em chunks de --chunk-chars
+
+Uso:
+  python scripts/benchmark_markdown.py --repeat 5 --tokens 4000
+  python scripts/benchmark_markdown.py --only inline,table
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+
+# Ensure backend code is importable
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from firebase.markdown_renderer import (
+    IncrementalMarkdownRenderer,
+    _format_inline,
+    _markdown_to_html,
+    _process_table_cell,
+)
+
+GOLDEN_PATH = os.path.join(BACKEND_DIR, 'ai', 'test_data', 'markdown_golden.json')
+
+
+def load_golden():
+    with open(GOLDEN_PATH, encoding='utf-8') as f:
+        return {case['name']: case for case in json.load(f)['cases']}
+
+
+def check_golden(golden):
+    failures = [name for name, case in golden.items() if _markdown_to_html(case['markdown']) != case['html']]
+    for name in failures:
+        print(f"❌ Saída diferente do corpus de referência: {name}")
+    return not failures
+
+
+def build_response(section, tokens):
+    # ~4 caracteres por token
+    target_chars = tokens * 4
+    return (section * (target_chars // len(section) + 1))[:target_chars]
+
+
+def stream(text, chunk_chars):
+    renderer = IncrementalMarkdownRenderer()
+    for i in range(0, len(text), chunk_chars):
+        renderer.feed(text[i:i + chunk_chars])
+    return renderer.finish()
+
+
+def build_cases(golden, args):
+    response = build_response(golden['stream_section']['markdown'], args.tokens)
+    return {
+        'inline': (lambda: _format_inline('O **milho** deve ser semeado com *cuidado*, ver `pH 5.5` e [guia](https://lura.co.mz)'), 20000),
+        'plain': (lambda: _format_inline('Aguarde as primeiras chuvas para garantir boa germinacao das sementes'), 50000),
+        'cell': (lambda: _process_table_cell('<ul><li>**Neem** a 5%</li><li>*Sabão* potássico</li></ul>'), 50000),
+        'table': (lambda: _markdown_to_html(golden['test_table_formatting']['markdown']), 2000),
+        'document': (lambda: _markdown_to_html(golden['test_markdown_formatting']['markdown']), 2000),
+        'response': (lambda: _markdown_to_html(response), 50),
+        'streaming': (lambda: stream(response, args.chunk_chars), 50),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tokens', type=int, default=4000, help='tamanho da resposta longa')
+    parser.add_argument('--chunk-chars', type=int, default=24)
+    parser.add_argument('--only', default='', help='lista de casos separados por vírgula')
+    args = parser.parse_args()
+
+    golden = load_golden()
+    if not check_golden(golden):
+        sys.exit(1)
+    print(f"✅ Corpus de referência: {len(golden)} casos idênticos")
+
+    cases = build_cases(golden, args)
+    selected = [c.strip() for c in args.only.split(',') if c.strip()] or list(cases)
+    for name in selected:
+        func, number = cases[name]
+        best = min(timeit.repeat(func, number=number, repeat=args.repeat)) / number
+        print(f"[{name:<10}] {best * 1e6:10.2f} µs/op")
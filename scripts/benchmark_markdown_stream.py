@@ -0,0 +1,154 @@
+"""
+Benchmark do streaming SSE de respostas da IA: protocolo antigo vs. deltas.
+
+Simula uma resposta de ~4k tokens (títulos, listas, tabelas e blocos de
+código) partida em chunks, e mede para cada protocolo:
+  - bytes enviados no fio (eventos "data: {json}\\n\\n")
+  - CPU do servidor (serialização + markdown)
+  - CPU do cliente (parse dos eventos + renderização do markdown)
+
+Protocolo antigo: cada evento leva `text` + `accumulated`; o cliente
+re-renderiza o markdown acumulado a cada chunk; o evento final leva
+`total_text` + `content_html`.
+Protocolo novo: cada evento leva `text` + `html` (delta dos blocos
+completos); o evento final leva o HTML restante, tamanho e checksum.
+
+Uso:
+  python scripts/benchmark_markdown_stream.py --tokens 4000 --chunk-chars 24
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+# Ensure backend code is importable
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from firebase.markdown_renderer import IncrementalMarkdownRenderer, _markdown_to_html
+from firebase.ai_service import _stream_content_event, _stream_done_event
+
+SECTION = """## Cultivo de milho em {provincia}
+
+O milho deve ser semeado no início das chuvas. **Importante**: verificar o pH do solo (entre *5.5* e *7.0*).
+
+1. Limpeza do terreno
+2. Lavoura a `20-30 cm`
+3. Aplicação de calcário se necessário
+
+- **Variedade precoce**: ZM 309
+- **Variedade média**: ZM 521
+- **Variedade tardia**: ZM 623
+
+| Praga | Sintomas | Tratamento |
+|-------|----------|------------|
+| Lagarta do funil | Folhas raspadas | Neem a 5% |
+| Broca do colmo | Galerias no caule | **Rotação de culturas** |
+| Afídeos | Folhas enroladas | Sabão potássico |
+
+> **Dica**: aguarde as primeiras chuvas para garantir germinação.
+
+```python
+def densidade(area_ha, plantas_por_ha=50000):
+    return area_ha * plantas_por_ha
+```
+
+---
+
+"""
+
+PROVINCIAS = ['Nampula', 'Zambézia', 'Tete', 'Manica', 'Sofala', 'Niassa', 'Cabo Delgado', 'Gaza', 'Inhambane', 'Maputo']
+
+
+def build_answer(tokens):
+    # ~4 caracteres por token
+    target_chars = tokens * 4
+    parts = []
+    i = 0
+    while sum(len(p) for p in parts) < target_chars:
+        parts.append(SECTION.format(provincia=PROVINCIAS[i % len(PROVINCIAS)]))
+        i += 1
+    return ''.join(parts)[:target_chars]
+
+
+def split_chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def sse(event):
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def run_legacy(chunks):
+    server_start = time.process_time()
+    wire = []
+    accumulated = ''
+    for chunk in chunks:
+        accumulated += chunk
+        wire.append(sse({'type': 'content', 'text': chunk, 'accumulated': accumulated, 'done': False}))
+    wire.append(sse({'type': 'done', 'done': True, 'total_text': accumulated,
+                     'content_html': _markdown_to_html(accumulated), 'model': 'bench', 'chunks': len(chunks)}))
+    server_cpu = time.process_time() - server_start
+
+    client_start = time.process_time()
+    client_text = ''
+    for payload in wire:
+        event = json.loads(payload[6:])
+        if event['type'] == 'content':
+            client_text += event['text']
+            # o cliente re-renderiza o markdown acumulado a cada chunk
+            _markdown_to_html(client_text)
+        else:
+            final_html = event['content_html']
+    client_cpu = time.process_time() - client_start
+    return wire, server_cpu, client_cpu, final_html
+
+
+def run_delta(chunks):
+    server_start = time.process_time()
+    wire = []
+    renderer = IncrementalMarkdownRenderer()
+    for chunk in chunks:
+        wire.append(sse(_stream_content_event(renderer, chunk)))
+    wire.append(sse(_stream_done_event(renderer, model='bench', chunks=len(chunks))))
+    server_cpu = time.process_time() - server_start
+
+    client_start = time.process_time()
+    client_text = ''
+    client_html = ''
+    for payload in wire:
+        event = json.loads(payload[6:])
+        if event['type'] == 'content':
+            client_text += event['text']
+        client_html += event.get('html', '')
+    assert len(client_text.encode('utf-8')) == event['length']
+    client_cpu = time.process_time() - client_start
+    return wire, server_cpu, client_cpu, client_html
+
+
+def report(label, wire, server_cpu, client_cpu):
+    total_bytes = sum(len(w.encode('utf-8')) for w in wire)
+    print(f"[{label}] events={len(wire)} bytes={total_bytes:,} "
+          f"server_cpu={server_cpu * 1000:.1f}ms client_cpu={client_cpu * 1000:.1f}ms")
+    return total_bytes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokens', type=int, default=4000)
+    parser.add_argument('--chunk-chars', type=int, default=24, help='tamanho médio de cada chunk do modelo')
+    args = parser.parse_args()
+
+    answer = build_answer(args.tokens)
+    chunks = split_chunks(answer, args.chunk_chars)
+    print(f"Resposta: {len(answer):,} caracteres em {len(chunks)} chunks")
+
+    legacy = run_legacy(chunks)
+    delta = run_delta(chunks)
+    legacy_bytes = report('legacy (accumulated)', *legacy[:3])
+    delta_bytes = report('delta (html incremental)', *delta[:3])
+    print(f"HTML final idêntico: {legacy[3] == delta[3]}")
+    print(f"Redução de bytes: {legacy_bytes / max(delta_bytes, 1):.1f}x")
@@ -0,0 +1,92 @@
+"""
+Benchmark do registo de notificações para muitos destinatários.
+
+Corre numa base de dados de teste criada e destruída pelo próprio script
+(como o manage.py test), com --users agricultores (10% com WhatsApp).
+
+Modos comparados:
+  legacy  - comportamento antigo: User.objects.get + Notificacao.objects.create
+            + save() por destinatário (--legacy-users, extrapolado).
+  bulk    - recipients.resolve_recipients (filtro de campanha) +
+            outbox.enqueue (cursor no servidor e bulk_create em lotes).
+
+Uso:
+  python scripts/benchmark_notification_enqueue.py --users 50000
+"""
+import os
+import sys
+import time
+import argparse
+
+# Ensure backend code is importable
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agroalerta.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+
+from notificacoes.models import Notificacao
+from notificacoes.services import outbox, recipients
+from users.models import User
+
+
+def seed(count):
+    users = [
+        User(username=f'agricultor{i}', telefone=f'84{i:07d}', provincia='Nampula',
+             culturas_interesse=['milho'], receber_whatsapp=(i % 10 == 0))
+        for i in range(count)
+    ]
+    User.objects.bulk_create(users, batch_size=5000)
+
+
+def legacy(user_ids):
+    tipo = outbox.get_tipo('geral')
+    for user_id in user_ids:
+        user = User.objects.get(id=user_id)
+        for canal in outbox.channels_for(user):
+            notificacao = Notificacao.objects.create(
+                usuario=user, tipo=tipo, titulo='Campanha', conteudo='Vacinação na sexta-feira', canal=canal
+            )
+            notificacao.save()
+
+
+def bulk():
+    users = recipients.resolve_recipients({'provincia': 'Nampula', 'culturas_interesse': 'milho'})
+    return outbox.enqueue(users, 'Campanha', 'Vacinação na sexta-feira')
+
+
+def measure(label, fn, scale=1):
+    connection.queries_log.clear()
+    start = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        fn()
+    elapsed = time.perf_counter() - start
+    suffix = f" (extrapolado x{scale:.0f})" if scale != 1 else ''
+    print(f"[{label:<6}] queries={len(queries) * scale:<8.0f} tempo={elapsed * scale:7.2f}s{suffix}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--legacy-users', type=int, default=2000, help='amostra medida no modo legacy')
+    args = parser.parse_args()
+
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        seed(args.users)
+        print(f"🧪 {args.users} destinatários")
+        sample = list(User.objects.order_by('id').values_list('id', flat=True)[:args.legacy_users])
+        measure('legacy', lambda: legacy(sample), args.users / len(sample))
+        Notificacao.objects.all().delete()
+        measure('bulk', bulk)
+        print(f"Notificações em fila: {Notificacao.objects.count()}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,100 @@
+"""
+Benchmark de tempo total de um levantamento de campo (várias fotos) contra o
+stub local de inferência (pragas.inference_stub), sem rede.
+
+Modos comparados:
+  sequential - comportamento antigo: um pedido por foto, cada um com
+               detect_pest_in_image e depois classify_plant_disease.
+  single     - um pedido por foto com analyze_crop_health (inferências de
+               cada foto em paralelo).
+  batch      - analyze_batch (/api/pragas/detectar/lote/): todas as fotos no
+               pool limitado a PEST_BATCH_WORKERS.
+
+O cache de análises fica desligado (PEST_ANALYSIS_CACHE_ENABLED=false).
+
+Uso:
+  python scripts/benchmark_pest_batch.py --images 30 --pest-latency 0.3 --disease-latency 0.5
+  PEST_BATCH_WORKERS=16 python scripts/benchmark_pest_batch.py --modes single batch
+"""
+import os
+import sys
+import io
+import time
+import argparse
+
+# Ensure backend code is importable
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agroalerta.settings')
+os.environ['PEST_ANALYSIS_CACHE_ENABLED'] = 'false'
+
+import django
+django.setup()
+
+from django.conf import settings
+from PIL import Image
+
+from pragas.inference_stub import InferenceStubServer
+from pragas.services.huggingface_service import HuggingFaceService
+
+MODES = ['sequential', 'single', 'batch']
+
+
+def make_photos(count, megapixels):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    photos = []
+    for i in range(count):
+        output = io.BytesIO()
+        Image.effect_noise((width, height), 20 + i).convert('RGB').save(output, format='JPEG', quality=85)
+        photos.append((f'foto_{i}.jpg', output.getvalue()))
+    return photos
+
+
+def run_sequential(service, photos):
+    for _, image in photos:
+        pest_result = service.detect_pest_in_image(image)
+        disease_result = service.classify_plant_disease(image)
+        service._calculate_health_score(pest_result, disease_result)
+
+
+def run_single(service, photos):
+    for _, image in photos:
+        service.analyze_crop_health(image, 'milho')
+
+
+def run_batch(service, photos):
+    analyses = [analysis for _, _, analysis in service.analyze_batch(photos, 'milho')]
+    service.calculate_field_health(analyses, 'milho')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=30, help='fotos no levantamento')
+    parser.add_argument('--megapixels', type=float, default=3)
+    parser.add_argument('--pest-latency', type=float, default=0.3, help='segundos')
+    parser.add_argument('--disease-latency', type=float, default=0.5, help='segundos')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    args = parser.parse_args()
+
+    stub = InferenceStubServer(pest_latency=args.pest_latency, disease_latency=args.disease_latency).start()
+    try:
+        service = HuggingFaceService()
+        service.base_url = stub.url
+        photos = make_photos(args.images, args.megapixels)
+        service.analyze_crop_health(photos[0][1], 'milho')  # aquecimento (conexões keep-alive)
+        print(f"🧪 {args.images} fotos de {args.megapixels} MP; PEST_BATCH_WORKERS={settings.PEST_BATCH_WORKERS}")
+
+        timings = {}
+        for mode in args.modes:
+            start = time.perf_counter()
+            globals()[f'run_{mode}'](service, photos)
+            timings[mode] = time.perf_counter() - start
+            print(f"[{mode:<10}] total={timings[mode]:.2f}s por foto={timings[mode] / args.images * 1000:.0f}ms")
+        if 'sequential' in timings and 'batch' in timings:
+            print(f"sequential / batch: {timings['sequential'] / timings['batch']:.1f}x")
+    finally:
+        stub.stop()
@@ -0,0 +1,108 @@
+"""
+Benchmark do catálogo de pragas (/api/pragas/listar/).
+
+Corre numa base de dados de teste criada e destruída pelo próprio script
+(como o manage.py test), com --pests pragas associadas a --cultures culturas.
+
+Modos comparados:
+  legacy  - comportamento antigo: todas as pragas e uma query de culturas
+            por praga (N+1), dicionários refeitos em cada pedido.
+  cold    - primeiro pedido depois de uma alteração no catálogo (2 queries).
+  warm    - catálogo já no cache.
+  304     - cliente com If-None-Match (sincronização offline sem alterações).
+
+Uso:
+  python scripts/benchmark_pest_catalogue.py --pests 200 --requests 200
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+# Ensure backend code is importable
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agroalerta.settings')
+os.environ.setdefault('ALLOWED_HOSTS', 'testserver,localhost')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+
+from pragas.models import Cultura, TipoPraga
+from pragas.services import pest_catalogue
+
+
+def seed(pests, cultures):
+    culturas = [Cultura.objects.create(nome=f'Cultura {i}') for i in range(cultures)]
+    for i in range(pests):
+        praga = TipoPraga.objects.create(
+            nome=f'Praga {i}', nome_cientifico=f'Species {i}', tipo='inseto',
+            descricao='Descrição ' * 20, sintomas='Sintomas ' * 20
+        )
+        praga.culturas_afetadas.add(*culturas[i % cultures:][:3])
+
+
+def legacy():
+    data = []
+    for praga in TipoPraga.objects.all():
+        culturas_nomes = [c.nome for c in praga.culturas_afetadas.all()]
+        data.append({
+            'id': praga.id,
+            'nome': praga.nome,
+            'nome_cientifico': praga.nome_cientifico,
+            'tipo': praga.tipo,
+            'descricao': praga.descricao,
+            'culturas_afetadas': culturas_nomes,
+            'sintomas': praga.sintomas
+        })
+    return data
+
+
+def measure(label, fn, runs):
+    fn()
+    connection.queries_log.clear()
+    with CaptureQueriesContext(connection) as queries:
+        fn()
+    query_count = len(queries)  # cada pedido limpa connection.queries_log
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    print(f"[{label:<6}] queries={query_count:<4} p50={statistics.median(latencies) * 1000:7.2f}ms "
+          f"máx={max(latencies) * 1000:7.2f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pests', type=int, default=200)
+    parser.add_argument('--cultures', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=100)
+    args = parser.parse_args()
+
+    setup_test_environment(debug=False)  # sem registo de queries fora da medição
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        seed(args.pests, args.cultures)
+        client = Client()
+        print(f"🧪 {args.pests} pragas, {args.cultures} culturas")
+
+        def cold():
+            pest_catalogue.invalidate()
+            return client.get('/api/pragas/listar/')
+
+        etag = client.get('/api/pragas/listar/')['ETag']
+        measure('legacy', legacy, args.requests)
+        measure('cold', cold, args.requests)
+        measure('warm', lambda: client.get('/api/pragas/listar/'), args.requests)
+        measure('304', lambda: client.get('/api/pragas/listar/', HTTP_IF_NONE_MATCH=etag), args.requests)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,106 @@
+"""
+Benchmark de latência da análise de pragas (HuggingFaceService.analyze_crop_health)
+contra o stub local de inferência (pragas.inference_stub), sem rede.
+
+Modos comparados:
+  sequential - comportamento antigo: detect_pest_in_image e depois
+               classify_plant_disease, cada um a decodificar e pré-processar
+               a imagem de novo.
+  parallel   - analyze_crop_health: uma decodificação, as duas inferências em
+               paralelo pela sessão HTTP partilhada.
+  cached     - analyze_crop_health com a mesma foto já analisada (cache por
+               SHA-256/dHash, sem chamadas à API).
+
+Os modos sequential e parallel correm com PEST_ANALYSIS_CACHE_ENABLED=false.
+
+Com latências de 0.3s (pragas) e 0.5s (doenças) o esperado é ~0.8s no modo
+sequential e ~0.5s no parallel.
+
+Uso:
+  python scripts/benchmark_pest_inference.py --runs 20 --pest-latency 0.3 --disease-latency 0.5
+  python scripts/benchmark_pest_inference.py --image foto.jpg --concurrency 8
+"""
+import os
+import sys
+import io
+import time
+import base64
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+# Ensure backend code is importable
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agroalerta.settings')
+
+import django
+django.setup()
+
+from PIL import Image
+
+from pragas.inference_stub import InferenceStubServer
+from pragas.services.huggingface_service import HuggingFaceService
+
+
+def load_image_b64(path):
+    if path:
+        with open(path, 'rb') as f:
+            return base64.b64encode(f.read()).decode('ascii')
+    # Foto típica de telemóvel: 3000x2000, reduzida para 1024 no pré-processamento
+    output = io.BytesIO()
+    Image.effect_noise((3000, 2000), 40).convert('RGB').save(output, format='JPEG', quality=90)
+    return base64.b64encode(output.getvalue()).decode('ascii')
+
+
+def run_sequential(service, image_b64):
+    pest_result = service.detect_pest_in_image(image_b64)
+    disease_result = service.classify_plant_disease(image_b64)
+    return service._calculate_health_score(pest_result, disease_result)
+
+
+def run_parallel(service, image_b64):
+    return service.analyze_crop_health(image_b64, 'milho')['health_score']
+
+
+def measure(label, fn, service, image_b64, runs, concurrency, use_cache=False):
+    os.environ['PEST_ANALYSIS_CACHE_ENABLED'] = 'true' if use_cache else 'false'
+    fn(service, image_b64)  # aquecimento (conexões keep-alive)
+
+    def one(_):
+        start = time.perf_counter()
+        fn(service, image_b64)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as workers:
+        latencies = sorted(workers.map(one, range(runs)))
+    wall = time.perf_counter() - start
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"[{label:<10}] runs={runs} concurrency={concurrency} wall={wall:.2f}s "
+          f"p50={statistics.median(latencies) * 1000:.1f}ms p95={p95 * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=1, help='análises em simultâneo')
+    parser.add_argument('--pest-latency', type=float, default=0.3, help='segundos')
+    parser.add_argument('--disease-latency', type=float, default=0.5, help='segundos')
+    parser.add_argument('--image', help='imagem a usar (por omissão, uma imagem sintética 3000x2000)')
+    args = parser.parse_args()
+
+    stub = InferenceStubServer(pest_latency=args.pest_latency, disease_latency=args.disease_latency).start()
+    try:
+        service = HuggingFaceService()
+        service.base_url = stub.url
+        image_b64 = load_image_b64(args.image)
+        print(f"🧪 Stub em {stub.url}; imagem com {len(image_b64) // 1024} KB em base64")
+        measure('sequential', run_sequential, service, image_b64, args.runs, args.concurrency)
+        measure('parallel', run_parallel, service, image_b64, args.runs, args.concurrency)
+        measure('cached', run_parallel, service, image_b64, args.runs, args.concurrency, use_cache=True)
+    finally:
+        stub.stop()
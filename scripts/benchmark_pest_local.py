@@ -0,0 +1,131 @@
+"""
+Benchmark de débito (imagens/s) da inferência local de pragas e doenças com
+ONNX Runtime (pragas.services.local_inference), sem rede.
+
+Medições:
+  modelo   - OnnxImageClassifier.run em tensores já preparados, para cada
+             combinação de tamanho de lote e número de threads.
+  análise  - análise completa (decodificação + 2 modelos + interpretação):
+             analyze_crop_health foto a foto vs. analyze_batch, em que os
+             pedidos concorrentes são agrupados pelo micro-batcher.
+
+Sem --pest-model/--disease-model usa modelos sintéticos
+(pragas.inference_stub.write_stub_onnx_model, custo próximo do MobileNetV2).
+O cache de análises fica desligado (PEST_ANALYSIS_CACHE_ENABLED=false).
+Requer onnxruntime e numpy (e onnx para os modelos sintéticos).
+
+Uso:
+  python scripts/benchmark_pest_local.py --images 32 --batch-sizes 1 4 8 16 --threads 1 4
+  python scripts/benchmark_pest_local.py --pest-model pragas.onnx --disease-model doencas.onnx
+"""
+import os
+import sys
+import io
+import time
+import shutil
+import argparse
+import tempfile
+
+# Ensure backend code is importable
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agroalerta.settings')
+os.environ['PEST_ANALYSIS_CACHE_ENABLED'] = 'false'
+
+import django
+django.setup()
+
+from PIL import Image
+
+from pragas.inference_stub import write_stub_onnx_model
+from pragas.services import local_inference
+from pragas.services.huggingface_service import HuggingFaceService
+
+PEST_LABELS = ['caterpillar', 'aphid', 'beetle', 'grasshopper', 'whitefly', 'thrips', 'leaf']
+DISEASE_LABELS = ['leaf rust', 'leaf blight', 'mosaic', 'leaf spot', 'healthy']
+
+
+def make_photos(count, megapixels):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    photos = []
+    for i in range(count):
+        output = io.BytesIO()
+        Image.effect_noise((width, height), 20 + i).convert('RGB').save(output, format='JPEG', quality=85)
+        photos.append((f'foto_{i}.jpg', output.getvalue()))
+    return photos
+
+
+def measure_model(model_path, photos, batch_sizes, thread_counts, repeats):
+    for threads in thread_counts:
+        classifier = local_inference.OnnxImageClassifier(model_path, threads=threads)
+        tensors = [classifier.to_tensor(image) for _, image in photos]
+        classifier.run(tensors[:1])  # aquecimento
+        for batch_size in batch_sizes:
+            start = time.perf_counter()
+            for _ in range(repeats):
+                for i in range(0, len(tensors), batch_size):
+                    classifier.run(tensors[i:i + batch_size])
+            elapsed = time.perf_counter() - start
+            rate = len(tensors) * repeats / elapsed
+            print(f"[modelo ] threads={threads:<2} lote={batch_size:<3} {rate:7.1f} imagens/s")
+
+
+def measure_analysis(photos, batch_size):
+    os.environ['PEST_ONNX_BATCH_SIZE'] = str(batch_size)
+    local_inference.reset_backend()
+    service = HuggingFaceService()
+    service.analyze_crop_health(photos[0][1], 'milho')  # aquecimento (carrega os modelos)
+
+    start = time.perf_counter()
+    for _, image in photos:
+        service.analyze_crop_health(image, 'milho')
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in service.analyze_batch(photos, 'milho'):
+        pass
+    batch = time.perf_counter() - start
+
+    print(f"[análise] foto a foto {len(photos) / single:7.1f} imagens/s")
+    print(f"[análise] lote={batch_size:<3}    {len(photos) / batch:7.1f} imagens/s ({single / batch:.1f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=32)
+    parser.add_argument('--megapixels', type=float, default=3)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, os.cpu_count() or 1],
+                        help='intra_op_num_threads a comparar')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--pest-model', help='modelo ONNX de pragas (por omissão, sintético)')
+    parser.add_argument('--disease-model', help='modelo ONNX de doenças (por omissão, sintético)')
+    args = parser.parse_args()
+
+    if local_inference.ort is None:
+        print("❌ onnxruntime e numpy não estão instalados")
+        sys.exit(1)
+
+    workdir = tempfile.mkdtemp(prefix='lura_onnx_')
+    try:
+        pest_model = args.pest_model or write_stub_onnx_model(
+            os.path.join(workdir, 'pragas.onnx'), PEST_LABELS, depth=3)
+        disease_model = args.disease_model or write_stub_onnx_model(
+            os.path.join(workdir, 'doencas.onnx'), DISEASE_LABELS, depth=3)
+        os.environ.update({
+            'PEST_INFERENCE_BACKEND': 'onnx',
+            'PEST_ONNX_PEST_MODEL': pest_model,
+            'PEST_ONNX_DISEASE_MODEL': disease_model,
+            'PEST_ONNX_THREADS': str(max(args.threads)),
+        })
+
+        photos = make_photos(args.images, args.megapixels)
+        print(f"🧪 {args.images} fotos de {args.megapixels} MP; {os.cpu_count()} CPUs")
+        measure_model(pest_model, photos, args.batch_sizes, sorted(set(args.threads)), args.repeats)
+        measure_analysis(photos, max(args.batch_sizes))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
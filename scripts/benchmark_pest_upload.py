@@ -0,0 +1,191 @@
+"""
+Benchmark de memória do upload de imagens em /api/pragas/detectar/.
+
+Cada modo corre num processo novo, que chama o handler WSGI do Django com o
+corpo do pedido lido de um ficheiro (como de um socket, sem o pré-carregar em
+memória). Mede-se o pico de RSS (VmHWM, Linux) de um único pedido, depois de
+um pedido de aquecimento com uma imagem pequena.
+
+Modos:
+  base64     - JSON {"image": "<base64>"} (clientes antigos)
+  multipart  - multipart/form-data, campo "file" (frontend)
+  binary     - corpo binário com Content-Type image/jpeg
+
+A inferência usa o stub local (pragas.inference_stub) e o cache de análises
+fica desligado, para que todos os modos façam o pré-processamento completo.
+
+Uso:
+  python scripts/benchmark_pest_upload.py --megapixels 12
+  python scripts/benchmark_pest_upload.py --image foto.jpg --modes multipart binary
+"""
+import os
+import sys
+import json
+import base64
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+# Ensure backend code is importable
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+MODES = ['base64', 'multipart', 'binary']
+BOUNDARY = 'LuraBenchmarkBoundary'
+USERNAME = 'bench_upload'
+
+
+def make_image(path, megapixels):
+    from PIL import Image
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    Image.effect_noise((width, height), 30).convert('RGB').save(path, format='JPEG', quality=85)
+
+
+def write_body(mode, image_path, body_path):
+    """Escreve o corpo do pedido em disco; retorna (content_type, query_string)"""
+    with open(body_path, 'wb') as body, open(image_path, 'rb') as image:
+        if mode == 'base64':
+            payload = {'image': base64.b64encode(image.read()).decode('ascii'), 'crop_type': 'milho'}
+            body.write(json.dumps(payload).encode('utf-8'))
+            return 'application/json', ''
+        if mode == 'multipart':
+            body.write((
+                f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="cultura"\r\n\r\nmilho\r\n'
+                f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="foto.jpg"\r\n'
+                'Content-Type: image/jpeg\r\n\r\n'
+            ).encode('ascii'))
+            shutil.copyfileobj(image, body)
+            body.write(f'\r\n--{BOUNDARY}--\r\n'.encode('ascii'))
+            return f'multipart/form-data; boundary={BOUNDARY}', ''
+        shutil.copyfileobj(image, body)
+        return 'image/jpeg', 'crop_type=milho'
+
+
+def _status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+
+def child(args):
+    """Processo de medição de um modo (invocado pelo próprio script)"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agroalerta.settings')
+    os.environ.setdefault('ALLOWED_HOSTS', 'testserver,localhost')
+    os.environ['PEST_ANALYSIS_CACHE_ENABLED'] = 'false'
+
+    import django
+    django.setup()
+
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test.utils import override_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+    from unittest import mock
+
+    from notificacoes.services.twilio_service import twilio_service
+    from pragas.inference_stub import InferenceStubServer
+    from pragas.services.huggingface_service import huggingface_service
+    from users.models import User
+
+    user, _ = User.objects.get_or_create(username=USERNAME, defaults={'localizacao': 'Nampula'})
+    token = str(AccessToken.for_user(user))
+    handler = WSGIHandler()
+
+    def post(body_path, content_type, query):
+        with open(body_path, 'rb') as stream:
+            environ = {
+                'REQUEST_METHOD': 'POST',
+                'PATH_INFO': '/api/pragas/detectar/',
+                'QUERY_STRING': query,
+                'CONTENT_TYPE': content_type,
+                'CONTENT_LENGTH': str(os.path.getsize(body_path)),
+                'HTTP_AUTHORIZATION': f'Bearer {token}',
+                'HTTP_HOST': 'localhost',
+                'SERVER_NAME': 'localhost',
+                'SERVER_PORT': '80',
+                'SERVER_PROTOCOL': 'HTTP/1.1',
+                'wsgi.input': stream,
+                'wsgi.url_scheme': 'http',
+                'wsgi.errors': sys.stderr,
+            }
+            statuses = []
+            response = handler(environ, lambda status, headers: statuses.append(status))
+            b''.join(response)
+            response.close()
+            assert statuses[0].startswith('200'), statuses
+
+    stub = InferenceStubServer().start()
+    try:
+        with override_settings(MEDIA_ROOT=args.media_root), \
+                mock.patch.object(huggingface_service, 'base_url', stub.url), \
+                mock.patch.object(twilio_service, 'send_pest_detection_alert'):
+            post(args.warmup_body, *write_body(args.mode, args.warmup_image, args.warmup_body))
+
+            # Repor o pico de RSS (VmHWM) para o valor atual
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            baseline = _status_kb('VmRSS')
+            post(args.body, args.content_type, args.query)
+            peak = _status_kb('VmHWM')
+    finally:
+        stub.stop()
+    print(json.dumps({'baseline_kb': baseline, 'peak_kb': peak}))
+
+
+def run_mode(mode, image_path, workdir):
+    body_path = os.path.join(workdir, f'body_{mode}')
+    content_type, query = write_body(mode, image_path, body_path)
+    warmup_image = os.path.join(workdir, 'warmup.jpg')
+    make_image(warmup_image, 0.05)
+    output = subprocess.run([
+        sys.executable, __file__, '--child', '--mode', mode,
+        '--body', body_path, '--content-type', content_type, '--query', query,
+        '--warmup-image', warmup_image, '--warmup-body', os.path.join(workdir, f'warmup_{mode}'),
+        '--media-root', os.path.join(workdir, 'media'),
+    ], capture_output=True, text=True, cwd=BACKEND_DIR)
+    if output.returncode != 0:
+        print(output.stderr[-2000:])
+        sys.exit(1)
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    growth = (result['peak_kb'] - result['baseline_kb']) / 1024
+    print(f"[{mode:<9}] corpo={os.path.getsize(body_path) / 1e6:.1f} MB  pico por pedido=+{growth:.1f} MB")
+    return growth
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image', help='foto a usar (por omissão, uma foto sintética)')
+    parser.add_argument('--megapixels', type=float, default=12, help='tamanho da foto sintética')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    for option in ('--mode', '--body', '--content-type', '--query', '--warmup-image', '--warmup-body', '--media-root'):
+        parser.add_argument(option, default='', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        sys.exit(0)
+
+    if not os.path.exists('/proc/self/clear_refs'):
+        print("❌ Este benchmark precisa de Linux (/proc/self/clear_refs)")
+        sys.exit(1)
+
+    workdir = tempfile.mkdtemp(prefix='lura_upload_')
+    try:
+        image_path = args.image
+        if not image_path:
+            image_path = os.path.join(workdir, 'foto.jpg')
+            make_image(image_path, args.megapixels)
+        print(f"📷 Imagem: {os.path.getsize(image_path) / 1e6:.1f} MB")
+        results = {mode: run_mode(mode, image_path, workdir) for mode in args.modes}
+        if 'base64' in results:
+            for mode in ('multipart', 'binary'):
+                if mode in results and results[mode] > 0:
+                    print(f"base64 / {mode}: {results['base64'] / results[mode]:.1f}x")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,112 @@
+"""
+Benchmark do agendamento de notificações (notificacoes.services.scheduler).
+
+Corre numa base de dados de teste criada e destruída pelo próprio script
+(como o manage.py test), com --users agricultores com PreferenciaNotificacao
+(janela 07:00-19:00, mercado por SMS) e --messages mensagens de mercado
+enviadas às 22:00.
+
+Mede:
+  volume  - SMS a enviar com outbox.enqueue (tudo já) e com
+            scheduler.schedule (adiadas para a janela e juntas em resumos).
+  claim   - tempo de outbox.claim com a fila cheia de baldes futuros, com o
+            filtro antigo (agendada_para <= agora OR IS NULL) e o actual
+            (só agendada_para <= agora, pelo índice parcial), e o plano.
+
+Uso:
+  python scripts/benchmark_scheduler.py --users 20000 --messages 5
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+from unittest import mock
+
+# Ensure backend code is importable
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agroalerta.settings')
+
+import django
+django.setup()
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test.utils import setup_test_environment
+from django.utils import timezone
+
+from notificacoes.models import Notificacao, PreferenciaNotificacao
+from notificacoes.services import outbox, recipients, scheduler
+from users.models import User
+
+NIGHT = timezone.make_aware(datetime(2026, 10, 14, 22, 0))
+
+
+def seed(count):
+    User.objects.bulk_create([
+        User(username=f'agricultor{i}', telefone=f'84{i:07d}', provincia='Nampula') for i in range(count)
+    ], batch_size=5000)
+    PreferenciaNotificacao.objects.bulk_create([
+        PreferenciaNotificacao(usuario_id=user_id, canal_mercado='sms')
+        for user_id in User.objects.values_list('id', flat=True)
+    ], batch_size=5000)
+
+
+def volume(messages):
+    users = recipients.resolve_recipients({'provincia': 'Nampula'})
+    for i in range(messages):
+        outbox.enqueue(users, f'Mercado {i}', 'Milho a 25 MZN/kg', tipo='mercado')
+    legacy = Notificacao.objects.count()
+    Notificacao.objects.all().delete()
+
+    start = time.perf_counter()
+    with mock.patch('notificacoes.services.scheduler.timezone.now', return_value=NIGHT):
+        for i in range(messages):
+            scheduler.schedule(users, f'Mercado {i}', 'Milho a 25 MZN/kg', tipo='mercado')
+    elapsed = time.perf_counter() - start
+    now = Notificacao.objects.filter(agendada_para=NIGHT).count()
+    total = Notificacao.objects.filter(metadados__resumo=True).count()
+    print(f"[volume] enqueue: {legacy} SMS às 22:00 | schedule: {now} às 22:00, {total} resumos na janela "
+          f"das 07:00 ({elapsed:.2f}s)")
+
+
+def claim_time(label, due_filter, repeat=20):
+    now = timezone.now()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        with transaction.atomic():
+            list(Notificacao.objects.select_for_update(skip_locked=True, of=('self',))
+                 .filter(status='pendente', canal__in=outbox.SEND_CHANNELS).filter(due_filter(now))
+                 .order_by('agendada_para', 'id')[:100])
+    print(f"[claim ] {label:<8} {(time.perf_counter() - start) / repeat * 1000:7.2f} ms/lote")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--messages', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        seed(args.users)
+        print(f"🧪 {args.users} destinatários, {args.messages} mensagens às 22:00")
+        volume(args.messages)
+
+        # Baldes futuros na fila e poucas devidas
+        Notificacao.objects.filter(status='pendente').update(agendada_para=timezone.now() + timedelta(hours=9))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE notificacoes_notificacao')
+        claim_time('antigo', lambda now: Q(agendada_para__lte=now) | Q(agendada_para__isnull=True))
+        claim_time('actual', lambda now: Q(agendada_para__lte=now))
+        plan = (Notificacao.objects.filter(status='pendente', canal__in=outbox.SEND_CHANNELS,
+                                           agendada_para__lte=timezone.now())
+                .order_by('agendada_para', 'id')[:100].explain())
+        print(plan)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,140 @@
+"""
+Benchmark do cliente Twilio (notificacoes.services.twilio_service).
+
+Envia --messages SMS para um servidor HTTP local que imita a API de
+mensagens da Twilio (resposta 201 depois de --latency-ms; 429 quando tem
+mais de --server-limit pedidos em curso). Conta as ligações TCP abertas.
+
+Modos comparados:
+  sequencial - cliente do SDK por omissão, uma mensagem de cada vez
+               (comportamento antigo de send_sms).
+  pool       - TwilioService.send_many com --concurrency pedidos em
+               simultâneo sobre ligações keep-alive.
+  429        - como pool, mas o servidor só aceita --server-limit pedidos em
+               simultâneo; mostra as respostas 429 e o resultado final.
+
+Uso:
+  python scripts/benchmark_twilio_client.py --messages 500 --concurrency 16
+  python scripts/benchmark_twilio_client.py --latency-ms 150 --server-limit 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Ensure backend code is importable
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agroalerta.settings')
+
+import django
+django.setup()
+
+from django.test.utils import override_settings
+from twilio.rest import Client
+
+from notificacoes.services.twilio_service import TwilioService
+
+ACCOUNT_SID = 'AC' + '0' * 32
+
+
+class FakeTwilio(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.05
+    limit = 0
+    in_flight = 0
+    stats = {'201': 0, '429': 0, 'connections': set()}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.lock:
+            FakeTwilio.in_flight += 1
+            rejected = self.limit and FakeTwilio.in_flight > self.limit
+            self.stats['connections'].add(self.client_address)
+        try:
+            if rejected:
+                status, payload = 429, {'code': 20429, 'message': 'Too Many Requests', 'status': 429}
+            else:
+                time.sleep(self.latency)
+                status, payload = 201, {'sid': 'SM' + '0' * 32, 'status': 'queued'}
+        finally:
+            with self.lock:
+                FakeTwilio.in_flight -= 1
+                self.stats[str(status)] += 1
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def reset(limit=0):
+    FakeTwilio.limit = limit
+    FakeTwilio.stats = {'201': 0, '429': 0, 'connections': set()}
+
+
+def report(label, count, elapsed, ok):
+    stats = FakeTwilio.stats
+    print(f"[{label:<10}] {ok}/{count} aceites em {elapsed:6.2f}s = {count / elapsed:7.1f} msg/s "
+          f"(ligações: {len(stats['connections'])}, respostas 429: {stats['429']})")
+
+
+def sequential(base_url, phones):
+    reset()
+    client = Client(ACCOUNT_SID, 'token')
+    client.api.base_url = base_url
+    start = time.perf_counter()
+    for phone in phones:
+        client.messages.create(body='Alerta de chuva forte', from_='+258840000000', to=phone)
+    report('sequencial', len(phones), time.perf_counter() - start, FakeTwilio.stats['201'])
+
+
+def pooled(label, base_url, phones, concurrency, server_limit=0):
+    reset(server_limit)
+    with override_settings(TWILIO_ACCOUNT_SID=ACCOUNT_SID, TWILIO_AUTH_TOKEN='token',
+                           TWILIO_PHONE_NUMBER='+258840000000', TWILIO_SMS_CONCURRENCY=concurrency,
+                           TWILIO_BACKOFF_BASE_SECONDS=0.05, TWILIO_BACKOFF_MAX_SECONDS=1,
+                           TWILIO_MAX_RETRIES=20):
+        service = TwilioService()
+    service.client.api.base_url = base_url
+    messages = [{'canal': 'sms', 'telefone': phone, 'mensagem': 'Alerta de chuva forte'} for phone in phones]
+    start = time.perf_counter()
+    results = service.send_many(messages)
+    ok = sum(1 for result in results if result and result['success'])
+    report(label, len(phones), time.perf_counter() - start, ok)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--sequential-messages', type=int, default=100, help='amostra do modo sequencial')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--server-limit', type=int, default=4)
+    args = parser.parse_args()
+
+    FakeTwilio.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTwilio)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    phones = [f'+25884{i:07d}' for i in range(args.messages)]
+    print(f"🧪 {args.messages} mensagens, latência {args.latency_ms:.0f}ms")
+    try:
+        sequential(base_url, phones[:args.sequential_messages])
+        pooled('pool', base_url, phones, args.concurrency)
+        pooled('429', base_url, phones, args.concurrency, args.server_limit)
+    finally:
+        server.shutdown()
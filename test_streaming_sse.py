@@ -116,9 +116,10 @@ def test_streaming():
                             print(f"📝 Total de caracteres: {len(accumulated_text)}")
                             print(f"🤖 Modelo usado: {data.get('model', 'unknown')}")
                             
-                            # Validar HTML formatado
-                            if data.get('content_html'):
-                                print(f"✅ HTML formatado gerado ({len(data['content_html'])} chars)")
+                            # Validar tamanho do texto acumulado (o servidor envia apenas deltas)
+                            if data.get('length') is not None:
+                                ok = len(accumulated_text.encode('utf-8')) == data['length']
+                                print(f"{'✅' if ok else '❌'} Tamanho confere com o servidor ({data['length']} bytes)")
                             
                             break
                         